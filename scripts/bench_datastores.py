@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+Compares job save & read latency of the embedded SQLite datastore with
+the in-memory MockDatastore (and optionally Couchbase)
+
+    python scripts/bench_datastores.py [--jobs 2000] [--couchbase HOST]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zerog.datastores.mock_datastore import MockDatastore
+from zerog.datastores.sqlite_datastore import SqliteDatastore
+from zerog.queues.mock_queue import MockQueue
+
+from tests.job_classes import GoodJob
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def bench(name, datastore, count):
+    queue = MockQueue()
+    jobs = [GoodJob(datastore, queue) for _ in range(count)]
+
+    creates = [timed(job.save) for job in jobs]
+    updates = [
+        timed(lambda: job.update_attrs(completeness=0.5)) for job in jobs
+    ]
+    reads = [
+        timed(lambda: datastore.read_with_cas(job.key())) for job in jobs
+    ]
+
+    print(f"{name}")
+    for opName, samples in [
+        ("create", creates), ("update", updates), ("read", reads)
+    ]:
+        samples.sort()
+        p99 = samples[int(len(samples) * 0.99) - 1]
+        print(
+            f"    {opName:8s} mean {statistics.mean(samples) * 1e6:8.1f}us"
+            f"  p99 {p99 * 1e6:8.1f}us"
+            f"  {len(samples) / sum(samples):10.0f} ops/s"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--couchbase", help="couchbase host to compare")
+    args = parser.parse_args()
+
+    bench("MockDatastore", MockDatastore(), args.jobs)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        bench(
+            "SqliteDatastore",
+            SqliteDatastore(os.path.join(tmpdir, "bench.sqlite")),
+            args.jobs
+        )
+
+    if args.couchbase:
+        from zerog.datastores import CouchbaseDatastore
+        bench(
+            "CouchbaseDatastore",
+            CouchbaseDatastore(
+                args.couchbase, "Administrator", "password", "test"
+            ),
+            args.jobs
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+Compares the cost of encoding & decoding management messages as JSON
+objects (through the marshmallow schemas) and in the compact encoding
+
+    python scripts/bench_messages.py [--msgs 20000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zerog.mgmt.messages import (
+    encode_msg, fast_msg, make_msg, make_msg_from_json
+)
+from zerog.mgmt.utils import make_worker_id
+
+WORKER_ID = make_worker_id("zerog", "10.0.0.1", "bench", 1234)
+MSGS = {
+    "job": dict(
+        workerId=WORKER_ID,
+        uuid="0f8fad5b-d9cb-469f-a165-70867728950e",
+        action="end",
+        jobType="bench",
+        duration=1.25
+    ),
+    "info": dict(
+        workerId=WORKER_ID,
+        state="activeRunning",
+        uuid="0f8fad5b-d9cb-469f-a165-70867728950e",
+        mem=dict(available=8 * 2 ** 30, used=300 * 2 ** 20),
+        retiring=False
+    ),
+    "heartbeat": dict(
+        workerId=WORKER_ID,
+        state="activeIdle",
+        uuid="",
+        retiring=False,
+        interval=10
+    ),
+}
+
+
+def rate(count, func):
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return count / (time.perf_counter() - start)
+
+
+def bench(msgtype, kwargs, count):
+    bodies = {
+        compact: json.dumps(encode_msg(make_msg(msgtype, **kwargs), compact))
+        for compact in [False, True]
+    }
+
+    print(f"{msgtype}")
+    for compact, name, make in [
+        (False, "json", make_msg),
+        (True, "compact", fast_msg),
+    ]:
+        encodeRate = rate(
+            count,
+            lambda: json.dumps(encode_msg(make(msgtype, **kwargs), compact))
+        )
+        decodeRate = rate(count, lambda: make_msg_from_json(bodies[compact]))
+        print(
+            f"    {name:8} {len(bodies[compact]):4} bytes "
+            f"encode {encodeRate:9.0f} msgs/s  decode {decodeRate:9.0f} msgs/s"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--msgs", type=int, default=20000)
+    args = parser.parse_args()
+
+    for msgtype, kwargs in MSGS.items():
+        bench(msgtype, kwargs, args.msgs)
+
+
+if __name__ == "__main__":
+    main()
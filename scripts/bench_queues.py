@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+Compares put & reserve throughput of the SQLite queue, the in-memory
+MockQueue and BeanstalkdQueue on the beanstalkd emulator (and optionally a
+real beanstalkd), including reserves by several consumer processes
+
+    python scripts/bench_queues.py [--jobs 5000] [--consumers 4]
+                                   [--beanstalkd HOST[:PORT]]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zerog.queues.beanstalk_queue import BeanstalkdQueue
+from zerog.queues.emulator import EmulatorServer
+from zerog.queues.mock_queue import MockQueue
+from zerog.queues.sqlite_queue import SqliteQueue
+
+
+def rate(count, func):
+    start = time.perf_counter()
+    func()
+    return count / (time.perf_counter() - start)
+
+
+def drain(queue):
+    while True:
+        job = queue.reserve(timeout=0)
+        if job is None:
+            return
+
+        job.delete()
+
+
+def consume(makeQueue):
+    drain(makeQueue())
+
+
+def bench(name, makeQueue, jobs, consumers):
+    queue = makeQueue()
+    drain(queue)
+    bodies = [str(uuid.uuid4()) for _ in range(jobs)]
+
+    putRate = rate(jobs, lambda: [queue.put(body) for body in bodies])
+    reserveRate = rate(jobs, lambda: drain(queue))
+    putManyRate = rate(jobs, lambda: queue.put_many(bodies))
+    drain(queue)
+
+    print(f"{name}")
+    print(f"    put              {putRate:10.0f} jobs/s")
+    print(f"    put_many         {putManyRate:10.0f} jobs/s")
+    print(f"    reserve+delete   {reserveRate:10.0f} jobs/s")
+
+    if consumers and not isinstance(queue, MockQueue):
+        # the jobs are all queued before the consumers start, so each
+        # consumer stops when it finds the queue empty
+        queue.put_many(bodies)
+        procs = [
+            multiprocessing.Process(target=consume, args=(makeQueue,))
+            for _ in range(consumers)
+        ]
+
+        def run():
+            for proc in procs:
+                proc.start()
+            for proc in procs:
+                proc.join()
+
+        consumeRate = rate(jobs, run)
+        print(
+            f"    {consumers} consumers      {consumeRate:10.0f} jobs/s"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--consumers", type=int, default=4)
+    parser.add_argument("--beanstalkd", help="beanstalkd host[:port]")
+    args = parser.parse_args()
+
+    bench("MockQueue", MockQueue, args.jobs, 0)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "bench.sqlite")
+        bench(
+            "SqliteQueue",
+            lambda: SqliteQueue(path, "bench"),
+            args.jobs,
+            args.consumers
+        )
+
+    emulator = EmulatorServer().start()
+    bench(
+        "BeanstalkdQueue (emulator)",
+        lambda: BeanstalkdQueue(emulator.host, emulator.port, "bench"),
+        args.jobs,
+        args.consumers
+    )
+    emulator.stop()
+
+    if args.beanstalkd:
+        host, _, port = args.beanstalkd.partition(":")
+        bench(
+            "BeanstalkdQueue",
+            lambda: BeanstalkdQueue(host, int(port or 11300), "bench"),
+            args.jobs,
+            args.consumers
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,13 @@ setup(
     version=open('VERSION').read().strip(),
     author='MotiveMetrics',
     install_requires=[
-        'beanstalkc3>=0.4.0',
         'couchbase==4.5.0',
         'marshmallow>=3.0.5',
         'psutil',
         'tornado>=4.5'
     ],
+    extras_require={
+        'msgpack': ['msgpack>=1.0']
+    },
     packages=find_packages(exclude=["tests"])
 )
@@ -0,0 +1,218 @@
+import datetime
+import gzip
+import json
+import os
+import pytest
+import time
+import tornado.gen
+
+from zerog.archive import JobArchiver, archive_jobs
+from zerog.datastores.mock_datastore import MockDatastore
+from zerog.handlers.uuid import InfoHandler, UUID_PATT
+from zerog.jobindex import JobIndex
+from zerog.queues.mock_queue import MockQueue
+
+from tests.job_classes import GoodJob
+
+HANDLERS = [("/info/%s" % UUID_PATT, InfoHandler)]
+
+
+class ExpiringJob(GoodJob):
+    JOB_TYPE = "expiring_test_job"
+    EXPIRY = 60
+
+
+class ChangingDatastore(MockDatastore):
+    """
+    MockDatastore whose jobs are updated right after they're read, as if
+    by another process
+    """
+    def __init__(self):
+        super(ChangingDatastore, self).__init__()
+        self.changing = set()
+
+    def read_multi(self, keys, **kwargs):
+        results = super(ChangingDatastore, self).read_multi(keys, **kwargs)
+        for key in self.changing & set(keys):
+            self.set(key, dict(results[key][0]))
+
+        return results
+
+
+@pytest.fixture
+def datastore():
+    datastore = ChangingDatastore()
+    datastore.jobIndex = JobIndex(datastore, flushInterval=3600)
+    return datastore
+
+
+@pytest.fixture
+def archiver(tmp_path):
+    archiver = JobArchiver(str(tmp_path / "archive"))
+    yield archiver
+    archiver.close()
+
+
+@pytest.fixture
+def app(mock_app, datastore, archiver):
+    return mock_app(
+        [GoodJob], HANDLERS, datastore=datastore,
+        makeArchiver=lambda: archiver, archiveDelay=0
+    )
+
+
+def make_job(datastore, jobClass=GoodJob, resultCode=200):
+    job = jobClass(datastore, MockQueue())
+    job.save()
+    if resultCode is not None:
+        job.update_attrs(resultCode=resultCode, completeness=1)
+
+    return job
+
+
+def test_expiry(datastore):
+    job = make_job(datastore, ExpiringJob, resultCode=None)
+    assert 'expiresAt' not in datastore.db[job.key()]
+
+    job.update_attrs(resultCode=200)
+    assert datastore.db[job.key()]['expiresAt'] > time.time()
+
+    datastore.db[job.key()]['expiresAt'] = time.time() - 1
+    assert datastore.read_with_cas(job.key()) == (None, None)
+
+
+def test_no_expiry_by_default(datastore):
+    job = make_job(datastore)
+    assert 'expiresAt' not in datastore.db[job.key()]
+
+
+def test_archive_jobs(datastore, archiver):
+    done = [make_job(datastore) for _ in range(3)]
+    running = make_job(datastore, resultCode=None)
+
+    archived = archive_jobs(
+        datastore, archiver, [job.uuid for job in done + [running]]
+    )
+
+    assert archived == [job.uuid for job in done]
+    assert all(job.key() not in datastore.db for job in done)
+    assert running.key() in datastore.db
+
+    for job in done:
+        assert job.uuid in archiver
+        archived = archiver.read(job.uuid)
+        assert archived['uuid'] == job.uuid
+        assert archived['resultCode'] == 200
+
+    assert running.uuid not in archiver
+    assert archiver.read(running.uuid) is None
+
+
+def test_archive_layout(datastore, archiver):
+    jobs = [make_job(datastore) for _ in range(4)]
+    archive_jobs(datastore, archiver, [job.uuid for job in jobs[:2]])
+    archive_jobs(datastore, archiver, [job.uuid for job in jobs[2:]])
+
+    paths = [
+        os.path.join(dirpath, name)
+        for dirpath, _, names in os.walk(archiver.rootDir)
+        for name in names if name.endswith(".jsonl.gz")
+    ]
+    assert len(paths) == 1
+
+    today = datetime.datetime.utcnow()
+    assert today.strftime("%Y/%m/%d") in paths[0]
+
+    # the file is a valid stream of gzip members, one job per line
+    with gzip.open(paths[0], "rt") as f:
+        uuids = [json.loads(line)['uuid'] for line in f]
+    assert uuids == [job.uuid for job in jobs]
+
+
+def test_get_job_from_archive(app, datastore, archiver):
+    job = make_job(datastore)
+    archive_jobs(datastore, archiver, [job.uuid])
+
+    found = app.get_job(job.uuid)
+    assert found.uuid == job.uuid
+    assert found.resultCode == 200
+
+    assert app.get_jobs([job.uuid])[job.uuid].uuid == job.uuid
+
+
+def test_changed_jobs_are_skipped(datastore, archiver):
+    jobs = [make_job(datastore) for _ in range(2)]
+    datastore.changing.add(jobs[0].key())
+
+    archived = archive_jobs(datastore, archiver, [job.uuid for job in jobs])
+    assert archived == [jobs[1].uuid]
+
+    # the changed job stays in the datastore, and its stale copy isn't
+    # read back from the archive
+    assert jobs[0].key() in datastore.db
+    assert jobs[0].uuid not in archiver
+    assert jobs[1].uuid in archiver
+
+
+def test_missing_jobs_leave_the_index(datastore, archiver):
+    job = make_job(datastore)
+    datastore.delete(job.key())
+    assert datastore.jobIndex.completed(datetime.datetime.utcnow()) == [
+        job.uuid
+    ]
+
+    assert archive_jobs(datastore, archiver, [job.uuid]) == []
+    assert datastore.jobIndex.completed(datetime.datetime.utcnow()) == []
+
+
+def test_server_archives_completed_jobs(app, datastore, archiver):
+    done = make_job(datastore)
+    running = make_job(datastore, resultCode=None)
+
+    uuids = app.due_for_archive()
+    assert uuids == [done.uuid]
+    assert app.archive_due() == 1
+    assert done.key() not in datastore.db
+    assert running.key() in datastore.db
+    assert app.due_for_archive() == []
+
+
+@pytest.mark.gen_test
+def test_archive_poll(app, datastore):
+    job = make_job(datastore)
+
+    # archiving only runs on the IOLoop
+    yield tornado.gen.moment
+    app.do_archive_poll()
+    yield app.archiving
+    assert job.key() not in datastore.db
+
+    # the index isn't polled again until ARCHIVE_INTERVAL has passed
+    other = make_job(datastore)
+    app.do_archive_poll()
+    assert app.archiving is None
+    assert other.key() in datastore.db
+
+
+def test_archive_delay(app, datastore):
+    app.archiveDelay = 60
+    job = make_job(datastore)
+
+    assert app.due_for_archive() == []
+    assert app.due_for_archive(now=time.time() + 61) == [job.uuid]
+
+
+def test_archiving_requires_job_index(mock_app, archiver):
+    with pytest.raises(ValueError):
+        mock_app([GoodJob], HANDLERS, makeArchiver=lambda: archiver)
+
+
+@pytest.mark.gen_test
+def test_info_handler_reads_archive(
+    app, http_client, base_url, datastore, archiver
+):
+    job = make_job(datastore)
+    archive_jobs(datastore, archiver, [job.uuid])
+
+    response = yield http_client.fetch("%s/info/%s" % (base_url, job.uuid))
+    assert json.loads(response.body)['result'] == 200
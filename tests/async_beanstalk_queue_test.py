@@ -0,0 +1,150 @@
+import pytest
+import tornado.gen
+
+import zerog
+from zerog.mgmt.messages import make_msg, make_msg_from_json
+from zerog.queues.async_beanstalk_queue import AsyncBeanstalkdQueue
+from zerog.queues.beanstalk_client import CommandFailed, Connection
+
+from tests.job_classes import GoodJob
+
+
+@pytest.fixture
+def make_async_queue(beanstalkd):
+    def _func(queueName):
+        return AsyncBeanstalkdQueue("127.0.0.1", beanstalkd.port, queueName)
+
+    return _func
+
+
+@pytest.mark.gen_test
+def test_put_reserve_delete(make_async_queue):
+    queue = make_async_queue("jobs")
+    jid = yield queue.put(dict(a=1))
+
+    job = yield queue.reserve(timeout=0)
+    assert job.jid == jid
+    assert job.body == '{"a": 1}'
+
+    stats = yield job.stats()
+    assert stats['state'] == "reserved"
+    assert stats['tube'] == "jobs"
+
+    yield job.delete()
+    assert (yield queue.reserve(timeout=0)) is None
+
+    with pytest.raises(CommandFailed):
+        yield queue.delete(jid)
+
+
+@pytest.mark.gen_test
+def test_release_bury(make_async_queue):
+    queue = make_async_queue("jobs")
+    yield queue.put("x")
+
+    job = yield queue.reserve(timeout=0)
+    yield job.release(delay=10)
+    assert (yield queue.reserve(timeout=0)) is None
+
+    stats = yield queue.stats_tube("jobs")
+    assert stats['current-jobs-delayed'] == 1
+
+
+@pytest.mark.gen_test
+def test_put_many_and_put_to(beanstalkd, make_async_queue):
+    beanstalkd.emulator.maxJobSize = 3
+    queue = make_async_queue("jobs")
+    jids = yield queue.put_many(["a", "too big", "b"])
+    assert jids[0] and jids[1] is None and jids[2]
+
+    yield queue.put_to("other", "c")
+    stats = yield queue.stats_tube("other")
+    assert stats['current-jobs-ready'] == 1
+
+    # still using & watching the queue's own tube
+    yield queue.put("d")
+    bodies = []
+    for _ in range(3):
+        job = yield queue.reserve(timeout=0)
+        bodies.append(job.body)
+    assert bodies == ['"a"', '"b"', '"d"']
+
+
+@pytest.mark.gen_test
+def test_reserve_doesnt_block_loop(make_async_queue):
+    consumer = make_async_queue("jobs")
+    producer = make_async_queue("jobs")
+
+    reserving = tornado.gen.convert_yielded(consumer.reserve())
+    yield tornado.gen.sleep(0.1)
+    assert not reserving.done()
+
+    yield producer.put("wake up")
+    job = yield reserving
+    assert job.body == '"wake up"'
+
+
+@pytest.mark.gen_test
+def test_reconnect(beanstalkd, make_async_queue):
+    queue = make_async_queue("jobs")
+    yield queue.put("before")
+
+    beanstalkd.drop_connections()
+    yield tornado.gen.sleep(0.05)
+
+    yield queue.put("after")
+    job = yield queue.reserve(timeout=0)
+    assert job.body == '"before"'
+
+
+@pytest.mark.gen_test(timeout=15)
+def test_server_control_loop(beanstalkd, make_async_queue, mock_app):
+    app = mock_app([GoodJob], [], makeAsyncQueue=make_async_queue)
+    ctrl = make_async_queue(app.workerId)
+    updates = make_async_queue(zerog.UPDATES_CHANNEL_NAME)
+    yield updates.connect()
+
+    yield ctrl.put(make_msg("requestInfo").dump())
+    job = yield updates.reserve(timeout=5)
+    msg = make_msg_from_json(job.body)
+    assert msg.msgtype == "info"
+    assert msg.workerId == app.workerId
+
+    yield ctrl.put(make_msg("drain").dump())
+    for _ in range(50):
+        if app.state != "activeIdle":
+            break
+        yield tornado.gen.sleep(0.1)
+    assert app.state == "drainingIdle"
+
+    # the control channel is watched, so managers see a live server
+    conn = Connection("127.0.0.1", beanstalkd.port)
+    assert conn.stats_tube(app.workerId)['current-watching'] >= 1
+    conn.close()
+
+
+@pytest.mark.gen_test(timeout=15)
+def test_server_control_loop_survives_errors(
+    beanstalkd, make_async_queue, mock_app
+):
+    app = mock_app([GoodJob], [], makeAsyncQueue=make_async_queue)
+    ctrl = make_async_queue(app.workerId)
+    process = app.process_control_message
+
+    def fail_once(msg):
+        app.process_control_message = process
+        raise RuntimeError("processing failed")
+
+    app.process_control_message = fail_once
+    yield ctrl.put(make_msg("requestInfo").dump())
+    yield ctrl.put(make_msg("drain").dump())
+    for _ in range(50):
+        if app.state != "activeIdle":
+            break
+        yield tornado.gen.sleep(0.1)
+    assert app.state == "drainingIdle"
+
+    # both messages were deleted
+    stats = yield ctrl.stats_tube(app.workerId)
+    assert stats['current-jobs-ready'] == 0
+    assert stats['current-jobs-reserved'] == 0
@@ -0,0 +1,207 @@
+import asyncio
+import json
+import pdb
+import pytest
+import time
+import tornado.gen
+
+from zerog.datastores.async_mock_datastore import AsyncMockDatastore
+from zerog.datastores.executor_datastore import ExecutorDatastore
+from zerog.datastores.mock_datastore import MockDatastore
+from zerog.handlers.uuid import ProgressHandler, UUID_PATT
+from zerog.handlers.run_job import RunJobHandler, JOB_TYPE_PATT
+from zerog.jobs import async_enqueue_jobs, make_key
+from zerog.queues.mock_queue import MockQueue
+from zerog.signals import Signals
+
+from tests.job_classes import GoodJob
+
+SLOW = 0.5
+
+HANDLERS = [
+    ("/progress/%s" % UUID_PATT, ProgressHandler),
+    ("/runjob/%s" % JOB_TYPE_PATT, RunJobHandler)
+]
+
+
+class SlowMockDatastore(MockDatastore):
+    """
+    blocking datastore with a slow read for specific keys
+    """
+    def __init__(self):
+        super(SlowMockDatastore, self).__init__()
+        self.slowKeys = set()
+        self.completed = []
+
+    def read_with_cas(self, key, **kwargs):
+        if key in self.slowKeys:
+            time.sleep(SLOW)
+
+        result = super(SlowMockDatastore, self).read_with_cas(key, **kwargs)
+        self.completed.append(key)
+        return result
+
+
+class SlowMockQueue(MockQueue):
+    """
+    queue with a slow bulk put
+    """
+    def put_many(self, datas, **kwargs):
+        time.sleep(SLOW)
+        return super(SlowMockQueue, self).put_many(datas, **kwargs)
+
+
+@pytest.fixture
+def async_datastore():
+    return AsyncMockDatastore(MockDatastore())
+
+
+@pytest.fixture
+def app(mock_app, async_datastore):
+    return mock_app(
+        [GoodJob],
+        HANDLERS,
+        datastore=async_datastore.datastore,
+        makeAsyncDatastore=lambda: async_datastore
+    )
+
+
+def save_good_job(datastore):
+    job = GoodJob(datastore, MockQueue())
+    job.save()
+    return job
+
+
+@pytest.mark.gen_test
+def test_slow_read_does_not_block_requests(
+    app, http_client, base_url, async_datastore
+):
+    slowJob = save_good_job(async_datastore.datastore)
+    fastJob = save_good_job(async_datastore.datastore)
+    async_datastore.keyDelays[slowJob.key()] = SLOW
+
+    responses = yield [
+        http_client.fetch("%s/progress/%s" % (base_url, slowJob.uuid)),
+        http_client.fetch("%s/progress/%s" % (base_url, fastJob.uuid))
+    ]
+
+    assert [r.code for r in responses] == [200, 200]
+    assert async_datastore.completed == [
+        ("read_with_cas", fastJob.key()),
+        ("read_with_cas", slowJob.key())
+    ]
+
+
+@pytest.mark.gen_test
+def test_loop_not_blocked(app, http_client, base_url, async_datastore):
+    slowJob = save_good_job(async_datastore.datastore)
+    async_datastore.keyDelays[slowJob.key()] = SLOW
+
+    ticks = 0
+    done = False
+
+    async def ticker():
+        nonlocal ticks
+        while not done:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    tornado.ioloop.IOLoop.current().spawn_callback(ticker)
+    response = yield http_client.fetch(
+        "%s/progress/%s" % (base_url, slowJob.uuid)
+    )
+    done = True
+
+    assert response.code == 200
+    assert ticks > (SLOW / 0.01) / 2
+
+
+@pytest.mark.gen_test
+def test_async_enqueue_jobs_loop_not_blocked(app, async_datastore):
+    queue = SlowMockQueue()
+    jobs = [GoodJob(async_datastore.datastore, queue) for _ in range(2)]
+
+    ticks = 0
+    done = False
+
+    async def ticker():
+        nonlocal ticks
+        while not done:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    tornado.ioloop.IOLoop.current().spawn_callback(ticker)
+    yield async_enqueue_jobs(async_datastore, jobs)
+    done = True
+
+    assert ticks > (SLOW / 0.01) / 2
+    assert [queue.reserve(timeout=0).jid for _ in jobs] == [
+        job.queueJobId for job in jobs
+    ]
+    for job in jobs:
+        job.reload()
+        assert job.queueJobId > 0
+
+
+@pytest.mark.gen_test
+def test_run_job(app, http_client, base_url, async_datastore):
+    response = yield http_client.fetch(
+        "%s/runjob/%s" % (base_url, GoodJob.JOB_TYPE),
+        method="POST",
+        body=json.dumps(dict(goodness="async"))
+    )
+    assert response.code == 201
+
+    uuid = json.loads(response.body)['uuid']
+    data = async_datastore.datastore.read(make_key(uuid))
+    assert data['goodness'] == "async"
+    assert data['queueJobId'] != 0
+    assert ("set_with_cas", make_key(uuid)) in async_datastore.completed
+
+
+@pytest.mark.gen_test
+def test_missing_job(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s/progress/%s" % (base_url, "not-a-job"), raise_error=False
+    )
+    assert response.code == 404
+
+
+@pytest.mark.gen_test
+def test_async_record_killed_job(app, async_datastore):
+    job = save_good_job(async_datastore.datastore)
+    yield app.async_record_killed_job(job.uuid, False)
+
+    job.reload()
+    assert job.events[-1].msg == "System restart"
+
+
+@pytest.mark.gen_test
+def test_async_record_killed_job_signals(app):
+    job = GoodJob(app.datastore, app.jobQueue, signalKeys=["killed"])
+    job.enqueue()
+    yield app.async_record_killed_job(job.uuid, True)
+
+    job.reload()
+    assert job.resultCode == 410
+    assert job.errorCount == 1
+    assert "Killed by user" in job.errors[0].msg
+    assert Signals(app.datastore, app.jobQueue).count("killed") == 1
+    assert app.jobQueue.reserve(timeout=0) is None
+
+
+@pytest.mark.gen_test
+def test_executor_datastore(mock_app):
+    datastore = SlowMockDatastore()
+    app = mock_app([GoodJob], HANDLERS, datastore=datastore)
+    assert isinstance(app.asyncDatastore, ExecutorDatastore)
+
+    slowJob = save_good_job(datastore)
+    fastJob = save_good_job(datastore)
+    datastore.slowKeys.add(slowJob.key())
+
+    slowRead = app.asyncDatastore.read_with_cas(slowJob.key())
+    fastRead = app.asyncDatastore.read_with_cas(fastJob.key())
+    yield [slowRead, fastRead]
+
+    assert datastore.completed == [fastJob.key(), slowJob.key()]
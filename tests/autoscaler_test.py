@@ -0,0 +1,161 @@
+import pytest
+import time
+
+import zerog
+from zerog.mgmt import Autoscaler, WorkerManager, make_worker_id
+from zerog.mgmt.autoscaler import erlang_c, required_workers
+
+
+def test_erlang_c():
+    assert erlang_c(1, 0) == 0
+    assert erlang_c(2, 1) == pytest.approx(1 / 3)
+    assert erlang_c(2, 2) == 1
+    assert 0 < erlang_c(100, 80) < erlang_c(90, 80) < 1
+
+
+def test_required_workers():
+    assert required_workers(0, 10) == 0
+
+    # 10 erlangs at 80% utilization
+    assert required_workers(1, 10) == 13
+
+    # the backlog is worked off within the target wait
+    assert required_workers(0, 10, backlog=12, targetWait=60) == 2
+
+    # a tight target wait needs more than the utilization bound
+    assert required_workers(1, 10, targetWait=0.01) > 13
+
+
+@pytest.fixture
+def manager(beanstalkd):
+    return WorkerManager(beanstalkd.host, beanstalkd.port)
+
+
+@pytest.fixture
+def jobs(beanstalkd):
+    return zerog.BeanstalkdQueue(
+        beanstalkd.host, beanstalkd.port, "zerog_test_jobs"
+    )
+
+
+def add_workers(
+    manager, host, count, state="activeIdle", service="zerog_test"
+):
+    workerIds = []
+    for pid in range(count):
+        workerId = make_worker_id("zerog", host, service, pid)
+        manager.workerTable.update(
+            workerId, 3600, state=state, infoAt=time.time()
+        )
+        workerIds.append(workerId)
+
+    return workerIds
+
+
+def ctrl_msgs(jobs, workerIds):
+    return sum(
+        jobs.do_bean("stats_tube", workerId)['current-jobs-ready']
+        for workerId in workerIds
+        if workerId in jobs.do_bean("tubes")
+    )
+
+
+def test_scale_down(manager, jobs):
+    host1 = add_workers(manager, "host1", 2)
+    host2 = add_workers(manager, "host2", 3)
+    add_workers(manager, "host3", 4, service="other")
+    manager.workers[host2[0]]['state'] = "activeRunning"
+
+    autoscaler = Autoscaler(manager, "zerog_test", minWorkers=2)
+    decision = autoscaler.step(now=1000)
+    assert decision['active'] == 5
+    assert decision['required'] == 2
+
+    # host1 is emptied first, and the running worker is left alone
+    assert decision['drained'] == host1 + host2[1:2]
+    assert ctrl_msgs(jobs, host1 + host2[1:2]) == 3
+
+    # cooling down
+    for workerId in decision['drained']:
+        manager.workers[workerId]['state'] = "drainingIdle"
+    manager.workers[host2[2]]['state'] = "activeIdle"
+    add_workers(manager, "host4", 1)
+    assert autoscaler.step(now=1010)['drained'] == []
+
+
+def test_scale_up(manager, jobs):
+    active = add_workers(manager, "host1", 1)
+    drained = add_workers(manager, "host2", 4, state="drainingIdle")
+    manager.workers[drained[0]]['retiring'] = True
+    jobs.put_many(["job"] * 30)
+
+    autoscaler = Autoscaler(
+        manager,
+        "zerog_test",
+        maxWorkers=3,
+        targetWait=60,
+        defaultServiceTime=10
+    )
+    decision = autoscaler.step(now=1000)
+    assert decision['ready'] == 30
+    assert decision['required'] == 3
+
+    # retiring workers stay drained
+    assert decision['undrained'] == drained[1:3]
+    assert ctrl_msgs(jobs, drained) == 2
+    assert ctrl_msgs(jobs, active) == 0
+
+
+def test_retire_drained_hosts(manager, jobs):
+    add_workers(manager, "host1", 1)
+    host2 = add_workers(manager, "host2", 2, state="drainingIdle")
+
+    autoscaler = Autoscaler(
+        manager, "zerog_test", retireHosts=True, retireAfter=60
+    )
+    assert autoscaler.step(now=1000)['retired'] == []
+    assert autoscaler.step(now=1059)['retired'] == []
+    assert autoscaler.step(now=1060)['retired'] == ["host2"]
+    assert ctrl_msgs(jobs, host2) == 2
+
+
+def test_no_retire_when_scaling_up(manager, jobs):
+    add_workers(manager, "host1", 1)
+    host2 = add_workers(manager, "host2", 2, state="drainingIdle")
+
+    autoscaler = Autoscaler(
+        manager,
+        "zerog_test",
+        targetWait=60,
+        defaultServiceTime=10,
+        retireHosts=True,
+        retireAfter=60
+    )
+    assert autoscaler.step(now=1000)['retired'] == []
+
+    # the backlog needs host2 back just as it's due to be retired
+    jobs.put_many(["job"] * 30)
+    decision = autoscaler.step(now=1060)
+    assert decision['undrained'] == host2
+    assert decision['retired'] == []
+    assert "host2" not in autoscaler.drainedSince
+    assert ctrl_msgs(jobs, host2) == 2
+
+    # or, while the scale up is cooling down, stays drained but isn't
+    # retired
+    autoscaler = Autoscaler(
+        manager,
+        "zerog_test",
+        targetWait=60,
+        defaultServiceTime=10,
+        retireHosts=True,
+        retireAfter=60
+    )
+    for workerId in host2:
+        manager.workers[workerId]['state'] = "drainingIdle"
+    autoscaler.drainedSince["host2"] = 1000
+    autoscaler.lastScaleUp = 1059
+    decision = autoscaler.step(now=1060)
+    assert decision['undrained'] == []
+    assert decision['retired'] == []
+    assert autoscaler.drainedSince["host2"] == 1000
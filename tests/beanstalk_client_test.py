@@ -0,0 +1,217 @@
+import pytest
+
+from zerog.mgmt.messages import make_msg, send_msg, get_msg
+from zerog.queues.beanstalk_client import (
+    CommandFailed, Connection, parse_yaml_dict, parse_yaml_list
+)
+from zerog.queues.beanstalk_queue import BeanstalkdQueue
+
+
+@pytest.fixture
+def conn(beanstalkd):
+    conn = Connection("127.0.0.1", beanstalkd.port)
+    yield conn
+    conn.close()
+
+
+def count_writes(conn):
+    # wraps the connection's socket to count its writes
+    sock = conn._socket
+    writes = []
+
+    class CountingSocket(object):
+        def sendall(self, data):
+            writes.append(data)
+            return sock.sendall(data)
+
+        def __getattr__(self, name):
+            return getattr(sock, name)
+
+    conn._socket = CountingSocket()
+    return writes
+
+
+def test_parse_yaml():
+    stats = parse_yaml_dict(
+        "---\ncurrent-jobs-ready: 3\nrusage-utime: 0.125000\n"
+        "version: \"1.12\"\nhostname: fakehost\n"
+    )
+    assert stats == {
+        'current-jobs-ready': 3,
+        'rusage-utime': 0.125,
+        'version': "1.12",
+        'hostname': "fakehost"
+    }
+
+    assert parse_yaml_list("---\n- default\n- 2021\n") == ["default", "2021"]
+
+
+def test_put_reserve_delete(conn):
+    jid = conn.put("hello")
+    job = conn.reserve(timeout=0)
+    assert job.jid == jid
+    assert job.body == "hello"
+
+    job.delete()
+    assert conn.reserve(timeout=0) is None
+    assert conn.peek(jid) is None
+
+
+def test_priority_order(conn):
+    conn.put("low", priority=100)
+    conn.put("high", priority=1)
+
+    assert conn.reserve(timeout=0).body == "high"
+    assert conn.reserve(timeout=0).body == "low"
+
+
+def test_release_bury_kick(conn):
+    jid = conn.put("job")
+
+    job = conn.reserve(timeout=0)
+    job.release(delay=10)
+    assert conn.reserve(timeout=0) is None
+    assert conn.peek_delayed().jid == jid
+
+    conn.kick_job(jid)
+    job = conn.reserve(timeout=0)
+    job.bury()
+    assert conn.peek_buried().jid == jid
+    assert conn.stats_job(jid)['state'] == "buried"
+
+    assert conn.kick(10) == 1
+    job = conn.reserve(timeout=0)
+    stats = job.stats()
+    assert stats['reserves'] == 3
+    assert stats['releases'] == 1
+    assert stats['buries'] == 1
+
+
+def test_command_failed(conn):
+    with pytest.raises(CommandFailed) as e:
+        conn.delete(12345)
+
+    assert e.value.args[:2] == ("delete", "NOT_FOUND")
+
+    # connection is still usable
+    assert conn.put("ok")
+
+
+def test_tubes_and_stats(conn):
+    assert conn.use("tube1") == "tube1"
+    conn.put("x")
+    assert conn.using() == "tube1"
+
+    assert conn.watch("tube1") == 2
+    assert conn.ignore("default") == 1
+    assert conn.watching() == ["tube1"]
+
+    # can't ignore the last watched tube
+    assert conn.ignore("tube1") == 1
+    assert conn.watching() == ["tube1"]
+
+    assert "tube1" in conn.tubes()
+    assert conn.stats_tube("tube1")['current-jobs-ready'] == 1
+    assert conn.stats()['current-jobs-ready'] == 1
+
+
+def test_use_watch_cached(beanstalkd, conn):
+    conn.use("tube1")
+    conn.use("tube1")
+    conn.watch("tube1")
+    conn.watch("tube1")
+    conn.ignore("other")
+
+    stats = conn.stats()
+    assert stats['cmd-use'] == 1
+    assert stats['cmd-watch'] == 1
+    assert stats['cmd-ignore'] == 0
+
+
+def test_pipeline(beanstalkd, conn):
+    writes = count_writes(conn)
+    results = conn.pipeline().use("tube1").put("a").put("b").watch(
+        "tube1"
+    ).ignore("default").reserve(timeout=0).execute()
+
+    assert len(writes) == 1
+    assert results[0] == "tube1"
+    assert results[3:5] == [2, 1]
+    assert results[5].jid == results[1]
+    assert results[5].body == "a"
+    assert conn.currentTube == "tube1"
+    assert conn.watchedTubes == {"tube1"}
+
+
+def test_pipeline_failure_keeps_sync(conn):
+    pipeline = conn.pipeline().put("a").delete(12345).put("b")
+    with pytest.raises(CommandFailed):
+        pipeline.execute()
+
+    # all the responses were read, so the next command gets its own
+    job = conn.reserve(timeout=0)
+    assert job.body == "a"
+
+
+def test_put_many(beanstalkd, conn):
+    beanstalkd.emulator.maxJobSize = 3
+    writes = count_writes(conn)
+    jids = conn.put_many(["a", "too big", "c"], ttr=60)
+
+    assert len(writes) == 1
+    assert writes[0].count(b"put 2147483648 0 60 1\r\n") == 2
+    assert jids[0] and jids[1] is None and jids[2]
+
+
+def test_large_body(conn):
+    body = "x" * 200000
+    conn.put("a" * 60000)
+    job = conn.reserve(timeout=0)
+    assert job.body == "a" * 60000
+
+    conn.encoding = None
+    conn.put(body.encode()[:65000])
+    assert conn.reserve(timeout=0).body == b"x" * 65000
+
+
+def test_queue_reconnect(beanstalkd):
+    queue = BeanstalkdQueue("127.0.0.1", beanstalkd.port, "jobs")
+    queue.put("before")
+
+    beanstalkd.drop_connections()
+
+    # do_bean reconnects and re-attaches to the queue's tube
+    queue.put("after")
+    assert queue.bean.currentTube == "jobs"
+    assert queue.reserve(timeout=0).body == '"before"'
+    assert queue.reserve(timeout=0).body == '"after"'
+
+
+def test_queue_put_many(beanstalkd):
+    queue = BeanstalkdQueue("127.0.0.1", beanstalkd.port, "jobs")
+    jids = queue.put_many(["a", "b"])
+
+    assert len(jids) == 2
+    assert queue.reserve(timeout=0).body == '"a"'
+
+
+def test_send_get_msg(beanstalkd):
+    queue = BeanstalkdQueue("127.0.0.1", beanstalkd.port, "updates")
+    writes = count_writes(queue.bean)
+
+    send_msg(make_msg("drain"), queue, "worker1")
+    queue.put("update")
+
+    # only the named tube is watched while getting a message
+    msg = get_msg(queue, "worker1")
+    assert msg.msgtype == "drain"
+    assert get_msg(queue, "worker1") is None
+
+    # one round trip for each send_msg / get_msg, plus the put and the
+    # message's delete
+    assert len(writes) == 5
+
+    assert queue.bean.currentTube == "updates"
+    assert queue.bean.watchedTubes == {"updates"}
+    assert queue.bean.watching() == ["updates"]
+    assert queue.reserve(timeout=0).body == '"update"'
@@ -0,0 +1,253 @@
+import json
+import pdb
+import pytest
+
+import time
+
+from zerog.archive import JobArchiver, archive_jobs
+from zerog.blobstores import FileBlobstore, MockBlobstore, make_digest
+from zerog.datastores.mock_datastore import MockDatastore
+from zerog.jobs import BlobRef
+from zerog.handlers.uuid import GetDataHandler, UUID_PATT
+from zerog.jobindex import JobIndex
+from zerog.jobs.blob import BLOB_KEY, BlobNotFound
+from zerog.queues.mock_queue import MockQueue
+from zerog.registry import JobRegistry
+
+from tests.job_classes import BlobJob
+
+
+class ExpiringBlobJob(BlobJob):
+    JOB_TYPE = "expiring_blob_test_job"
+    EXPIRY = 60
+
+BIG_INPUT = {str(i): "datum %d" % i for i in range(1000)}
+
+
+@pytest.fixture(params=["file", "mock"])
+def blobstore(request, tmp_path):
+    if request.param == "file":
+        return FileBlobstore(str(tmp_path / "blobs"))
+    else:
+        return MockBlobstore()
+
+
+@pytest.fixture
+def blob_datastore(blobstore):
+    datastore = MockDatastore()
+    datastore.blobstore = blobstore
+    return datastore
+
+
+@pytest.fixture
+def blob_registry():
+    registry = JobRegistry()
+    registry.add_classes([BlobJob])
+    return registry
+
+
+def test_put_and_get_value(blobstore):
+    digest = blobstore.put_value(BIG_INPUT)
+
+    assert digest == make_digest(BIG_INPUT)
+    assert blobstore.exists(digest)
+    assert blobstore.get_value(digest) == BIG_INPUT
+
+
+def test_get_missing_value(blobstore):
+    assert blobstore.get_value(make_digest("nope")) is None
+
+
+def test_delete(blobstore):
+    digest = blobstore.put_value(BIG_INPUT)
+
+    assert blobstore.delete(digest) is True
+    assert blobstore.exists(digest) is False
+    assert blobstore.delete(digest) is False
+
+
+def test_identical_values_stored_once():
+    blobstore = MockBlobstore()
+    reordered = dict(reversed(list(BIG_INPUT.items())))
+
+    assert blobstore.put_value(BIG_INPUT) == blobstore.put_value(reordered)
+    assert blobstore.puts == 1
+
+
+def test_job_document_holds_reference(blob_datastore, blob_registry):
+    job = blob_registry.make_job(
+        dict(bigInput=BIG_INPUT), blob_datastore, MockQueue(),
+        jobType=BlobJob.JOB_TYPE
+    )
+    job.save()
+
+    doc = blob_datastore.read(job.key())
+    assert doc['bigInput'] == {BLOB_KEY: make_digest(BIG_INPUT)}
+    assert doc['bigResult'] is None
+
+
+def test_blob_loaded_lazily(blob_datastore, blob_registry):
+    job = blob_registry.make_job(
+        dict(bigInput=BIG_INPUT), blob_datastore, MockQueue(),
+        jobType=BlobJob.JOB_TYPE
+    )
+    job.save()
+
+    job2 = blob_registry.get_job(job.uuid, blob_datastore, MockQueue())
+    assert isinstance(job2.bigInput, BlobRef)
+    assert job2.bigInput.loaded is False
+    assert job2.bigInput.value == BIG_INPUT
+    assert job2.bigInput.loaded is True
+
+
+def test_blob_not_rewritten_on_change(blob_registry):
+    datastore = MockDatastore()
+    datastore.blobstore = MockBlobstore()
+    job = blob_registry.make_job(
+        dict(bigInput=BIG_INPUT), datastore, MockQueue(),
+        jobType=BlobJob.JOB_TYPE
+    )
+    job.save()
+    job.record_event("changed")
+    job.update_attrs(completeness=0.5)
+
+    assert datastore.blobstore.puts == 1
+
+
+def test_blob_result(blob_datastore, blob_registry):
+    job = blob_registry.make_job(
+        dict(bigInput=BIG_INPUT), blob_datastore, MockQueue(),
+        jobType=BlobJob.JOB_TYPE
+    )
+    job.save()
+    job.run()
+    job.save()
+
+    job2 = blob_registry.get_job(job.uuid, blob_datastore, MockQueue())
+    assert job2.get_data() == dict(count=len(BIG_INPUT))
+
+
+def test_no_blobstore_stays_inline(blob_registry):
+    datastore = MockDatastore()
+    job = blob_registry.make_job(
+        dict(bigInput=BIG_INPUT), datastore, MockQueue(),
+        jobType=BlobJob.JOB_TYPE
+    )
+    job.save()
+
+    assert datastore.read(job.key())['bigInput'] == BIG_INPUT
+
+    job2 = blob_registry.get_job(job.uuid, datastore, MockQueue())
+    assert job2.bigInput.value == BIG_INPUT
+
+
+def test_missing_blob(blob_datastore, blob_registry):
+    job = blob_registry.make_job(
+        dict(bigInput=BIG_INPUT), blob_datastore, MockQueue(),
+        jobType=BlobJob.JOB_TYPE
+    )
+    job.save()
+    blob_datastore.blobstore.delete_value(make_digest(BIG_INPUT), job.uuid)
+
+    job2 = blob_registry.get_job(job.uuid, blob_datastore, MockQueue())
+    with pytest.raises(BlobNotFound):
+        job2.bigInput.value
+
+
+def make_blob_job(datastore, registry, bigInput=BIG_INPUT):
+    job = registry.make_job(
+        dict(bigInput=bigInput), datastore, MockQueue(),
+        jobType=BlobJob.JOB_TYPE
+    )
+    job.save()
+    return job
+
+
+def test_blobs_belong_to_their_job(blob_datastore, blob_registry):
+    blobstore = blob_datastore.blobstore
+    jobs = [make_blob_job(blob_datastore, blob_registry) for _ in range(2)]
+    digest = make_digest(BIG_INPUT)
+
+    assert blobstore.delete_value(digest, jobs[0].uuid)
+    job2 = blob_registry.get_job(jobs[1].uuid, blob_datastore, MockQueue())
+    assert job2.bigInput.value == BIG_INPUT
+
+    # a job given another job's blob stores its own copy
+    job3 = blob_registry.make_job(
+        dict(bigInput=job2.bigInput), blob_datastore, MockQueue(),
+        jobType=BlobJob.JOB_TYPE
+    )
+    job3.save()
+    assert blobstore.delete_value(digest, jobs[1].uuid)
+    job3 = blob_registry.get_job(job3.uuid, blob_datastore, MockQueue())
+    assert job3.bigInput.value == BIG_INPUT
+
+
+def test_changed_blob_stored_again(blob_datastore, blob_registry):
+    blobstore = blob_datastore.blobstore
+    job = make_blob_job(blob_datastore, blob_registry)
+    job = blob_registry.get_job(job.uuid, blob_datastore, MockQueue())
+
+    job.bigInput.value['new'] = "changed in place"
+    job.save()
+
+    # the new value replaces the old one, which is deleted
+    changed = dict(BIG_INPUT, new="changed in place")
+    job2 = blob_registry.get_job(job.uuid, blob_datastore, MockQueue())
+    assert job2.bigInput.value == changed
+    assert blobstore.get_value(make_digest(BIG_INPUT), job.uuid) is None
+    assert blobstore.get_value(make_digest(changed), job.uuid) == changed
+
+
+def test_blobs_expire_with_job(blob_datastore, monkeypatch):
+    blobstore = blob_datastore.blobstore
+    job = ExpiringBlobJob(
+        blob_datastore, MockQueue(), bigInput=BlobRef(value=BIG_INPUT)
+    )
+    job.save()
+    job.update_attrs(resultCode=200)
+
+    digest = make_digest(BIG_INPUT)
+    assert blobstore.get_value(digest, job.uuid) == BIG_INPUT
+
+    later = time.time() + ExpiringBlobJob.EXPIRY + 1
+    monkeypatch.setattr(time, "time", lambda: later)
+    if isinstance(blobstore, FileBlobstore):
+        assert blobstore.purge_expired() == 1
+
+    assert blobstore.get_value(digest, job.uuid) is None
+
+
+def test_archived_blobs(blob_datastore, blob_registry, tmp_path):
+    blob_datastore.jobIndex = JobIndex(blob_datastore, flushInterval=3600)
+    archiver = JobArchiver(str(tmp_path / "archive"))
+    job = make_blob_job(blob_datastore, blob_registry)
+    job.update_attrs(resultCode=200)
+
+    assert archive_jobs(blob_datastore, archiver, [job.uuid]) == [job.uuid]
+
+    # archived with the blob's value, and the blob is deleted
+    assert archiver.read(job.uuid)['bigInput'] == BIG_INPUT
+    blobstore = blob_datastore.blobstore
+    assert blobstore.get_value(make_digest(BIG_INPUT), job.uuid) is None
+    archiver.close()
+
+
+@pytest.fixture
+def app(mock_app, blob_datastore):
+    return mock_app(
+        [BlobJob], [("/data/%s" % UUID_PATT, GetDataHandler)],
+        datastore=blob_datastore
+    )
+
+
+@pytest.mark.gen_test
+def test_data_handler_loads_blobs(
+    app, http_client, base_url, blob_datastore, blob_registry
+):
+    job = make_blob_job(blob_datastore, blob_registry)
+    job.run()
+    job.save()
+
+    response = yield http_client.fetch("%s/data/%s" % (base_url, job.uuid))
+    assert json.loads(response.body) == dict(count=len(BIG_INPUT))
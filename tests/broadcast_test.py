@@ -0,0 +1,184 @@
+import atexit
+import pytest
+import threading
+import time
+
+import zerog
+from zerog.datastores.mock_datastore import MockDatastore
+from zerog.mgmt import WorkerManager, make_msg
+from zerog.mgmt.messages import (
+    BROADCAST_HISTORY, get_broadcasts, peek_broadcasts, reserve_broadcasts,
+    send_broadcast
+)
+from zerog.mgmt.utils import make_broadcast_tube
+from zerog.queues.emulator import BeanstalkEmulator
+from zerog.queues.mock_queue import MockQueue
+
+from tests.job_classes import GoodJob
+
+TUBE = make_broadcast_tube("host", "host1")
+
+
+def test_log():
+    queue = MockQueue()
+    assert get_broadcasts(queue, TUBE, 0) == []
+
+    seqs = [
+        send_broadcast(make_msg(msgtype), queue, TUBE, compact=compact)
+        for msgtype, compact in [("drain", False), ("undrain", True)]
+    ]
+    assert seqs[0] < seqs[1]
+
+    # one entry in the tube, holding the whole log
+    assert queue.do_bean("stats_tube", TUBE)['current-jobs-ready'] == 1
+    assert [
+        (seq, msg.msgtype) for seq, msg in get_broadcasts(queue, TUBE, 0)
+    ] == list(zip(seqs, ["drain", "undrain"]))
+    assert [
+        msg.msgtype for _, msg in get_broadcasts(queue, TUBE, seqs[0])
+    ] == ["undrain"]
+    assert get_broadcasts(queue, TUBE, seqs[1]) == []
+
+
+def test_log_is_bounded():
+    queue = MockQueue()
+    seqs = [
+        send_broadcast(make_msg("requestInfo"), queue, TUBE)
+        for _ in range(BROADCAST_HISTORY + 5)
+    ]
+    entries = peek_broadcasts(queue, TUBE)
+    assert [seq for seq, _ in entries] == seqs[-BROADCAST_HISTORY:]
+    assert queue.do_bean("stats_tube", TUBE)['current-jobs-ready'] == 1
+
+
+def test_concurrent_senders(monkeypatch):
+    monkeypatch.setattr(zerog.mgmt.messages, "BROADCAST_HISTORY", 1000)
+    emulator = BeanstalkEmulator()
+    seqs = []
+
+    def send():
+        queue = MockQueue(emulator)
+        for _ in range(25):
+            seqs.append(send_broadcast(make_msg("requestInfo"), queue, TUBE))
+
+    threads = [threading.Thread(target=send) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # no sender dropped another's message from the log
+    queue = MockQueue(emulator)
+    assert [seq for seq, _ in peek_broadcasts(queue, TUBE)] == sorted(seqs)
+    assert len(set(seqs)) == 100
+    stats = queue.do_bean("stats_tube", TUBE)
+    assert stats['current-jobs-ready'] == 1
+    assert stats['current-jobs-reserved'] == 0
+
+
+def test_sender_waits_for_held_log():
+    emulator = BeanstalkEmulator()
+    queue = MockQueue(emulator)
+    first = send_broadcast(make_msg("drain"), queue, TUBE)
+
+    held = reserve_broadcasts(queue, TUBE)
+    reader = MockQueue(emulator)
+    assert peek_broadcasts(reader, TUBE) == []
+
+    seqs = []
+    sender = threading.Thread(target=lambda: seqs.append(
+        send_broadcast(make_msg("undrain"), MockQueue(emulator), TUBE)
+    ))
+    sender.start()
+    time.sleep(0.1)
+    assert sender.is_alive()
+
+    held.release()
+    sender.join()
+    assert [
+        seq for seq, _ in peek_broadcasts(reader, TUBE, wait=1)
+    ] == [first] + seqs
+
+
+@pytest.fixture
+def make_app(beanstalkd):
+    servers = []
+
+    def _func(name="zerog_test", **kwargs):
+        datastore = MockDatastore()
+
+        def make_queue(queueName):
+            return zerog.BeanstalkdQueue(
+                beanstalkd.host, beanstalkd.port, queueName
+            )
+
+        server = zerog.Server(
+            name, lambda: datastore, make_queue, [GoodJob], [],
+            thisHost="zerog", **kwargs
+        )
+        servers.append(server)
+        return server
+
+    yield _func
+    for server in servers:
+        server.proc.kill()
+        atexit.unregister(server.exit_handler)
+
+
+def test_drain_host(beanstalkd, make_app):
+    app = make_app()
+    manager = WorkerManager(beanstalkd.host, beanstalkd.port)
+
+    manager.drain_host("zerog")
+    app.do_broadcast_poll()
+    assert app.state == "drainingIdle"
+
+    # seen already, so it's not acted on again
+    app.undrain()
+    app.do_broadcast_poll()
+    assert app.state == "activeIdle"
+
+    manager.drain_host("zerog", retire=True)
+    app.do_broadcast_poll()
+    assert app.state == "drainingIdle"
+    assert app.retiring is True
+
+    # other hosts aren't affected
+    manager.drain_host("elsewhere")
+    manager.un_drain_host("elsewhere")
+    app.retiring = False
+    app.do_broadcast_poll()
+    assert app.state == "drainingIdle"
+
+
+def test_drain_service(beanstalkd, make_app):
+    app = make_app()
+    other = make_app("other_service")
+    manager = WorkerManager(beanstalkd.host, beanstalkd.port)
+
+    manager.drain_service("zerog_test")
+    app.do_broadcast_poll()
+    other.do_broadcast_poll()
+    assert app.state == "drainingIdle"
+    assert other.state == "activeIdle"
+
+    manager.un_drain_service("zerog_test")
+    app.do_broadcast_poll()
+    assert app.state == "activeIdle"
+
+
+def test_only_new_broadcasts(beanstalkd, make_app):
+    manager = WorkerManager(beanstalkd.host, beanstalkd.port)
+    manager.drain_host("zerog")
+
+    app = make_app()
+    app.do_broadcast_poll()
+    assert app.state == "activeIdle"
+
+
+def test_broadcast_interval(beanstalkd, make_app):
+    app = make_app(broadcastInterval=0.5)
+    assert app.broadcastCallback.callback_time == 500
+
+    app = make_app(broadcastInterval=0)
+    assert not hasattr(app, "broadcastCallback")
@@ -0,0 +1,148 @@
+import json
+import pytest
+
+from zerog.datastores.async_mock_datastore import AsyncMockDatastore
+from zerog.datastores.mock_datastore import MockDatastore
+from zerog.handlers.bulk_run_job import BulkRunJobHandler
+from zerog.handlers.run_job import JOB_TYPE_PATT
+from zerog.jobindex import JobIndex
+from zerog.jobs import make_key
+from zerog.queues.mock_queue import MockQueue
+from zerog.registry import JobRegistry
+
+from tests.job_classes import GoodJob
+
+HANDLERS = [
+    ("/runjobs", BulkRunJobHandler),
+    ("/runjobs/%s" % JOB_TYPE_PATT, BulkRunJobHandler)
+]
+
+
+class ConflictMockDatastore(MockDatastore):
+    """
+    mock datastore where a "worker" updates the first job between the
+    bulk save and the queueJobId write
+    """
+    def update_multi_with_cas(self, items, **kwargs):
+        key = sorted(items)[0]
+        value, cas = self.read_with_cas(key)
+        self.set_with_cas(key, dict(value, running=True), cas=cas)
+        return super().update_multi_with_cas(items, **kwargs)
+
+
+@pytest.fixture
+def registry():
+    registry = JobRegistry()
+    registry.add_classes([GoodJob])
+    return registry
+
+
+@pytest.fixture
+def async_datastore():
+    return AsyncMockDatastore(MockDatastore())
+
+
+@pytest.fixture
+def app(mock_app, async_datastore):
+    return mock_app(
+        [GoodJob],
+        HANDLERS,
+        datastore=async_datastore.datastore,
+        makeAsyncDatastore=lambda: async_datastore
+    )
+
+
+def test_enqueue_jobs(registry):
+    datastore = MockDatastore()
+    queue = MockQueue()
+    results = registry.enqueue_jobs(
+        [dict(goodness="very")] * 5, datastore, queue,
+        jobType=GoodJob.JOB_TYPE, ttr=60
+    )
+
+    assert queue.do_bean("stats")['current-jobs-ready'] == 5
+    for job, error in results:
+        assert error is None
+        data, cas = datastore.read_with_cas(job.key())
+        assert cas == job.cas
+        assert data['goodness'] == "very"
+        assert data['queueJobId'] == job.queueJobId
+        assert data['queueKwargs'] == dict(ttr=60)
+
+
+def test_enqueue_jobs_invalid_data(registry):
+    datastore = MockDatastore()
+    results = registry.enqueue_jobs(
+        [dict(jobType=GoodJob.JOB_TYPE), dict(jobType="nope"),
+         dict(jobType=GoodJob.JOB_TYPE, goodness=5)],
+        datastore, MockQueue()
+    )
+
+    assert results[0][0] and results[0][1] is None
+    assert results[1][0] is None and "nope" in results[1][1]
+    assert results[2][0] is None and "goodness" in results[2][1]
+    assert len(datastore.db) == 1
+
+
+def test_enqueue_jobs_conflict(registry):
+    datastore = ConflictMockDatastore()
+    results = registry.enqueue_jobs(
+        [dict()] * 3, datastore, MockQueue(), jobType=GoodJob.JOB_TYPE
+    )
+
+    for job, _ in results:
+        data = datastore.read(job.key())
+        assert data['queueJobId'] == job.queueJobId
+
+    # the worker's update wasn't lost
+    first = sorted(job.key() for job, _ in results)[0]
+    assert datastore.read(first)['running'] is True
+
+
+def test_enqueue_jobs_indexed(registry):
+    datastore = MockDatastore()
+    datastore.jobIndex = JobIndex(datastore)
+    results = registry.enqueue_jobs(
+        [dict()] * 20, datastore, MockQueue(), jobType=GoodJob.JOB_TYPE
+    )
+
+    listed, _ = datastore.jobIndex.list(GoodJob.JOB_TYPE, state="queued")
+    assert {e['uuid'] for e in listed} == {job.uuid for job, _ in results}
+
+
+@pytest.mark.gen_test
+def test_bulk_run_job_handler(app, http_client, base_url, async_datastore):
+    body = dict(jobs=[dict(goodness=str(i)) for i in range(50)])
+    response = yield http_client.fetch(
+        "%s/runjobs/%s" % (base_url, GoodJob.JOB_TYPE),
+        method="POST", body=json.dumps(body)
+    )
+    assert response.code == 201
+
+    result = json.loads(response.body)
+    assert result['errors'] == {}
+    assert len(result['uuids']) == 50
+
+    datastore = async_datastore.datastore
+    for i, uuid in enumerate(result['uuids']):
+        data = datastore.read(make_key(uuid))
+        assert data['goodness'] == str(i)
+        assert data['queueJobId']
+
+
+@pytest.mark.gen_test
+def test_bulk_run_job_handler_errors(app, http_client, base_url):
+    body = dict(jobs=[dict(jobType=GoodJob.JOB_TYPE), dict(jobType="nope")])
+    response = yield http_client.fetch(
+        "%s/runjobs" % base_url, method="POST", body=json.dumps(body)
+    )
+    result = json.loads(response.body)
+    assert result['uuids'][0]
+    assert result['uuids'][1] is None
+    assert list(result['errors']) == ["1"]
+
+    response = yield http_client.fetch(
+        "%s/runjobs" % base_url, method="POST", body=json.dumps(dict()),
+        raise_error=False
+    )
+    assert response.code == 400
@@ -0,0 +1,111 @@
+import json
+import pytest
+
+from zerog.datastores.async_mock_datastore import AsyncMockDatastore
+from zerog.datastores.mock_datastore import MockDatastore
+from zerog.handlers.bulk import BulkStatusHandler
+from zerog.queues.mock_queue import MockQueue
+
+from tests.job_classes import GoodJob
+
+HANDLERS = [("/status", BulkStatusHandler)]
+
+
+@pytest.fixture
+def async_datastore():
+    return AsyncMockDatastore(MockDatastore())
+
+
+@pytest.fixture
+def app(mock_app, async_datastore):
+    return mock_app(
+        [GoodJob],
+        HANDLERS,
+        datastore=async_datastore.datastore,
+        makeAsyncDatastore=lambda: async_datastore
+    )
+
+
+def save_good_jobs(datastore, count):
+    jobs = [GoodJob(datastore, MockQueue()) for _ in range(count)]
+    for job in jobs:
+        job.save()
+
+    return jobs
+
+
+def post_status(http_client, base_url, body):
+    return http_client.fetch(
+        "%s/status" % base_url,
+        method="POST",
+        body=json.dumps(body),
+        raise_error=False
+    )
+
+
+def test_mock_multi():
+    datastore = MockDatastore()
+    results = datastore.set_multi({"a": 1, "b": 2})
+    assert all(success for success, cas in results.values())
+
+    records = datastore.read_multi(["a", "b", "c"])
+    assert records["a"] == (1, results["a"][1])
+    assert records["b"] == (2, results["b"][1])
+    assert records["c"] == (None, None)
+
+
+def test_get_jobs(app, async_datastore):
+    jobs = save_good_jobs(async_datastore.datastore, 3)
+    jobs[0].update_attrs(resultCode=200)
+
+    found = app.get_jobs([job.uuid for job in jobs] + ["missing"])
+
+    assert found["missing"] is None
+    assert [found[job.uuid].uuid for job in jobs] == [j.uuid for j in jobs]
+    assert found[jobs[0].uuid].resultCode == 200
+
+    # completed job comes from the cache, running jobs are revalidated
+    app.get_jobs([job.uuid for job in jobs])
+    stats = app.jobCache.stats()
+    assert stats['hits'] == 3
+    assert stats['revalidations'] == 2
+
+
+@pytest.mark.gen_test
+def test_bulk_progress(app, http_client, base_url, async_datastore):
+    jobs = save_good_jobs(async_datastore.datastore, 20)
+    uuids = [job.uuid for job in jobs]
+
+    response = yield post_status(
+        http_client, base_url, dict(uuids=uuids + ["missing"])
+    )
+    assert response.code == 200
+
+    statuses = json.loads(response.body)
+    assert statuses["missing"] is None
+    assert all(statuses[uuid] == jobs[0].progress() for uuid in uuids)
+
+    # all the jobs are read by one request
+    reads = [method for method, key in async_datastore.completed]
+    assert reads == ["read_with_cas"] * 21
+
+
+@pytest.mark.gen_test
+def test_bulk_info(app, http_client, base_url, async_datastore):
+    job = save_good_jobs(async_datastore.datastore, 1)[0]
+
+    response = yield post_status(
+        http_client, base_url, dict(uuids=[job.uuid], fields="info")
+    )
+    assert json.loads(response.body)[job.uuid] == job.info()
+
+
+@pytest.mark.gen_test
+def test_bulk_bad_requests(app, http_client, base_url):
+    response = yield post_status(http_client, base_url, dict())
+    assert response.code == 400
+
+    response = yield post_status(
+        http_client, base_url, dict(uuids=["a"], fields="everything")
+    )
+    assert response.code == 400
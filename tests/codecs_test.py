@@ -0,0 +1,142 @@
+import datetime
+import json
+import pdb
+import pytest
+import sys
+
+from zerog.datastores import codecs
+from zerog.datastores.codecs import (
+    CodecError, JsonCodec, MsgpackCodec, decode, is_encoded
+)
+from zerog.datastores.mock_datastore import MockDatastore
+from zerog.queues.mock_queue import MockQueue
+from zerog.registry import JobRegistry
+
+from tests.job_classes import GoodJob
+
+
+def make_doc():
+    job = GoodJob(MockDatastore(), MockQueue())
+    job.record_event("something happened")
+    doc = job.dump()
+    doc['bigField'] = {str(i): "x" * 20 for i in range(200)}
+    return doc
+
+
+@pytest.fixture(params=[JsonCodec, MsgpackCodec])
+def codec(request):
+    return request.param()
+
+
+def test_round_trip(codec):
+    doc = make_doc()
+    encoded = codec.encode(doc)
+
+    assert is_encoded(encoded)
+    assert codec.decode(encoded) == doc
+
+
+def test_round_trip_str(codec):
+    value = "the quick brown fox jumps over the lazy dog"
+    assert codec.decode(codec.encode(value)) == value
+
+
+def test_compression_threshold(codec):
+    doc = make_doc()
+    codec.compressThreshold = None
+    uncompressed = codec.encode(doc)
+
+    codec.compressThreshold = 16
+    compressed = codec.encode(doc)
+
+    assert len(compressed) < len(uncompressed)
+    assert codec.decode(compressed) == doc
+
+
+def test_msgpack_smaller_than_json():
+    doc = make_doc()
+    encoded = MsgpackCodec(compressThreshold=None).encode(doc)
+    assert len(encoded) < len(json.dumps(doc))
+
+
+def test_msgpack_not_installed(monkeypatch):
+    encoded = MsgpackCodec().encode(make_doc())
+
+    monkeypatch.setattr(codecs, "msgpack", None)
+    monkeypatch.setitem(sys.modules, "msgpack", None)
+    with pytest.raises(CodecError, match="pip install zerog"):
+        MsgpackCodec()
+    with pytest.raises(CodecError, match="pip install zerog"):
+        decode(encoded)
+
+    # JSON documents don't need it
+    assert decode(JsonCodec().encode("doc")) == "doc"
+
+
+def test_msgpack_datetimes():
+    codec = MsgpackCodec()
+    now = datetime.datetime.utcnow()
+    doc = dict(
+        naive=now.isoformat(),
+        noMicros=now.replace(microsecond=0).isoformat(),
+        aware=now.replace(tzinfo=datetime.timezone.utc).isoformat(),
+        notADate="2021-01-01Tomorrow"
+    )
+    assert codec.decode(codec.encode(doc)) == doc
+
+
+def test_decode_legacy_json():
+    doc = make_doc()
+    assert decode(json.dumps(doc).encode("utf-8")) == doc
+    assert decode(doc) == doc
+
+
+def test_decode_other_format():
+    doc = make_doc()
+    assert MsgpackCodec().decode(JsonCodec().encode(doc)) == doc
+    assert JsonCodec().decode(MsgpackCodec().encode(doc)) == doc
+
+
+def test_stats_report():
+    codec = MsgpackCodec(collectStats=True)
+    doc = make_doc()
+    codec.decode(codec.encode(doc))
+    codec.decode(codec.encode("not a job"))
+
+    report = codec.report()
+    assert set(report.keys()) == {GoodJob.JOB_TYPE, "other"}
+
+    stats = report[GoodJob.JOB_TYPE]
+    assert stats['encodes'] == 1
+    assert stats['decodes'] == 1
+    assert stats['savedBytes'] > 0
+    assert stats['sizeRatio'] < 1
+
+
+def test_no_stats_report():
+    assert MsgpackCodec().report() == {}
+
+
+def test_mock_datastore_with_codec(codec):
+    datastore = MockDatastore(codec=codec)
+    registry = JobRegistry()
+    registry.add_classes([GoodJob])
+
+    job = registry.make_job(
+        dict(goodness="binary"), datastore, MockQueue(),
+        jobType=GoodJob.JOB_TYPE
+    )
+    job.save()
+    assert isinstance(datastore.db[job.key()]['value'], bytes)
+
+    job2 = registry.get_job(job.uuid, datastore, MockQueue())
+    assert job2.goodness == "binary"
+    assert job2.createdAt == job.createdAt
+
+
+def test_mock_datastore_reads_legacy(codec):
+    datastore = MockDatastore()
+    datastore.set("legacy", {"yo": "dawg"})
+
+    datastore.codec = codec
+    assert datastore.read("legacy") == {"yo": "dawg"}
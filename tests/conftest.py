@@ -5,7 +5,10 @@ import pytest
 
 from tests.job_classes import GoodJob
 import zerog
+from zerog.datastores.mock_datastore import MockDatastore
 from zerog.queues.beanstalk_queue import QueueJob
+from zerog.queues.emulator import EmulatorServer
+from zerog.queues.mock_queue import MockQueue
 
 
 @pytest.fixture
@@ -37,6 +40,16 @@ def make_queue():
     return _func
 
 
+@pytest.fixture
+def beanstalkd():
+    """
+    beanstalkd emulator server on a free local port
+    """
+    server = EmulatorServer().start()
+    yield server
+    server.stop()
+
+
 @pytest.fixture
 def peek_delayed():
     def _func(queue):
@@ -176,3 +189,30 @@ def zerog_app(make_datastore, make_queue, clear_queue):
     yield _func
     server.kill_worker()
     clear_queue(server.ctrlChannel.queue)
+
+
+@pytest.fixture
+def mock_app():
+    """
+    Creates a zerog app backed by a mock datastore & mock queues, so it
+    doesn't need couchbase or beanstalkd
+    """
+    server = None
+
+    def _func(jobClasses, handlers, datastore=None, **kwargs):
+        nonlocal server
+        datastore = datastore or MockDatastore()
+        server = zerog.Server(
+            "zerog_test",
+            lambda: datastore,
+            lambda queueName: MockQueue(),
+            jobClasses,
+            handlers,
+            thisHost="zerog",
+            **kwargs
+        )
+        return server
+
+    yield _func
+    if server:
+        server.proc.kill()
@@ -1,6 +1,7 @@
 import pdb
 import pytest
 
+from zerog.datastores.codecs import MsgpackCodec
 from zerog.datastores.couchbase_datastore import CouchbaseDatastore
 
 
@@ -114,6 +115,18 @@ def test_read_with_cas(datastore):
     assert bool(readcas)    # ensure it's not nothing
 
 
+def test_read_cas(datastore):
+    key = "test_string"
+    value = "the quick brown fox peeks at the lazy dog"
+
+    datastore.set(key, value)
+    _, readcas = datastore.read_with_cas(key)
+    assert datastore.read_cas(key) == readcas
+
+    datastore.delete(key)
+    assert datastore.read_cas(key) is None
+
+
 def test_update(datastore):
     key = "test_string"
     value = "the quick brown fox laughs at the lazy dog"
@@ -204,3 +217,59 @@ def test_set_with_cas(datastore):
 
     readvalue = datastore.read(key)
     assert readvalue == newvalue
+
+
+def test_codec_reads_legacy_json(datastore):
+    key = "test_codec_dict"
+    value = {"yo": "dawg", "createdAt": "2021-09-17T15:52:06.123456"}
+
+    datastore.delete(key)
+    datastore.set(key, value)    # written as plain JSON
+
+    codecDatastore = CouchbaseDatastore(
+        "couchbase", "Administrator", "password", "test",
+        codec=MsgpackCodec()
+    )
+    assert codecDatastore.read(key) == value
+
+    newvalue = dict(value, fish="marlin")
+    success, cas = codecDatastore.set_with_cas(key, newvalue)
+    assert success is True
+
+    readvalue, readcas = codecDatastore.read_with_cas(key)
+    assert readvalue == newvalue
+    assert readcas == cas
+
+
+def test_set_and_read_multi(datastore):
+    items = {"test_multi_%d" % i: dict(number=i) for i in range(5)}
+    datastore.delete("test_multi_missing")
+
+    results = datastore.set_multi(items, chunkSize=2)
+    assert set(results) == set(items)
+    assert all(success for success, cas in results.values())
+
+    records = datastore.read_multi(
+        list(items) + ["test_multi_missing"], chunkSize=2
+    )
+    for key, value in items.items():
+        assert records[key] == (value, results[key][1])
+    assert records["test_multi_missing"] == (None, None)
+
+
+def test_update_multi_with_cas(datastore):
+    results = datastore.set_multi({"test_multi_a": 1, "test_multi_b": 2})
+    datastore.set("test_multi_b", 3)
+    datastore.delete("test_multi_missing")
+
+    updated = datastore.update_multi_with_cas({
+        "test_multi_a": (10, results["test_multi_a"][1]),
+        "test_multi_b": (20, results["test_multi_b"][1]),
+        "test_multi_missing": (30, 1)
+    })
+
+    assert updated["test_multi_a"][0] is True
+    assert updated["test_multi_b"] == (False, None)
+    assert updated["test_multi_missing"] == (False, None)
+    assert datastore.read("test_multi_a") == 10
+    assert datastore.read("test_multi_b") == 3
@@ -0,0 +1,206 @@
+import json
+import mock
+import multiprocessing
+import pytest
+
+import zerog
+from zerog.datastores.mock_datastore import MockDatastore
+from zerog.handlers.dead_letter import DeadLetterHandler
+from zerog.mgmt import WorkerManager
+from zerog.queues.emulator import BeanstalkEmulator
+from zerog.queues.mock_queue import MockQueue
+from zerog.workers.base import MAX_NOT_FOUND_RESERVES, MAX_RESERVES
+
+from tests.job_classes import GoodJob
+
+HANDLERS = [("/deadletters", DeadLetterHandler)]
+
+
+@pytest.fixture
+def datastore():
+    return MockDatastore()
+
+
+@pytest.fixture
+def queue():
+    return MockQueue(BeanstalkEmulator(), "zerog_test_jobs")
+
+
+@pytest.fixture
+def worker(datastore, queue):
+    registry = zerog.JobRegistry()
+    registry.add_classes([GoodJob])
+    parentConn, childConn = multiprocessing.Pipe()
+    worker = zerog.BaseWorker(
+        "zerog_test",
+        lambda: datastore,
+        lambda queueName: MockQueue(queue.emulator, queueName),
+        registry,
+        childConn
+    )
+    worker.run_init()
+    worker.parentConn = parentConn     # keep the pipe open
+    return worker
+
+
+def run_next(worker):
+    queueJob = worker.queue.reserve(timeout=0)
+    worker._process_queue_job(queueJob)
+    return queueJob
+
+
+def run_until_buried(worker):
+    # runs the next entry, kicking it while it's retried
+    queueJob = run_next(worker)
+    while queueJob.stats()['state'] == "delayed":
+        queueJob.kick()
+        queueJob = run_next(worker)
+    return queueJob
+
+
+def test_missing_job_is_buried(worker, queue):
+    jid = queue.put("no-such-uuid")
+
+    # retried a few times, in case the job isn't visible yet
+    for _ in range(MAX_NOT_FOUND_RESERVES):
+        queueJob = run_next(worker)
+        assert queueJob.stats()['state'] == "delayed"
+        assert worker.deadLetters.list() == []
+        queueJob.kick()
+
+    run_next(worker)
+    assert queue.do_bean("stats_job", jid)['state'] == "buried"
+    entries = worker.deadLetters.list()
+    assert len(entries) == 1
+    assert entries[0]['jid'] == jid
+    assert entries[0]['uuid'] == "no-such-uuid"
+    assert entries[0]['reason'] == "job not found"
+    assert entries[0]['body'] == '"no-such-uuid"'
+
+
+def test_bad_body_is_buried(worker, queue):
+    queue.bean.put("not json")
+    run_next(worker)
+
+    entries = worker.deadLetters.list()
+    assert [e['reason'] for e in entries] == ["bad queue entry"]
+
+
+def test_load_errors_are_retried(worker, queue, datastore):
+    job = GoodJob(datastore, queue)
+    job.enqueue()
+    worker.get_job = mock.Mock(side_effect=RuntimeError("datastore down"))
+
+    queueJob = run_next(worker)
+    stats = queueJob.stats()
+    assert stats['state'] == "delayed"
+    assert worker.deadLetters.list() == []
+
+    # reserved too many times: buried with the error
+    for _ in range(MAX_RESERVES):
+        queueJob.kick()
+        queueJob = run_next(worker)
+
+    entries = worker.deadLetters.list()
+    assert len(entries) == 1
+    assert entries[0]['reason'].startswith(
+        "more than {0} reserves: RuntimeError".format(MAX_RESERVES)
+    )
+
+
+def test_kick(worker, queue, datastore):
+    jids = [queue.put("missing-%d" % i) for i in range(3)]
+    for _ in jids:
+        run_until_buried(worker)
+
+    assert queue.reserve(timeout=0) is None
+    assert worker.deadLetters.kick(jids[:1]) == jids[:1]
+    assert [e['jid'] for e in worker.deadLetters.list()] == jids[1:]
+    assert queue.reserve(timeout=0).jid == jids[0]
+
+    # entries kicked by other means are dropped from the list
+    queue.do_bean("kick_job", jids[1])
+    assert [e['jid'] for e in worker.deadLetters.list()] == jids[2:]
+
+    assert worker.deadLetters.kick() == jids[2:]
+    assert worker.deadLetters.list() == []
+
+
+def test_kick_all_is_bulk(worker, queue):
+    jids = [queue.put("missing-%d" % i) for i in range(3)]
+    for _ in jids:
+        run_until_buried(worker)
+    delayed = queue.put("later", delay=60)
+
+    # one kick command for all the buried entries, which leaves delayed
+    # entries alone
+    kicks = queue.do_bean("stats")['cmd-kick']
+    assert worker.deadLetters.kick() == jids
+    assert queue.do_bean("stats")['cmd-kick'] == kicks + 1
+    assert queue.do_bean("stats_job", delayed)['state'] == "delayed"
+    assert queue.do_bean("stats_tube", queue.queueName)[
+        'current-jobs-ready'
+    ] == 3
+
+
+def test_records_are_capped(worker, queue, monkeypatch):
+    monkeypatch.setattr(zerog.deadletters, "MAX_ENTRIES", 2)
+    jids = []
+    for i in range(3):
+        jids.append(queue.put("missing-%d" % i))
+        worker.deadLetters.bury(queue.reserve(timeout=0), "job not found")
+
+    # the oldest record is dropped, but its entry is still kicked
+    assert [e['jid'] for e in worker.deadLetters.list()] == jids[1:]
+    assert worker.deadLetters.kick() == jids[1:]
+    assert queue.do_bean("stats_tube", queue.queueName)[
+        'current-jobs-buried'
+    ] == 0
+
+
+@pytest.fixture
+def app(mock_app):
+    return mock_app([GoodJob], HANDLERS)
+
+
+@pytest.mark.gen_test
+def test_handler(app, http_client, base_url):
+    queue = app.jobQueue
+    jids = []
+    for i in range(2):
+        jids.append(queue.put("missing-%d" % i))
+        app.deadLetters.bury(queue.reserve(timeout=0), "job not found")
+
+    url = "%s/deadletters" % base_url
+    response = yield http_client.fetch(url)
+    entries = json.loads(response.body)['entries']
+    assert [e['jid'] for e in entries] == jids
+
+    response = yield http_client.fetch(
+        url, method="POST", body=json.dumps(dict(jids=jids[:1]))
+    )
+    assert json.loads(response.body) == dict(kicked=jids[:1])
+
+    response = yield http_client.fetch(url, method="POST", body="")
+    assert json.loads(response.body) == dict(kicked=jids[1:])
+    assert queue.do_bean("stats")['current-jobs-ready'] == 2
+
+
+def test_worker_manager(beanstalkd, datastore):
+    queue = zerog.BeanstalkdQueue(
+        beanstalkd.host, beanstalkd.port, "zerog_test_jobs"
+    )
+    deadLetters = zerog.DeadLetters(datastore, queue)
+    jid = queue.put("missing")
+    deadLetters.bury(queue.reserve(timeout=0), "job not found")
+
+    manager = WorkerManager(beanstalkd.host, beanstalkd.port, datastore)
+    entries = manager.list_dead_letters("zerog_test")
+    assert [e['jid'] for e in entries] == [jid]
+    assert manager.kick_dead_letters("zerog_test") == [jid]
+    assert queue.reserve(timeout=0).jid == jid
+
+    with pytest.raises(ValueError):
+        WorkerManager(beanstalkd.host, beanstalkd.port).list_dead_letters(
+            "zerog_test"
+        )
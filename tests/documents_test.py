@@ -0,0 +1,97 @@
+import pytest
+
+from zerog.datastores.codecs import JsonCodec
+from zerog.datastores import ExecutorDatastore
+from zerog.datastores.documents import update_document
+from zerog.datastores.mock_datastore import MockDatastore
+from zerog.datastores.sqlite_datastore import SqliteDatastore
+
+
+class CollidingDatastore(MockDatastore):
+    """
+    MockDatastore whose next writes collide with another process. Encodes
+    documents so that reads return copies, like a real datastore
+    """
+    def __init__(self, collisions):
+        super(CollidingDatastore, self).__init__(codec=JsonCodec())
+        self.collisions = collisions
+
+    def set_with_cas(self, key, value, **kwargs):
+        if self.collisions:
+            self.collisions -= 1
+            raise self.casException
+
+        return super(CollidingDatastore, self).set_with_cas(
+            key, value, **kwargs
+        )
+
+
+class CasOnlyDatastore(MockDatastore):
+    """
+    Datastore that, like some custom datastores, doesn't define an
+    existsException
+    """
+    def __getattribute__(self, name):
+        if name == "existsException":
+            raise AttributeError(name)
+
+        return super(CasOnlyDatastore, self).__getattribute__(name)
+
+
+def increment(data):
+    doc = data or dict(count=0)
+    doc['count'] += 1
+    return doc
+
+
+def test_update_document():
+    datastore = MockDatastore()
+    assert update_document(datastore, "doc", increment)
+    assert update_document(datastore, "doc", increment)
+    assert datastore.read("doc") == dict(count=2)
+
+    assert not update_document(datastore, "doc", lambda data: None)
+    assert datastore.read("doc") == dict(count=2)
+
+
+def test_collisions_retry():
+    datastore = CollidingDatastore(collisions=2)
+    datastore.create("doc", dict(count=0))
+    assert update_document(datastore, "doc", increment)
+    assert datastore.read("doc") == dict(count=1)
+
+    datastore.collisions = 3
+    assert not update_document(datastore, "doc", increment, tries=3)
+
+
+def test_concurrent_create_retries(tmp_path):
+    datastore = SqliteDatastore(str(tmp_path / "docs.sqlite"))
+    calls = []
+
+    def create_first(data):
+        # another process creates the document before this one
+        if not calls:
+            datastore.create("doc", dict(count=5))
+        calls.append(data)
+        return increment(data)
+
+    assert update_document(datastore, "doc", create_first)
+    assert calls[0] is None
+    assert datastore.read("doc") == dict(count=6)
+
+
+def test_other_errors_raise():
+    def fail(data):
+        raise ValueError("bad document")
+
+    with pytest.raises(ValueError):
+        update_document(MockDatastore(), "doc", fail)
+
+
+def test_no_exists_exception():
+    datastore = CasOnlyDatastore()
+    assert update_document(datastore, "doc", increment)
+    assert datastore.read("doc") == dict(count=1)
+
+    executor = ExecutorDatastore(datastore)
+    assert executor.existsException is datastore.casException
@@ -0,0 +1,220 @@
+import multiprocessing
+import pytest
+import threading
+import time
+
+from zerog.queues.beanstalk_client import CommandFailed, DeadlineSoon
+from zerog.queues.beanstalk_queue import BeanstalkdQueue
+from zerog.queues.emulator import BeanstalkEmulator
+from zerog.queues.mock_queue import MockQueue
+
+CONSUMERS = 4
+JOBS = 200
+
+
+@pytest.fixture
+def emulator():
+    return BeanstalkEmulator()
+
+
+@pytest.fixture
+def queue(emulator):
+    return MockQueue(emulator, "jobs")
+
+
+def test_priority_order(queue):
+    queue.put("low", priority=100)
+    queue.put("high", priority=1)
+    queue.put("also low", priority=100)
+
+    bodies = [queue.reserve(timeout=0).body for _ in range(3)]
+    assert bodies == ['"high"', '"low"', '"also low"']
+    assert queue.reserve(timeout=0) is None
+
+
+def test_delay(queue):
+    queue.put("later", delay=0.2)
+    assert queue.reserve(timeout=0) is None
+    assert queue.do_bean("peek_delayed").body == '"later"'
+
+    start = time.time()
+    job = queue.reserve(timeout=2)
+    assert job.body == '"later"'
+    assert time.time() - start >= 0.1
+
+
+def test_release_with_delay(queue):
+    queue.put("retry")
+    queue.reserve(timeout=0).release(delay=0.2)
+    assert queue.reserve(timeout=0) is None
+
+    job = queue.reserve(timeout=2)
+    assert job.stats()['releases'] == 1
+
+
+def test_ttr_expiry(queue):
+    queue.put("slow", ttr=1)
+    job = queue.reserve(timeout=0)
+
+    # another client gets the job once its ttr runs out
+    other = MockQueue(queue.emulator, "jobs")
+    again = other.reserve(timeout=3)
+    assert again.jid == job.jid
+
+    stats = again.stats()
+    assert stats['reserves'] == 2
+    assert stats['timeouts'] == 1
+
+    with pytest.raises(CommandFailed):
+        job.delete()
+
+
+def test_deadline_soon(queue):
+    queue.put("slow", ttr=1)
+    queue.reserve(timeout=0)
+
+    with pytest.raises(DeadlineSoon):
+        queue.reserve(timeout=0)
+
+
+def test_touch(queue):
+    queue.put("slow", ttr=2)
+    job = queue.reserve(timeout=0)
+    time.sleep(0.5)
+    job.touch()
+    assert job.stats()['time-left'] >= 1
+
+
+def test_release_bury_priority(queue):
+    queue.put("job", priority=100)
+    job = queue.reserve(timeout=0)
+    job.release()
+    assert job.stats()['pri'] == 100
+
+    # priority 0 is kept, not replaced by the job's priority
+    job = queue.reserve(timeout=0)
+    job.release(priority=0)
+    assert job.stats()['pri'] == 0
+
+    job = queue.reserve(timeout=0)
+    job.bury()
+    assert job.stats()['pri'] == 0
+    job.kick()
+
+    job = queue.reserve(timeout=0)
+    job.bury(priority=5)
+    assert job.stats()['pri'] == 5
+
+
+def test_bury_and_kick(queue):
+    for i in range(3):
+        queue.put(i)
+
+    for _ in range(3):
+        queue.reserve(timeout=0).bury()
+
+    assert queue.reserve(timeout=0) is None
+    assert queue.do_bean("stats_tube", "jobs")['current-jobs-buried'] == 3
+    assert queue.do_bean("peek_buried").body == "0"
+
+    assert queue.do_bean("kick", 2) == 2
+    assert queue.do_bean("stats_tube", "jobs")['current-jobs-ready'] == 2
+
+
+def test_tubes(emulator):
+    jobs = MockQueue(emulator, "jobs")
+    ctrl = MockQueue(emulator, "ctrl")
+
+    jobs.put("job")
+    jobs.put_to("ctrl", "msg")
+    msg = ctrl.reserve(timeout=0)
+    assert msg.body == '"msg"'
+    msg.delete()
+    assert ctrl.reserve(timeout=0) is None
+
+    assert jobs.list_all_queues() == ["ctrl", "jobs"]
+    assert jobs.do_bean("stats_tube", "ctrl")['current-watching'] == 1
+
+    # watching several tubes
+    ctrl.bean.watch("jobs")
+    assert ctrl.reserve(timeout=0).body == '"job"'
+
+    ctrl.close()
+    assert jobs.list_all_queues() == ["jobs"]
+    with pytest.raises(CommandFailed):
+        jobs.do_bean("stats_tube", "ctrl")
+
+
+def test_close_releases_reserved(queue):
+    queue.put("job")
+    queue.reserve(timeout=0)
+    other = MockQueue(queue.emulator, "jobs")
+    assert other.reserve(timeout=0) is None
+
+    queue.close()
+    assert other.reserve(timeout=0).body == '"job"'
+
+
+def test_blocking_reserve(queue):
+    other = MockQueue(queue.emulator, "jobs")
+    timer = threading.Timer(0.2, other.put, args=("wake up",))
+    timer.start()
+
+    # MockQueue.reserve doesn't block unless asked to
+    assert queue.reserve() is None
+    job = queue.reserve(timeout=None)
+    assert job.body == '"wake up"'
+
+
+def test_pause_tube(queue):
+    queue.put("job")
+    queue.do_bean("pause_tube", "jobs", 0.3)
+    assert queue.reserve(timeout=0) is None
+    assert queue.reserve(timeout=2).body == '"job"'
+
+
+def test_stats(queue):
+    queue.put("a")
+    queue.put("b", delay=10)
+    queue.reserve(timeout=0)
+
+    stats = queue.do_bean("stats")
+    assert stats['current-jobs-reserved'] == 1
+    assert stats['current-jobs-delayed'] == 1
+    assert stats['cmd-put'] == 2
+    assert stats['total-jobs'] == 2
+    assert stats['current-connections'] == 1
+
+
+def consume(port, results):
+    queue = BeanstalkdQueue("127.0.0.1", port, "jobs")
+    while True:
+        job = queue.reserve(timeout=0)
+        if job is None:
+            return
+
+        results.put(job.body)
+        job.delete()
+
+
+def test_consumers_across_processes(beanstalkd):
+    queue = BeanstalkdQueue("127.0.0.1", beanstalkd.port, "jobs")
+    queue.put_many(list(range(JOBS)))
+
+    results = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(
+            target=consume, args=(beanstalkd.port, results)
+        )
+        for _ in range(CONSUMERS)
+    ]
+    for proc in procs:
+        proc.start()
+
+    bodies = [results.get(timeout=30) for _ in range(JOBS)]
+    for proc in procs:
+        proc.join()
+
+    # every job was reserved exactly once
+    assert sorted(int(body) for body in bodies) == list(range(JOBS))
+    assert queue.do_bean("stats")['current-jobs-ready'] == 0
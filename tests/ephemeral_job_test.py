@@ -0,0 +1,252 @@
+import atexit
+import json
+import multiprocessing
+import pytest
+import time
+
+import zerog
+from zerog.datastores.mock_datastore import MockDatastore
+from zerog.jobs import INTERNAL_ERROR, NO_RESULT, enqueue_jobs, make_key
+from zerog.jobs.base import MAX_INLINE_SIZE
+from zerog.queues.emulator import BeanstalkEmulator
+from zerog.queues.mock_queue import MockQueue
+
+from tests.job_classes import (
+    EphemeralJob,
+    EphemeralResultJob,
+    EphemeralRequeueJob,
+    EphemeralExceptionJob,
+    EphemeralSleepJob,
+    GoodJob
+)
+
+JOB_CLASSES = [
+    EphemeralJob,
+    EphemeralResultJob,
+    EphemeralRequeueJob,
+    EphemeralExceptionJob,
+    EphemeralSleepJob,
+    GoodJob
+]
+
+
+class CountingMockDatastore(MockDatastore):
+    """
+    mock datastore that counts reads & writes
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reads = 0
+        self.writes = 0
+
+    def read_with_cas(self, key, **kwargs):
+        self.reads += 1
+        return super().read_with_cas(key, **kwargs)
+
+    def set_with_cas(self, key, value, **kwargs):
+        self.writes += 1
+        return super().set_with_cas(key, value, **kwargs)
+
+
+@pytest.fixture
+def datastore():
+    return CountingMockDatastore()
+
+
+@pytest.fixture
+def queue():
+    return MockQueue(BeanstalkEmulator(), "zerog_test_jobs")
+
+
+@pytest.fixture
+def registry():
+    registry = zerog.JobRegistry()
+    registry.add_classes(JOB_CLASSES)
+    return registry
+
+
+@pytest.fixture
+def worker(datastore, queue, registry):
+    parentConn, childConn = multiprocessing.Pipe()
+    worker = zerog.BaseWorker(
+        "zerog_test",
+        lambda: datastore,
+        lambda queueName: MockQueue(queue.emulator, queueName),
+        registry,
+        childConn
+    )
+    worker.run_init()
+    worker.parentConn = parentConn     # keep the pipe open
+    return worker
+
+
+@pytest.fixture
+def make_job(datastore, queue, registry):
+    def _func(jobClass, **data):
+        return registry.make_job(
+            data, datastore, queue, jobType=jobClass.JOB_TYPE
+        )
+
+    return _func
+
+
+def run_next(worker):
+    queueJob = worker.queue.reserve(timeout=0)
+    worker._process_queue_job(queueJob)
+    return queueJob
+
+
+def test_enqueue_inline(make_job, datastore, queue):
+    job = make_job(EphemeralJob, goodness="great")
+    job.enqueue()
+
+    assert job.inline
+    assert datastore.writes == 0
+    assert job.queueJobId > 0
+
+    body = json.loads(queue.reserve(timeout=0).body)
+    assert body['uuid'] == job.uuid
+    assert body['goodness'] == "great"
+
+
+def test_run_inline(make_job, worker, datastore):
+    make_job(EphemeralJob).enqueue()
+    run_next(worker)
+
+    # the job ran without being read or written
+    assert datastore.reads == 0
+    assert datastore.writes == 0
+    assert worker.queue.reserve(timeout=0) is None
+
+
+def test_persist_result(make_job, worker, datastore):
+    job = make_job(EphemeralResultJob)
+    job.enqueue()
+    run_next(worker)
+
+    assert datastore.reads == 0
+    data, _ = datastore.read_with_cas(make_key(job.uuid))
+    assert data['resultCode'] == 200
+    assert data['completeness'] == 1
+    assert data['running'] is False
+
+
+def test_requeue_persists(make_job, worker, datastore):
+    job = make_job(EphemeralRequeueJob)
+    job.enqueue()
+    run_next(worker)
+
+    # requeued by uuid once it's in the datastore
+    data, _ = datastore.read_with_cas(make_key(job.uuid))
+    assert data['resultCode'] == NO_RESULT
+    queueJob = worker.queue.reserve(timeout=2)
+    assert json.loads(queueJob.body) == job.uuid
+
+    worker._process_queue_job(queueJob)
+    job.reload()
+    assert job.resultCode == 200
+
+
+def test_error_persists(make_job, worker, datastore):
+    job = make_job(EphemeralExceptionJob)
+    job.enqueue()
+    run_next(worker)
+
+    job.reload()
+    assert job.errorCount == 1
+    assert job.resultCode == NO_RESULT
+    assert job.queueJobId > 0
+
+
+def test_too_big_is_saved(make_job, datastore, queue):
+    job = make_job(EphemeralJob, goodness="x" * MAX_INLINE_SIZE)
+    job.enqueue()
+
+    assert not job.inline
+    assert datastore.writes > 0
+    assert json.loads(queue.reserve(timeout=0).body) == job.uuid
+
+
+def test_enqueue_jobs_mixed(make_job, worker, datastore):
+    ephemeral = [make_job(EphemeralJob) for _ in range(3)]
+    good = make_job(GoodJob)
+    enqueue_jobs(ephemeral + [good])
+
+    assert all(job.queueJobId > 0 for job in ephemeral + [good])
+    assert list(datastore.db) == [good.key()]
+
+    for _ in range(4):
+        run_next(worker)
+
+    good.reload()
+    assert good.resultCode == 200
+    assert list(datastore.db) == [good.key()]
+
+
+def crash(worker):
+    # as if the worker running the next entry had died: its reservation
+    # is released without the entry being deleted
+    worker.queue.reserve(timeout=0).release()
+
+
+def test_crash_is_recorded(make_job, worker, datastore):
+    job = make_job(EphemeralJob)
+    job.enqueue()
+    crash(worker)
+    run_next(worker)
+
+    # the job was persisted, so the crash counts towards MAX_ERRORS
+    job.reload()
+    assert job.errorCount == 1
+    assert job.resultCode == 200
+    assert job.running is False
+    assert worker.queue.reserve(timeout=0) is None
+
+
+def test_crash_loop_finishes(make_job, worker, datastore):
+    job = make_job(EphemeralJob)
+    job.enqueue()
+
+    # persisted & running after earlier crashes
+    job.errorCount = job.MAX_ERRORS - 1
+    job.running = True
+    job.persist()
+
+    crash(worker)
+    run_next(worker)
+    job.reload()
+    assert job.errorCount == job.MAX_ERRORS
+    assert job.resultCode == INTERNAL_ERROR
+    assert worker.queue.reserve(timeout=0) is None
+
+
+def test_kill_inline_job(beanstalkd):
+    datastore = MockDatastore()
+
+    def make_queue(queueName):
+        return zerog.BeanstalkdQueue(
+            beanstalkd.host, beanstalkd.port, queueName
+        )
+
+    app = zerog.Server(
+        "zerog_test", lambda: datastore, make_queue, JOB_CLASSES, [],
+        thisHost="zerog"
+    )
+    try:
+        job = app.make_job(dict(delay=30), EphemeralSleepJob.JOB_TYPE)
+        job.enqueue()
+        for _ in range(100):
+            app.do_poll()
+            if app.runningJobUuid:
+                break
+            time.sleep(0.1)
+        assert app.runningJobUuid == job.uuid
+
+        # the job isn't in the datastore, so its entry is deleted
+        app.kill_job()
+        stats = app.jobQueue.do_bean("stats_tube", "zerog_test_jobs")
+        assert stats['current-jobs-ready'] == 0
+        assert stats['current-jobs-reserved'] == 0
+    finally:
+        app.proc.kill()
+        atexit.unregister(app.exit_handler)
@@ -0,0 +1,116 @@
+import atexit
+import pytest
+import tornado.gen
+import tornado.ioloop
+
+import zerog
+from zerog.datastores.mock_datastore import MockDatastore
+from zerog.mgmt import WorkerManager, make_msg, make_worker_id
+
+from tests.job_classes import GoodJob
+
+
+@pytest.fixture
+def make_app(beanstalkd):
+    servers = []
+
+    def _func(thisHost="zerog"):
+        datastore = MockDatastore()
+
+        def make_queue(queueName):
+            return zerog.BeanstalkdQueue(
+                beanstalkd.host, beanstalkd.port, queueName
+            )
+
+        server = zerog.Server(
+            "zerog_test", lambda: datastore, make_queue, [GoodJob], [],
+            thisHost=thisHost
+        )
+        servers.append(server)
+        return server
+
+    yield _func
+    for server in servers:
+        server.proc.kill()
+        atexit.unregister(server.exit_handler)
+
+
+def poll_later(*apps):
+    # the servers handle their control messages while gather waits
+    async def poll():
+        await tornado.gen.sleep(0.05)
+        for app in apps:
+            app.do_poll()
+            app.do_broadcast_poll()
+
+    tornado.ioloop.IOLoop.current().spawn_callback(poll)
+
+
+@pytest.mark.gen_test
+def test_gather_info(beanstalkd, make_app):
+    apps = [make_app("host1"), make_app("host2")]
+    manager = WorkerManager(beanstalkd.host, beanstalkd.port)
+    manager.poll_updates_channel()
+
+    poll_later(*apps)
+    replies = yield manager.gather("requestInfo", timeout=5)
+    assert set(replies) == {app.workerId for app in apps}
+    assert all(r.msgtype == "info" for r in replies.values())
+    assert replies[apps[0].workerId].mem['available'] > 0
+
+    # requests with replies don't also send info on the updates channel
+    manager.poll_updates_channel()
+    assert manager.updatesChannel.get_msg() is None
+
+
+@pytest.mark.gen_test
+def test_gather_acks(beanstalkd, make_app):
+    app = make_app()
+    manager = WorkerManager(beanstalkd.host, beanstalkd.port)
+    manager.poll_updates_channel()
+
+    poll_later(app)
+    replies = yield manager.gather("drain", workerIds=[app.workerId])
+    assert replies[app.workerId].state == "drainingIdle"
+    assert manager.workers[app.workerId]['state'] == "drainingIdle"
+
+
+@pytest.mark.gen_test
+def test_gather_deadline(beanstalkd, make_app):
+    app = make_app()
+    manager = WorkerManager(beanstalkd.host, beanstalkd.port)
+    manager.poll_updates_channel()
+    missing = make_worker_id("zerog", "zerog", "zerog_test", 1)
+
+    # the missing worker never replies, so gather returns at the deadline
+    poll_later(app)
+    replies = yield manager.gather(
+        "requestInfo", workerIds=[app.workerId, missing], timeout=0.5
+    )
+    assert list(replies) == [app.workerId]
+
+    # and the expired request is dropped by the worker
+    app.do_poll()
+    queue = manager.get_queue(manager.replyTube)
+    assert queue.do_bean("stats_tube", manager.replyTube)[
+        'current-jobs-ready'
+    ] == 0
+
+
+def test_expired_requests_are_dropped(beanstalkd, make_app):
+    app = make_app()
+    manager = WorkerManager(beanstalkd.host, beanstalkd.port)
+    manager.send_ctrl_msg(app.workerId, make_msg("drain", expiresAt=1))
+    app.do_poll()
+    assert app.state == "activeIdle"
+
+
+def test_dead_workers_are_purged(beanstalkd):
+    manager = WorkerManager(beanstalkd.host, beanstalkd.port)
+    dead = make_worker_id("zerog", "host1", "zerog_test", 1)
+    manager.workerTable.update(dead, 10, now=0, state="activeIdle")
+    manager.send_ctrl_msg(dead, make_msg("drain"))
+
+    manager.known_workers()
+    assert manager.workers == {}
+    assert dead not in manager.queue.do_bean("tubes")
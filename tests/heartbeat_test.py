@@ -0,0 +1,130 @@
+import atexit
+import pytest
+
+import zerog
+from zerog.datastores.mock_datastore import MockDatastore
+from zerog.mgmt import WorkerManager, make_worker_id
+from zerog.mgmt.messages import peek_broadcasts
+from zerog.mgmt.utils import make_broadcast_tube
+from zerog.mgmt.workertable import WorkerTable
+
+from tests.job_classes import GoodJob
+
+
+def worker_id(host, pid):
+    return make_worker_id("zerog", host, "zerog_test", pid)
+
+
+def test_worker_table_expiry():
+    table = WorkerTable(misses=3)
+    a, b = worker_id("host1", 1), worker_id("host1", 2)
+    table.update(a, 10, now=0, state="activeIdle")
+    table.update(b, 10, now=0, state="activeIdle")
+    assert table.on_host("host1") == [a, b]
+
+    # b keeps sending heartbeats, a stops
+    table.update(b, 10, now=20)
+    assert table.expire(now=29) == []
+    assert table.expire(now=30) == [a]
+    assert table.on_host("host1") == [b]
+
+    assert table.expire(now=49) == []
+    assert table.expire(now=50) == [b]
+    assert table.hosts() == []
+    assert table.workers == {}
+
+
+def test_worker_table_goodbye():
+    table = WorkerTable()
+    a = worker_id("host1", 1)
+    table.update(a, 10, now=0, state="activeIdle")
+    table.update(a, 0)
+    assert table.workers == {}
+    assert table.hosts() == []
+
+    # coming back after a goodbye, with a shorter interval
+    table.update(a, 1, now=5, state="activeRunning")
+    assert table.expire(now=7) == []
+    assert table.expire(now=8) == [a]
+    assert table.expire(now=100) == []
+
+
+def test_worker_table_info():
+    table = WorkerTable(misses=2)
+    a = worker_id("host1", 1)
+    table.update(a, 60, now=0, state="activeIdle")
+
+    # info messages keep the worker's heartbeat interval
+    table.update(a, now=10, state="drainingIdle", mem=dict(used=1))
+    assert table.expire(now=100) == []
+    assert table.workers[a]['state'] == "drainingIdle"
+    assert table.workers[a]['mem'] == dict(used=1)
+
+    # ids that aren't worker ids are ignored
+    table.update("not a worker", 10, now=0)
+    assert list(table.workers) == [a]
+
+
+@pytest.fixture
+def app(beanstalkd):
+    datastore = MockDatastore()
+
+    def make_queue(queueName):
+        return zerog.BeanstalkdQueue(
+            beanstalkd.host, beanstalkd.port, queueName
+        )
+
+    server = zerog.Server(
+        "zerog_test",
+        lambda: datastore,
+        make_queue,
+        [GoodJob],
+        [],
+        thisHost="zerog"
+    )
+    yield server
+    server.proc.kill()
+    atexit.unregister(server.exit_handler)    # the emulator is gone by then
+
+
+def test_worker_manager(beanstalkd, app):
+    manager = WorkerManager(beanstalkd.host, beanstalkd.port)
+    manager.poll_updates_channel()
+
+    workers = manager.workers_by_host()
+    assert list(workers) == ["zerog"]
+    assert [w['workerId'] for w in workers["zerog"]] == [app.workerId]
+    assert workers["zerog"][0]['state'] == "activeIdle"
+    assert manager.known_workers()[app.workerId]['host'] == "zerog"
+
+    manager.drain_host("zerog")
+    app.do_broadcast_poll()
+    app.send_heartbeat()
+    manager.poll_updates_channel()
+    assert manager.states_by_host() == {"zerog": ["drainingIdle"]}
+
+    app.send_heartbeat(interval=0)
+    manager.poll_updates_channel()
+    assert manager.workers == {}
+    assert manager.workers_by_host() == {}
+
+
+def test_info_is_pushed(beanstalkd, app):
+    manager = WorkerManager(beanstalkd.host, beanstalkd.port)
+    manager.poll_updates_channel()
+    assert manager.workers[app.workerId]['mem']['available'] > 0
+
+    # state changes are published without a request
+    manager.drain_host("zerog", retire=True)
+    app.do_broadcast_poll()
+    manager.poll_updates_channel()
+    worker = manager.workers[app.workerId]
+    assert worker['state'] == "drainingIdle"
+    assert worker['retiring'] is True
+
+    # so requests only go to hosts with workers whose info is stale
+    tube = make_broadcast_tube("host", "zerog")
+    manager.request_updates()
+    assert len(peek_broadcasts(manager.queue, tube)) == 1
+    manager.request_updates(maxAge=0)
+    assert len(peek_broadcasts(manager.queue, tube)) == 2
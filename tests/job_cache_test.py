@@ -0,0 +1,209 @@
+import json
+import pytest
+import time
+
+from zerog.blobstores import MockBlobstore
+from zerog.cache import JobCache
+from zerog.datastores.mock_datastore import MockDatastore
+from zerog.handlers.stats import JobCacheStatsHandler
+from zerog.handlers.uuid import ProgressHandler, UUID_PATT
+from zerog.queues.mock_queue import MockQueue
+
+from tests.job_classes import BlobJob, GoodJob
+
+HANDLERS = [
+    ("/progress/%s" % UUID_PATT, ProgressHandler),
+    ("/cachestats", JobCacheStatsHandler)
+]
+
+
+class CountingMockDatastore(MockDatastore):
+    """
+    mock datastore that counts document reads & cas lookups
+    """
+    def __init__(self):
+        super(CountingMockDatastore, self).__init__()
+        self.reads = 0
+        self.casReads = 0
+
+    def read_with_cas(self, key, **kwargs):
+        self.reads += 1
+        return super(CountingMockDatastore, self).read_with_cas(key, **kwargs)
+
+    def read_cas(self, key, **kwargs):
+        self.casReads += 1
+        return super(CountingMockDatastore, self).read_cas(key, **kwargs)
+
+
+class NoCasReadDatastore(CountingMockDatastore):
+    """
+    mock datastore without read_cas, like some custom datastores
+    """
+    def __getattribute__(self, name):
+        if name == "read_cas":
+            raise AttributeError(name)
+
+        return super(NoCasReadDatastore, self).__getattribute__(name)
+
+
+@pytest.fixture
+def datastore():
+    return CountingMockDatastore()
+
+
+@pytest.fixture
+def app(mock_app, datastore):
+    return mock_app([GoodJob], HANDLERS, datastore=datastore)
+
+
+def save_good_job(datastore, **kwargs):
+    job = GoodJob(datastore, MockQueue(), **kwargs)
+    job.save()
+    return job
+
+
+def test_running_job_revalidated(app, datastore):
+    job = save_good_job(datastore)
+
+    first = app.get_job(job.uuid)
+    second = app.get_job(job.uuid)
+
+    assert first is not second
+    assert second.uuid == job.uuid
+    assert datastore.reads == 1
+    assert datastore.casReads == 1
+
+    stats = app.jobCache.stats()
+    assert stats['misses'] == 1
+    assert stats['hits'] == 1
+    assert stats['revalidations'] == 1
+
+
+@pytest.mark.gen_test
+def test_revalidated_without_read_cas(mock_app):
+    datastore = NoCasReadDatastore()
+    app = mock_app([GoodJob], HANDLERS, datastore=datastore)
+    job = save_good_job(datastore)
+
+    app.get_job(job.uuid)
+    assert app.get_job(job.uuid).uuid == job.uuid
+    yield app.async_get_job(job.uuid)
+    job.update_attrs(completeness=0.5)
+    assert app.get_job(job.uuid).completeness == 0.5
+
+    stats = app.jobCache.stats()
+    assert stats['revalidations'] == 2
+    assert stats['stale'] == 1
+
+
+def test_running_job_changed(app, datastore):
+    job = save_good_job(datastore)
+
+    app.get_job(job.uuid)
+    job.update_attrs(completeness=0.5)
+    updated = app.get_job(job.uuid)
+
+    assert updated.completeness == 0.5
+    assert datastore.reads == 2
+    assert app.jobCache.stats()['stale'] == 1
+
+
+def test_running_job_ttl(app, datastore):
+    app.jobCache.ttl = 0
+    job = save_good_job(datastore)
+
+    app.get_job(job.uuid)
+    time.sleep(0.01)
+    app.get_job(job.uuid)
+
+    assert datastore.reads == 2
+    assert datastore.casReads == 0
+
+
+def test_completed_job_not_revalidated(app, datastore):
+    job = save_good_job(datastore)
+    job.update_attrs(resultCode=200, completeness=1)
+
+    app.get_job(job.uuid)
+    cached = app.get_job(job.uuid)
+
+    assert cached.resultCode == 200
+    assert datastore.reads == 1
+    assert datastore.casReads == 0
+
+
+def test_cached_job_isolated(app, datastore):
+    job = save_good_job(datastore)
+    job.update_attrs(resultCode=200)
+
+    first = app.get_job(job.uuid)
+    first.events.append("not in the cache")
+    second = app.get_job(job.uuid)
+
+    assert "not in the cache" not in second.events
+
+
+def test_cached_blobs_not_loaded(mock_app, datastore):
+    datastore.blobstore = MockBlobstore()
+    app = mock_app([BlobJob], HANDLERS, datastore=datastore)
+    job = BlobJob(datastore, MockQueue(), bigInput=dict(big="x" * 1000))
+    job.save()
+    job.update_attrs(resultCode=200)
+
+    first = app.get_job(job.uuid)
+    assert first.bigInput.value == dict(big="x" * 1000)
+
+    # the value first loaded isn't shared with the cache or other jobs
+    entry = app.jobCache.lookup(job.uuid)
+    assert entry.loaded['bigInput'].loaded is False
+    second = app.get_job(job.uuid)
+    assert second.bigInput is not first.bigInput
+    assert second.bigInput.loaded is False
+    assert second.bigInput.value == dict(big="x" * 1000)
+    assert entry.loaded['bigInput'].loaded is False
+
+
+def test_missing_job(app, datastore):
+    assert app.get_job("not-a-job") is None
+    assert len(app.jobCache) == 0
+
+
+def test_eviction(datastore):
+    cache = JobCache(maxBytes=1000)
+    jobs = [save_good_job(datastore, goodness="x" * 200) for _ in range(5)]
+
+    for job in jobs:
+        data, cas = datastore.read_with_cas(job.key())
+        cache.store(job.uuid, GoodJob, data, cas, data)
+
+    assert cache.totalBytes <= 1000
+    assert cache.evictions > 0
+    assert cache.lookup(jobs[0].uuid) is None
+    assert cache.lookup(jobs[-1].uuid) is not None
+
+
+def test_disabled(datastore):
+    cache = JobCache(maxBytes=0)
+    job = save_good_job(datastore)
+    data, cas = datastore.read_with_cas(job.key())
+    cache.store(job.uuid, GoodJob, data, cas, data)
+
+    assert len(cache) == 0
+
+
+@pytest.mark.gen_test
+def test_stats_handler(app, http_client, base_url, datastore):
+    job = save_good_job(datastore)
+
+    for _ in range(3):
+        response = yield http_client.fetch(
+            "%s/progress/%s" % (base_url, job.uuid)
+        )
+        assert response.code == 200
+
+    response = yield http_client.fetch("%s/cachestats" % base_url)
+    stats = json.loads(response.body)
+
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+    assert stats['entries'] == 1
@@ -1,7 +1,7 @@
 from marshmallow import fields
 import time
 
-from zerog.jobs import BaseJob, BaseJobSchema, NO_RESULT
+from zerog.jobs import BaseJob, BaseJobSchema, Blob, NO_RESULT
 
 
 class GoodJobSchema(BaseJobSchema):
@@ -26,6 +26,28 @@ class GoodJob(BaseJob):
         return data
 
 
+class BlobJobSchema(BaseJobSchema):
+    bigInput = Blob()
+    bigResult = Blob(allow_none=True)
+
+
+class BlobJob(BaseJob):
+    JOB_TYPE = "blob_test_job"
+    SCHEMA = BlobJobSchema
+
+    def __init__(self, *args, **kwargs):
+        super(BlobJob, self).__init__(*args, **kwargs)
+        self.bigInput = kwargs.get("bigInput")
+        self.bigResult = kwargs.get("bigResult")
+
+    def run(self):
+        self.bigResult = dict(count=len(self.bigInput.value))
+        return 200, None
+
+    def get_data(self):
+        return self.bigResult.value
+
+
 class SleepJobSchema(BaseJobSchema):
     delay = fields.Integer(missing=5)
 
@@ -161,3 +183,48 @@ class ErrorFinishJob(BaseJob):
 
     def run(self):
         self.raise_error_finish(self.errorCode, self.msg)
+
+
+class EphemeralJob(GoodJob):
+    JOB_TYPE = "ephemeral_test_job"
+    EPHEMERAL = True
+
+
+class EphemeralResultJob(GoodJob):
+    JOB_TYPE = "ephemeral_result_test_job"
+    EPHEMERAL = True
+    PERSIST_RESULT = True
+
+
+class EphemeralRequeueJob(RequeueJob):
+    JOB_TYPE = "ephemeral_requeue_test_job"
+    EPHEMERAL = True
+
+
+class EphemeralExceptionJob(ExceptionJob):
+    JOB_TYPE = "ephemeral_exception_test_job"
+    EPHEMERAL = True
+
+
+class EphemeralSleepJob(SleepJob):
+    JOB_TYPE = "ephemeral_sleep_test_job"
+    EPHEMERAL = True
+
+
+class WaitJob(BaseJob):
+    JOB_TYPE = "wait_test_job"
+    SCHEMA = BaseJobSchema
+
+    signalName = "wait_test_signal"
+    readyKey = "wait_test_ready"
+
+    def run(self):
+        if not self.datastore.read_with_cas(self.readyKey)[0]:
+            return self.wait_for_signal(self.signalName)
+
+        return 200, None
+
+
+class CheckpointJob(SleepJob):
+    JOB_TYPE = "checkpoint_test_job"
+    CHECKPOINTS = True
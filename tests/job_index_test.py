@@ -0,0 +1,250 @@
+import datetime
+import json
+import pytest
+import time
+
+from zerog.archive import JobArchiver, archive_jobs
+from zerog.datastores.mock_datastore import MockDatastore
+from zerog.datastores.sqlite_datastore import SqliteDatastore
+from zerog.handlers.job_list import JobListHandler
+from zerog.jobindex import JobIndex
+from zerog.queues.mock_queue import MockQueue
+
+from tests.job_classes import GoodJob
+
+HANDLERS = [("/jobs", JobListHandler)]
+NOW = datetime.datetime.utcnow()
+
+
+class ExpiringJob(GoodJob):
+    JOB_TYPE = "expiring_index_test_job"
+    EXPIRY = 60
+
+
+@pytest.fixture(params=["mock", "sqlite"])
+def datastore(request, tmp_path):
+    if request.param == "mock":
+        datastore = MockDatastore()
+    else:
+        datastore = SqliteDatastore(str(tmp_path / "jobs.sqlite"))
+
+    # flushed by the tests, or by listing
+    datastore.jobIndex = JobIndex(datastore, flushInterval=3600)
+    return datastore
+
+
+class CountingIndex(object):
+    # records the index records a datastore writes
+    def __init__(self, datastore):
+        self.written = []
+        write_index = datastore.write_index
+
+        def counting_write_index(records):
+            self.written += [record for record, _ in records]
+            return write_index(records)
+
+        datastore.write_index = counting_write_index
+
+
+@pytest.fixture
+def app(mock_app, datastore):
+    return mock_app([GoodJob], HANDLERS, datastore=datastore)
+
+
+def make_job(datastore, hoursAgo=0, jobClass=GoodJob, **kwargs):
+    job = jobClass(
+        datastore, MockQueue(),
+        createdAt=NOW - datetime.timedelta(hours=hoursAgo, minutes=1),
+        **kwargs
+    )
+    job.save()
+    return job
+
+
+def index_entry(datastore, job):
+    jobs, _ = datastore.jobIndex.list(GoodJob.JOB_TYPE, limit=1000)
+    return {e['uuid']: e for e in jobs}.get(job.uuid)
+
+
+def test_state_transitions(datastore):
+    job = make_job(datastore)
+    assert index_entry(datastore, job)['state'] == "queued"
+
+    job.update_attrs(running=True)
+    assert index_entry(datastore, job)['state'] == "running"
+
+    job.record_result(500)
+    job.update_attrs(running=False)
+    entry = index_entry(datastore, job)
+    assert entry['state'] == "failed"
+    assert entry['resultCode'] == 500
+
+
+def test_loaded_job_keeps_index(datastore):
+    job = make_job(datastore)
+    job.update_attrs(running=True)
+
+    data, cas = datastore.read_with_cas(job.key())
+    data['cas'] = cas
+    loaded = GoodJob(datastore, MockQueue(), **GoodJob.SCHEMA().load(data))
+    loaded.record_result(200)
+
+    assert index_entry(datastore, job)['state'] == "succeeded"
+
+
+def test_index_written_on_state_change_only(datastore):
+    counting = CountingIndex(datastore)
+    job = make_job(datastore)
+    job.record_event("no state change")
+    job.update_attrs(completeness=0.5)
+    datastore.jobIndex.flush()
+
+    assert [record['state'] for record in counting.written] == ["queued"]
+
+
+def test_updates_are_batched(datastore):
+    counting = CountingIndex(datastore)
+    job = make_job(datastore)
+    job.update_attrs(running=True)
+    job.record_result(200)
+    assert counting.written == []
+
+    # the newest update of each job is written once
+    datastore.jobIndex.flush()
+    assert [record['state'] for record in counting.written] == ["succeeded"]
+
+
+def test_background_flush():
+    datastore = MockDatastore()
+    datastore.jobIndex = JobIndex(datastore, flushInterval=0.05)
+    counting = CountingIndex(datastore)
+    make_job(datastore)
+
+    deadline = time.time() + 5
+    while not counting.written and time.time() < deadline:
+        time.sleep(0.05)
+    assert len(counting.written) == 1
+
+
+def test_stale_update_ignored(datastore):
+    job = make_job(datastore)
+    stale = GoodJob(
+        datastore, MockQueue(), **GoodJob.SCHEMA().load(job.dump())
+    )
+    job.update_attrs(running=True)
+    datastore.jobIndex.flush()
+
+    stale.updatedAt = NOW - datetime.timedelta(days=1)
+    datastore.jobIndex.update(stale)
+    assert index_entry(datastore, job)['state'] == "running"
+
+
+def test_expired_and_archived_jobs_leave_index(
+    datastore, tmp_path, monkeypatch
+):
+    expiring = make_job(datastore, jobClass=ExpiringJob)
+    expiring.record_result(200)
+    archived = make_job(datastore)
+    archived.record_result(200)
+    kept = make_job(datastore)
+
+    def listed():
+        jobs, _ = datastore.jobIndex.list(
+            [GoodJob.JOB_TYPE, ExpiringJob.JOB_TYPE]
+        )
+        return {job['uuid'] for job in jobs}
+
+    assert listed() == {expiring.uuid, archived.uuid, kept.uuid}
+
+    archiver = JobArchiver(str(tmp_path / "archive"))
+    assert archive_jobs(datastore, archiver, [archived.uuid]) == [
+        archived.uuid
+    ]
+    archiver.close()
+
+    # the expiring job's record expires with it
+    future = time.time() + ExpiringJob.EXPIRY + 1
+    monkeypatch.setattr(time, "time", lambda: future)
+    assert listed() == {kept.uuid}
+
+
+def test_completed(datastore):
+    old = make_job(datastore)
+    old.record_result(500)
+    make_job(datastore)
+
+    later = datetime.datetime.utcnow() + datetime.timedelta(seconds=1)
+    assert datastore.jobIndex.completed(later) == [old.uuid]
+    assert datastore.jobIndex.completed(old.createdAt) == []
+
+
+def test_list_filters(datastore):
+    failed = make_job(datastore)
+    failed.record_result(500)
+    succeeded = make_job(datastore)
+    succeeded.record_result(200)
+    queued = make_job(datastore)
+
+    def uuids(**kwargs):
+        jobs, _ = datastore.jobIndex.list(GoodJob.JOB_TYPE, **kwargs)
+        return {job['uuid'] for job in jobs}
+
+    assert uuids(state="failed") == {failed.uuid}
+    assert uuids(resultCode=200) == {succeeded.uuid}
+    assert uuids(state="queued") == {queued.uuid}
+    assert uuids() == {failed.uuid, succeeded.uuid, queued.uuid}
+    assert uuids(state="queued", since=NOW) == set()
+
+
+def test_list_pagination(datastore):
+    jobs = [make_job(datastore, hoursAgo=i % 5) for i in range(25)]
+    expected = sorted(
+        jobs, key=lambda j: (j.createdAt.isoformat(), j.uuid), reverse=True
+    )
+
+    pages = []
+    cursor = None
+    while True:
+        page, cursor = datastore.jobIndex.list(
+            GoodJob.JOB_TYPE, limit=7, cursor=cursor
+        )
+        pages.append(page)
+        if not cursor:
+            break
+
+    assert [len(page) for page in pages] == [7, 7, 7, 4]
+    listed = [entry['uuid'] for page in pages for entry in page]
+    assert listed == [job.uuid for job in expected]
+
+
+def test_list_window(datastore):
+    recent = make_job(datastore, hoursAgo=1)
+    make_job(datastore, hoursAgo=30)
+
+    jobs, _ = datastore.jobIndex.list(GoodJob.JOB_TYPE)
+    assert [job['uuid'] for job in jobs] == [recent.uuid]
+
+
+@pytest.mark.gen_test
+def test_list_handler(app, http_client, base_url, datastore):
+    jobs = [make_job(datastore) for _ in range(3)]
+    jobs[0].record_result(500)
+
+    response = yield http_client.fetch(
+        "%s/jobs?state=failed&limit=10" % base_url
+    )
+    listing = json.loads(response.body)
+    assert [job['uuid'] for job in listing['jobs']] == [jobs[0].uuid]
+    assert listing['cursor'] is None
+
+    response = yield http_client.fetch(
+        "%s/jobs?jobType=%s&limit=2" % (base_url, GoodJob.JOB_TYPE)
+    )
+    listing = json.loads(response.body)
+    assert len(listing['jobs']) == 2
+    assert listing['cursor']
+
+    response = yield http_client.fetch(
+        "%s/jobs?state=bogus" % base_url, raise_error=False
+    )
+    assert response.code == 400
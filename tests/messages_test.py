@@ -0,0 +1,122 @@
+import datetime
+import json
+import pytest
+
+from zerog.mgmt import MgmtChannel, make_msg, make_worker_id
+from zerog.mgmt.messages import (
+    COMPACT_VERSION, decode_msg, encode_msg, fast_msg, make_msg_from_json
+)
+from zerog.queues.mock_queue import MockQueue
+
+WORKER_ID = make_worker_id("zerog", "host1", "zerog_test", 1)
+MSGS = [
+    ("job", dict(workerId=WORKER_ID, uuid="a", action="start")),
+    (
+        "job",
+        dict(
+            workerId=WORKER_ID, uuid="a", action="end", jobType="good",
+            duration=0.5
+        )
+    ),
+    (
+        "info",
+        dict(
+            workerId=WORKER_ID, state="activeIdle", mem=dict(used=1),
+            retiring=True
+        )
+    ),
+    (
+        "heartbeat",
+        dict(workerId=WORKER_ID, state="activeIdle", interval=10)
+    ),
+    ("requestInfo", dict()),
+    (
+        "requestInfo",
+        dict(correlationId="c1", replyTo="replies", expiresAt=1609459201.5)
+    ),
+    ("killJob", dict(uuid="a")),
+    ("drain", dict()),
+]
+
+
+@pytest.mark.parametrize("msgtype,kwargs", MSGS)
+def test_round_trip(msgtype, kwargs):
+    msg = make_msg(msgtype, **kwargs)
+    for compact in [False, True]:
+        decoded = make_msg_from_json(json.dumps(encode_msg(msg, compact)))
+        assert type(decoded) is type(msg)
+        assert decoded.dump() == msg.dump()
+
+
+@pytest.mark.parametrize("msgtype,kwargs", MSGS)
+def test_fast_msg(msgtype, kwargs):
+    dumps = [
+        make(msgtype, **kwargs).dump() for make in [fast_msg, make_msg]
+    ]
+    for dump in dumps:
+        del dump['timestamp']
+    assert dumps[0] == dumps[1]
+
+
+def test_compact_format():
+    msg = make_msg(
+        "heartbeat",
+        workerId=WORKER_ID,
+        state="activeIdle",
+        interval=10,
+        timestamp="2021-01-01T00:00:01.5"
+    )
+    assert msg.dump_compact() == [
+        1, "heartbeat", 1609459201.5,
+        WORKER_ID, "activeIdle", "", False, 10
+    ]
+
+    # fields added by later versions are ignored
+    decoded = decode_msg(msg.dump_compact() + ["new field"])
+    assert decoded.interval == 10
+    assert decoded.timestamp == datetime.datetime(2021, 1, 1, 0, 0, 1, 500000)
+
+    # fields missing from earlier versions are defaulted
+    job = decode_msg([1, "job", 0, WORKER_ID, "a", "end"])
+    assert job.duration is None
+    assert job.jobType == ""
+
+    with pytest.raises(ValueError):
+        decode_msg([COMPACT_VERSION + 1, "job", 0, WORKER_ID, "a", "end"])
+
+
+def test_envelope():
+    # unset envelope fields aren't sent, so older readers can load them
+    plain = make_msg("drain")
+    assert set(plain.dump()) == {"msgtype", "timestamp"}
+    assert plain.dump_compact()[0] == 1
+    assert not plain.expired()
+
+    request = make_msg("drain", correlationId="c1", expiresAt=100)
+    assert request.dump()['correlationId'] == "c1"
+    assert "replyTo" not in request.dump()
+    assert request.dump_compact()[:2] == [2, "drain"]
+    assert request.dump_compact()[3] == dict(correlationId="c1", expiresAt=100)
+
+    decoded = decode_msg(request.dump_compact())
+    assert decoded.correlationId == "c1"
+    assert decoded.replyTo is None
+    assert not decoded.expired(now=99.9)
+    assert decoded.expired(now=100)
+
+
+def test_channels():
+    queue = MockQueue()
+    compact = MgmtChannel(queue, compact=True)
+    plain = MgmtChannel(queue)
+
+    compact.send_msg(make_msg("drain"))
+    plain.send_msg(make_msg("undrain"))
+    queue.bean.put("[99, \"drain\", 0]")
+
+    assert plain.get_msg().msgtype == "drain"
+    assert compact.get_msg().msgtype == "undrain"
+
+    # bad messages are dropped
+    assert compact.get_msg() is None
+    assert compact.get_msg() is None
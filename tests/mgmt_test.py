@@ -93,6 +93,15 @@ def make_channel(make_queue):
     return _func
 
 
+def get_update(channel, msgtype):
+    # servers also push heartbeats & info messages on their own, so skip
+    # to the next message of the wanted type
+    while True:
+        msg = channel.get_msg()
+        if msg is None or msg.msgtype == msgtype:
+            return msg
+
+
 def test_list_all_queues(make_channel):
     queueName = "test_list_all_queues"
     channel = make_channel(queueName)
@@ -183,13 +192,13 @@ def test_job_msgs(server_app, make_sleep_job, make_channel, clear_queue):
     # manually run the server app's main event loop
     app.do_poll()
 
-    msg0 = channel.get_msg()
+    msg0 = get_update(channel, "job")
     assert msg0 is not None
     assert msg0.msgtype == "job"
     assert msg0.uuid == j.uuid
     assert msg0.action == "start"
 
-    msg1 = channel.get_msg()
+    msg1 = get_update(channel, "job")
     assert msg1 is not None
     assert msg1.msgtype == "job"
     assert msg1.uuid == j.uuid
@@ -209,7 +218,7 @@ def test_request_info_msg(server_app, make_channel, clear_queue):
     ctrlchannel.send_msg(msg)
 
     app.do_poll()
-    infomsg = updateschannel.get_msg()
+    infomsg = get_update(updateschannel, "info")
 
     assert infomsg is not None
     assert infomsg.msgtype == "info"
@@ -239,7 +248,7 @@ def test_get_running_job_uuid(
     ctrlchannel.send_msg(msg)
 
     app.do_poll()
-    infomsg = updateschannel.get_msg()
+    infomsg = get_update(updateschannel, "info")
 
     assert infomsg is not None
     assert infomsg.msgtype == "info"
@@ -258,7 +267,7 @@ def test_get_running_job_uuid(
     ctrlchannel.send_msg(msg)
 
     app.do_poll()
-    infomsg = updateschannel.get_msg()
+    infomsg = get_update(updateschannel, "info")
 
     assert infomsg is not None
     assert infomsg.msgtype == "info"
@@ -290,7 +299,7 @@ def test_drain(server_app, make_sleep_job, make_channel, clear_queue):
     ctrlchannel.send_msg(msg)
 
     app.do_poll()
-    infomsg = updateschannel.get_msg()
+    infomsg = get_update(updateschannel, "info")
     assert infomsg is not None
     assert infomsg.msgtype == "info"
     assert infomsg.workerId == workerId
@@ -361,7 +370,7 @@ def test_un_drain(server_app, make_sleep_job, make_channel, clear_queue):
     ctrlchannel.send_msg(msg)
 
     app.do_poll()
-    infomsg = updateschannel.get_msg()
+    infomsg = get_update(updateschannel, "info")
     assert infomsg is not None
     assert infomsg.msgtype == "info"
     assert infomsg.workerId == workerId
@@ -407,7 +416,7 @@ def test_retire(server_app, make_sleep_job, make_channel, clear_queue):
     ctrlchannel.send_msg(msg)
 
     app.do_poll()
-    infomsg = updateschannel.get_msg()
+    infomsg = get_update(updateschannel, "info")
     assert infomsg is not None
     assert infomsg.msgtype == "info"
     assert infomsg.workerId == workerId
@@ -431,7 +440,7 @@ def test_worker_manager(server_app, make_channel, clear_queue):
 
     workerManager = WorkerManager("beanstalkd", 11300)
     workerManager.request_updates()
-    app.do_poll()
+    app.do_broadcast_poll()
     workerManager.poll_updates_channel()
     
     workers = workerManager.workers
@@ -457,7 +466,7 @@ def test_worker_manager_drain_host(server_app, make_channel, clear_queue):
 
     workerManager = WorkerManager("beanstalkd", 11300)
     workerManager.request_updates()
-    app.do_poll()
+    app.do_broadcast_poll()
     workerManager.poll_updates_channel()
 
     workers = workerManager.workers_by_host()
@@ -465,10 +474,10 @@ def test_worker_manager_drain_host(server_app, make_channel, clear_queue):
 
     host = list(workers.keys())[0]
     workerManager.drain_host(host)
-    app.do_poll()
+    app.do_broadcast_poll()
 
     workerManager.request_updates()
-    app.do_poll()
+    app.do_broadcast_poll()
     workerManager.poll_updates_channel()
 
     workers = workerManager.workers
@@ -486,7 +495,7 @@ def test_worker_manager_un_drain_host(server_app, make_channel, clear_queue):
 
     workerManager = WorkerManager("beanstalkd", 11300)
     workerManager.request_updates()
-    app.do_poll()
+    app.do_broadcast_poll()
     workerManager.poll_updates_channel()
 
     workers = workerManager.workers_by_host()
@@ -494,10 +503,10 @@ def test_worker_manager_un_drain_host(server_app, make_channel, clear_queue):
 
     host = list(workers.keys())[0]
     workerManager.drain_host(host)
-    app.do_poll()
+    app.do_broadcast_poll()
 
     workerManager.request_updates()
-    app.do_poll()
+    app.do_broadcast_poll()
     workerManager.poll_updates_channel()
 
     workers = workerManager.workers
@@ -508,10 +517,10 @@ def test_worker_manager_un_drain_host(server_app, make_channel, clear_queue):
     assert "draining" in worker['state']
 
     workerManager.un_drain_host(host)
-    app.do_poll()
+    app.do_broadcast_poll()
 
     workerManager.request_updates()
-    app.do_poll()
+    app.do_broadcast_poll()
     workerManager.poll_updates_channel()
 
     workers = workerManager.workers
@@ -527,7 +536,7 @@ def test_worker_manager_retire_host(server_app, make_channel, clear_queue):
 
     workerManager = WorkerManager("beanstalkd", 11300)
     workerManager.request_updates()
-    app.do_poll()
+    app.do_broadcast_poll()
     workerManager.poll_updates_channel()
 
     workers = workerManager.workers_by_host()
@@ -535,10 +544,10 @@ def test_worker_manager_retire_host(server_app, make_channel, clear_queue):
 
     host = list(workers.keys())[0]
     workerManager.drain_host(host, retire=True)
-    app.do_poll()
+    app.do_broadcast_poll()
 
     workerManager.request_updates()
-    app.do_poll()
+    app.do_broadcast_poll()
     workerManager.poll_updates_channel()
 
     workers = workerManager.workers
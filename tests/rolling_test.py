@@ -0,0 +1,269 @@
+import atexit
+import pytest
+
+import zerog
+from zerog.datastores.mock_datastore import MockDatastore
+from zerog.mgmt import RollingDrain, WorkerManager, make_msg, make_worker_id
+from zerog.mgmt.messages import peek_broadcasts
+from zerog.mgmt.utils import make_broadcast_tube
+from zerog.queues.sqlite_queue import SqliteQueue
+
+from tests.job_classes import CheckpointJob, GoodJob, SleepJob
+
+
+@pytest.fixture
+def manager(beanstalkd):
+    return WorkerManager(beanstalkd.host, beanstalkd.port)
+
+
+def add_workers(manager, host, count, state="activeIdle", running=0):
+    workerIds = []
+    for pid in range(count):
+        workerId = make_worker_id("zerog", host, "zerog_test", pid)
+        manager.workerTable.update(
+            workerId,
+            3600,
+            state=state,
+            runningJobUuid="job" if pid < running else ""
+        )
+        workerIds.append(workerId)
+
+    return workerIds
+
+
+def set_state(manager, host, state):
+    for workerId in manager.workerTable.on_host(host):
+        manager.workers[workerId]['state'] = state
+        manager.workers[workerId]['runningJobUuid'] = ""
+
+
+def broadcasts(manager, host):
+    return [
+        data['msgtype'] for _, data in peek_broadcasts(
+            manager.queue, make_broadcast_tube("host", host)
+        )
+    ]
+
+
+def test_budget(manager):
+    add_workers(manager, "host1", 2, running=1)
+    add_workers(manager, "host2", 2)
+    add_workers(manager, "host3", 3)
+    add_workers(manager, "host4", 1)
+
+    updated = []
+    rolling = RollingDrain(
+        manager,
+        ["host1", "host2", "host3", "host4"],
+        action=updated.append,
+        maxUnavailable=3
+    )
+    assert rolling.step(now=0) is False
+
+    # idle hosts first, and host4 fills the budget host3 doesn't fit in
+    assert rolling.phases == dict(
+        host1="pending", host2="draining", host3="pending", host4="draining"
+    )
+    assert broadcasts(manager, "host2") == ["drain", "preempt"]
+    assert broadcasts(manager, "host1") == []
+
+    set_state(manager, "host2", "drainingIdle")
+    rolling.step(now=10)
+    assert updated == ["host2"]
+    assert rolling.phases['host2'] == "returning"
+
+    # host2 comes back, so host3 fits
+    set_state(manager, "host2", "activeIdle")
+    set_state(manager, "host4", "drainingIdle")
+    rolling.step(now=20)
+    assert rolling.phases == dict(
+        host1="pending", host2="done", host3="draining", host4="returning"
+    )
+
+    progress = rolling.progress(now=20)
+    assert progress['counts'] == dict(
+        pending=1, draining=1, returning=1, done=1, failed=0
+    )
+    assert progress['elapsed'] == 20
+    assert progress['eta'] == 60
+
+
+def test_large_host_goes_alone(manager):
+    add_workers(manager, "host1", 3)
+    add_workers(manager, "host2", 1)
+
+    rolling = RollingDrain(
+        manager, ["host1", "host2"], action=lambda h: None, maxUnavailable=2
+    )
+    rolling.step(now=0)
+    assert rolling.phases == dict(host1="draining", host2="pending")
+
+    # host1 hasn't come back, so capacity is below the budget
+    set_state(manager, "host1", "drainingIdle")
+    rolling.step(now=10)
+    assert rolling.phases == dict(host1="returning", host2="pending")
+
+    rolling.step(now=10 + rolling.returnTimeout)
+    assert rolling.phases == dict(host1="failed", host2="pending")
+
+
+def test_retire(manager):
+    add_workers(manager, "host1", 1)
+    add_workers(manager, "host2", 1)
+    progress = []
+
+    rolling = RollingDrain(
+        manager,
+        ["host1", "host2"],
+        maxUnavailable=0.5,
+        retire=True,
+        preempt=False,
+        onProgress=progress.append
+    )
+    rolling.step(now=0)
+    assert broadcasts(manager, "host1") == ["retire"]
+    assert rolling.phases['host2'] == "pending"
+
+    set_state(manager, "host1", "drainingIdle")
+    rolling.step(now=5)
+    assert rolling.phases == dict(host1="done", host2="draining")
+
+    set_state(manager, "host2", "drainingIdle")
+    assert rolling.step(now=8) is True
+    assert [p['counts']['done'] for p in progress] == [0, 1, 2]
+    assert progress[-1]['eta'] == 0
+
+
+def test_action_fails(manager):
+    add_workers(manager, "host1", 1, state="drainingIdle")
+
+    def action(host):
+        raise RuntimeError("deploy failed")
+
+    rolling = RollingDrain(manager, ["host1"], action=action)
+    rolling.step(now=0)
+    assert rolling.step(now=1) is True
+    assert rolling.phases == dict(host1="failed")
+
+    with pytest.raises(ValueError):
+        RollingDrain(manager, ["host1"])
+
+
+@pytest.fixture
+def app(beanstalkd):
+    datastore = MockDatastore()
+
+    def make_queue(queueName):
+        return zerog.BeanstalkdQueue(
+            beanstalkd.host, beanstalkd.port, queueName
+        )
+
+    server = zerog.Server(
+        "zerog_test",
+        lambda: datastore,
+        make_queue,
+        [GoodJob, SleepJob, CheckpointJob],
+        [],
+        thisHost="zerog"
+    )
+    yield server
+    server.proc.kill()
+    atexit.unregister(server.exit_handler)
+
+
+def run_job(app, jobClass):
+    # as if the worker were running the job
+    job = jobClass(app.datastore, app.jobQueue)
+    job.save()
+    job.update_attrs(running=True)
+    app.state = "drainingRunning"
+    app.runningJobUuid = job.uuid
+    app.runningJobType = jobClass.JOB_TYPE
+    return job
+
+
+def test_preempt(app):
+    run_job(app, SleepJob)
+    app.process_control_message(make_msg("preempt"))
+    assert app.state == "drainingRunning"
+
+    job = run_job(app, CheckpointJob)
+    proc = app.proc
+
+    # the job is no longer running by the time the worker is stopped
+    stopped = []
+    stop_worker_proc = app.stop_worker_proc
+
+    def check_stop_worker_proc():
+        stopped.append(app.get_job(job.uuid).running)
+        return stop_worker_proc()
+
+    app.stop_worker_proc = check_stop_worker_proc
+    app.process_control_message(make_msg("preempt"))
+    assert stopped == [False]
+    assert app.state == "drainingDown"
+    assert app.runningJobUuid == ""
+    assert app.preempting is False
+
+    proc.join(5)
+    assert not proc.is_alive()
+
+    job = app.get_job(job.uuid)
+    assert job.running is False
+    assert job.events[-1].msg == "Preempted by drain - requeued"
+
+
+class EphemeralCheckpointJob(CheckpointJob):
+    JOB_TYPE = "ephemeral_checkpoint_test_job"
+    EPHEMERAL = True
+
+
+def test_ephemeral_jobs_not_preempted(app):
+    added = app.registry.add_classes([EphemeralCheckpointJob])
+    assert added['EphemeralCheckpointJob'] == dict(
+        success=False, error="EphemeralCheckpoints"
+    )
+
+    # even if such a class were registered, its inline jobs would have no
+    # checkpoint to rerun from
+    app.registry.registry[EphemeralCheckpointJob.JOB_TYPE] = (
+        EphemeralCheckpointJob
+    )
+    run_job(app, EphemeralCheckpointJob)
+    app.process_control_message(make_msg("preempt"))
+    assert app.state == "drainingRunning"
+    assert app.preempting is False
+
+
+def test_preempt_releases_entry(tmp_path):
+    # SqliteQueue doesn't release a killed worker's entries by itself
+    datastore = MockDatastore()
+    path = str(tmp_path / "queue.sqlite")
+    app = zerog.Server(
+        "zerog_test",
+        lambda: datastore,
+        lambda queueName: SqliteQueue(path, queueName),
+        [CheckpointJob],
+        [],
+        thisHost="zerog"
+    )
+    try:
+        # stands in for the worker, which would reserve the entry itself
+        app.proc.kill()
+        app.proc.join(5)
+        job = run_job(app, CheckpointJob)
+        job.enqueue()
+        workerQueue = SqliteQueue(path, app.jobQueue.queueName)
+        queueJob = workerQueue.reserve(timeout=0)
+        assert queueJob.jid == job.queueJobId
+        app.runningQueueJobId = queueJob.jid
+
+        app.process_control_message(make_msg("preempt"))
+        assert app.state == "drainingDown"
+        assert app.runningQueueJobId is None
+
+        queueJob = workerQueue.reserve(timeout=0)
+        assert queueJob.jid == job.queueJobId
+    finally:
+        app.proc.kill()
+        atexit.unregister(app.exit_handler)
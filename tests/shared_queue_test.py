@@ -0,0 +1,128 @@
+import multiprocessing
+import pytest
+
+from zerog.mgmt import MgmtChannel, make_msg
+from zerog.mgmt.messages import get_msg, send_msg
+from zerog.queues.beanstalk_queue import BeanstalkdQueue
+from zerog.queues.shared_beanstalk_queue import (
+    SharedBeanstalkdQueue, get_shared_connection
+)
+
+
+@pytest.fixture
+def make_queue(beanstalkd):
+    def _func(queueName):
+        return SharedBeanstalkdQueue(
+            beanstalkd.host, beanstalkd.port, queueName
+        )
+
+    return _func
+
+
+@pytest.fixture
+def stats(beanstalkd):
+    observer = BeanstalkdQueue(beanstalkd.host, beanstalkd.port, "observer")
+
+    def _func():
+        return observer.do_bean("stats")
+
+    return _func
+
+
+def test_one_connection(stats, make_queue):
+    queues = [make_queue(name) for name in ["jobs", "updates", "ctrl"]]
+    assert len({id(queue.bean) for queue in queues}) == 1
+
+    # + the observer's connection
+    assert stats()['current-connections'] == 2
+
+    # every tube is still watched, so the WorkerManager sees live workers
+    for queue in queues:
+        assert queue.do_bean("stats_tube", queue.queueName)[
+            'current-watching'
+        ] == 1
+
+
+def test_tubes_are_separate(make_queue):
+    jobs = make_queue("jobs")
+    ctrl = make_queue("ctrl")
+
+    jobs.put("job")
+    assert ctrl.reserve(timeout=0) is None
+
+    ctrl.put_many(["msg1", "msg2"])
+    assert jobs.reserve(timeout=0).body == '"job"'
+    assert jobs.reserve(timeout=0) is None
+    assert [ctrl.reserve(timeout=0).body for _ in range(2)] == [
+        '"msg1"', '"msg2"'
+    ]
+
+
+def test_tube_switch_caching(stats, make_queue):
+    jobs = make_queue("jobs")
+    updates = make_queue("updates")
+
+    before = stats()['cmd-use']
+    for i in range(5):
+        jobs.put(i)
+    updates.put("update")
+    updates.put("update")
+
+    # one switch to each tube
+    assert stats()['cmd-use'] - before == 2
+
+
+def test_mgmt_channels(make_queue):
+    updates = make_queue("updates")
+    channel = MgmtChannel(make_queue("worker1"))
+
+    send_msg(make_msg("drain"), updates, "worker1")
+    assert updates.reserve(timeout=0) is None
+    assert channel.get_msg().msgtype == "drain"
+    assert channel.get_named_queue_watchers("worker1") == 1
+
+    channel.send_msg(make_msg("undrain"))
+    assert get_msg(updates, "worker1").msgtype == "undrain"
+
+
+def test_detach(make_queue):
+    jobs = make_queue("jobs")
+    other = make_queue("jobs")
+    ctrl = make_queue("ctrl")
+
+    other.detach()
+    assert jobs.do_bean("stats_tube", "jobs")['current-watching'] == 1
+
+    jobs.detach()
+    assert "jobs" not in ctrl.bean.watchedTubes
+
+    ctrl.detach()
+    assert ctrl.bean.watchedTubes == {"default"}
+
+
+def test_reconnect(beanstalkd, make_queue):
+    jobs = make_queue("jobs")
+    ctrl = make_queue("ctrl")
+    beanstalkd.drop_connections()
+
+    jobs.put("after")
+    assert jobs.bean.watchedTubes == {"jobs", "ctrl"}
+    assert ctrl.reserve(timeout=0) is None
+    assert jobs.reserve(timeout=0).body == '"after"'
+
+
+def connection_id(host, port, results):
+    results.put(id(get_shared_connection(host, port)))
+
+
+def test_connection_per_process(beanstalkd):
+    shared = get_shared_connection(beanstalkd.host, beanstalkd.port)
+    results = multiprocessing.Queue()
+    proc = multiprocessing.Process(
+        target=connection_id, args=(beanstalkd.host, beanstalkd.port, results)
+    )
+    proc.start()
+    childId = results.get(timeout=10)
+    proc.join()
+
+    assert childId != id(shared)
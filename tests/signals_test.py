@@ -0,0 +1,138 @@
+import json
+import multiprocessing
+import pytest
+
+import zerog
+from zerog.datastores.mock_datastore import MockDatastore
+from zerog.handlers.signal import SIGNAL_PATT, SignalHandler
+from zerog.queues.emulator import BeanstalkEmulator
+from zerog.queues.mock_queue import MockQueue
+from zerog.signals import DEFAULT_WAIT, Signals
+
+from tests.job_classes import GoodJob, WaitJob
+
+HANDLERS = [("/signal/%s" % SIGNAL_PATT, SignalHandler)]
+
+
+@pytest.fixture
+def datastore():
+    return MockDatastore()
+
+
+@pytest.fixture
+def queue():
+    return MockQueue(BeanstalkEmulator(), "zerog_test_jobs")
+
+
+@pytest.fixture
+def worker(datastore, queue):
+    registry = zerog.JobRegistry()
+    registry.add_classes([GoodJob, WaitJob])
+    parentConn, childConn = multiprocessing.Pipe()
+    worker = zerog.BaseWorker(
+        "zerog_test",
+        lambda: datastore,
+        lambda queueName: MockQueue(queue.emulator, queueName),
+        registry,
+        childConn
+    )
+    worker.run_init()
+    worker.parentConn = parentConn     # keep the pipe open
+    return worker
+
+
+def run_next(worker):
+    queueJob = worker.queue.reserve(timeout=0)
+    worker._process_queue_job(queueJob)
+    return queueJob
+
+
+def enqueue_wait_job(datastore, queue):
+    job = WaitJob(datastore, queue)
+    job.enqueue()
+    return job
+
+
+def test_wait_and_signal(datastore, queue, worker):
+    job = enqueue_wait_job(datastore, queue)
+    run_next(worker)
+
+    # parked: requeued with a long delay instead of being re-run
+    job.reload()
+    stats = queue.do_bean("stats_job", job.queueJobId)
+    assert stats['state'] == "delayed"
+    assert stats['delay'] == DEFAULT_WAIT
+    assert worker.queue.reserve(timeout=0) is None
+
+    datastore.create(WaitJob.readyKey, True)
+    signals = Signals(datastore, queue)
+    assert signals.signal(WaitJob.signalName) == [job.uuid]
+    assert signals.count(WaitJob.signalName) == 1
+
+    run_next(worker)
+    job.reload()
+    assert job.resultCode == 200
+
+    # nobody is waiting any more
+    assert signals.signal(WaitJob.signalName) == []
+
+
+def test_signal_before_park(datastore, queue):
+    signals = Signals(datastore, queue)
+    jid = queue.put("uuid1", delay=DEFAULT_WAIT)
+
+    count = signals.count("sig")
+    signals.signal("sig")
+
+    # the signal was sent after the job read the count, so it isn't parked
+    assert signals.park("sig", "uuid1", jid, count) is False
+    assert queue.do_bean("stats_job", jid)['state'] == "ready"
+    assert signals.park("sig", "uuid1", jid, count + 1) is True
+
+
+def test_signal_kicks_buried(datastore, queue):
+    signals = Signals(datastore, queue)
+    queue.put("uuid1")
+    queueJob = queue.reserve(timeout=0)
+    queueJob.bury()
+
+    signals.park("sig", "uuid1", queueJob.jid, 0)
+    assert signals.signal("sig") == ["uuid1"]
+    assert queue.reserve(timeout=0).jid == queueJob.jid
+
+
+def test_signal_on_completion(datastore, queue, worker):
+    waiter = enqueue_wait_job(datastore, queue)
+    run_next(worker)
+
+    datastore.create(WaitJob.readyKey, True)
+    job = GoodJob(datastore, queue, signalKeys=[WaitJob.signalName])
+    job.enqueue()
+    run_next(worker)
+
+    run_next(worker)
+    waiter.reload()
+    assert waiter.resultCode == 200
+
+
+@pytest.fixture
+def app(mock_app):
+    return mock_app([WaitJob], HANDLERS)
+
+
+@pytest.mark.gen_test
+def test_signal_handler(app, http_client, base_url):
+    job = enqueue_wait_job(app.datastore, app.jobQueue)
+    app.jobQueue.reserve(timeout=0).delete()
+    job.enqueue(delay=DEFAULT_WAIT)
+    job.wait_for_signal("handler_test")
+    job.park()
+
+    response = yield http_client.fetch(
+        "%s/signal/handler_test" % base_url, method="POST", body=""
+    )
+    assert response.code == 200
+    assert json.loads(response.body) == dict(
+        signal="handler_test", woken=[job.uuid]
+    )
+    assert app.jobQueue.reserve(timeout=0).body == json.dumps(job.uuid)
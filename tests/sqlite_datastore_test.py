@@ -0,0 +1,172 @@
+import datetime
+import multiprocessing
+import pytest
+import time
+
+from zerog.datastores.codecs import MsgpackCodec
+from zerog.datastores.sqlite_datastore import SqliteDatastore
+from zerog.queues.mock_queue import MockQueue
+
+from tests.job_classes import GoodJob
+
+INCREMENTS = 50
+
+
+@pytest.fixture
+def datastore(tmp_path):
+    return SqliteDatastore(str(tmp_path / "zerog.sqlite"))
+
+
+def test_create_and_read(datastore):
+    value = {"yo": "dawg", "fish": "marlin"}
+    assert datastore.create("test_dict", value) is True
+    assert datastore.read("test_dict") == value
+
+    with pytest.raises(Exception):
+        datastore.create("test_dict", value)
+
+
+def test_read_nonexistent(datastore):
+    assert datastore.read("nope") is None
+    assert datastore.read_with_cas("nope") == (None, None)
+    assert datastore.read_cas("nope") is None
+
+
+def test_set_with_cas(datastore):
+    success, cas = datastore.set_with_cas("test_string", "the fox", cas=0)
+    assert success is True
+    assert datastore.read_cas("test_string") == cas
+
+    with pytest.raises(datastore.casException):
+        datastore.set_with_cas("test_string", "the dog", cas=55)
+    assert datastore.read("test_string") == "the fox"
+
+    success, newcas = datastore.set_with_cas("test_string", "the dog", cas=cas)
+    assert newcas != cas
+    assert datastore.read_with_cas("test_string") == ("the dog", newcas)
+
+
+def test_update(datastore):
+    with pytest.raises(Exception):
+        datastore.update("test_string", "the fox")
+
+    datastore.set("test_string", "the fox")
+    _, cas = datastore.read_with_cas("test_string")
+
+    with pytest.raises(datastore.casException):
+        datastore.update_with_cas("test_string", "the dog", cas=55)
+
+    success, newcas = datastore.update_with_cas(
+        "test_string", "the dog", cas=cas
+    )
+    assert datastore.read("test_string") == "the dog"
+
+
+def test_delete(datastore):
+    datastore.set("test_delete", {"this": "doesn't matter"})
+    assert datastore.delete("test_delete") is True
+    assert datastore.read("test_delete") is None
+    assert datastore.delete("test_delete") is False
+
+
+def test_delete_with_cas(datastore):
+    _, cas = datastore.set_with_cas("test_delete", "the fox", cas=0)
+    with pytest.raises(datastore.casException):
+        datastore.delete("test_delete", cas=55)
+    assert datastore.read("test_delete") == "the fox"
+
+    assert datastore.delete("test_delete", cas=cas) is True
+    assert datastore.delete("test_delete", cas=cas) is False
+
+
+def test_multi(datastore):
+    items = {"test_multi_%d" % i: dict(number=i) for i in range(5)}
+    results = datastore.set_multi(items)
+
+    records = datastore.read_multi(list(items) + ["missing"])
+    for key, value in items.items():
+        assert records[key] == (value, results[key][1])
+    assert records["missing"] == (None, None)
+
+
+def test_expiry(datastore):
+    datastore.set(
+        "test_expiry", "gone", expiry=datetime.timedelta(milliseconds=1)
+    )
+    datastore.set("test_keep", "here", expiry=datetime.timedelta(hours=1))
+    time.sleep(0.01)
+
+    assert datastore.read("test_expiry") is None
+    assert datastore.read_cas("test_expiry") is None
+    assert datastore.read("test_keep") == "here"
+    assert datastore.purge_expired() == 1
+
+
+def test_persistence_and_codec(tmp_path):
+    path = str(tmp_path / "zerog.sqlite")
+    value = {"createdAt": "2021-09-17T15:52:06.123456", "big": 2 ** 100}
+    SqliteDatastore(path).set("test_dict", value)
+
+    # documents written with one codec can be read with another
+    datastore = SqliteDatastore(path, codec=MsgpackCodec())
+    assert datastore.read("test_dict") == value
+
+
+def test_job_round_trip(datastore):
+    job = GoodJob(datastore, MockQueue(), goodness="very")
+    job.save()
+    job.update_attrs(completeness=0.5)
+
+    data, cas = datastore.read_with_cas(job.key())
+    assert data['goodness'] == "very"
+    assert data['completeness'] == 0.5
+    assert cas == job.cas
+
+
+def increment(path):
+    datastore = SqliteDatastore(path)
+    for _ in range(INCREMENTS):
+        while True:
+            value, cas = datastore.read_with_cas("counter")
+            try:
+                datastore.set_with_cas("counter", value + 1, cas=cas)
+                break
+            except datastore.casException:
+                pass
+
+
+def test_cas_across_processes(tmp_path):
+    path = str(tmp_path / "zerog.sqlite")
+    datastore = SqliteDatastore(path)
+    datastore.set("counter", 0)
+
+    procs = [
+        multiprocessing.Process(target=increment, args=(path,))
+        for _ in range(4)
+    ]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join(60)
+
+    assert [proc.exitcode for proc in procs] == [0] * 4
+    assert datastore.read("counter") == 4 * INCREMENTS
+
+
+def test_update_multi_with_cas(datastore):
+    results = datastore.set_multi({"a": 1, "b": 2})
+    datastore.set("b", 3)
+
+    updated = datastore.update_multi_with_cas({
+        "a": (10, results["a"][1]),
+        "b": (20, results["b"][1]),
+        "c": (30, 1)
+    })
+
+    assert updated["a"][0] is True
+    assert updated["b"] == (False, None)
+    assert updated["c"] == (False, None)
+    assert datastore.read_multi(["a", "b", "c"]) == {
+        "a": (10, updated["a"][1]), "b": (3, datastore.read_cas("b")),
+        "c": (None, None)
+    }
@@ -0,0 +1,224 @@
+import json
+import multiprocessing
+import pytest
+import time
+
+from zerog.mgmt import MgmtChannel, make_msg
+from zerog.mgmt.messages import (
+    get_broadcasts, get_msg, send_broadcast, send_msg
+)
+from zerog.queues.beanstalk_client import CommandFailed
+from zerog.queues.sqlite_queue import SqliteQueue
+
+CONSUMERS = 4
+JOBS = 200
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "queue.sqlite")
+
+
+@pytest.fixture
+def queue(path):
+    return SqliteQueue(path, "jobs")
+
+
+def test_put_reserve_delete(queue):
+    jid = queue.put("uuid1")
+    job = queue.reserve(timeout=0)
+    assert job.jid == jid
+    assert json.loads(job.body) == "uuid1"
+
+    job.delete()
+    assert queue.reserve(timeout=0) is None
+
+    with pytest.raises(CommandFailed):
+        queue.delete(jid)
+
+
+def test_priority_and_delay(queue):
+    queue.put("later", delay=1)
+    queue.put("low", priority=100)
+    queue.put("high", priority=1)
+
+    assert queue.reserve(timeout=0).body == '"high"'
+    assert queue.reserve(timeout=0).body == '"low"'
+    assert queue.reserve(timeout=0) is None
+    assert queue.peek_delayed().body == '"later"'
+
+    job = queue.reserve(timeout=2)
+    assert job.body == '"later"'
+
+
+def test_reserve_timeout(queue):
+    start = time.time()
+    assert queue.reserve(timeout=0.2) is None
+    assert time.time() - start >= 0.2
+
+
+def test_ttr(queue):
+    queue.put("slow", ttr=1)
+    job = queue.reserve(timeout=0)
+    assert queue.reserve(timeout=0) is None
+
+    # not deleted, released or touched within its ttr, so it's ready again
+    again = queue.reserve(timeout=2)
+    assert again.jid == job.jid
+    stats = again.stats()
+    assert stats['reserves'] == 2
+    assert stats['timeouts'] == 1
+
+
+def reserve_and_exit(path):
+    SqliteQueue(path, "jobs").reserve(timeout=5)
+
+
+def test_reserver_exits(path, queue):
+    jid = queue.put("orphan", ttr=3600)
+    proc = multiprocessing.Process(target=reserve_and_exit, args=(path,))
+    proc.start()
+    proc.join()
+
+    # the job is ready again as soon as its reserver has exited, well
+    # before its ttr
+    job = queue.reserve(timeout=0)
+    assert job.jid == jid
+    stats = job.stats()
+    assert stats['reserves'] == 2
+    assert stats['timeouts'] == 0
+
+    # a live reserver keeps its job
+    assert queue.reserve(timeout=0) is None
+
+
+def test_release_bury_priority(queue):
+    queue.put("job", priority=10)
+    job = queue.reserve(timeout=0)
+    job.release(priority=0)
+    assert job.stats()['pri'] == 0
+
+    job = queue.reserve(timeout=0)
+    job.bury()
+    assert job.stats()['pri'] == 0
+
+    queue.kick(1)
+    job = queue.reserve(timeout=0)
+    job.bury(priority=0)
+    assert job.stats()['pri'] == 0
+
+
+def test_release_bury_kick(queue):
+    jid = queue.put("job")
+
+    job = queue.reserve(timeout=0)
+    job.release(delay=10)
+    assert queue.stats_job(jid)['state'] == "delayed"
+
+    job.kick()
+    job = queue.reserve(timeout=0)
+    job.bury()
+    assert queue.peek_buried().jid == jid
+    assert queue.reserve(timeout=0) is None
+
+    assert queue.kick(10) == 1
+    job = queue.reserve(timeout=0)
+    job.touch()
+    stats = job.stats()
+    assert stats['state'] == "reserved"
+    assert stats['releases'] == 1
+    assert stats['buries'] == 1
+    assert stats['kicks'] == 2
+
+
+def test_tubes_and_stats(path, queue):
+    other = SqliteQueue(path, "other")
+    queue.put("a")
+    queue.put_many(["b", "c"])
+    queue.put_to("other", "d")
+
+    assert queue.list_all_queues() == ["default", "jobs", "other"]
+    assert queue.stats_tube("jobs")['current-jobs-ready'] == 3
+    assert queue.stats_tube("other")['current-watching'] == 1
+    assert other.reserve(timeout=0).body == '"d"'
+
+    other.detach()
+    assert queue.stats_tube("other")['current-watching'] == 0
+
+    with pytest.raises(CommandFailed):
+        queue.stats_tube("nope")
+
+
+def test_durable(path, queue):
+    queue.put("survivor")
+    reopened = SqliteQueue(path, "jobs")
+    assert reopened.reserve(timeout=0).body == '"survivor"'
+
+
+def test_mgmt_messages(path):
+    updates = SqliteQueue(path, "updates")
+    channel = MgmtChannel(SqliteQueue(path, "worker1"))
+
+    send_msg(make_msg("drain"), updates, "worker1")
+    assert updates.reserve(timeout=0) is None
+    assert channel.get_msg().msgtype == "drain"
+    assert channel.get_named_queue_watchers("worker1") == 1
+
+    channel.send_msg(make_msg("undrain"))
+    assert get_msg(updates, "worker1").msgtype == "undrain"
+
+
+def test_peek_from(path, queue):
+    other = SqliteQueue(path, "other")
+    assert queue.peek_from("other") is None
+
+    other.put("later", delay=10)
+    jid = other.put("a")
+    assert queue.peek_from("other").jid == jid
+    assert queue.peek_from("other").jid == jid     # it stays in the tube
+    assert queue.peek_ready() is None
+
+
+def test_broadcasts(path):
+    sender = SqliteQueue(path, "updates")
+    reader = SqliteQueue(path, "worker1")
+    seqs = [
+        send_broadcast(make_msg(msgtype), sender, "broadcast")
+        for msgtype in ["drain", "undrain"]
+    ]
+
+    assert [
+        msg.msgtype for _, msg in get_broadcasts(reader, "broadcast", 0)
+    ] == ["drain", "undrain"]
+    assert get_broadcasts(reader, "broadcast", seqs[1]) == []
+    assert sender.stats_tube("broadcast")['current-jobs-ready'] == 1
+
+
+def consume(path, results):
+    queue = SqliteQueue(path, "jobs")
+    while True:
+        job = queue.reserve(timeout=0.5)
+        if job is None:
+            return
+
+        results.put(job.body)
+        job.delete()
+
+
+def test_consumers_across_processes(path, queue):
+    queue.put_many(list(range(JOBS)))
+
+    results = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=consume, args=(path, results))
+        for _ in range(CONSUMERS)
+    ]
+    for proc in procs:
+        proc.start()
+
+    bodies = [results.get(timeout=30) for _ in range(JOBS)]
+    for proc in procs:
+        proc.join()
+
+    # every job was reserved exactly once
+    assert sorted(int(body) for body in bodies) == list(range(JOBS))
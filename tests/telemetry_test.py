@@ -0,0 +1,128 @@
+import pytest
+
+from zerog.mgmt import WorkerManager, make_msg, make_worker_id
+from zerog.mgmt.telemetry import (
+    DURATION_BUCKETS, BucketCounter, JobTelemetry, RingBuffer, histogram,
+    percentiles
+)
+
+
+def test_ring_buffer():
+    buffer = RingBuffer(3)
+    assert buffer.latest() is None
+    assert list(buffer.since(0)) == []
+
+    for t in range(5):
+        buffer.append(t, t * 10)
+
+    assert len(buffer) == 3
+    assert buffer.latest() == 4
+    assert list(buffer.since(0)) == [20, 30, 40]
+    assert list(buffer.since(3)) == [30, 40]
+    assert list(buffer.since(5)) == []
+
+
+def test_histogram_and_percentiles():
+    assert histogram([0.05, 0.1, 0.2, 2, 5000]) == (
+        [2, 1, 0, 1] + [0] * (len(DURATION_BUCKETS) - 4) + [1]
+    )
+
+    values = list(range(1, 101))
+    assert percentiles(values) == dict(p50=50, p90=90, p99=99)
+    assert percentiles([7]) == dict(p50=7, p90=7, p99=7)
+    assert percentiles([]) == dict(p50=None, p90=None, p99=None)
+
+
+def test_snapshot():
+    telemetry = JobTelemetry(capacity=100, window=100)
+    for i in range(10):
+        telemetry.record_wait("good", "host1", i, now=i)
+        telemetry.record_run("good", "host1", 0.2, now=i)
+    telemetry.record_run("slow", "host2", 60, now=2)
+
+    snapshot = telemetry.snapshot(now=60)
+    good = snapshot['jobTypes']['good']
+    assert good['runs'] == 10
+    assert good['throughput'] == pytest.approx(0.1)
+    assert good['meanDuration'] == pytest.approx(0.2)
+    assert good['durationHistogram'][1] == 10
+    assert good['waits']['p50'] == 4
+    assert snapshot['hosts']['host2']['runs'] == 1
+    assert snapshot['hosts']['host2']['waits']['p50'] is None
+
+    # cached until a sample is recorded
+    assert telemetry.snapshot(now=60.5) is snapshot
+    telemetry.record_run("good", "host1", 0.2, now=61)
+    assert telemetry.snapshot(now=61)['jobTypes']['good']['runs'] == 11
+
+    # old samples age out, and so do idle job types & hosts
+    snapshot = telemetry.snapshot(now=105)
+    assert snapshot['jobTypes']['good']['runs'] == 6
+    assert "slow" not in snapshot['jobTypes']
+    assert list(snapshot['hosts']) == ["host1"]
+
+
+def test_bucket_counter():
+    counter = BucketCounter(window=10)
+    assert counter.latest() is None
+    assert counter.since(0) == (0, 0)
+
+    for t in [0.5, 1.2, 1.7, 11.5]:
+        counter.add(t, 2)
+
+    assert counter.latest() == 11.5
+    assert counter.since(1.5) == (3, 6)
+    assert counter.since(2) == (1, 2)
+
+    # a second that has been reused isn't counted again
+    counter.add(0.2, 2)
+    assert counter.since(0) == (3, 6)
+
+
+def test_bounded():
+    telemetry = JobTelemetry(capacity=10, window=1000)
+    for i in range(100):
+        telemetry.record_run("good", "host1", 1, now=i)
+
+    good = telemetry.snapshot(now=100)['jobTypes']['good']
+    assert len(telemetry.durations[("jobTypes", "good")]) == 10
+    assert sum(good['durationHistogram']) == 10
+
+    # every run counts toward throughput, not just the sampled ones
+    assert good['runs'] == 100
+    assert good['throughput'] == pytest.approx(0.1)
+    assert good['meanDuration'] == pytest.approx(1)
+
+
+def test_throughput_above_capacity():
+    telemetry = JobTelemetry(capacity=1000, window=300)
+    for i in range(30000):
+        telemetry.record_run("good", "host1", 0.2, now=i / 100)
+
+    good = telemetry.snapshot(now=300)['jobTypes']['good']
+    assert good['runs'] == 30000
+    assert good['throughput'] == pytest.approx(100)
+
+
+def test_worker_manager(beanstalkd):
+    manager = WorkerManager(beanstalkd.host, beanstalkd.port)
+    workerId = make_worker_id("zerog", "host1", "zerog_test", 1)
+    for msg in [
+        make_msg(
+            "job", workerId=workerId, uuid="a", action="start",
+            jobType="good", queueWait=1.5
+        ),
+        make_msg(
+            "job", workerId=workerId, uuid="a", action="end",
+            jobType="good", duration=0.3
+        ),
+        # from an older server
+        make_msg("job", workerId=workerId, uuid="b", action="end"),
+    ]:
+        manager.updatesChannel.send_msg(msg)
+
+    manager.poll_updates_channel()
+    stats = manager.job_stats()
+    assert stats['jobTypes']['good']['runs'] == 1
+    assert stats['jobTypes']['good']['waits']['p99'] == 1.5
+    assert stats['hosts']['host1']['meanDuration'] == pytest.approx(0.3)
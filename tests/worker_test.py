@@ -1,10 +1,13 @@
-import json
+import datetime
+import mock
 import pdb
 import pytest
 import random
 import time
 
-from zerog.workers.base import MAX_RESERVES, MAX_TIMEOUTS
+from zerog.workers.base import (
+    MAX_NOT_FOUND_RESERVES, MAX_RESERVES, MAX_TIMEOUTS
+)
 from zerog.jobs import INTERNAL_ERROR, NO_RESULT
 from zerog.queues.beanstalk_queue import QueueJob
 
@@ -44,41 +47,65 @@ def test_missing_job(make_job_and_worker, clear_queue):
     """
     job, registry, worker, parentConn = make_job_and_worker(GoodJob)
     clear_queue(job.queue)
-    job.enqueue()
-    queueJob = job.queue.reserve(timeout=0)
 
-    # make the queueJob defective, then pass to the worker
-    queueJob.body = json.dumps(random.randint(1, 1000000))
-    worker._process_queue_job(queueJob)
+    # a queue entry for a job that doesn't exist is retried, in case the
+    # job isn't visible yet, then buried as a dead letter
+    job.queue.put(random.randint(1, 1000000))
+    for _ in range(MAX_NOT_FOUND_RESERVES + 1):
+        queueJob = job.queue.reserve(timeout=0)
+        worker._process_queue_job(queueJob)
+        if queueJob.stats()['state'] == 'delayed':
+            queueJob.kick()
     job.reload()
 
-    # queueJob should have been released back into the queue
     stats = queueJob.stats()
-    queueJob.delete()
-    assert stats['state'] == 'delayed'
-    assert stats['releases'] == 1
-    assert stats['reserves'] == 1
+    entries = worker.deadLetters.list()
+    worker.deadLetters.delete([queueJob.jid])
+    assert stats['state'] == 'buried'
+    assert stats['buries'] == 1
+    assert stats['reserves'] == MAX_NOT_FOUND_RESERVES + 1
+    assert [e['jid'] for e in entries] == [queueJob.jid]
+    assert entries[0]['reason'] == "job not found"
 
     assert job.resultCode == NO_RESULT
 
 
+def test_queue_wait(make_job_and_worker):
+    """
+    tests that a job's queue wait doesn't include the delay it was
+    enqueued with
+    """
+    job, registry, worker, parentConn = make_job_and_worker(GoodJob)
+    job.updatedAt = datetime.datetime.utcnow() - datetime.timedelta(
+        seconds=70
+    )
+    job.queueKwargs = dict(delay=60)
+    assert 9 < worker.queue_wait(job) < 11
+
+    job.queueKwargs = {}
+    assert 69 < worker.queue_wait(job) < 71
+
+    job.updatedAt = None
+    assert worker.queue_wait(job) is None
+
+
 @pytest.mark.skip(reason="30 second retry delay makes this test slow")
 def test_too_many_reserves(make_job_and_worker, clear_queue):
     """
     Another test of the case where we somehow can't load the zerog job
     that's identified by a queueJob. After some maximum number of reserves,
-    the queueJob should be discarded
+    the queueJob should be buried
     """
     job, registry, worker, parentConn = make_job_and_worker(GoodJob)
     clear_queue(job.queue)
     job.enqueue()
     queueJob = job.queue.reserve(timeout=0)
 
-    # make the queueJob defective each time before passing it to worker,
-    # then check how many times it gets released before it is deleted
+    # make loading the job fail each time, then check how many times the
+    # queueJob gets released before it is buried
+    worker.get_job = mock.Mock(side_effect=RuntimeError("datastore down"))
     reserveCount = 1
     for _ in range(MAX_RESERVES + 1):
-        queueJob.body = json.dumps(random.randint(1, 1000000))
         worker._process_queue_job(queueJob)
         newQueueJob = job.queue.reserve(timeout=60)
         if newQueueJob:
@@ -99,7 +126,7 @@ def test_too_many_timeouts(make_job_and_worker, clear_queue):
     """
     Test of the case where we somehow can't load the zerog job, but the
     job was somehow reserved for longer than its queue timeout. After
-    some maximum number of timeouts, the queueJob should be discarded.
+    some maximum number of timeouts, the queueJob should be buried.
     """
     job, registry, worker, parentConn = make_job_and_worker(GoodJob)
     clear_queue(job.queue)
@@ -107,11 +134,11 @@ def test_too_many_timeouts(make_job_and_worker, clear_queue):
     queueJob = job.queue.reserve(timeout=0)
     time.sleep(2)
 
-    # make the queueJob defective each time before passing it to worker,
-    # then check how many times it gets released before it is deleted
+    # make loading the job fail each time, then check how many times the
+    # queueJob gets released before it is buried
+    worker.get_job = mock.Mock(side_effect=RuntimeError("datastore down"))
     reserveCount = 1
     for _ in range(MAX_TIMEOUTS + 1):
-        queueJob.body = json.dumps(random.randint(1, 1000000))
         worker._process_queue_job(queueJob)
         newQueueJob = job.queue.reserve(timeout=60)
         if newQueueJob:
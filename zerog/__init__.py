@@ -1,18 +1,34 @@
 UPDATES_CHANNEL_NAME = "updates"
 
-from zerog.datastores import CouchbaseDatastore
+from zerog.archive import JobArchiver
+from zerog.blobstores import CouchbaseBlobstore, FileBlobstore
+from zerog.datastores import CouchbaseDatastore, SqliteDatastore
+from zerog.deadletters import DeadLetters
 from zerog.handlers import (
     BaseHandler, 
     GetDataHandler, 
     ProgressHandler, 
     RunJobHandler, 
     InfoHandler,
-    DumpHandler
+    DumpHandler,
+    JobCacheStatsHandler,
+    BulkStatusHandler,
+    JobListHandler,
+    BulkRunJobHandler,
+    SignalHandler,
+    DeadLetterHandler
 )
 from zerog.handlers.run_job import JOB_TYPE_PATT
+from zerog.handlers.signal import SIGNAL_PATT
 from zerog.handlers.uuid import UUID_PATT
-from zerog.jobs import BaseJob, BaseJobSchema, NO_RESULT, INTERNAL_ERROR
-from zerog.queues import BeanstalkdQueue
+from zerog.jobindex import JobIndex
+from zerog.jobs import (
+    BaseJob, BaseJobSchema, Blob, NO_RESULT, INTERNAL_ERROR
+)
+from zerog.queues import (
+    AsyncBeanstalkdQueue, BeanstalkdQueue, SharedBeanstalkdQueue, SqliteQueue
+)
 from zerog.registry import JobRegistry, find_subclasses, import_submodules
 from zerog.server import Server
+from zerog.signals import Signals
 from zerog.workers import BaseWorker
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2017-2021 MotiveMetrics. All rights reserved.
+"""
+ZeroG JobArchiver class definition
+"""
+import datetime
+import gzip
+import json
+import os
+import psutil
+import sqlite3
+import threading
+
+from zerog.jobs import NO_RESULT, make_key
+from zerog.jobs.blob import delete_blobs, inline_blobs
+
+import logging
+log = logging.getLogger(__name__)
+
+INDEX_NAME = "index.sqlite"
+SQLITE_TIMEOUT = 30
+
+
+def archive_jobs(datastore, archiver, uuids):
+    """
+    Moves completed jobs from the datastore to an archive. Jobs that
+    don't exist or haven't completed are skipped, and so are jobs that
+    are updated or deleted (e.g. by another server's archiver) while
+    they're archived: they're only deleted from the datastore if their
+    cas is unchanged, and dropped from the archive's index otherwise.
+
+    If the datastore has a blob store, the values of the jobs' blobs are
+    archived inline, and the blobs are deleted with the documents.
+
+    Args:
+        datastore: datastore holding the jobs
+
+        archiver: JobArchiver
+
+        uuids: uuids of the jobs to archive
+
+    Returns:
+        list of the archived jobs' uuids
+    """
+    keys = {uuid: make_key(uuid) for uuid in uuids}
+    records = datastore.read_multi(list(keys.values()))
+
+    completed = []
+    missing = []
+    for uuid, key in keys.items():
+        data, cas = records.get(key, (None, None))
+        if data is None:
+            missing.append(uuid)
+        elif data.get('resultCode', NO_RESULT) != NO_RESULT:
+            completed.append((data, cas))
+
+    blobstore = getattr(datastore, 'blobstore', None)
+    archived = []
+    if completed:
+        archiver.write([
+            inline_blobs(data, blobstore) if blobstore else data
+            for data, _ in completed
+        ])
+
+        # only delete the documents once they're safely in the archive
+        changed = []
+        for data, cas in completed:
+            try:
+                deleted = datastore.delete(keys[data['uuid']], cas=cas)
+            except datastore.casException:
+                deleted = False
+
+            if deleted:
+                archived.append(data['uuid'])
+                if blobstore:
+                    delete_blobs(data, blobstore)
+            else:
+                changed.append(data['uuid'])
+
+        if changed:
+            log.info(f"{len(changed)} jobs changed while being archived")
+            archiver.forget(changed)
+
+    jobIndex = getattr(datastore, 'jobIndex', None)
+    if jobIndex is not None and (archived or missing):
+        jobIndex.remove(archived + missing)
+
+    return archived
+
+
+class JobArchiver(object):
+    """
+    Archive of completed job documents, stored as gzip-compressed JSONL
+    files partitioned by the jobs' creation date::
+
+        <rootDir>/2021/09/17/zerog_jobs_<pid>.jsonl.gz
+
+    Each ``write`` appends one gzip member per file, so files can be
+    streamed with any gzip reader. An sqlite index maps every archived
+    uuid to its file & member, so single jobs can be read back without
+    scanning.
+
+    Each process writes its own files, so several servers on a host can
+    share an archive directory. The archive is local to a host, though:
+    its index is an sqlite database in WAL mode, which doesn't work on
+    network filesystems, so the directory must not be shared across
+    hosts. A server only reads back the jobs that its own host archived;
+    ``get_job`` doesn't find jobs archived on other hosts.
+
+    Args:
+        rootDir: archive directory. Created if it doesn't exist
+    """
+    def __init__(self, rootDir):
+        self.rootDir = rootDir
+        os.makedirs(rootDir, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.index = sqlite3.connect(
+            os.path.join(rootDir, INDEX_NAME),
+            timeout=SQLITE_TIMEOUT,
+            check_same_thread=False
+        )
+        self.index.execute("PRAGMA journal_mode=WAL")
+        self.index.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "uuid TEXT PRIMARY KEY, path TEXT, offset INTEGER, "
+            "length INTEGER)"
+        )
+        self.index.commit()
+
+    def partition_path(self, data):
+        # relative path of the file that holds a job document
+        try:
+            createdAt = datetime.datetime.fromisoformat(data['createdAt'])
+        except (KeyError, TypeError, ValueError):
+            createdAt = datetime.datetime.utcnow()
+
+        return os.path.join(
+            createdAt.strftime("%Y"),
+            createdAt.strftime("%m"),
+            createdAt.strftime("%d"),
+            "zerog_jobs_{0}.jsonl.gz".format(psutil.Process().pid)
+        )
+
+    def write(self, records):
+        """
+        Appends job documents to the archive
+
+        Args:
+            records: list of serialized job documents
+        """
+        partitions = dict()
+        for data in records:
+            partitions.setdefault(self.partition_path(data), []).append(data)
+
+        with self.lock:
+            rows = []
+            for path, partition in partitions.items():
+                fullPath = os.path.join(self.rootDir, path)
+                os.makedirs(os.path.dirname(fullPath), exist_ok=True)
+
+                lines = "".join(
+                    json.dumps(data, default=str) + "\n"
+                    for data in partition
+                )
+                member = gzip.compress(lines.encode("utf-8"))
+
+                with open(fullPath, "ab") as f:
+                    offset = f.tell()
+                    f.write(member)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                rows += [
+                    (data['uuid'], path, offset, len(member))
+                    for data in partition
+                ]
+
+            self.index.executemany(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?)", rows
+            )
+            self.index.commit()
+
+        log.info(f"archived {len(rows)} jobs")
+
+    def read(self, uuid):
+        """
+        Reads an archived job document
+
+        Returns:
+            the job document, or None if the job isn't in the archive
+        """
+        with self.lock:
+            row = self.index.execute(
+                "SELECT path, offset, length FROM jobs WHERE uuid = ?",
+                (uuid,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        path, offset, length = row
+        with open(os.path.join(self.rootDir, path), "rb") as f:
+            f.seek(offset)
+            member = f.read(length)
+
+        for line in gzip.decompress(member).splitlines():
+            data = json.loads(line)
+            if data.get('uuid') == uuid:
+                return data
+
+        return None
+
+    def forget(self, uuids):
+        """
+        Drops jobs from the index, e.g. ones whose archived documents
+        turned out to be stale. Their lines stay in the archive files
+        """
+        with self.lock:
+            self.index.executemany(
+                "DELETE FROM jobs WHERE uuid = ?", [(uuid,) for uuid in uuids]
+            )
+            self.index.commit()
+
+    def __contains__(self, uuid):
+        with self.lock:
+            row = self.index.execute(
+                "SELECT 1 FROM jobs WHERE uuid = ?", (uuid,)
+            ).fetchone()
+
+        return row is not None
+
+    def close(self):
+        self.index.close()
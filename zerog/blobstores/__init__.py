@@ -0,0 +1,4 @@
+from .base import BaseBlobstore, make_blob_id, make_digest
+from .couchbase_blobstore import CouchbaseBlobstore
+from .file_blobstore import FileBlobstore
+from .mock_blobstore import MockBlobstore
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+Content-addressed blob storage for large job fields.
+
+A blob is any JSON-serializable value. It's stored under the SHA-256
+digest of its canonical JSON encoding, so identical values are only
+stored once, and a blob never changes once it's written.
+
+Blobs can belong to an owner, e.g. the job whose document references
+them. An owner's blobs are stored under their own ids, so they can be
+deleted (or expired) with the owner without affecting other owners'
+blobs with the same value.
+"""
+import hashlib
+import json
+
+from zerog.datastores.codecs import JsonCodec, decode
+
+import logging
+log = logging.getLogger(__name__)
+
+
+def canonical_json(value):
+    return json.dumps(
+        value, sort_keys=True, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def make_digest(value):
+    """
+    Makes the content address for a blob value
+
+    :param value: JSON-serializable value
+    :returns: hex SHA-256 digest of the value's canonical JSON encoding
+    :rtype: str
+    """
+    return hashlib.sha256(canonical_json(value)).hexdigest()
+
+
+def make_blob_id(digest, owner=None):
+    """
+    Makes the id a blob is stored under
+
+    :param str digest: the blob value's digest
+    :param str owner: the blob's owner, e.g. a job uuid
+    :returns: blob id
+    :rtype: str
+    """
+    if owner is None:
+        return digest
+
+    return "{0}_{1}".format(owner, digest)
+
+
+class BaseBlobstore(object):
+    """
+    Base class for blob stores. Subclasses implement the raw byte
+    operations ``put``, ``get``, ``exists``, ``delete`` and ``expire``,
+    keyed by blob id (see ``make_blob_id``).
+
+    Args:
+        codec: document codec used to encode blob values. Defaults to
+               compressed JSON
+    """
+    def __init__(self, codec=None):
+        self.codec = codec or JsonCodec()
+
+    def put(self, digest, data):
+        raise NotImplementedError
+
+    def get(self, digest):
+        raise NotImplementedError
+
+    def exists(self, digest):
+        raise NotImplementedError
+
+    def delete(self, digest):
+        raise NotImplementedError
+
+    def expire(self, digest, expiry):
+        raise NotImplementedError
+
+    def put_value(self, value, digest=None, owner=None):
+        """
+        Stores a value unless an identical value is already stored for
+        the same owner
+
+        :returns: the value's digest
+        """
+        digest = digest or make_digest(value)
+        blobId = make_blob_id(digest, owner)
+        if not self.exists(blobId):
+            self.put(blobId, self.codec.encode(value))
+
+        return digest
+
+    def get_value(self, digest, owner=None):
+        """
+        :returns: the stored value, or None if there's no blob with the
+            specified digest & owner
+        """
+        data = self.get(make_blob_id(digest, owner))
+        if data is None:
+            return None
+
+        return decode(data)
+
+    def delete_value(self, digest, owner=None):
+        """
+        Deletes a stored value
+
+        :returns: True if there was a blob to delete
+        """
+        return self.delete(make_blob_id(digest, owner))
+
+    def expire_value(self, digest, expiry, owner=None):
+        """
+        Deletes a stored value once an expiry has passed, e.g. the
+        expiry of the job document that references it
+
+        :param datetime.timedelta expiry: time until the value expires
+        """
+        self.expire(make_blob_id(digest, owner), expiry)
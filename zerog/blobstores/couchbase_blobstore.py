@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+"""
+from couchbase.options import GetOptions, InsertOptions
+from couchbase.transcoder import RawBinaryTranscoder
+import couchbase.exceptions
+
+from zerog.datastores.couchbase_datastore import retry_on_timeouts
+from .base import BaseBlobstore
+
+import logging
+log = logging.getLogger(__name__)
+
+DOCUMENT_TYPE = "zerog_blob"
+
+
+class CouchbaseBlobstore(BaseBlobstore):
+    """
+    Stores blobs as binary documents in the same bucket as a
+    CouchbaseDatastore. Expired blobs are removed by Couchbase.
+
+    Args:
+        datastore: CouchbaseDatastore whose collection will hold the blobs
+    """
+    def __init__(self, datastore, **kwargs):
+        super(CouchbaseBlobstore, self).__init__(**kwargs)
+        self.collection = datastore.collection
+        self.transcoder = RawBinaryTranscoder()
+
+    def key(self, digest):
+        return "%s_%s" % (DOCUMENT_TYPE, digest)
+
+    @retry_on_timeouts
+    def put(self, digest, data):
+        try:
+            self.collection.insert(
+                self.key(digest),
+                data,
+                InsertOptions(transcoder=self.transcoder)
+            )
+        except couchbase.exceptions.DocumentExistsException:
+            # content-addressed, so someone else already stored it
+            pass
+
+    @retry_on_timeouts
+    def get(self, digest):
+        try:
+            result = self.collection.get(
+                self.key(digest), GetOptions(transcoder=self.transcoder)
+            )
+        except couchbase.exceptions.DocumentNotFoundException:
+            return None
+
+        return result.value
+
+    @retry_on_timeouts
+    def exists(self, digest):
+        return self.collection.exists(self.key(digest)).exists
+
+    @retry_on_timeouts
+    def expire(self, digest, expiry):
+        try:
+            self.collection.touch(self.key(digest), expiry)
+        except couchbase.exceptions.DocumentNotFoundException:
+            pass
+
+    @retry_on_timeouts
+    def delete(self, digest):
+        try:
+            self.collection.remove(self.key(digest))
+        except couchbase.exceptions.DocumentNotFoundException:
+            return False
+
+        return True
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+"""
+import os
+import tempfile
+import time
+
+from .base import BaseBlobstore
+
+import logging
+log = logging.getLogger(__name__)
+
+EXPIRES_SUFFIX = ".expires"
+
+
+class FileBlobstore(BaseBlobstore):
+    """
+    Stores blobs as files in a local (or shared) directory.
+
+    Blobs are fanned out into subdirectories by id prefix. Writes go to a
+    temporary file that's renamed into place, so concurrent writers in
+    separate processes never see a partial blob.
+
+    A blob's expiry is kept in an ``.expires`` file next to it. Expired
+    blobs take up space until they're deleted by ``purge_expired``, which
+    should be run periodically (e.g. from cron).
+
+    Args:
+        rootDir: directory in which blobs are stored. Created if it
+                 doesn't exist
+    """
+    def __init__(self, rootDir, **kwargs):
+        super(FileBlobstore, self).__init__(**kwargs)
+        self.rootDir = rootDir
+        os.makedirs(rootDir, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.rootDir, digest[:2], digest[2:4], digest)
+
+    def write(self, path, data):
+        # writes a file atomically
+        dirName = os.path.dirname(path)
+        os.makedirs(dirName, exist_ok=True)
+
+        fd, tmpPath = tempfile.mkstemp(dir=dirName, prefix=".tmp_")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmpPath, path)
+        except BaseException:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            raise
+
+    def put(self, digest, data):
+        self.write(self.path(digest), data)
+
+    def get(self, digest):
+        try:
+            with open(self.path(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def delete(self, digest):
+        path = self.path(digest)
+        try:
+            os.remove(path + EXPIRES_SUFFIX)
+        except FileNotFoundError:
+            pass
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+
+        return True
+
+    def expire(self, digest, expiry):
+        path = self.path(digest)
+        if os.path.exists(path):
+            expiresAt = time.time() + expiry.total_seconds()
+            self.write(path + EXPIRES_SUFFIX, str(expiresAt).encode("ascii"))
+
+    def purge_expired(self):
+        """
+        Deletes expired blobs
+
+        :returns: number of blobs deleted
+        """
+        now = time.time()
+        purged = 0
+        for dirPath, _, names in os.walk(self.rootDir):
+            for name in names:
+                if not name.endswith(EXPIRES_SUFFIX):
+                    continue
+
+                try:
+                    with open(os.path.join(dirPath, name), "rb") as f:
+                        expiresAt = float(f.read())
+                except (FileNotFoundError, ValueError):
+                    continue
+
+                if expiresAt <= now:
+                    purged += self.delete(name[:-len(EXPIRES_SUFFIX)])
+
+        return purged
@@ -0,0 +1,41 @@
+import time
+
+from .base import BaseBlobstore
+
+
+class MockBlobstore(BaseBlobstore):
+    """
+    Mock blob store class for testing.
+
+    Use a dictionary to simulate blob storage
+    """
+    def __init__(self, **kwargs):
+        super(MockBlobstore, self).__init__(**kwargs)
+        self.blobs = dict()
+        self.expiries = dict()
+        self.puts = 0
+
+    def _purge(self, digest):
+        if self.expiries.get(digest, float('inf')) <= time.time():
+            self.delete(digest)
+
+    def put(self, digest, data):
+        self.puts += 1
+        self.blobs[digest] = data
+        self.expiries.pop(digest, None)
+
+    def get(self, digest):
+        self._purge(digest)
+        return self.blobs.get(digest)
+
+    def exists(self, digest):
+        self._purge(digest)
+        return digest in self.blobs
+
+    def delete(self, digest):
+        self.expiries.pop(digest, None)
+        return self.blobs.pop(digest, None) is not None
+
+    def expire(self, digest, expiry):
+        if digest in self.blobs:
+            self.expiries[digest] = time.time() + expiry.total_seconds()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2017-2021 MotiveMetrics. All rights reserved.
+"""
+ZeroG JobCache class definition
+"""
+import collections
+import copy
+import json
+import time
+
+from zerog.jobs import NO_RESULT, BlobRef
+
+import logging
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 32 * 2 ** 20
+DEFAULT_TTL = 300
+
+
+def copy_value(value):
+    if isinstance(value, BlobRef):
+        return value.copy()
+
+    if isinstance(value, (list, dict)):
+        return copy.copy(value)
+
+    return value
+
+
+def copy_loaded(loaded):
+    """
+    Shallow-copies the mutable values of schema-loaded job data, so a job
+    instantiated from it doesn't share lists, dicts or blob references
+    with the cache. Copied references to stored blobs are unloaded
+    """
+    return {key: copy_value(value) for key, value in loaded.items()}
+
+
+class CacheEntry(object):
+    __slots__ = ["jobClass", "loaded", "cas", "size", "complete", "cachedAt"]
+
+    def __init__(self, jobClass, loaded, cas, size, complete, cachedAt):
+        self.jobClass = jobClass
+        self.loaded = loaded
+        self.cas = cas
+        self.size = size
+        self.complete = complete
+        self.cachedAt = cachedAt
+
+
+class JobCache(object):
+    """
+    LRU cache of deserialized job records, bounded by total (serialized)
+    size.
+
+    Completed jobs (``resultCode != NO_RESULT``) never change, so they stay
+    cached until they're evicted. Records of running jobs must be
+    revalidated against the datastore's cas before use, and are dropped
+    once they're older than ``ttl`` seconds.
+
+    The cache holds the schema-loaded job data, not job instances, so each
+    lookup gets its own job instance that can be modified safely. Blob
+    references are copied in & out of the cache unloaded, so values that
+    jobs load from the blob store aren't kept by the cache; the size of
+    an entry only counts blob values that are inline in the record.
+
+    Args:
+        maxBytes: approximate budget for cached records. 0 disables the
+                  cache
+
+        ttl: maximum age, in seconds, of a cached running job record
+    """
+    def __init__(self, maxBytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.maxBytes = maxBytes
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+        self.totalBytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, uuid):
+        """
+        Returns the cache entry for a job, or None. Entries for running
+        jobs that are older than the TTL are dropped.
+
+        The caller must revalidate a returned entry that isn't complete,
+        then call ``hit`` or ``miss``.
+        """
+        entry = self.entries.get(uuid)
+        if entry is None:
+            return None
+
+        if (
+            not entry.complete and
+            time.monotonic() - entry.cachedAt > self.ttl
+        ):
+            self.invalidate(uuid)
+            return None
+
+        self.entries.move_to_end(uuid)
+        return entry
+
+    def hit(self, entry, revalidated=False):
+        self.hits += 1
+        if revalidated:
+            self.revalidations += 1
+
+    def miss(self, stale=False):
+        self.misses += 1
+        if stale:
+            self.stale += 1
+
+    def store(self, uuid, jobClass, loaded, cas, data):
+        """
+        Caches a job record.
+
+        Args:
+            uuid: job uuid
+
+            jobClass: the job's class
+
+            loaded: the record data, deserialized by the job's schema
+
+            cas: the record's cas
+
+            data: the serialized record, used to estimate the entry size
+        """
+        if self.maxBytes <= 0:
+            return
+
+        size = len(json.dumps(data, default=str))
+        if size > self.maxBytes:
+            return
+
+        self.invalidate(uuid)
+        complete = loaded.get('resultCode', NO_RESULT) != NO_RESULT
+        self.entries[uuid] = CacheEntry(
+            jobClass, copy_loaded(loaded), cas, size, complete,
+            time.monotonic()
+        )
+        self.totalBytes += size
+
+        while self.totalBytes > self.maxBytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.totalBytes -= evicted.size
+            self.evictions += 1
+
+    def invalidate(self, uuid):
+        entry = self.entries.pop(uuid, None)
+        if entry is not None:
+            self.totalBytes -= entry.size
+
+    def clear(self):
+        self.entries.clear()
+        self.totalBytes = 0
+
+    def make_job(self, entry, datastore, queue, keepalive=None):
+        """
+        Instantiates a job from a cache entry. Mutable attributes are
+        copied so changes to the job don't leak into the cache.
+        """
+        return entry.jobClass(
+            datastore, queue, keepalive, **copy_loaded(entry.loaded)
+        )
+
+    def stats(self):
+        """
+        :returns: cache metrics
+        :rtype: dict
+        """
+        lookups = self.hits + self.misses
+        return dict(
+            entries=len(self.entries),
+            bytes=self.totalBytes,
+            maxBytes=self.maxBytes,
+            hits=self.hits,
+            misses=self.misses,
+            hitRate=(self.hits / lookups) if lookups else 0.0,
+            revalidations=self.revalidations,
+            stale=self.stale,
+            evictions=self.evictions
+        )
@@ -1 +1,5 @@
 from .couchbase_datastore import CouchbaseDatastore
+from .async_couchbase_datastore import AsyncCouchbaseDatastore
+from .codecs import JsonCodec, MsgpackCodec
+from .executor_datastore import ExecutorDatastore
+from .sqlite_datastore import SqliteDatastore
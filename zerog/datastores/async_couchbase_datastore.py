@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+Asyncio Couchbase datastore client, for use on the Server's IOLoop
+"""
+from acouchbase.cluster import Cluster
+from couchbase.options import ReplaceOptions
+import couchbase.exceptions
+import asyncio
+import functools
+import psutil
+
+from .couchbase_datastore import make_cluster_options, make_connection_string
+from .multi import DEFAULT_MULTI_CHUNK_SIZE
+
+import logging
+log = logging.getLogger(__name__)
+
+
+def async_retry_on_timeouts(func):
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        await self.connect()
+
+        tries = 0
+        while True:
+            try:
+                return await func(self, *args, **kwargs)
+
+            except couchbase.exceptions.TimeoutException as e:
+                tries += 1
+                if tries > 3:
+                    raise e
+                log.info(
+                    "couchbase timeout in process {0} -- retrying #{1}".format(
+                        psutil.Process().pid, tries
+                    )
+                )
+
+    return wrapper
+
+
+class AsyncCouchbaseDatastore(object):
+    """
+    Asyncio Couchbase datastore client object. Same interface and
+    return values as CouchbaseDatastore, but every operation is a
+    coroutine.
+
+    The connection is made lazily by the first operation, so instances
+    can be created before the IOLoop is running.
+    """
+    casException = couchbase.exceptions.CASMismatchException
+    lockedException = couchbase.exceptions.DocumentLockedException
+    existsException = couchbase.exceptions.DocumentExistsException
+
+    def __init__(self, host, username, password, bucket, **kwargs):
+        self.codec = kwargs.pop("codec", None)
+        self.connectionString = make_connection_string(host, kwargs)
+        self.clusterOptions = make_cluster_options(
+            username, password, self.codec
+        )
+        self.bucketName = bucket
+        self.cluster = None
+        self.collection = None
+        self._connecting = None
+
+    async def connect(self):
+        if self.collection is not None:
+            return
+
+        if self._connecting is None:
+            self._connecting = asyncio.ensure_future(self._connect())
+
+        try:
+            await self._connecting
+        except BaseException:
+            self._connecting = None
+            raise
+
+    async def _connect(self):
+        self.cluster = await Cluster.connect(
+            self.connectionString, self.clusterOptions
+        )
+        bucket = self.cluster.bucket(self.bucketName)
+        await bucket.on_connect()
+        self.collection = bucket.default_collection()
+
+    @async_retry_on_timeouts
+    async def create(self, key, value, **kwargs):
+        result = await self.collection.insert(key, value, **kwargs)
+        return result.success
+
+    @async_retry_on_timeouts
+    async def read(self, key, **kwargs):
+        try:
+            result = await self.collection.get(key, **kwargs)
+        except couchbase.exceptions.DocumentNotFoundException:
+            return None
+
+        return result.value
+
+    @async_retry_on_timeouts
+    async def read_with_cas(self, key, **kwargs):
+        try:
+            result = await self.collection.get(key, **kwargs)
+        except couchbase.exceptions.DocumentNotFoundException:
+            return None, None
+
+        return result.value, result.cas
+
+    @async_retry_on_timeouts
+    async def read_cas(self, key, **kwargs):
+        # metadata-only lookup -- much cheaper than reading the document
+        result = await self.collection.exists(key, **kwargs)
+        return result.cas if result.exists else None
+
+    async def read_multi(
+        self, keys, chunkSize=DEFAULT_MULTI_CHUNK_SIZE, **kwargs
+    ):
+        """
+        Reads several documents, with at most ``chunkSize`` reads in
+        flight at once.
+
+        :returns: dictionary of {key: (value, cas)}
+        """
+        semaphore = asyncio.Semaphore(max(1, chunkSize))
+
+        async def read_one(key):
+            async with semaphore:
+                return await self.read_with_cas(key, **kwargs)
+
+        keys = list(keys)
+        results = await asyncio.gather(*[read_one(key) for key in keys])
+        return dict(zip(keys, results))
+
+    @async_retry_on_timeouts
+    async def update(self, key, value, **kwargs):
+        result = await self.collection.replace(
+            key, value, ReplaceOptions(**kwargs)
+        )
+        return result.success
+
+    @async_retry_on_timeouts
+    async def update_with_cas(self, key, value, **kwargs):
+        result = await self.collection.replace(
+            key, value, ReplaceOptions(**kwargs)
+        )
+        return result.success, result.cas
+
+    @async_retry_on_timeouts
+    async def set(self, key, value, **kwargs):
+        result = await self.collection.upsert(key, value, **kwargs)
+        return result.success
+
+    @async_retry_on_timeouts
+    async def set_with_cas(self, key, value, **kwargs):
+        # see CouchbaseDatastore.set_with_cas
+        try:
+            result = await self.collection.replace(
+                key, value, ReplaceOptions(**kwargs)
+            )
+        except couchbase.exceptions.DocumentNotFoundException:
+            insertKwargs = {
+                k: v for k, v in kwargs.items() if k in ["expiry"]
+            }
+            result = await self.collection.insert(key, value, **insertKwargs)
+        return result.success, result.cas
+
+    async def set_multi(
+        self, items, chunkSize=DEFAULT_MULTI_CHUNK_SIZE, **kwargs
+    ):
+        """
+        Upserts several documents, with at most ``chunkSize`` writes in
+        flight at once.
+
+        :param dict items: dictionary of {key: value}
+
+        :returns: dictionary of {key: (success, cas)}
+        """
+        semaphore = asyncio.Semaphore(max(1, chunkSize))
+
+        async def set_one(key):
+            async with semaphore:
+                return await self._upsert(key, items[key], **kwargs)
+
+        keys = list(items)
+        results = await asyncio.gather(*[set_one(key) for key in keys])
+        return dict(zip(keys, results))
+
+    async def update_multi_with_cas(
+        self, items, chunkSize=DEFAULT_MULTI_CHUNK_SIZE, **kwargs
+    ):
+        """
+        Replaces several documents, each only if its cas matches, with at
+        most ``chunkSize`` writes in flight at once. Mismatches don't raise.
+
+        :param dict items: dictionary of {key: (value, cas)}
+
+        :returns: dictionary of {key: (success, cas)}. Documents that
+            changed or don't exist get (False, None)
+        """
+        semaphore = asyncio.Semaphore(max(1, chunkSize))
+
+        async def update_one(key):
+            value, cas = items[key]
+            async with semaphore:
+                try:
+                    return await self.update_with_cas(
+                        key, value, cas=cas, **kwargs
+                    )
+                except (
+                    couchbase.exceptions.CASMismatchException,
+                    couchbase.exceptions.DocumentNotFoundException
+                ):
+                    return False, None
+
+        keys = list(items)
+        results = await asyncio.gather(*[update_one(key) for key in keys])
+        return dict(zip(keys, results))
+
+    @async_retry_on_timeouts
+    async def _upsert(self, key, value, **kwargs):
+        result = await self.collection.upsert(key, value, **kwargs)
+        return result.success, result.cas
+
+    @async_retry_on_timeouts
+    async def delete(self, key, **kwargs):
+        try:
+            result = await self.collection.remove(key, **kwargs)
+        except couchbase.exceptions.DocumentNotFoundException:
+            return False
+
+        return result.success
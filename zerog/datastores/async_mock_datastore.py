@@ -0,0 +1,79 @@
+import asyncio
+
+from .documents import exists_exception
+from .mock_datastore import MockDatastore
+
+
+class AsyncMockDatastore(object):
+    """
+    Async mock datastore class for testing.
+
+    Wraps a MockDatastore so that sync and async clients can share the
+    same data. Every operation sleeps (without blocking the event loop)
+    to simulate network latency.
+
+    Args:
+        datastore: MockDatastore to wrap. A new one is created if None
+
+        delay: simulated latency, in seconds, of every operation
+
+        keyDelays: dictionary of {key: delay} for simulating slow
+                   operations on specific keys
+    """
+    def __init__(self, datastore=None, delay=0, keyDelays=None):
+        self.datastore = datastore or MockDatastore()
+        self.delay = delay
+        self.keyDelays = keyDelays or {}
+        self.casException = self.datastore.casException
+        self.lockedException = self.datastore.lockedException
+        self.existsException = exists_exception(self.datastore)
+        self.completed = []
+
+    async def _call(self, method, key, *args, **kwargs):
+        await asyncio.sleep(self.keyDelays.get(key, self.delay))
+        result = getattr(self.datastore, method)(key, *args, **kwargs)
+        self.completed.append((method, key))
+        return result
+
+    async def create(self, key, value, **kwargs):
+        return await self._call("create", key, value, **kwargs)
+
+    async def read(self, key, **kwargs):
+        return await self._call("read", key, **kwargs)
+
+    async def read_with_cas(self, key, **kwargs):
+        return await self._call("read_with_cas", key, **kwargs)
+
+    async def read_cas(self, key, **kwargs):
+        return await self._call("read_cas", key, **kwargs)
+
+    async def read_multi(self, keys, **kwargs):
+        results = await asyncio.gather(
+            *[self._call("read_with_cas", key) for key in keys]
+        )
+        return dict(zip(keys, results))
+
+    async def set(self, key, value, **kwargs):
+        return await self._call("set", key, value, **kwargs)
+
+    async def set_with_cas(self, key, value, **kwargs):
+        return await self._call("set_with_cas", key, value, **kwargs)
+
+    async def delete(self, key, **kwargs):
+        return await self._call("delete", key, **kwargs)
+
+    async def set_multi(self, items, **kwargs):
+        keys = list(items)
+        results = await asyncio.gather(
+            *[self._call("set", key, items[key]) for key in keys]
+        )
+        return {
+            key: (success, self.datastore.db[key]['cas'])
+            for key, success in zip(keys, results)
+        }
+
+    async def update_multi_with_cas(self, items, **kwargs):
+        await asyncio.sleep(self.delay)
+        results = self.datastore.update_multi_with_cas(items, **kwargs)
+        self.completed += [("update_multi_with_cas", key) for key in items]
+        return results
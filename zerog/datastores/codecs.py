@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+Document codecs for zerog datastores.
+
+A codec turns a document (native python data: dicts, lists, strings,
+numbers) into bytes before it is written to the datastore, and turns
+those bytes back into a document when it is read. Encoded documents start
+with a short header that identifies the codec and whether the payload is
+compressed, so any codec can read documents written by any other codec.
+
+Documents without a header are legacy JSON documents and are decoded with
+``json.loads``.
+
+    header: MAGIC (3 bytes) | FORMAT (1 byte) | FLAGS (1 byte)
+"""
+import datetime
+import json
+import struct
+import time
+import zlib
+
+import logging
+log = logging.getLogger(__name__)
+
+MAGIC = b"\x89ZG"
+HEADER_LEN = len(MAGIC) + 2
+
+FORMAT_JSON = 1
+FORMAT_MSGPACK = 2
+
+FLAG_COMPRESSED = 0x01
+
+# msgpack extension types for ISO datetime strings, and for integers that
+# don't fit in 64 bits (msgpack's limit, but not JSON's)
+EXT_ISO_DATETIME = 1
+EXT_BIG_INT = 2
+INT_MIN = -2 ** 63
+INT_MAX = 2 ** 64 - 1
+DATETIME_STRUCT = struct.Struct(">qI")
+EPOCH = datetime.datetime(1970, 1, 1)
+
+DEFAULT_COMPRESS_THRESHOLD = 1024
+DEFAULT_COMPRESS_LEVEL = 6
+
+# msgpack is an optional dependency (pip install zerog[msgpack]), imported
+# by import_msgpack when it's first needed
+msgpack = None
+
+
+class CodecError(Exception):
+    pass
+
+
+def import_msgpack():
+    """
+    Imports msgpack, which only msgpack documents need. Raises CodecError
+    if it isn't installed
+    """
+    global msgpack
+    if msgpack is None:
+        try:
+            import msgpack as module
+        except ImportError:
+            raise CodecError(
+                "msgpack documents need the msgpack package - "
+                "pip install zerog[msgpack]"
+            )
+
+        msgpack = module
+
+    return msgpack
+
+
+class CodecStats(object):
+    """
+    Accumulates encoded size & latency compared to plain JSON, keyed by
+    the ``jobType`` of the document (or "other" for non-job documents)
+    """
+    def __init__(self):
+        self.byJobType = {}
+
+    def _entry(self, jobType):
+        entry = self.byJobType.get(jobType)
+        if entry is None:
+            entry = dict(
+                encodes=0,
+                decodes=0,
+                jsonBytes=0,
+                encodedBytes=0,
+                jsonEncodeSecs=0.0,
+                encodeSecs=0.0,
+                decodeSecs=0.0
+            )
+            self.byJobType[jobType] = entry
+
+        return entry
+
+    def record_encode(
+        self, jobType, jsonBytes, encodedBytes, jsonEncodeSecs, encodeSecs
+    ):
+        entry = self._entry(jobType)
+        entry['encodes'] += 1
+        entry['jsonBytes'] += jsonBytes
+        entry['encodedBytes'] += encodedBytes
+        entry['jsonEncodeSecs'] += jsonEncodeSecs
+        entry['encodeSecs'] += encodeSecs
+
+    def record_decode(self, jobType, decodeSecs):
+        entry = self._entry(jobType)
+        entry['decodes'] += 1
+        entry['decodeSecs'] += decodeSecs
+
+    def report(self):
+        """
+        Returns a dictionary of {jobType: savings} where savings includes
+        total & average sizes and encode latencies for the codec versus
+        plain JSON.
+        """
+        report = {}
+        for jobType, entry in self.byJobType.items():
+            encodes = entry['encodes'] or 1
+            decodes = entry['decodes'] or 1
+            jsonBytes = entry['jsonBytes']
+            encodedBytes = entry['encodedBytes']
+            report[jobType] = dict(
+                encodes=entry['encodes'],
+                decodes=entry['decodes'],
+                avgJsonBytes=jsonBytes / encodes,
+                avgEncodedBytes=encodedBytes / encodes,
+                savedBytes=jsonBytes - encodedBytes,
+                sizeRatio=(encodedBytes / jsonBytes) if jsonBytes else None,
+                avgJsonEncodeSecs=entry['jsonEncodeSecs'] / encodes,
+                avgEncodeSecs=entry['encodeSecs'] / encodes,
+                avgDecodeSecs=entry['decodeSecs'] / decodes
+            )
+
+        return report
+
+    def reset(self):
+        self.byJobType = {}
+
+
+class BaseCodec(object):
+    """
+    Base class for document codecs. Subclasses implement ``_dumps`` and
+    set ``FORMAT``. Decoding is format-agnostic.
+
+    Args:
+        compressThreshold: payloads at least this many bytes long are
+                           zlib compressed. None disables compression
+
+        compressLevel: zlib compression level
+
+        collectStats: if True, track size & latency against plain JSON
+                      per jobType. This costs an extra JSON encode for
+                      every document, so leave it off in production
+                      unless you're measuring
+    """
+    FORMAT = None
+
+    def __init__(
+        self,
+        compressThreshold=DEFAULT_COMPRESS_THRESHOLD,
+        compressLevel=DEFAULT_COMPRESS_LEVEL,
+        collectStats=False
+    ):
+        self.compressThreshold = compressThreshold
+        self.compressLevel = compressLevel
+        self.stats = CodecStats() if collectStats else None
+
+    def _dumps(self, value):
+        raise NotImplementedError
+
+    def encode(self, value):
+        """
+        Encode a document as bytes, including the codec header
+        """
+        if self.stats is not None:
+            startTime = time.perf_counter()
+
+        payload = self._dumps(value)
+        flags = 0
+        if (
+            self.compressThreshold is not None and
+            len(payload) >= self.compressThreshold
+        ):
+            compressed = zlib.compress(payload, self.compressLevel)
+            if len(compressed) < len(payload):
+                payload = compressed
+                flags |= FLAG_COMPRESSED
+
+        encoded = MAGIC + bytes((self.FORMAT, flags)) + payload
+
+        if self.stats is not None:
+            encodeSecs = time.perf_counter() - startTime
+            startTime = time.perf_counter()
+            jsonBytes = len(json.dumps(value).encode("utf-8"))
+            jsonEncodeSecs = time.perf_counter() - startTime
+            self.stats.record_encode(
+                doc_job_type(value),
+                jsonBytes,
+                len(encoded),
+                jsonEncodeSecs,
+                encodeSecs
+            )
+
+        return encoded
+
+    def decode(self, data):
+        """
+        Decode bytes written by any codec, or a legacy JSON document
+        """
+        if self.stats is None:
+            return decode(data)
+
+        startTime = time.perf_counter()
+        value = decode(data)
+        self.stats.record_decode(
+            doc_job_type(value), time.perf_counter() - startTime
+        )
+        return value
+
+    def report(self):
+        """
+        Returns per-jobType size & latency savings, or an empty dictionary
+        if the codec isn't collecting stats
+        """
+        if self.stats is None:
+            return {}
+
+        return self.stats.report()
+
+
+class JsonCodec(BaseCodec):
+    """
+    Compact JSON, optionally compressed
+    """
+    FORMAT = FORMAT_JSON
+
+    def _dumps(self, value):
+        return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+class MsgpackCodec(BaseCodec):
+    """
+    msgpack binary encoding, optionally compressed. ISO datetime strings
+    are packed as 12-byte extension values and restored as identical
+    strings on decode.
+    """
+    FORMAT = FORMAT_MSGPACK
+
+    def __init__(self, *args, **kwargs):
+        import_msgpack()
+        super(MsgpackCodec, self).__init__(*args, **kwargs)
+
+    def _dumps(self, value):
+        return msgpack.packb(pack_value(value), use_bin_type=True)
+
+
+def doc_job_type(value):
+    if isinstance(value, dict):
+        return value.get('jobType') or "other"
+
+    return "other"
+
+
+def is_encoded(data):
+    return isinstance(data, (bytes, bytearray)) and data[:3] == MAGIC
+
+
+def decode(data):
+    """
+    Decode a document written by any codec. Data that doesn't start with
+    the codec header is treated as a legacy JSON document.
+    """
+    if not is_encoded(data):
+        if isinstance(data, (bytes, bytearray)):
+            return json.loads(data)
+
+        # already decoded -- e.g. a legacy document that the datastore
+        # client deserialized itself
+        return data
+
+    fmt = data[3]
+    flags = data[4]
+    payload = bytes(data[HEADER_LEN:])
+
+    if flags & FLAG_COMPRESSED:
+        payload = zlib.decompress(payload)
+
+    if fmt == FORMAT_JSON:
+        return json.loads(payload)
+
+    elif fmt == FORMAT_MSGPACK:
+        return import_msgpack().unpackb(
+            payload, raw=False, ext_hook=_ext_hook
+        )
+
+    raise CodecError("unknown document format {0}".format(fmt))
+
+
+def pack_value(value):
+    """
+    Prepares a document for msgpack. ISO datetime strings are replaced
+    with compact extension values -- only naive strings that round-trip
+    exactly are replaced. Integers too big for msgpack are replaced with
+    extension values holding their decimal string.
+    """
+    if isinstance(value, dict):
+        return {k: pack_value(v) for k, v in value.items()}
+
+    elif isinstance(value, list):
+        return [pack_value(v) for v in value]
+
+    elif isinstance(value, str):
+        packed = _pack_iso_datetime(value)
+        if packed is not None:
+            return packed
+
+    elif type(value) is int and not (INT_MIN <= value <= INT_MAX):
+        return msgpack.ExtType(EXT_BIG_INT, str(value).encode("ascii"))
+
+    return value
+
+
+def _pack_iso_datetime(value):
+    # cheap rejection before trying to parse
+    if not (19 <= len(value) <= 26) or value[10:11] != "T" or \
+            value[4:5] != "-":
+        return None
+
+    try:
+        dt = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+    if dt.tzinfo is not None or dt.isoformat() != value:
+        return None
+
+    delta = dt - EPOCH
+    seconds = delta.days * 86400 + delta.seconds
+    return msgpack.ExtType(
+        EXT_ISO_DATETIME, DATETIME_STRUCT.pack(seconds, delta.microseconds)
+    )
+
+
+def _ext_hook(code, data):
+    if code == EXT_ISO_DATETIME:
+        seconds, microseconds = DATETIME_STRUCT.unpack(data)
+        dt = EPOCH + datetime.timedelta(
+            seconds=seconds, microseconds=microseconds
+        )
+        return dt.isoformat()
+
+    elif code == EXT_BIG_INT:
+        return int(data)
+
+    return msgpack.ExtType(code, data)
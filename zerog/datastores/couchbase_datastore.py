@@ -7,10 +7,22 @@ Copyright (c) 2020 MotiveMetrics. All rights reserved.
 from couchbase.cluster import Cluster
 from couchbase.auth import PasswordAuthenticator
 # from couchbase.management.buckets import BucketManager
-from couchbase.options import ClusterOptions, ReplaceOptions
+from couchbase.n1ql import QueryScanConsistency
+from couchbase.options import (
+    ClusterOptions, QueryOptions, ReplaceOptions, ReplaceMultiOptions
+)
+from couchbase.transcoder import (
+    Transcoder, FMT_BYTES, FMT_JSON, get_decode_format
+)
 import couchbase.exceptions
+import json
 import psutil
 
+from .documents import (
+    INDEX_DOCUMENT_TYPE, make_index_key, update_document
+)
+from .multi import DEFAULT_MULTI_CHUNK_SIZE, chunked
+
 import logging
 log = logging.getLogger(__name__)
 
@@ -42,28 +54,78 @@ def retry_on_timeouts(func):
     return wrapper
 
 
+def make_connection_string(host, kwargs):
+    # pops any connection kwargs out of kwargs
+    connectionString = "couchbase://{0}".format(host)
+
+    connectArgs = []
+    for arg in CONNECTION_KWARGS:
+        value = kwargs.pop(arg, None)
+        if value:
+            connectArgs.append("{0}={1}".format(arg, value))
+
+    queryStr = "&".join(connectArgs)
+    if queryStr:
+        connectionString += "?{0}".format(queryStr)
+
+    return connectionString
+
+
+def make_cluster_options(username, password, codec=None):
+    authenticator = PasswordAuthenticator(username, password)
+    if codec:
+        return ClusterOptions(
+            authenticator, transcoder=CodecTranscoder(codec)
+        )
+
+    return ClusterOptions(authenticator)
+
+
+class CodecTranscoder(Transcoder):
+    """
+    Couchbase transcoder that writes documents with a zerog document codec
+    and reads both codec-encoded and legacy JSON documents
+    """
+    def __init__(self, codec):
+        self.codec = codec
+
+    def encode_value(self, value):
+        return self.codec.encode(value), FMT_BYTES
+
+    def decode_value(self, value, flags):
+        fmt = get_decode_format(flags)
+        if fmt in [FMT_JSON, 0, None]:
+            # legacy document written by the default JSON transcoder
+            return json.loads(value)
+
+        return self.codec.decode(value)
+
+
 class CouchbaseDatastore(object):
     """
     Simple Couchbase datastore client object
+
+    Pass a ``codec`` keyword argument (see zerog.datastores.codecs) to
+    store documents in a compact binary encoding. Existing JSON documents
+    are still read transparently.
+
+    Set the ``blobstore`` attribute to a blob store (see zerog.blobstores)
+    to keep jobs' ``Blob`` fields out of their documents, and the
+    ``jobIndex`` attribute to a JobIndex (see zerog.jobindex) to have jobs
+    maintain it.
     """
     casException = couchbase.exceptions.CASMismatchException
     lockedException = couchbase.exceptions.DocumentLockedException
+    existsException = couchbase.exceptions.DocumentExistsException
+    blobstore = None
+    jobIndex = None
 
     def __init__(self, host, username, password, bucket, **kwargs):
-        connectionString = "couchbase://{0}".format(host)
-
-        connectArgs = []
-        for arg in CONNECTION_KWARGS:
-            value = kwargs.pop(arg, None)
-            if value:
-                connectArgs.append("{0}={1}".format(arg, value))
-
-        queryStr = "&".join(connectArgs)
-        if queryStr:
-            connectionString += "?{0}".format(queryStr)
-
-        authenticator = PasswordAuthenticator(username, password)
-        self.cluster = Cluster(connectionString, ClusterOptions(authenticator))
+        self.codec = kwargs.pop("codec", None)
+        connectionString = make_connection_string(host, kwargs)
+        clusterOptions = make_cluster_options(username, password, self.codec)
+        self.cluster = Cluster(connectionString, clusterOptions)
+        self.bucketName = bucket
         self.bucket = self.cluster.bucket(bucket)
         self.viewManager = self.bucket.view_indexes()
         # self.bucketManager = BucketManager(self.bucket._admin)
@@ -84,6 +146,44 @@ class CouchbaseDatastore(object):
         result = self.collection.get(key, quiet=True, **kwargs)
         return result.value, result.cas
 
+    @retry_on_timeouts
+    def read_cas(self, key, **kwargs):
+        # metadata-only lookup -- much cheaper than reading the document
+        result = self.collection.exists(key, **kwargs)
+        return result.cas if result.exists else None
+
+    def read_multi(self, keys, chunkSize=DEFAULT_MULTI_CHUNK_SIZE, **kwargs):
+        """
+        Reads several documents. Keys are fetched in batches of at most
+        ``chunkSize`` concurrent operations.
+
+        :returns: dictionary of {key: (value, cas)}. Both are None for
+            missing documents
+        """
+        results = dict()
+        for chunk in chunked(keys, chunkSize):
+            results.update(self._read_chunk(chunk, **kwargs))
+
+        return results
+
+    @retry_on_timeouts
+    def _read_chunk(self, keys, **kwargs):
+        multiResult = self.collection.get_multi(
+            keys, return_exceptions=True, **kwargs
+        )
+        for e in multiResult.exceptions.values():
+            if not isinstance(
+                e, couchbase.exceptions.DocumentNotFoundException
+            ):
+                raise e
+
+        found = multiResult.results
+        return {
+            key: (found[key].value, found[key].cas) if key in found
+            else (None, None)
+            for key in keys
+        }
+
     @retry_on_timeouts
     def update(self, key, value, **kwargs):
         result = self.collection.replace(key, value, ReplaceOptions(**kwargs))
@@ -110,7 +210,182 @@ class CouchbaseDatastore(object):
             result = self.collection.insert(key, value, **kwargs)
         return result.success, result.cas
 
+    def set_multi(self, items, chunkSize=DEFAULT_MULTI_CHUNK_SIZE, **kwargs):
+        """
+        Upserts several documents. Documents are written in batches of at
+        most ``chunkSize`` concurrent operations.
+
+        :param dict items: dictionary of {key: value}
+
+        :returns: dictionary of {key: (success, cas)}
+        """
+        results = dict()
+        for chunk in chunked(items, chunkSize):
+            results.update(
+                self._set_chunk({key: items[key] for key in chunk}, **kwargs)
+            )
+
+        return results
+
+    @retry_on_timeouts
+    def _set_chunk(self, items, **kwargs):
+        multiResult = self.collection.upsert_multi(
+            items, return_exceptions=True, **kwargs
+        )
+        for e in multiResult.exceptions.values():
+            raise e
+
+        return {
+            key: (result.success, result.cas)
+            for key, result in multiResult.results.items()
+        }
+
+    def update_multi_with_cas(
+        self, items, chunkSize=DEFAULT_MULTI_CHUNK_SIZE, **kwargs
+    ):
+        """
+        Replaces several documents, each only if its cas matches. Unlike
+        ``update_with_cas``, mismatches don't raise.
+
+        :param dict items: dictionary of {key: (value, cas)}
+
+        :returns: dictionary of {key: (success, cas)}. Documents that
+            changed or don't exist get (False, None)
+        """
+        results = dict()
+        for chunk in chunked(items, chunkSize):
+            results.update(
+                self._update_chunk({key: items[key] for key in chunk}, **kwargs)
+            )
+
+        return results
+
+    @retry_on_timeouts
+    def _update_chunk(self, items, **kwargs):
+        multiResult = self.collection.replace_multi(
+            {key: value for key, (value, _) in items.items()},
+            ReplaceMultiOptions(
+                per_key_options={
+                    key: ReplaceOptions(cas=cas, **kwargs)
+                    for key, (_, cas) in items.items()
+                },
+                return_exceptions=True
+            )
+        )
+        results = dict()
+        for key, e in multiResult.exceptions.items():
+            if not isinstance(e, (
+                couchbase.exceptions.CASMismatchException,
+                couchbase.exceptions.DocumentNotFoundException
+            )):
+                raise e
+
+            results[key] = (False, None)
+
+        for key, result in multiResult.results.items():
+            results[key] = (result.success, result.cas)
+
+        return results
+
     @retry_on_timeouts
     def delete(self, key, **kwargs):
-        result = self.collection.remove(key, quiet=True, **kwargs)
+        # a cas kwarg makes the delete fail with a casException if the
+        # document has changed
+        try:
+            result = self.collection.remove(key, quiet=True, **kwargs)
+        except couchbase.exceptions.DocumentNotFoundException:
+            return False
+
         return result.success
+
+    def create_job_index(self):
+        """
+        Creates the GSI indexes that job index queries (see
+        zerog.jobindex) use, if they don't exist
+        """
+        for name, keys in (
+            (
+                INDEX_DOCUMENT_TYPE,
+                "jobType, state, createdAt DESC, uuid DESC, resultCode, "
+                "updatedAt"
+            ),
+            (INDEX_DOCUMENT_TYPE + "_updated", "state, updatedAt")
+        ):
+            self.cluster.query(
+                "CREATE INDEX `{0}` IF NOT EXISTS ON `{1}`({2}) "
+                "WHERE documentType = \"{3}\"".format(
+                    name, self.bucketName, keys, INDEX_DOCUMENT_TYPE
+                )
+            ).execute()
+
+    def write_index(self, records):
+        """
+        Writes job index records (see zerog.jobindex), each unless the
+        stored record of its job is newer. Records are documents covered
+        by the GSI indexes of ``create_job_index``.
+
+        :param list records: (record, expiry) pairs. expiry is the
+            document expiry of the record's job, or None
+        """
+        for record, expiry in records:
+            def newer(data, record=record):
+                if data and data['updatedAt'] > record['updatedAt']:
+                    return None
+
+                return dict(record, documentType=INDEX_DOCUMENT_TYPE)
+
+            kwargs = dict(expiry=expiry) if expiry else dict()
+            update_document(
+                self, make_index_key(record['uuid']), newer, **kwargs
+            )
+
+    def delete_index(self, uuids):
+        for uuid in uuids:
+            self.delete(make_index_key(uuid))
+
+    def query_index(self, query):
+        """
+        :param dict query: query of the job index (see zerog.jobindex)
+        :returns: the matching records, newest first
+        """
+        where = ["r.documentType = $documentType"]
+        params = dict(documentType=INDEX_DOCUMENT_TYPE)
+        if query['jobTypes'] is not None:
+            where.append("r.jobType IN $jobTypes")
+            params['jobTypes'] = query['jobTypes']
+        else:
+            where.append("r.jobType IS NOT MISSING")
+
+        for clause, name, value in (
+            ("r.state IN $states", 'states', query['states']),
+            ("r.resultCode = $resultCode", 'resultCode', query['resultCode']),
+            ("r.createdAt >= $since", 'since', query['since']),
+            ("r.createdAt <= $until", 'until', query['until']),
+            (
+                "r.updatedAt < $updatedBefore", 'updatedBefore',
+                query['updatedBefore']
+            )
+        ):
+            if value is not None:
+                where.append(clause)
+                params[name] = value
+
+        if query['after'] is not None:
+            where.append(
+                "(r.createdAt < $afterAt OR "
+                "(r.createdAt = $afterAt AND r.uuid < $afterUuid))"
+            )
+            params['afterAt'], params['afterUuid'] = query['after']
+
+        result = self.cluster.query(
+            "SELECT r.uuid, r.jobType, r.state, r.resultCode, r.createdAt, "
+            "r.updatedAt FROM `{0}` r WHERE {1} "
+            "ORDER BY r.createdAt DESC, r.uuid DESC LIMIT {2}".format(
+                self.bucketName, " AND ".join(where), int(query['limit'])
+            ),
+            QueryOptions(
+                named_parameters=params,
+                scan_consistency=QueryScanConsistency.REQUEST_PLUS
+            )
+        )
+        return list(result.rows())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+Helpers for shared datastore documents that aren't jobs, and for the
+job index records that datastores keep (see zerog.jobindex)
+"""
+import random
+import time
+
+import logging
+log = logging.getLogger(__name__)
+
+MAX_TRIES = 10
+INDEX_DOCUMENT_TYPE = "zerog_jobindex"
+
+
+def exists_exception(datastore):
+    """
+    The exception a datastore raises when a create collides with an
+    existing document. Datastores that don't define ``existsException``
+    are assumed to raise their ``casException``
+    """
+    return getattr(datastore, 'existsException', datastore.casException)
+
+
+def update_document(datastore, key, func, tries=MAX_TRIES, **kwargs):
+    """
+    Read-modify-write of a document that several processes update, e.g.
+    a signal or index document.
+
+    func is called with the stored document, or None if there isn't one,
+    and returns the document to write, or None if nothing should be
+    written. If another process writes the document first (a cas
+    mismatch, a lock or a concurrent create), func is called again with
+    the new document. Other datastore errors are raised.
+
+    Args:
+        datastore: datastore holding the document
+
+        key: key of the document
+
+        func: function of the stored document, returning the new one
+
+        tries: number of attempts before giving up
+
+        kwargs: options of the write, e.g. expiry
+
+    Returns:
+        True if the document was written
+    """
+    collisions = (
+        datastore.casException,
+        datastore.lockedException,
+        exists_exception(datastore)
+    )
+    for _ in range(tries):
+        data, cas = datastore.read_with_cas(key)
+        doc = func(data)
+        if doc is None:
+            return False
+
+        try:
+            if data is None:
+                datastore.create(key, doc, **kwargs)
+            else:
+                datastore.set_with_cas(key, doc, cas=cas, **kwargs)
+            return True
+
+        except collisions:
+            log.debug(f"collision on {key} - retrying")
+            time.sleep(random.random() / 100)
+
+    log.error(f"update of {key} failed - too many collisions")
+    return False
+
+
+def make_index_key(uuid):
+    # key of a job's index record, for datastores that keep records as
+    # documents
+    return "{0}_{1}".format(INDEX_DOCUMENT_TYPE, uuid)
+
+
+def match_index_record(record, query):
+    """
+    True if an index record matches a ``query_index`` query. For
+    datastores that filter records in Python
+    """
+    if query['jobTypes'] is not None and (
+        record['jobType'] not in query['jobTypes']
+    ):
+        return False
+    if query['states'] is not None and record['state'] not in query['states']:
+        return False
+    if query['resultCode'] is not None and (
+        record['resultCode'] != query['resultCode']
+    ):
+        return False
+    if query['since'] is not None and record['createdAt'] < query['since']:
+        return False
+    if query['until'] is not None and record['createdAt'] > query['until']:
+        return False
+    if query['updatedBefore'] is not None and (
+        record['updatedAt'] >= query['updatedBefore']
+    ):
+        return False
+    if query['after'] is not None and (
+        [record['createdAt'], record['uuid']] >= list(query['after'])
+    ):
+        return False
+    return True
+
+
+def sort_index_records(records):
+    # query_index order: newest (createdAt, uuid) first
+    return sorted(
+        records, key=lambda r: (r['createdAt'], r['uuid']), reverse=True
+    )
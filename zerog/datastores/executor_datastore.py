@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+
+from .documents import exists_exception
+
+import logging
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 4
+
+
+class ExecutorDatastore(object):
+    """
+    Async interface to a synchronous datastore. Each operation is run in a
+    thread pool so it doesn't block the event loop.
+
+    Used by the Server when no native async datastore is configured.
+
+    Args:
+        datastore: synchronous datastore object
+
+        maxWorkers: maximum number of concurrent datastore operations
+    """
+    def __init__(self, datastore, maxWorkers=DEFAULT_MAX_WORKERS):
+        self.datastore = datastore
+        self.casException = datastore.casException
+        self.lockedException = datastore.lockedException
+        self.existsException = exists_exception(datastore)
+        self.executor = ThreadPoolExecutor(
+            max_workers=maxWorkers, thread_name_prefix="zerog_datastore"
+        )
+
+    def __getattr__(self, name):
+        method = getattr(self.datastore, name)
+        if not callable(method):
+            return method
+
+        async def wrapper(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, functools.partial(method, *args, **kwargs)
+            )
+
+        return wrapper
@@ -1,5 +1,11 @@
+import time
 import uuid
 
+from .documents import (
+    INDEX_DOCUMENT_TYPE, make_index_key, match_index_record,
+    sort_index_records
+)
+
 
 class CasException(Exception):
     pass
@@ -9,46 +15,169 @@ class LockedException(Exception):
     pass
 
 
+class ExistsException(KeyError):
+    pass
+
+
 class MockDatastore(object):
     """
     Mock datastore class for testing.
 
     Use a dictionary to simulate a key-value store
+
+    Args:
+        codec: optional document codec (see zerog.datastores.codecs).
+               If set, values are stored as encoded bytes
+
+    Like Couchbase, documents written with an ``expiry`` (a
+    datetime.timedelta) are dropped once they expire.
+
+    Set the ``blobstore`` attribute to a blob store (see zerog.blobstores)
+    to keep jobs' ``Blob`` fields out of their documents, and the
+    ``jobIndex`` attribute to a JobIndex (see zerog.jobindex) to have jobs
+    maintain it.
     """
     casException = CasException
     lockedException = LockedException
+    existsException = ExistsException
+    blobstore = None
+    jobIndex = None
 
-    def __init__(self):
+    def __init__(self, codec=None):
         self.db = dict()
+        self.codec = codec
+
+    def _encode(self, value):
+        if self.codec:
+            return self.codec.encode(value)
+
+        return value
+
+    def _decode(self, value):
+        if self.codec and isinstance(value, (bytes, bytearray)):
+            return self.codec.decode(value)
+
+        return value
+
+    def _make_doc(self, value, kwargs):
+        doc = dict(value=self._encode(value), cas=uuid.uuid4().int)
+        if kwargs.get('expiry'):
+            doc['expiresAt'] = time.time() + kwargs['expiry'].total_seconds()
+
+        return doc
+
+    def _get(self, key):
+        data = self.db.get(key, None)
+        if data and data.get('expiresAt', float('inf')) <= time.time():
+            del self.db[key]
+            return None
+
+        return data
 
     def create(self, key, value, **kwargs):
-        if key not in self.db:
-            self.db[key] = dict(value=value, cas=uuid.uuid4().int)
+        if self._get(key) is None:
+            self.db[key] = self._make_doc(value, kwargs)
 
         return True
 
     def read(self, key, **kwargs):
-        return self.db.get(key, None)['value']
+        return self._decode(self._get(key)['value'])
 
     def read_with_cas(self, key, **kwargs):
-        data = self.db.get(key, None)
+        data = self._get(key)
 
         if data:
-            return data['value'], data['cas']
+            return self._decode(data['value']), data['cas']
         else:
             return None, None
 
+    def read_cas(self, key, **kwargs):
+        data = self._get(key)
+        return data['cas'] if data else None
+
+    def read_multi(self, keys, **kwargs):
+        return {key: self.read_with_cas(key) for key in keys}
+
     def set(self, key, value, **kwargs):
-        self.db[key] = dict(value=value, cas=uuid.uuid4().int)
+        self.db[key] = self._make_doc(value, kwargs)
         return True
 
     def set_with_cas(self, key, value, **kwargs):
-        data = self.db.get(key, None)
+        data = self._get(key)
 
         if data and kwargs['cas'] != data['cas']:
             raise self.casException
 
-        newdata = dict(value=value, cas=uuid.uuid4().int)
+        newdata = self._make_doc(value, kwargs)
         self.db[key] = newdata
 
         return True, newdata['cas']
+
+    def set_multi(self, items, **kwargs):
+        results = dict()
+        for key, value in items.items():
+            self.set(key, value)
+            results[key] = (True, self.db[key]['cas'])
+
+        return results
+
+    def update_multi_with_cas(self, items, **kwargs):
+        results = dict()
+        for key, (value, cas) in items.items():
+            data = self._get(key)
+            if data is None or data['cas'] != cas:
+                results[key] = (False, None)
+            else:
+                self.db[key] = self._make_doc(value, kwargs)
+                results[key] = (True, self.db[key]['cas'])
+
+        return results
+
+    def delete(self, key, **kwargs):
+        data = self._get(key)
+        if data and kwargs.get('cas') and kwargs['cas'] != data['cas']:
+            raise self.casException
+
+        return self.db.pop(key, None) is not None
+
+    def write_index(self, records):
+        """
+        Writes job index records (see zerog.jobindex), each unless the
+        stored record of its job is newer. Records are kept as documents
+        and filtered in Python, so queries scan every record.
+
+        :param list records: (record, expiry) pairs. expiry is the
+            document expiry of the record's job, or None
+        """
+        for record, expiry in records:
+            key = make_index_key(record['uuid'])
+            current = self._get(key)
+            if current and (
+                self._decode(current['value'])['updatedAt'] >
+                record['updatedAt']
+            ):
+                continue
+
+            self.db[key] = self._make_doc(dict(record), dict(expiry=expiry))
+
+    def delete_index(self, uuids):
+        for uuid in uuids:
+            self.db.pop(make_index_key(uuid), None)
+
+    def query_index(self, query):
+        """
+        :param dict query: query of the job index (see zerog.jobindex)
+        :returns: the matching records, newest first
+        """
+        records = []
+        for key in list(self.db):
+            if not key.startswith(INDEX_DOCUMENT_TYPE):
+                continue
+
+            data = self._get(key)
+            if data:
+                record = self._decode(data['value'])
+                if match_index_record(record, query):
+                    records.append(dict(record))
+
+        return sort_index_records(records)[:query['limit']]
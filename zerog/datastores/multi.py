@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+Helpers for bulk (multi-key) datastore operations
+"""
+import logging
+log = logging.getLogger(__name__)
+
+# maximum number of keys in flight in one bulk datastore operation
+DEFAULT_MULTI_CHUNK_SIZE = 100
+
+
+def chunked(items, chunkSize=DEFAULT_MULTI_CHUNK_SIZE):
+    """
+    Splits a list into lists of at most ``chunkSize`` items
+    """
+    items = list(items)
+    chunkSize = max(1, chunkSize)
+    return [
+        items[i:i + chunkSize] for i in range(0, len(items), chunkSize)
+    ]
@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+Embedded SQLite datastore, for single-host deployments
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from .codecs import JsonCodec, decode
+from .mock_datastore import CasException, ExistsException, LockedException
+
+import logging
+log = logging.getLogger(__name__)
+
+SQLITE_TIMEOUT = 30
+
+
+def make_cas():
+    # opaque, non-zero cas that fits in an sqlite INTEGER
+    return (uuid.uuid4().int >> 65) or 1
+
+
+def expires_at(kwargs):
+    expiry = kwargs.get('expiry')
+    return time.time() + expiry.total_seconds() if expiry else None
+
+
+class SqliteDatastore(object):
+    """
+    Persistent datastore in a local SQLite database, with the same
+    interface and cas semantics as CouchbaseDatastore.
+
+    The database is opened in WAL mode, so readers don't block the writer,
+    and every read-modify-write runs in an immediate transaction. It's
+    safe to share one database file between the server and its worker
+    processes: each process (and thread) opens its own connection.
+
+    Args:
+        path: database file path
+
+        codec: document codec (see zerog.datastores.codecs). Defaults to
+               JsonCodec
+
+    Set the ``blobstore`` attribute to a blob store (see zerog.blobstores)
+    to keep jobs' ``Blob`` fields out of their documents, and the
+    ``jobIndex`` attribute to a JobIndex (see zerog.jobindex) to have jobs
+    maintain it.
+    """
+    casException = CasException
+    lockedException = LockedException
+    existsException = ExistsException
+    blobstore = None
+    jobIndex = None
+
+    def __init__(self, path, codec=None):
+        self.path = path
+        self.codec = codec or JsonCodec()
+        self.local = threading.local()
+
+        dirname = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dirname, exist_ok=True)
+
+        conn = self.connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+            "cas INTEGER NOT NULL, expiresAt REAL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_index ("
+            "uuid TEXT PRIMARY KEY, jobType TEXT NOT NULL, "
+            "state TEXT NOT NULL, resultCode INTEGER NOT NULL, "
+            "createdAt TEXT NOT NULL, updatedAt TEXT NOT NULL, "
+            "expiresAt REAL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS job_index_listing ON job_index "
+            "(jobType, state, createdAt, uuid)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS job_index_updated ON job_index "
+            "(state, updatedAt)"
+        )
+
+    def connection(self):
+        # connections can't be shared across processes or threads
+        pid = os.getpid()
+        if getattr(self.local, "pid", None) != pid:
+            conn = sqlite3.connect(
+                self.path, timeout=SQLITE_TIMEOUT, isolation_level=None
+            )
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "PRAGMA busy_timeout={0}".format(SQLITE_TIMEOUT * 1000)
+            )
+            self.local.conn = conn
+            self.local.pid = pid
+
+        return self.local.conn
+
+    def _fetch(self, conn, key):
+        # returns (value, cas) of an unexpired document, or None
+        row = conn.execute(
+            "SELECT value, cas, expiresAt FROM docs WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is None or (row[2] is not None and row[2] <= time.time()):
+            return None
+
+        return decode(bytes(row[0])), row[1]
+
+    def _write(self, conn, key, value, kwargs):
+        cas = make_cas()
+        conn.execute(
+            "INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?)",
+            (key, self.codec.encode(value), cas, expires_at(kwargs))
+        )
+        return cas
+
+    def _modify(self, key, value, kwargs, mustExist=False,
+                mustNotExist=False):
+        # read-modify-write in one immediate transaction
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            current = self._fetch(conn, key)
+            if mustNotExist and current is not None:
+                raise self.existsException(
+                    "document {0} already exists".format(key)
+                )
+
+            if mustExist and current is None:
+                raise KeyError("document {0} doesn't exist".format(key))
+
+            cas = kwargs.get('cas')
+            if cas and current is not None and cas != current[1]:
+                raise self.casException
+
+            newCas = self._write(conn, key, value, kwargs)
+
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        conn.execute("COMMIT")
+        return newCas
+
+    def create(self, key, value, **kwargs):
+        self._modify(key, value, kwargs, mustNotExist=True)
+        return True
+
+    def read(self, key, **kwargs):
+        found = self._fetch(self.connection(), key)
+        return found[0] if found else None
+
+    def read_with_cas(self, key, **kwargs):
+        return self._fetch(self.connection(), key) or (None, None)
+
+    def read_cas(self, key, **kwargs):
+        row = self.connection().execute(
+            "SELECT cas, expiresAt FROM docs WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+
+        return row[0]
+
+    def read_multi(self, keys, **kwargs):
+        conn = self.connection()
+        return {key: self._fetch(conn, key) or (None, None) for key in keys}
+
+    def update(self, key, value, **kwargs):
+        self._modify(key, value, kwargs, mustExist=True)
+        return True
+
+    def update_with_cas(self, key, value, **kwargs):
+        return True, self._modify(key, value, kwargs, mustExist=True)
+
+    def set(self, key, value, **kwargs):
+        conn = self.connection()
+        self._write(conn, key, value, kwargs)
+        return True
+
+    def set_with_cas(self, key, value, **kwargs):
+        return True, self._modify(key, value, kwargs)
+
+    def set_multi(self, items, **kwargs):
+        conn = self.connection()
+        results = dict()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key, value in items.items():
+                results[key] = (True, self._write(conn, key, value, kwargs))
+
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        conn.execute("COMMIT")
+        return results
+
+    def update_multi_with_cas(self, items, **kwargs):
+        """
+        Replaces several documents, each only if its cas matches. Unlike
+        ``update_with_cas``, mismatches don't raise.
+
+        :param dict items: dictionary of {key: (value, cas)}
+
+        :returns: dictionary of {key: (success, cas)}. Documents that
+            changed or don't exist get (False, None)
+        """
+        conn = self.connection()
+        results = dict()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key, (value, cas) in items.items():
+                current = self._fetch(conn, key)
+                if current is None or current[1] != cas:
+                    results[key] = (False, None)
+                else:
+                    results[key] = (True, self._write(conn, key, value, kwargs))
+
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        conn.execute("COMMIT")
+        return results
+
+    def delete(self, key, **kwargs):
+        cas = kwargs.get('cas')
+        if not cas:
+            cursor = self.connection().execute(
+                "DELETE FROM docs WHERE key = ?", (key,)
+            )
+            return cursor.rowcount > 0
+
+        cursor = self.connection().execute(
+            "DELETE FROM docs WHERE key = ? AND cas = ?", (key, cas)
+        )
+        if cursor.rowcount == 0 and self.read_cas(key) is not None:
+            raise self.casException
+
+        return cursor.rowcount > 0
+
+    def purge_expired(self):
+        """
+        Deletes expired documents. Expired documents are never returned
+        by reads, but they take up space until they're purged.
+
+        :returns: number of documents deleted
+        """
+        conn = self.connection()
+        now = time.time()
+        conn.execute("DELETE FROM job_index WHERE expiresAt <= ?", (now,))
+        cursor = conn.execute("DELETE FROM docs WHERE expiresAt <= ?", (now,))
+        return cursor.rowcount
+
+    def write_index(self, records):
+        """
+        Writes job index records (see zerog.jobindex), each unless the
+        stored record of its job is newer. Records are kept in an indexed
+        table, so queries only read the records they return.
+
+        :param list records: (record, expiry) pairs. expiry is the
+            document expiry of the record's job, or None
+        """
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO job_index VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(uuid) DO UPDATE SET "
+                "state = excluded.state, "
+                "resultCode = excluded.resultCode, "
+                "updatedAt = excluded.updatedAt, "
+                "expiresAt = excluded.expiresAt "
+                "WHERE excluded.updatedAt >= job_index.updatedAt",
+                [
+                    (
+                        record['uuid'], record['jobType'], record['state'],
+                        record['resultCode'], record['createdAt'],
+                        record['updatedAt'], expires_at(dict(expiry=expiry))
+                    )
+                    for record, expiry in records
+                ]
+            )
+
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        conn.execute("COMMIT")
+
+    def delete_index(self, uuids):
+        self.connection().executemany(
+            "DELETE FROM job_index WHERE uuid = ?",
+            [(uuid,) for uuid in uuids]
+        )
+
+    def query_index(self, query):
+        """
+        :param dict query: query of the job index (see zerog.jobindex)
+        :returns: the matching records, newest first
+        """
+        where = ["(expiresAt IS NULL OR expiresAt > ?)"]
+        params = [time.time()]
+        for field, values in (
+            ("jobType", query['jobTypes']), ("state", query['states'])
+        ):
+            if values is not None:
+                where.append("{0} IN ({1})".format(
+                    field, ", ".join("?" * len(values))
+                ))
+                params += values
+
+        for clause, value in (
+            ("resultCode = ?", query['resultCode']),
+            ("createdAt >= ?", query['since']),
+            ("createdAt <= ?", query['until']),
+            ("updatedAt < ?", query['updatedBefore'])
+        ):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+
+        if query['after'] is not None:
+            where.append("(createdAt, uuid) < (?, ?)")
+            params += list(query['after'])
+
+        rows = self.connection().execute(
+            "SELECT uuid, jobType, state, resultCode, createdAt, updatedAt "
+            "FROM job_index WHERE {0} "
+            "ORDER BY createdAt DESC, uuid DESC LIMIT ?".format(
+                " AND ".join(where)
+            ),
+            params + [query['limit']]
+        ).fetchall()
+        return [
+            dict(
+                uuid=uuid, jobType=jobType, state=state,
+                resultCode=resultCode, createdAt=createdAt,
+                updatedAt=updatedAt
+            )
+            for uuid, jobType, state, resultCode, createdAt, updatedAt
+            in rows
+        ]
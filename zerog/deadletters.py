@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2017-2021 MotiveMetrics. All rights reserved.
+"""
+ZeroG DeadLetters class definition
+"""
+import datetime
+
+from zerog.datastores.documents import update_document
+from zerog.queues.beanstalk_client import CommandFailed
+
+import logging
+log = logging.getLogger(__name__)
+
+DEADLETTER_DOCUMENT_TYPE = "zerog_deadletters"
+MAX_BODY_LENGTH = 1000
+MAX_ENTRIES = 1000
+
+
+class DeadLetters(object):
+    """
+    Poison queue entries -- entries whose job can't be loaded -- buried in
+    a job queue, with the reason they were buried.
+
+    beanstalkd can't list a tube's buried entries, so each bury is also
+    recorded in a datastore document per tube. The document keeps the
+    latest MAX_ENTRIES records; older entries stay buried, and are kicked
+    by ``kick()``, but aren't listed. Buried entries stay out of the
+    workers' way until they're kicked back into the queue (e.g. after the
+    cause has been fixed) or deleted.
+
+    Args:
+        datastore: datastore holding the dead letter documents. Usually
+                   the datastore that holds the jobs
+
+        queue: job queue holding the buried entries
+    """
+    def __init__(self, datastore, queue):
+        self.datastore = datastore
+        self.queue = queue
+
+    def key(self):
+        return "{0}_{1}".format(DEADLETTER_DOCUMENT_TYPE, self.queue.queueName)
+
+    def bury(self, queueJob, reason, uuid=None):
+        """
+        Buries a reserved queue entry and records why.
+
+        :param queueJob: reserved queue job
+        :param str reason: why the entry was buried
+        :param str uuid: uuid of the entry's job, if known
+        :returns: ``None``
+        """
+        queueJob.bury()
+        entry = dict(
+            uuid=uuid,
+            reason=reason,
+            body=queueJob.body[:MAX_BODY_LENGTH],
+            buriedAt=datetime.datetime.utcnow().isoformat()
+        )
+
+        def add_entry(entries):
+            entries[str(queueJob.jid)] = entry
+            excess = sorted(
+                entries, key=lambda jid: entries[jid]['buriedAt']
+            )[:-MAX_ENTRIES]
+            for jid in excess:
+                del entries[jid]
+            if excess:
+                log.warning(
+                    f"{self.key()}: more than {MAX_ENTRIES} dead letters, "
+                    f"dropped the records of {len(excess)}"
+                )
+            return True
+
+        self.update(add_entry)
+
+    def list(self):
+        """
+        Lists the buried entries. Entries that have been kicked or deleted
+        by other means are dropped.
+
+        :returns: entries, oldest first. Each is a dict with the entry's
+            ``jid``, ``uuid``, ``reason``, ``body`` and ``buriedAt``
+        :rtype: list
+        """
+        data, _ = self.datastore.read_with_cas(self.key())
+        entries = (data or {}).get('entries', {})
+
+        gone = []
+        for jid in entries:
+            try:
+                state = self.queue.do_bean("stats_job", int(jid))['state']
+            except CommandFailed:
+                state = None
+
+            if state != "buried":
+                gone.append(jid)
+
+        if gone:
+            self.remove(gone)
+
+        return sorted(
+            (
+                dict(entry, jid=int(jid))
+                for jid, entry in entries.items() if jid not in gone
+            ),
+            key=lambda entry: entry['buriedAt']
+        )
+
+    def kick(self, jids=None):
+        """
+        Kicks buried entries back into the queue.
+
+        :param list jids: ids of the entries to kick. Kicks all the buried
+            entries, recorded or not, if ``None``
+        :returns: ids of the entries that were kicked. When kicking all
+            the entries, the ids of the recorded ones
+        :rtype: list
+        """
+        if jids is None:
+            return self.kick_all()
+
+        kicked = []
+        for jid in [int(jid) for jid in jids]:
+            try:
+                self.queue.kick_job(jid)
+            except CommandFailed:
+                # already kicked or deleted
+                continue
+
+            kicked.append(jid)
+
+        self.remove(jids)
+        return kicked
+
+    def kick_all(self):
+        # kicks the tube's buried entries with one bulk kick. kick only
+        # kicks delayed entries when there are no buried ones, so it's
+        # bounded by the number of buried entries
+        data, _ = self.datastore.read_with_cas(self.key())
+        jids = [int(jid) for jid in (data or {}).get('entries', {})]
+
+        try:
+            buried = self.queue.do_bean(
+                "stats_tube", self.queue.queueName
+            )['current-jobs-buried']
+        except CommandFailed:
+            buried = 0
+
+        if buried:
+            self.queue.do_bean("kick", buried)
+
+        self.remove(jids)
+        return sorted(jids)
+
+    def delete(self, jids):
+        """
+        Deletes buried entries from the queue for good.
+
+        :param list jids: ids of the entries to delete
+        :returns: ``None``
+        """
+        for jid in [int(jid) for jid in jids]:
+            try:
+                self.queue.delete(jid)
+            except CommandFailed:
+                pass
+
+        self.remove(jids)
+
+    def remove(self, jids):
+        # forgets entries
+        names = {str(jid) for jid in jids}
+
+        def remove_entries(entries):
+            removed = names & set(entries)
+            for name in removed:
+                del entries[name]
+
+            return bool(removed)
+
+        self.update(remove_entries)
+
+    def update(self, func):
+        # read-modify-write of the dead letter document. func modifies its
+        # entries and returns False if they shouldn't be written
+        def modify(data):
+            entries = (data or {}).get('entries', {})
+            return dict(entries=entries) if func(entries) else None
+
+        update_document(self.datastore, self.key(), modify)
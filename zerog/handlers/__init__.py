@@ -1,3 +1,9 @@
 from .base import BaseHandler
 from .uuid import ProgressHandler, GetDataHandler, InfoHandler, DumpHandler
 from .run_job import RunJobHandler
+from .stats import JobCacheStatsHandler
+from .bulk import BulkStatusHandler
+from .job_list import JobListHandler
+from .bulk_run_job import BulkRunJobHandler
+from .signal import SignalHandler
+from .dead_letter import DeadLetterHandler
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+"""
+import json
+import tornado.escape
+from tornado.web import HTTPError
+
+from .base import BaseHandler
+
+import logging
+log = logging.getLogger(__name__)
+
+MAX_BULK_UUIDS = 1000
+STATUS_FIELDS = {
+    "progress": lambda job: job.progress(),
+    "info": lambda job: job.info()
+}
+
+
+class BulkStatusHandler(BaseHandler):
+    async def post(self, *args, **kwargs):
+        """
+        Returns the status of several jobs in one response. The request body
+        is json::
+
+            {"uuids": [<uuid>, ...], "fields": "progress" | "info"}
+
+        ``fields`` defaults to "progress". The response maps each uuid to
+        its job's status, or to ``null`` if the job doesn't exist.
+        """
+        try:
+            data = tornado.escape.json_decode(self.request.body)
+        except:
+            data = {}
+
+        uuids = data.get("uuids") if isinstance(data, dict) else None
+        if not isinstance(uuids, list) or not uuids:
+            raise HTTPError(400, "request needs a list of 'uuids'")
+
+        if len(uuids) > MAX_BULK_UUIDS:
+            raise HTTPError(
+                400, "too many uuids: limit is {0}".format(MAX_BULK_UUIDS)
+            )
+
+        fields = data.get("fields", "progress")
+        if fields not in STATUS_FIELDS:
+            raise HTTPError(
+                400, "'fields' must be one of {0}".format(
+                    sorted(STATUS_FIELDS)
+                )
+            )
+
+        jobs = await self.application.async_get_jobs(uuids)
+        statuses = {
+            uuid: STATUS_FIELDS[fields](jobs[uuid]) if jobs.get(uuid) else None
+            for uuid in uuids
+        }
+        self.complete(
+            200, output=json.dumps(statuses, indent=4, allow_nan=False)
+        )
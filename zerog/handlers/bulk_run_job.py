@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+"""
+import json
+import tornado.escape
+from tornado.web import HTTPError
+
+from .base import BaseHandler
+
+import logging
+log = logging.getLogger(__name__)
+
+MAX_BULK_JOBS = 10000
+
+
+class BulkRunJobHandler(BaseHandler):
+    async def post(self, *args, **kwargs):
+        """
+        Creates & enqueues many jobs in one request. The request body is
+        json::
+
+            {"jobs": [<job data>, ...], "jobType": <default jobType>}
+
+        ``jobType`` is optional if each job's data has one, and can also
+        be extracted from the URL (see ``RunJobHandler``).
+
+        The response lists the new jobs' uuids in request order, with
+        ``null`` for jobs that couldn't be created, and the reasons in
+        ``errors``, keyed by position.
+        """
+        try:
+            data = tornado.escape.json_decode(self.request.body)
+        except:
+            data = {}
+
+        dataList = data.get("jobs") if isinstance(data, dict) else None
+        if not isinstance(dataList, list) or not dataList:
+            raise HTTPError(400, "request needs a list of 'jobs'")
+
+        if len(dataList) > MAX_BULK_JOBS:
+            raise HTTPError(
+                400, "too many jobs: limit is {0}".format(MAX_BULK_JOBS)
+            )
+
+        if not all(isinstance(jobData, dict) for jobData in dataList):
+            raise HTTPError(400, "each job must be a json object")
+
+        jobType = self.derive_job_type(data, *args, **kwargs)
+        results = self.application.make_jobs(dataList, jobType)
+        jobs = [job for job, _ in results if job]
+        log.info(f"creating {len(jobs)} ZeroG jobs in bulk")
+
+        await self.application.async_enqueue_jobs(jobs)
+
+        uuids = [job.uuid if job else None for job, _ in results]
+        errors = {
+            str(i): error for i, (_, error) in enumerate(results) if error
+        }
+        self.complete(201 if jobs else 400, output=json.dumps(
+            dict(uuids=uuids, errors=errors), indent=4
+        ))
+
+    def derive_job_type(self, data, *args, **kwargs):
+        """
+        Extract the default jobType from the POST: a named or positional
+        URL argument, or the ``jobType`` field of the request body. Returns
+        None if each job's data must name its jobType.
+        """
+        if "jobtype" in kwargs:
+            return kwargs['jobtype']
+        elif len(args) >= 1:
+            return args[0]
+        else:
+            return data.get('jobType')
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+"""
+import json
+import tornado.escape
+import tornado.ioloop
+from tornado.web import HTTPError
+
+from .base import BaseHandler
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class DeadLetterHandler(BaseHandler):
+    async def get(self, *args, **kwargs):
+        """
+        Lists the poison entries buried in the server's job queue, with
+        the reason each was buried
+        """
+        entries = await tornado.ioloop.IOLoop.current().run_in_executor(
+            None, self.application.deadLetters.list
+        )
+        self.complete(200, output=json.dumps(
+            dict(entries=entries), indent=4)
+        )
+
+    async def post(self, *args, **kwargs):
+        """
+        Kicks buried entries back into the job queue, e.g. once the cause
+        has been fixed.
+
+        Body (optional): {"jids": [queue job ids]}. Kicks all the buried
+        entries if there are no jids
+        """
+        try:
+            data = tornado.escape.json_decode(self.request.body or b"{}")
+        except ValueError:
+            raise HTTPError(400, "request body must be JSON")
+
+        jids = data.get("jids")
+        if jids is not None and not isinstance(jids, list):
+            raise HTTPError(400, "jids must be a list")
+
+        kicked = await tornado.ioloop.IOLoop.current().run_in_executor(
+            None, self.application.deadLetters.kick, jids
+        )
+        log.info(f"kicked {len(kicked)} dead letters")
+
+        self.complete(200, output=json.dumps(dict(kicked=kicked), indent=4))
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+"""
+import json
+import tornado.ioloop
+from tornado.web import HTTPError
+
+from zerog.jobindex import STATES, DEFAULT_LIMIT
+
+from .base import BaseHandler
+
+import logging
+log = logging.getLogger(__name__)
+
+MAX_LIMIT = 1000
+
+
+class JobListHandler(BaseHandler):
+    async def get(self, *args, **kwargs):
+        """
+        Lists jobs from the datastore's job index, newest first.
+
+        Query arguments (all optional):
+
+            jobType: list only this jobType. Defaults to all registered
+                     jobTypes
+            state: one of queued, running, succeeded, failed
+            resultCode: list only jobs with this resultCode
+            since, until: ISO datetime range of the jobs' createdAt
+            limit: page size
+            cursor: ``cursor`` from the previous page's response
+        """
+        jobIndex = getattr(self.application.datastore, "jobIndex", None)
+        if jobIndex is None:
+            raise HTTPError(501, "this server has no job index")
+
+        jobType = self.get_query_argument("jobType", None)
+        if jobType:
+            jobTypes = [jobType]
+        else:
+            jobTypes = [
+                jobClass.JOB_TYPE
+                for jobClass in self.registry.get_registered_classes()
+            ]
+
+        state = self.get_query_argument("state", None)
+        if state and state not in STATES:
+            raise HTTPError(400, "state must be one of {0}".format(STATES))
+
+        try:
+            resultCode = self.get_query_argument("resultCode", None)
+            resultCode = int(resultCode) if resultCode else None
+            limit = int(self.get_query_argument("limit", DEFAULT_LIMIT))
+        except ValueError:
+            raise HTTPError(400, "resultCode and limit must be integers")
+
+        listKwargs = dict(
+            state=state,
+            resultCode=resultCode,
+            since=self.get_query_argument("since", None),
+            until=self.get_query_argument("until", None),
+            limit=max(1, min(limit, MAX_LIMIT)),
+            cursor=self.get_query_argument("cursor", None)
+        )
+
+        try:
+            jobs, cursor = await tornado.ioloop.IOLoop.current(
+            ).run_in_executor(
+                None, lambda: jobIndex.list(jobTypes, **listKwargs)
+            )
+        except ValueError as e:
+            raise HTTPError(400, "bad since/until/cursor: {0}".format(e))
+
+        self.complete(200, output=json.dumps(
+            dict(jobs=jobs, cursor=cursor), indent=4, allow_nan=False)
+        )
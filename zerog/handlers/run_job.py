@@ -17,7 +17,7 @@ JOB_TYPE_PATT = "(?P<jobtype>[^/]+)"
 
 
 class RunJobHandler(BaseHandler):
-    def post(self, *args, **kwargs):
+    async def post(self, *args, **kwargs):
         """
             Args:
                 jobType: must be extractable from the request by the
@@ -36,7 +36,7 @@ class RunJobHandler(BaseHandler):
         job = self.application.make_job(data, jobType)
 
         if job:
-            job.enqueue()
+            await job.async_enqueue(self.application.asyncDatastore)
             self.complete(
                 201, output=json.dumps(dict(uuid=job.uuid), indent=4)
             )
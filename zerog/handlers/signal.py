@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+"""
+import json
+import tornado.ioloop
+from tornado.web import HTTPError
+
+from .base import BaseHandler
+
+import logging
+log = logging.getLogger(__name__)
+
+SIGNAL_PATT = "(?P<signal>[^/]+)"
+
+
+class SignalHandler(BaseHandler):
+    async def post(self, *args, **kwargs):
+        """
+        Sends a signal, waking up the jobs that are waiting for it.
+
+            Args:
+                signal: name of the signal, as a named or positional
+                        argument extracted from the URL
+        """
+        if "signal" in kwargs:
+            name = kwargs['signal']
+        elif len(args) >= 1:
+            name = args[0]
+        else:
+            raise HTTPError(400, "Could not extract signal from request")
+
+        woken = await tornado.ioloop.IOLoop.current().run_in_executor(
+            None, self.application.signal, name
+        )
+        log.info(f"signal {name} woke {len(woken)} jobs")
+
+        self.complete(200, output=json.dumps(
+            dict(signal=name, woken=woken), indent=4)
+        )
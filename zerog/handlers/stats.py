@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+"""
+import json
+
+from .base import BaseHandler
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class JobCacheStatsHandler(BaseHandler):
+    def get(self, *args, **kwargs):
+        """
+        Returns the hit/miss metrics of the server's job cache
+        """
+        self.complete(200, output=json.dumps(
+            self.application.jobCache.stats(), indent=4)
+        )
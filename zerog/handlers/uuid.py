@@ -5,7 +5,9 @@ Copyright (c) 2020 MotiveMetrics. All rights reserved.
 
 """
 from abc import abstractmethod
+import inspect
 import json
+import tornado.ioloop
 from tornado.web import HTTPError
 
 from .base import BaseHandler
@@ -17,22 +19,27 @@ UUID_PATT = "(?P<uuid>[^/]+)"           # kwarg == "uuid"
 
 
 class UuidHandler(BaseHandler):
-    def get(self, *args, **kwargs):
+    async def get(self, *args, **kwargs):
         """
             Args:
                 uuid: must be extractable from the request by the
                       derive_uuid method
         """
         uuid = self.derive_uuid(*args, **kwargs)
-        job = self.application.get_job(uuid)
+        job = await self.application.async_get_job(uuid)
 
         if job:
-            self.do_get(job)
+            result = self.do_get(job)
+            if inspect.isawaitable(result):
+                await result
         else:
             raise HTTPError(404, "Could not find job %s" % uuid)
 
     @abstractmethod
     def do_get(self, job):
+        """
+        Responds with the job. May be a coroutine
+        """
         pass
 
     def derive_uuid(self, *args, **kwargs):
@@ -70,9 +77,14 @@ class ProgressHandler(UuidHandler):
 
 
 class GetDataHandler(UuidHandler):
-    def do_get(self, job):
+    async def do_get(self, job):
+        # get_data may load blobs from the blob store, so it's run in a
+        # thread rather than on the IOLoop
+        data = await tornado.ioloop.IOLoop.current().run_in_executor(
+            None, job.get_data
+        )
         self.complete(200, output=json.dumps(
-            job.get_data(), indent=4, allow_nan=False)
+            data, indent=4, allow_nan=False)
         )
 
 
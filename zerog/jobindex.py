@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2017-2021 MotiveMetrics. All rights reserved.
+"""
+ZeroG JobIndex class definition
+"""
+import datetime
+import os
+import threading
+import time
+
+from zerog.jobs import NO_RESULT
+
+import logging
+log = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = datetime.timedelta(hours=24)
+MAX_WINDOW = datetime.timedelta(days=31)
+DEFAULT_LIMIT = 100
+FLUSH_INTERVAL = 1
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+STATES = [QUEUED, RUNNING, SUCCEEDED, FAILED]
+
+
+def job_state(running, resultCode):
+    """
+    Summarizes a job's ``running`` flag and ``resultCode`` as an index
+    state
+    """
+    if resultCode != NO_RESULT:
+        return SUCCEEDED if 200 <= resultCode < 300 else FAILED
+
+    return RUNNING if running else QUEUED
+
+
+def to_datetime(value):
+    if isinstance(value, datetime.datetime):
+        return value
+
+    return datetime.datetime.fromisoformat(value)
+
+
+def make_cursor(entry):
+    return "{0}|{1}".format(entry['createdAt'], entry['uuid'])
+
+
+def parse_cursor(cursor):
+    createdAt, _, uuid = cursor.partition("|")
+    return createdAt, uuid
+
+
+class JobIndex(object):
+    """
+    Secondary index of jobs by jobType, state, resultCode and creation
+    time, so jobs can be listed without scanning the datastore.
+
+    The index holds one small record per job, which the datastore keeps
+    in a secondary index of its own: a table in SqliteDatastore, and
+    documents covered by a GSI in CouchbaseDatastore (see its
+    ``create_job_index``). Jobs update their record when their state
+    changes: when they're enqueued, start or stop running, and when their
+    result is recorded. Records of completed jobs expire with their jobs,
+    and archived jobs' records are removed.
+
+    Updates are queued and written in batches by a background thread
+    every ``flushInterval`` seconds, so saving a job never waits for the
+    index. A record is never overwritten by an older update. ``list``
+    writes this process's queued updates first, and workers flush after
+    each job.
+
+    A query reads the matching records in order from the datastore's
+    index, so its cost depends on the size of the page rather than on
+    the number of jobs.
+
+    Set a datastore's ``jobIndex`` attribute to a JobIndex to have jobs
+    maintain it.
+
+    Args:
+        datastore: datastore holding the jobs. It must support
+                   ``write_index``, ``delete_index`` & ``query_index``
+
+        flushInterval: seconds between background writes. With None,
+                       updates are written when they're made
+    """
+    def __init__(self, datastore, flushInterval=FLUSH_INTERVAL):
+        for method in ("write_index", "delete_index", "query_index"):
+            if not callable(getattr(datastore, method, None)):
+                raise TypeError(
+                    f"{type(datastore).__name__} doesn't support a job index"
+                )
+
+        self.datastore = datastore
+        self.flushInterval = flushInterval
+        self.pid = None
+        self.start()
+
+    def start(self):
+        # resets the queued updates in this process. A forked worker
+        # doesn't inherit its parent's flusher thread, so it starts its own
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.pending = dict()       # uuid -> (record, expiry)
+        self.flusher = None
+
+    def run_flusher(self):
+        pid = os.getpid()
+        while self.pid == pid:
+            time.sleep(self.flushInterval)
+            try:
+                self.flush()
+            except Exception:
+                log.exception("job index flush failed")
+
+    def make_record(self, job):
+        record = dict(
+            uuid=job.uuid,
+            jobType=job.jobType,
+            state=job_state(job.running, job.resultCode),
+            resultCode=job.resultCode,
+            createdAt=job.createdAt.isoformat(),
+            updatedAt=job.updatedAt.isoformat()
+        )
+        return record, job.save_options().get('expiry')
+
+    def update(self, job):
+        """
+        Queues a job's current state to be recorded in the index.
+
+        :returns: ``None``
+        """
+        self.update_many([job])
+
+    def update_many(self, jobs):
+        """
+        Queues the current state of several jobs to be recorded in the
+        index.
+
+        :returns: ``None``
+        """
+        if self.pid != os.getpid():
+            self.start()
+
+        with self.lock:
+            for job in jobs:
+                record, expiry = self.make_record(job)
+                queued = self.pending.get(job.uuid)
+                if queued and queued[0]['updatedAt'] > record['updatedAt']:
+                    continue
+
+                self.pending[job.uuid] = (record, expiry)
+
+            if self.flushInterval is not None and self.flusher is None:
+                self.flusher = threading.Thread(
+                    target=self.run_flusher, name="zerog_jobindex",
+                    daemon=True
+                )
+                self.flusher.start()
+
+        if self.flushInterval is None:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the queued updates. Updates that fail are queued again,
+        unless a newer one has been queued since.
+
+        :returns: ``None``
+        """
+        if self.pid != os.getpid():
+            self.start()
+
+        with self.lock:
+            pending, self.pending = self.pending, dict()
+
+        if not pending:
+            return
+
+        try:
+            self.datastore.write_index(list(pending.values()))
+        except Exception:
+            with self.lock:
+                for uuid, update in pending.items():
+                    self.pending.setdefault(uuid, update)
+            raise
+
+    def remove(self, uuids):
+        """
+        Removes jobs' records, e.g. once the jobs are archived
+
+        :returns: ``None``
+        """
+        uuids = list(uuids)
+        if self.pid == os.getpid():
+            with self.lock:
+                for uuid in uuids:
+                    self.pending.pop(uuid, None)
+
+        if uuids:
+            self.datastore.delete_index(uuids)
+
+    def completed(self, before, limit=DEFAULT_LIMIT):
+        """
+        Returns the uuids of jobs that completed (were last updated)
+        before a datetime, e.g. to archive them
+        """
+        self.flush()
+        records = self.datastore.query_index(dict(
+            jobTypes=None,
+            states=[SUCCEEDED, FAILED],
+            resultCode=None,
+            since=None,
+            until=None,
+            updatedBefore=before.isoformat(),
+            after=None,
+            limit=limit
+        ))
+        return [record['uuid'] for record in records]
+
+    def list(
+        self,
+        jobTypes,
+        state=None,
+        resultCode=None,
+        since=None,
+        until=None,
+        limit=DEFAULT_LIMIT,
+        cursor=None
+    ):
+        """
+        Lists indexed jobs, newest first.
+
+        Args:
+            jobTypes: jobType, or list of jobTypes, to list. None lists
+                      every jobType
+
+            state: only list jobs in this state (see STATES)
+
+            resultCode: only list jobs with this resultCode
+
+            since: oldest createdAt (datetime or ISO string) to list.
+                   Defaults to 24 hours before ``until``
+
+            until: newest createdAt to list. Defaults to now
+
+            limit: maximum number of jobs to return
+
+            cursor: the cursor returned by the previous page
+
+        Returns:
+            (list of index records, cursor of the next page or None)
+        """
+        if isinstance(jobTypes, str):
+            jobTypes = [jobTypes]
+
+        until = to_datetime(until) if until else datetime.datetime.utcnow()
+        since = to_datetime(since) if since else until - DEFAULT_WINDOW
+        since = max(since, until - MAX_WINDOW)
+
+        self.flush()
+        records = self.datastore.query_index(dict(
+            jobTypes=list(jobTypes) if jobTypes is not None else None,
+            states=[state] if state else None,
+            resultCode=resultCode,
+            since=since.isoformat(),
+            until=until.isoformat(),
+            updatedBefore=None,
+            after=list(parse_cursor(cursor)) if cursor else None,
+            limit=limit + 1
+        ))
+
+        page = records[:limit]
+        nextCursor = make_cursor(page[-1]) if len(records) > limit else None
+        return page, nextCursor
+
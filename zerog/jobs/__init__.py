@@ -2,6 +2,8 @@ from .base import (
     BaseJob,
     BaseJobSchema,
     make_key,
+    enqueue_jobs,
+    async_enqueue_jobs,
     INTERNAL_ERROR,
     NO_RESULT,
     ErrorContinue,
@@ -9,3 +11,4 @@ from .base import (
     WarningContinue,
     WarningFinish
 )
+from .blob import Blob, BlobRef
@@ -11,7 +11,9 @@ ZeroG BaseJobSchema and BaseJob class definitions
 #
 
 from abc import ABC, abstractmethod
+import asyncio
 import datetime
+import json
 import psutil
 import random
 import time
@@ -19,6 +21,9 @@ import uuid
 
 from marshmallow import Schema, fields
 
+from zerog.signals import DEFAULT_WAIT, Signals
+
+from .blob import Blob, BlobRef
 from .error import ErrorSchema, make_error
 from .event import EventSchema, make_event
 from .warning import WarningSchema, make_warning
@@ -28,6 +33,10 @@ log = logging.getLogger(__name__)
 
 DEFAULT_TTR = 3600 * 24 * 30   # should never happen. When it does it's bad
 
+# largest serialized ephemeral job that is enqueued inline. beanstalkd's
+# default max-job-size is 65535 bytes
+MAX_INLINE_SIZE = 60000
+
 # result codes
 INTERNAL_ERROR = 500
 NO_RESULT = -1
@@ -82,6 +91,8 @@ class BaseJobSchema(Schema):
     :var float tickval: completeness increment per tick
     :var int resultCode: job resultCode, -1 if incomplete, 200 for success
 
+    :var list signalKeys: signals sent when the job completes
+
     """
     documentType = fields.String()
     jobType = fields.String()
@@ -110,6 +121,8 @@ class BaseJobSchema(Schema):
     tickval = fields.Float()
     resultCode = fields.Integer()
 
+    signalKeys = fields.List(fields.String())
+
 
 class BaseJob(ABC):
     """
@@ -126,6 +139,22 @@ class BaseJob(ABC):
         MUST override this attribute.
     :cvar int MAX_ERRORS: maximum number of error retries before the job
         fails. You MAY override this attribute.
+    :cvar int EXPIRY: seconds a completed job's document is kept in the
+        datastore. ``None`` keeps it indefinitely. You MAY override this
+        attribute.
+    :cvar bool EPHEMERAL: if True, a new job is enqueued inline -- the whole
+        serialized job travels in its queue entry and it's only written to
+        the datastore if it errors or is requeued. Until then its status
+        can't be looked up. You MAY override this attribute.
+    :cvar bool PERSIST_RESULT: if True, an ephemeral job is written to the
+        datastore when it completes, so its result can be looked up. You
+        MAY override this attribute.
+    :cvar bool CHECKPOINTS: if True, the job saves its progress as it runs,
+        so it can be stopped at any time and rerun from its last
+        checkpoint. A draining server asked to preempt its job (e.g. by a
+        rolling drain) stops it and returns it to the queue, rather than
+        waiting for it to finish. Can't be combined with ``EPHEMERAL``.
+        You MAY override this attribute.
 
     Subclasses MUST
 
@@ -138,6 +167,10 @@ class BaseJob(ABC):
     SCHEMA = OVERRIDE_SIGNATURE
 
     MAX_ERRORS = 3
+    EXPIRY = None
+    EPHEMERAL = False
+    PERSIST_RESULT = False
+    CHECKPOINTS = False
 
     def __init__(self, datastore, queue, keepalive=None, **kwargs):
         """
@@ -169,6 +202,8 @@ class BaseJob(ABC):
         self.datastore = datastore
         self.queue = queue
         self.keepalive = keepalive
+        self.blobstore = getattr(datastore, 'blobstore', None)
+        self.jobIndex = getattr(datastore, 'jobIndex', None)
 
         now = datetime.datetime.utcnow()
 
@@ -181,6 +216,15 @@ class BaseJob(ABC):
         self.cas = kwargs.get('cas', 0)
 
         self.uuid = kwargs.get('uuid') or str(uuid.uuid4())
+
+        # blob references loaded from the job document need to know where
+        # to load their values from, and that they belong to this job
+        for value in kwargs.values():
+            if isinstance(value, BlobRef):
+                if value.blobstore is None:
+                    value.blobstore = self.blobstore
+                if value.owner is None:
+                    value.owner = self.uuid
         self.logId = kwargs.get(
             'logId',
             "%s_%s" % (self.JOB_TYPE, self.uuid)
@@ -199,6 +243,19 @@ class BaseJob(ABC):
         self.tickcount = kwargs.get('tickcount', 0.0)
         self.tickval = kwargs.get('tickval', 0.001)
         self.resultCode = kwargs.get('resultCode', NO_RESULT)
+        self.signalKeys = kwargs.get('signalKeys', [])
+
+        # (signal name, signal count) the job is waiting for, set by
+        # wait_for_signal until the worker parks the requeued job
+        self.signalWait = None
+
+        # True while an ephemeral job only exists in its queue entry. Saves
+        # are deferred until the job is persisted
+        self.inline = False
+
+        # state last recorded in the job index. A job loaded from the
+        # datastore was indexed by whoever saved it
+        self.indexedState = self.index_state() if self.cas else None
 
     def dump(self):
         """
@@ -235,14 +292,133 @@ class BaseJob(ABC):
         Saves job instance to the datastore. Fails if job was updated in
         the datastore since this instance was last updated.
 
+        An inline job's changes are only kept in the instance until it's
+        persisted.
+
         :returns: ``None``
         """
         self.updatedAt = datetime.datetime.utcnow()
+        if self.inline:
+            return
+
+        options = self.save_options()
+        replaced = self.store_blobs()
         _, self.cas = self.datastore.set_with_cas(
             self.key(),
             self.dump(),
-            cas=self.cas
+            **options
         )
+        self.release_blobs(replaced, options.get('expiry'))
+        if self.index_state() != self.indexedState:
+            self.update_index()
+
+    def persist(self):
+        """
+        Writes an inline (ephemeral) job to the datastore, after which it's
+        saved, looked up and requeued like any other job.
+
+        :returns: ``None``
+        """
+        self.inline = False
+        self.save()
+
+    def save_options(self):
+        """
+        Keyword arguments for the datastore write that saves this job.
+        Completed jobs get a document expiry if the job class has an
+        ``EXPIRY``.
+
+        :returns: datastore keyword arguments
+        :rtype: dict
+        """
+        options = dict(cas=self.cas)
+        if self.EXPIRY and self.resultCode != NO_RESULT:
+            options['expiry'] = datetime.timedelta(seconds=self.EXPIRY)
+
+        return options
+
+    def index_state(self):
+        # the attributes that the job index records
+        return self.running, self.resultCode
+
+    def update_index(self):
+        """
+        Records the job's state in the datastore's job index, if it has
+        one. Called by ``save`` when the job's state changes.
+
+        :returns: ``None``
+        """
+        if self.jobIndex is None:
+            return
+
+        try:
+            self.jobIndex.update(self)
+        except Exception as e:
+            # the index is advisory -- never fail a job because of it
+            log.error(f"{self.jobType} {self.uuid} index update failed: {e}")
+        else:
+            self.indexedState = self.index_state()
+
+    def store_blobs(self):
+        """
+        Writes any new or changed values of ``Blob`` schema fields to the
+        blob store, so the job document only holds references to them.
+        Values that are already stored aren't rewritten. Changed values
+        are found by re-hashing the values that have been loaded.
+
+        If the datastore has no blob store, blob values stay inline in the
+        job document.
+
+        :returns: digests of this job's stored values that were replaced,
+            which can be deleted once the job is saved
+        :rtype: list
+        """
+        if self.blobstore is None:
+            return []
+
+        replaced = []
+        for name in blob_fields(self.SCHEMA):
+            value = getattr(self, name, None)
+            if value is None:
+                continue
+
+            if not isinstance(value, BlobRef):
+                value = BlobRef(value=value)
+                setattr(self, name, value)
+            elif value.stored and value.owner != self.uuid:
+                # another job's blob, which is deleted with that job
+                value = BlobRef(value=value.value)
+                setattr(self, name, value)
+
+            digest = value.store(self.blobstore, self.uuid)
+            if digest is not None:
+                replaced.append(digest)
+
+        return replaced
+
+    def release_blobs(self, replaced, expiry=None):
+        """
+        Deletes the replaced values of ``Blob`` fields once the job has
+        been saved, and gives the stored values the expiry of the job
+        document, if it has one.
+
+        :param list replaced: digests returned by ``store_blobs``
+        :param datetime.timedelta expiry: expiry of the job document
+        :returns: ``None``
+        """
+        if self.blobstore is None:
+            return
+
+        for digest in replaced:
+            self.blobstore.delete_value(digest, self.uuid)
+
+        if expiry is None:
+            return
+
+        for name in blob_fields(self.SCHEMA):
+            value = getattr(self, name, None)
+            if isinstance(value, BlobRef) and value.stored:
+                self.blobstore.expire_value(value.digest, expiry, self.uuid)
 
     def reload(self):
         """
@@ -296,6 +472,94 @@ class BaseJob(ABC):
         )
         return False
 
+    async def async_save(self, datastore):
+        """
+        Coroutine version of ``save`` that uses an async datastore, for
+        use on the Server's IOLoop.
+
+        :param datastore: async datastore (e.g. AsyncCouchbaseDatastore)
+        :returns: ``None``
+        """
+        self.updatedAt = datetime.datetime.utcnow()
+        if self.inline:
+            return
+
+        # blob store operations block, so they're run in a thread
+        loop = asyncio.get_running_loop()
+        options = self.save_options()
+        replaced = []
+        if self.blobstore is not None:
+            replaced = await loop.run_in_executor(None, self.store_blobs)
+        _, self.cas = await datastore.set_with_cas(
+            self.key(),
+            self.dump(),
+            **options
+        )
+        if self.blobstore is not None:
+            await loop.run_in_executor(
+                None, self.release_blobs, replaced, options.get('expiry')
+            )
+        if self.index_state() != self.indexedState:
+            await loop.run_in_executor(None, self.update_index)
+
+    async def async_reload(self, datastore):
+        """
+        Coroutine version of ``reload`` that uses an async datastore.
+
+        :param datastore: async datastore (e.g. AsyncCouchbaseDatastore)
+        :returns: ``None``
+        """
+        data, cas = await datastore.read_with_cas(self.key())
+        if data:
+            data['cas'] = cas
+            loaded = self.SCHEMA().load(data)
+            self.__init__(self.datastore, self.queue, **loaded)
+
+    async def async_record_change(self, datastore, func, *args, **kwargs):
+        # Coroutine version of record_change that uses an async datastore
+        for _ in range(10):
+            try:
+                func(*args, **kwargs)
+                await self.async_save(datastore)
+                return True
+
+            except datastore.casException:
+                log.info(
+                    "pid {0}, uuid {1} collision - reloading.".format(
+                        psutil.Process().pid, self.uuid
+                    )
+                )
+
+            except datastore.lockedException:
+                log.info(
+                    "pid {0}, uuid {1} locked - reloading.".format(
+                        psutil.Process().pid, self.uuid
+                    )
+                )
+
+            await asyncio.sleep(random.random() / 10)
+            await self.async_reload(datastore)
+
+        log.error(
+            "pid {0}, uuid {1} save failed - too many collisions".format(
+                psutil.Process().pid, self.uuid
+            )
+        )
+        return False
+
+    async def async_update_attrs(self, datastore, **kwargs):
+        """
+        Coroutine version of ``update_attrs`` that uses an async datastore.
+
+        :param datastore: async datastore (e.g. AsyncCouchbaseDatastore)
+        :returns: ``None``
+        """
+        def do_update_attrs():
+            for attr, value in kwargs.items():
+                setattr(self, attr, value)
+
+        await self.async_record_change(datastore, do_update_attrs)
+
     def update_attrs(self, **kwargs):
         """
         Updates a job's attributes. Only updates the attributes specified
@@ -374,6 +638,54 @@ class BaseJob(ABC):
             completeness=1
         )
 
+        for name in self.signalKeys:
+            self.signals().signal(name)
+
+    def signals(self):
+        return Signals(self.datastore, self.queue)
+
+    def wait_for_signal(self, name, timeout=DEFAULT_WAIT, count=None):
+        """
+        Requeues the job to run again once a signal is sent, rather than
+        after a fixed delay. Use it as the job's return value::
+
+            def run(self):
+                if not self.upstream_ready():
+                    return self.wait_for_signal("upstream_ready")
+                ...
+
+        A signal sent between reading ``count`` and the job being parked
+        wakes the job up at once. A signal sent before that is missed, so
+        a job that checks external state can read
+        ``self.signals().count(name)`` before checking it and pass it in.
+
+        :param str name: the signal to wait for
+        :param int timeout: seconds after which the job runs again even if
+            the signal hasn't been sent
+        :param int count: signal count the job has seen. Defaults to the
+            current count
+        :returns: ``(NO_RESULT, timeout)``
+        """
+        if count is None:
+            count = self.signals().count(name)
+
+        self.signalWait = (name, count)
+        return NO_RESULT, timeout
+
+    def park(self):
+        """
+        Records a job that has been requeued by the worker as a waiter of
+        the signal it's waiting for, if any (see ``wait_for_signal``).
+
+        :returns: ``None``
+        """
+        if self.signalWait is None or self.queueJobId <= 0:
+            return
+
+        name, count = self.signalWait
+        self.signalWait = None
+        self.signals().park(name, self.uuid, self.queueJobId, count)
+
     def keep_alive(self):
         if self.keepalive and callable(self.keepalive):
             self.keepalive()
@@ -515,25 +827,78 @@ class BaseJob(ABC):
         Sets the job's queueJobId if enqueueing is successful. Sets it to -1
         if enqueueing fails. 
 
+        A new ``EPHEMERAL`` job is put in the queue inline and isn't saved.
+
         :params dict kwargs: keyword arguments that will be passed to the
             queueing client
         :returns: ``None``
         """
+        body = self.inline_body(kwargs)
+        if body is not None:
+            self.queueJobId = self.put_in_queue(kwargs, body)
+            return
 
         # if the job has not been added to the database yet, cas is 0
         if self.cas == 0:
             self.save()
 
-        kwargs['ttr'] = kwargs.get('ttr', DEFAULT_TTR)
-        queueJobId = self.queue.put(self.uuid, **kwargs)
+        queueJobId = self.put_in_queue(kwargs)
+        self.update_attrs(queueKwargs=kwargs, queueJobId=queueJobId)
+
+    async def async_enqueue(self, datastore, **kwargs):
+        """
+        Coroutine version of ``enqueue`` that persists the job using an
+        async datastore.
+
+        :param datastore: async datastore (e.g. AsyncCouchbaseDatastore)
+        :params dict kwargs: keyword arguments that will be passed to the
+            queueing client
+        :returns: ``None``
+        """
+        body = self.inline_body(kwargs)
+        if body is not None:
+            self.queueJobId = self.put_in_queue(kwargs, body)
+            return
+
+        if self.cas == 0:
+            await self.async_save(datastore)
+
+        queueJobId = self.put_in_queue(kwargs)
+        await self.async_update_attrs(
+            datastore, queueKwargs=kwargs, queueJobId=queueJobId
+        )
 
+    def inline_body(self, kwargs):
+        # returns the queue body of a new ephemeral job -- the whole
+        # serialized job -- and marks the job inline. Returns None if the
+        # job must be saved & enqueued by uuid. Sets a default ttr in kwargs
+        if not self.EPHEMERAL or self.cas != 0:
+            return None
+
+        kwargs['ttr'] = kwargs.get('ttr', DEFAULT_TTR)
+        self.queueKwargs = dict(kwargs)
+        body = self.dump()
+        if len(json.dumps(body)) > MAX_INLINE_SIZE:
+            log.info(f"{self.jobType} {self.uuid} too big to enqueue inline")
+            return None
+
+        self.inline = True
+        return body
+
+    def put_in_queue(self, kwargs, body=None):
+        # puts the job's uuid (or an inline job's body) in its queue. Sets a
+        # default ttr in kwargs.
+        #
         # if we don't get a valid job id back from the attempt to enqueue,
-        # set queueJobId to -1 so we can later see that there was a problem
+        # return -1 so we can later see that there was a problem
+        kwargs['ttr'] = kwargs.get('ttr', DEFAULT_TTR)
+        queueJobId = self.queue.put(body or self.uuid, **kwargs)
+
         if not queueJobId:
             log.warning(f"{self.jobType} {self.uuid} enqueue failed")
             queueJobId = -1
 
-        self.update_attrs(queueKwargs=kwargs, queueJobId=queueJobId)
+        return queueJobId
 
     def progress(self):
         """
@@ -568,7 +933,9 @@ class BaseJob(ABC):
         Returns result data for this job.
 
         Override this method if the job needs to return data once it is
-        complete.
+        complete. Large results can be kept in a ``Blob`` schema field and
+        returned with ``self.someBlobField.value``, which loads the value
+        from the blob store only when it's requested.
 
         :returns: output data
         :rtype: dict
@@ -620,5 +987,171 @@ def make_key(uuid):
     return "%s_%s" % (BaseJob.DOCUMENT_TYPE, uuid)
 
 
+def enqueue_jobs(jobs, **kwargs):
+    """
+    Saves & enqueues several new jobs with batched datastore writes and a
+    pipelined queue put, instead of the three round trips per job that
+    ``enqueue`` makes. All the jobs must share a datastore and queue.
+
+    Sets each job's queueJobId, or -1 if enqueueing it failed.
+
+    ``EPHEMERAL`` jobs are put in the queue inline and aren't saved.
+
+    :param list jobs: new (unsaved) jobs
+    :params dict kwargs: keyword arguments that will be passed to the
+        queueing client
+    :returns: ``None``
+    """
+    jobs = put_inline_jobs_in_queue(jobs, kwargs)
+    if not jobs:
+        return
+
+    datastore = jobs[0].datastore
+    saved = datastore.set_multi(prepare_bulk_save(jobs, kwargs))
+    finish_bulk_save(jobs, saved)
+
+    updated = datastore.update_multi_with_cas(put_jobs_in_queue(jobs, kwargs))
+    for job in jobs:
+        success, cas = updated[job.key()]
+        if success:
+            job.cas = cas
+        else:
+            # a worker got to the job first -- reload it & retry
+            job.update_attrs(queueJobId=job.queueJobId)
+
+
+async def async_enqueue_jobs(datastore, jobs, **kwargs):
+    """
+    Coroutine version of ``enqueue_jobs`` that persists the jobs using an
+    async datastore. The queue puts & blob writes, which block, are run in
+    a thread.
+
+    :param datastore: async datastore (e.g. AsyncCouchbaseDatastore)
+    :param list jobs: new (unsaved) jobs
+    :params dict kwargs: keyword arguments that will be passed to the
+        queueing client
+    :returns: ``None``
+    """
+    loop = asyncio.get_running_loop()
+    jobs = await loop.run_in_executor(
+        None, put_inline_jobs_in_queue, jobs, kwargs
+    )
+    if not jobs:
+        return
+
+    docs = await loop.run_in_executor(None, prepare_bulk_save, jobs, kwargs)
+    saved = await datastore.set_multi(docs)
+    await loop.run_in_executor(None, finish_bulk_save, jobs, saved)
+
+    docs = await loop.run_in_executor(None, put_jobs_in_queue, jobs, kwargs)
+    updated = await datastore.update_multi_with_cas(docs)
+    for job in jobs:
+        success, cas = updated[job.key()]
+        if success:
+            job.cas = cas
+        else:
+            await job.async_update_attrs(
+                datastore, queueJobId=job.queueJobId
+            )
+
+
+def prepare_bulk_save(jobs, kwargs):
+    # returns {key: document} for the first write of a bulk enqueue.
+    # Sets a default ttr in kwargs
+    kwargs['ttr'] = kwargs.get('ttr', DEFAULT_TTR)
+    now = datetime.datetime.utcnow()
+
+    docs = dict()
+    for job in jobs:
+        job.updatedAt = now
+        job.queueKwargs = dict(kwargs)
+        job.store_blobs()
+        docs[job.key()] = job.dump()
+
+    return docs
+
+
+def finish_bulk_save(jobs, saved):
+    # records the cas of each saved job, then queues the new jobs' index
+    # records
+    for job in jobs:
+        _, job.cas = saved[job.key()]
+
+    jobIndex = jobs[0].jobIndex
+    if jobIndex is not None:
+        try:
+            jobIndex.update_many(jobs)
+        except Exception as e:
+            log.error(f"bulk index update failed: {e}")
+        else:
+            for job in jobs:
+                job.indexedState = job.index_state()
+
+
+def put_inline_jobs_in_queue(jobs, kwargs):
+    # puts new ephemeral jobs in their queue inline with one pipelined
+    # request. Returns the other jobs, which must be saved & enqueued by uuid
+    inline = []
+    others = []
+    for job in jobs:
+        body = job.inline_body(kwargs)
+        if body is None:
+            others.append(job)
+        else:
+            inline.append((job, body))
+
+    if inline:
+        queueJobIds = inline[0][0].queue.put_many(
+            [body for _, body in inline], **kwargs
+        )
+        for (job, _), queueJobId in zip(inline, queueJobIds):
+            if not queueJobId:
+                log.warning(f"{job.jobType} {job.uuid} enqueue failed")
+                queueJobId = -1
+
+            job.queueJobId = queueJobId
+
+    return others
+
+
+def put_jobs_in_queue(jobs, kwargs):
+    # puts the jobs' uuids in their queue with one pipelined request.
+    # Returns {key: (document, cas)} for the queueJobId write
+    queueJobIds = jobs[0].queue.put_many([job.uuid for job in jobs], **kwargs)
+
+    docs = dict()
+    for job, queueJobId in zip(jobs, queueJobIds):
+        if not queueJobId:
+            log.warning(f"{job.jobType} {job.uuid} enqueue failed")
+            queueJobId = -1
+
+        job.queueJobId = queueJobId
+        docs[job.key()] = (job.dump(), job.cas)
+
+    return docs
+
+
+def blob_fields(schemaClass):
+    """
+    Lists the names of a job schema's ``Blob`` fields.
+
+    :param schemaClass: BaseJobSchema subclass
+    :returns: field names
+    :rtype: list
+    """
+    names = _BLOB_FIELDS.get(schemaClass)
+    if names is None:
+        names = [
+            name for name, field in schemaClass().fields.items()
+            if isinstance(field, Blob)
+        ]
+        _BLOB_FIELDS[schemaClass] = names
+
+    return names
+
+
+_BLOB_FIELDS = {}
+
+
 def clamp(value, minval, maxval):
     return (max(min(maxval, value), minval))
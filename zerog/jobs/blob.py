@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2017-2021 MotiveMetrics. All rights reserved.
+"""
+ZeroG Blob schema field and BlobRef class definitions
+"""
+import copy
+
+from marshmallow import fields
+
+from zerog.blobstores import make_digest
+
+import logging
+log = logging.getLogger(__name__)
+
+BLOB_KEY = "$blob"
+
+
+class BlobNotFound(Exception):
+    pass
+
+
+def is_blob_ref(value):
+    # True for a serialized blob reference
+    return isinstance(value, dict) and list(value.keys()) == [BLOB_KEY]
+
+
+def inline_blobs(data, blobstore):
+    """
+    Returns a copy of a serialized job document with its blob references
+    replaced by their values, e.g. to archive the document. References to
+    missing blobs are kept.
+    """
+    inlined = dict(data)
+    for name, value in data.items():
+        if is_blob_ref(value):
+            blob = blobstore.get_value(value[BLOB_KEY], data.get('uuid'))
+            if blob is not None:
+                inlined[name] = blob
+
+    return inlined
+
+
+def delete_blobs(data, blobstore):
+    """
+    Deletes the blobs that a serialized job document references, e.g.
+    once the document has been deleted
+    """
+    for value in data.values():
+        if is_blob_ref(value):
+            blobstore.delete_value(value[BLOB_KEY], data.get('uuid'))
+
+
+class BlobRef(object):
+    """
+    Reference to a value that is stored in a blob store rather than in
+    the job document. The value is loaded lazily the first time it's
+    accessed.
+
+    Use ``ref.value`` to get the referenced value. A loaded value that's
+    changed in place is stored again, under its new digest, the next time
+    the job is saved.
+
+    A stored value belongs to its ``owner``, the job whose document
+    references it, and is deleted with that job's document.
+    """
+    def __init__(self, digest=None, value=None, blobstore=None, owner=None):
+        self.blobstore = blobstore
+        self.owner = owner
+        self._digest = digest
+        self._value = value
+        self.loaded = digest is None
+        self.stored = digest is not None
+
+    @property
+    def digest(self):
+        if self._digest is None:
+            self._digest = make_digest(self._value)
+
+        return self._digest
+
+    @property
+    def value(self):
+        if not self.loaded:
+            if self.blobstore is None:
+                raise BlobNotFound(
+                    "no blobstore to load blob {0}".format(self._digest)
+                )
+
+            value = self.blobstore.get_value(self._digest, self.owner)
+            if value is None:
+                raise BlobNotFound("blob {0} not found".format(self._digest))
+
+            self._value = value
+            self.loaded = True
+
+        return self._value
+
+    def store(self, blobstore=None, owner=None):
+        """
+        Writes the value to the blob store if it isn't already there, or
+        if the loaded value has changed since it was stored
+
+        Returns:
+            digest of the stored value that was replaced, if any
+        """
+        blobstore = blobstore or self.blobstore
+        if blobstore is None:
+            return None
+
+        replaced = None
+        if self.stored and self.loaded and (
+            make_digest(self._value) != self._digest
+        ):
+            # changed in place
+            replaced = self._digest
+            self._digest = None
+            self.stored = False
+
+        if not self.stored:
+            if owner is not None:
+                self.owner = owner
+            self._digest = blobstore.put_value(
+                self._value, self.digest, self.owner
+            )
+            self.blobstore = blobstore
+            self.stored = True
+
+        return replaced
+
+    def copy(self):
+        """
+        Returns a new reference to the same value. The new reference to a
+        stored value is unloaded, so it loads the value again when it's
+        accessed, and references that are kept (e.g. cached) don't keep
+        loaded values alive
+        """
+        if self.stored:
+            return BlobRef(
+                digest=self._digest, blobstore=self.blobstore,
+                owner=self.owner
+            )
+
+        return BlobRef(
+            value=copy.copy(self._value), blobstore=self.blobstore,
+            owner=self.owner
+        )
+
+    def dump(self):
+        """
+        A stored blob is dumped as a reference. A blob that hasn't been
+        stored (e.g. because no blob store is configured) is dumped inline.
+        """
+        if self.stored:
+            return {BLOB_KEY: self.digest}
+
+        return self._value
+
+    def __eq__(self, other):
+        if isinstance(other, BlobRef):
+            return self.digest == other.digest
+
+        return NotImplemented
+
+    def __repr__(self):
+        return "BlobRef({0})".format(self._digest or "unstored")
+
+
+class Blob(fields.Field):
+    """
+    Schema field for large values that should be kept out of the job
+    document. Loads to a BlobRef.
+
+    Example::
+
+        class BigJobSchema(BaseJobSchema):
+            bigInput = Blob()
+            bigResult = Blob(allow_none=True)
+    """
+    def _serialize(self, value, attr, obj, **kwargs):
+        if value is None:
+            return None
+
+        if not isinstance(value, BlobRef):
+            value = BlobRef(value=value)
+
+        return value.dump()
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        if isinstance(value, BlobRef):
+            return value
+
+        if is_blob_ref(value):
+            return BlobRef(digest=value[BLOB_KEY])
+
+        return BlobRef(value=value)
@@ -1,4 +1,8 @@
+from .autoscaler import Autoscaler
 from .channels import MgmtChannel
 from .manager import WorkerManager
 from .messages import make_msg
+from .rolling import RollingDrain
+from .telemetry import JobTelemetry
 from .utils import make_worker_id, parse_worker_id
+from .workertable import WorkerTable
@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+"""
+import math
+import time
+
+from .utils import parse_worker_id
+
+import logging
+log = logging.getLogger(__name__)
+
+CONTROL_INTERVAL = 30
+DEFAULT_SERVICE_TIME = 10
+TARGET_WAIT = 60
+TARGET_UTILIZATION = 0.8
+SCALE_UP_COOLDOWN = 60
+SCALE_DOWN_COOLDOWN = 300
+
+
+def erlang_c(servers, load):
+    """
+    Probability that a job has to wait in an M/M/c queue
+
+    Args:
+        servers: number of workers (c)
+
+        load: offered load in erlangs -- arrival rate * service time
+    """
+    if load <= 0:
+        return 0.0
+    if load >= servers:
+        return 1.0
+
+    # Erlang B by its recurrence, which doesn't overflow, then C from B
+    b = 1.0
+    for k in range(1, servers + 1):
+        b = load * b / (k + load * b)
+
+    return b / (1 - (load / servers) * (1 - b))
+
+
+def required_workers(
+    arrivalRate,
+    serviceTime,
+    backlog=0,
+    targetWait=TARGET_WAIT,
+    utilization=TARGET_UTILIZATION
+):
+    """
+    Estimates the number of workers needed for a job queue
+
+    Enough workers to keep utilization at or below the target and the
+    mean M/M/c queue wait under targetWait, plus enough to work off the
+    current backlog within targetWait.
+
+    Args:
+        arrivalRate: jobs per second
+
+        serviceTime: mean seconds per job run
+
+        backlog: jobs waiting in the queue
+
+        targetWait: seconds a job should wait in the queue
+
+        utilization: target fraction of time workers are busy
+    """
+    load = arrivalRate * serviceTime
+
+    # more workers than the load, or the queue grows without bound
+    servers = math.floor(load / utilization) + 1
+    while load > 0:
+        rate = servers / serviceTime - arrivalRate
+        if erlang_c(servers, load) / rate <= targetWait:
+            break
+        servers += 1
+
+    if load <= 0:
+        servers = 0
+
+    return servers + math.ceil(backlog * serviceTime / targetWait)
+
+
+class Autoscaler(object):
+    """
+    Controller that matches a service's active workers to its job queue's
+    backlog by draining and undraining workers through a WorkerManager.
+
+    Each step reads the job tube's stats and the job runs observed by the
+    manager's telemetry, estimates the arrival rate as the observed
+    throughput plus the growth of the ready backlog, and computes the
+    workers needed with an M/M/c estimate (see required_workers). Jobs
+    that are delayed aren't counted until they're ready.
+
+    Workers are added by undraining drained workers -- it can't start new
+    hosts -- and removed by draining idle workers, emptying the least
+    used hosts first. With retireHosts, hosts whose workers have all been
+    drained and idle for retireAfter seconds are retired, so they can be
+    shut down. Scaling up and down have separate cooldowns.
+
+    Args:
+        manager: WorkerManager of the workers
+
+        serviceName: name of the service, as passed to its Server
+
+        minWorkers, maxWorkers: bounds on the number of active workers
+
+        targetWait: seconds a job should wait in the queue
+
+        utilization: target fraction of time active workers are busy
+
+        defaultServiceTime: seconds per job run assumed before any runs
+                            have been observed
+
+        scaleUpCooldown, scaleDownCooldown: seconds after a scaling action
+                                            before the next one in the
+                                            same direction
+
+        retireHosts: retire hosts that have been drained for retireAfter
+                     seconds. Retiring can't be undone
+
+        retireAfter: seconds a host stays drained before it's retired
+    """
+    def __init__(
+        self,
+        manager,
+        serviceName,
+        minWorkers=1,
+        maxWorkers=None,
+        targetWait=TARGET_WAIT,
+        utilization=TARGET_UTILIZATION,
+        defaultServiceTime=DEFAULT_SERVICE_TIME,
+        scaleUpCooldown=SCALE_UP_COOLDOWN,
+        scaleDownCooldown=SCALE_DOWN_COOLDOWN,
+        retireHosts=False,
+        retireAfter=SCALE_DOWN_COOLDOWN
+    ):
+        self.manager = manager
+        self.serviceName = serviceName
+        self.queue = manager.get_queue(f"{serviceName}_jobs")
+
+        self.minWorkers = minWorkers
+        self.maxWorkers = maxWorkers
+        self.targetWait = targetWait
+        self.utilization = utilization
+        self.defaultServiceTime = defaultServiceTime
+        self.scaleUpCooldown = scaleUpCooldown
+        self.scaleDownCooldown = scaleDownCooldown
+        self.retireHosts = retireHosts
+        self.retireAfter = retireAfter
+
+        self.lastScaleUp = None
+        self.lastScaleDown = None
+        self.lastReady = None
+        self.lastStepAt = None
+        self.drainedSince = {}      # host -> time it was seen drained
+
+    def service_workers(self):
+        # {workerId: workerData} of this service's workers
+        return {
+            workerId: workerData
+            for workerId, workerData in self.manager.workers.items()
+            if parse_worker_id(workerId)['serviceName'] == self.serviceName
+        }
+
+    def tube_stats(self):
+        stats = self.queue.do_bean("stats_tube", self.queue.queueName)
+        return dict(
+            ready=stats['current-jobs-ready'],
+            delayed=stats['current-jobs-delayed'],
+            reserved=stats['current-jobs-reserved']
+        )
+
+    def observed(self, hosts):
+        # (throughput, mean service time) of the runs on this service's
+        # hosts, or (0, None) if there weren't any
+        snapshot = self.manager.job_stats()
+        runs = 0
+        total = 0
+        for host in hosts:
+            aggregates = snapshot['hosts'].get(host)
+            if aggregates and aggregates['runs']:
+                runs += aggregates['runs']
+                total += aggregates['runs'] * aggregates['meanDuration']
+
+        if not runs:
+            return 0, None
+
+        return runs / snapshot['window'], total / runs
+
+    def estimate(self, stats, workers, now):
+        """
+        Returns the number of active workers the service needs, within
+        minWorkers and maxWorkers
+        """
+        hosts = {parse_worker_id(workerId)['host'] for workerId in workers}
+        throughput, serviceTime = self.observed(hosts)
+        serviceTime = serviceTime or self.defaultServiceTime
+
+        arrivalRate = throughput
+        if self.lastReady is not None and now > self.lastStepAt:
+            growth = (stats['ready'] - self.lastReady) / (
+                now - self.lastStepAt
+            )
+            arrivalRate = max(0, throughput + growth)
+
+        required = required_workers(
+            arrivalRate,
+            serviceTime,
+            backlog=stats['ready'],
+            targetWait=self.targetWait,
+            utilization=self.utilization
+        )
+
+        # running jobs keep their workers busy whatever the estimate says
+        required = max(required, stats['reserved'], self.minWorkers)
+        if self.maxWorkers is not None:
+            required = min(required, self.maxWorkers)
+
+        return required
+
+    def step(self, now=None):
+        """
+        Runs one control iteration: refreshes the manager's view of the
+        workers, then drains, undrains or retires workers as needed.
+
+        Returns:
+            dict of the tube stats, the active & required worker counts,
+            and the workerIds & hosts acted on
+        """
+        now = time.time() if now is None else now
+        self.manager.poll_updates_channel()
+        self.manager.request_updates()
+
+        stats = self.tube_stats()
+        workers = self.service_workers()
+        active = [
+            workerId for workerId, workerData in workers.items()
+            if workerData['state'].startswith("active")
+        ]
+        required = self.estimate(stats, workers, now)
+        self.lastReady = stats['ready']
+        self.lastStepAt = now
+
+        decision = dict(
+            stats,
+            active=len(active),
+            required=required,
+            undrained=[],
+            drained=[],
+            retired=[]
+        )
+        if required > len(active) and self.cooled(
+            self.lastScaleUp, now, self.scaleUpCooldown
+        ):
+            decision['undrained'] = self.scale_up(
+                workers, required - len(active)
+            )
+            if decision['undrained']:
+                self.lastScaleUp = now
+
+        elif required < len(active) and self.cooled(
+            self.lastScaleDown, now, self.scaleDownCooldown
+        ):
+            decision['drained'] = self.scale_down(
+                workers, len(active) - required
+            )
+            if decision['drained']:
+                self.lastScaleDown = now
+
+        # workers is the state before this step's undrains & drains, so
+        # the hosts they touched are left for the next step. Hosts aren't
+        # retired while the service needs more workers
+        if self.retireHosts:
+            touched = {
+                parse_worker_id(workerId)['host']
+                for workerId in decision['undrained'] + decision['drained']
+            }
+            decision['retired'] = self.retire_drained_hosts(
+                workers, now, touched, scalingUp=required > len(active)
+            )
+
+        if decision['undrained'] or decision['drained'] or decision['retired']:
+            log.info(f"autoscaler {self.serviceName} | {decision}")
+
+        return decision
+
+    def cooled(self, last, now, cooldown):
+        return last is None or now - last >= cooldown
+
+    def by_host(self, workers):
+        hosts = {}
+        for workerId in workers:
+            host = parse_worker_id(workerId)['host']
+            hosts.setdefault(host, []).append(workerId)
+
+        return hosts
+
+    def active_on_host(self, workers):
+        # function of a workerId that returns the number of active workers
+        # on its host
+        counts = {
+            host: len([
+                w for w in workerIds
+                if workers[w]['state'].startswith("active")
+            ])
+            for host, workerIds in self.by_host(workers).items()
+        }
+        return lambda workerId: counts[parse_worker_id(workerId)['host']]
+
+    def scale_up(self, workers, count):
+        # undrains drained workers that aren't retiring, on the busiest
+        # hosts first, so lightly used hosts stay drainable
+        activeOnHost = self.active_on_host(workers)
+        candidates = sorted(
+            (
+                workerId for workerId, workerData in workers.items()
+                if workerData['state'].startswith("draining") and
+                not workerData['retiring']
+            ),
+            key=lambda w: (-activeOnHost(w), w)
+        )
+        chosen = candidates[:count]
+        self.manager.un_drain_workers(chosen)
+        return chosen
+
+    def scale_down(self, workers, count):
+        # drains idle workers on the least used hosts first, so whole
+        # hosts become drained
+        activeOnHost = self.active_on_host(workers)
+        candidates = sorted(
+            (
+                workerId for workerId, workerData in workers.items()
+                if workerData['state'] == "activeIdle"
+            ),
+            key=lambda w: (activeOnHost(w), w)
+        )
+        chosen = candidates[:count]
+        self.manager.drain_workers(chosen)
+        return chosen
+
+    def retire_drained_hosts(self, workers, now, touched=(), scalingUp=False):
+        # retires hosts whose workers have all been drained & idle for
+        # retireAfter seconds. Hosts in touched were just drained or
+        # undrained, so they start over. Nothing is retired while scaling
+        # up, but drained hosts keep their time
+        retired = []
+        for host, workerIds in self.by_host(workers).items():
+            if host in touched:
+                self.drainedSince.pop(host, None)
+                continue
+
+            drained = all(
+                workers[w]['state'].startswith("draining") and
+                not workers[w]['runningJobUuid']
+                for w in workerIds
+            )
+            retiring = all(workers[w]['retiring'] for w in workerIds)
+            if not drained or retiring:
+                self.drainedSince.pop(host, None)
+                continue
+
+            since = self.drainedSince.setdefault(host, now)
+            if now - since >= self.retireAfter and not scalingUp:
+                self.manager.drain_workers(workerIds, retire=True)
+                del self.drainedSince[host]
+                retired.append(host)
+
+        return retired
+
+    def run(self, interval=CONTROL_INTERVAL):
+        """
+        Runs the control loop forever, one step every interval seconds
+        """
+        while True:
+            try:
+                self.step()
+            except Exception:
+                log.exception(f"autoscaler {self.serviceName} | step failed")
+
+            time.sleep(interval)
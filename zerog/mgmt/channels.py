@@ -21,20 +21,24 @@ source (even though this is known from the queue)
 data
 
 """
-from .messages import make_msg, make_msg_from_json
+from .messages import encode_msg, make_msg, make_msg_from_json
 
 import logging
 log = logging.getLogger(__name__)
 
 
 class MgmtChannel(object):
-    def __init__(self, queue):
+    def __init__(self, queue, compact=False):
         """
         Args:
             queue: zerog Queue object on which messages will be
                    produced/consumed
+
+            compact: send messages in the compact encoding (see
+                     messages.py). Messages in either encoding are read
         """
         self.queue = queue
+        self.compact = compact
 
     def make_msg(self, msgtype, **kwargs):
         msg = make_msg(msgtype, **kwargs)
@@ -47,7 +51,7 @@ class MgmtChannel(object):
 
             kwargs: keyword arguments passed through to queue's "put" method
         """
-        self.queue.put(msg.dump(), **kwargs)
+        self.queue.put(encode_msg(msg, self.compact), **kwargs)
 
     def get_msg(self, **kwargs):
         """
@@ -71,7 +75,8 @@ class MgmtChannel(object):
             # to let any exceptions trickle up
             try:
                 msg = make_msg_from_json(queueJob.body)
-            except TypeError:
+            except (TypeError, ValueError, KeyError, IndexError):
+                msg = None
                 log.warning(
                     f"{self.queue.queueName} bad message: {queueJob.body}"
                 )
@@ -1,21 +1,92 @@
+import asyncio
+import datetime
+import time
+import uuid
+
+import tornado.gen
+import tornado.locks
+import tornado.util
+
 import zerog
+from zerog.deadletters import DeadLetters
+from zerog.queues.async_beanstalk_queue import AsyncBeanstalkdQueue
+from zerog.queues.beanstalk_client import BeanstalkError
 from .channels import MgmtChannel
-from .messages import make_msg, send_msg, get_msg
-from .utils import parse_worker_id
+from .messages import (
+    make_msg, make_msg_from_json, send_broadcast, send_msg
+)
+from .telemetry import DEFAULT_CAPACITY, DEFAULT_WINDOW, JobTelemetry
+from .utils import make_broadcast_tube, make_reply_tube, parse_worker_id
+from .workertable import HEARTBEAT_MISSES, WorkerTable
+
+import logging
+log = logging.getLogger(__name__)
+
+# a little over two of the Servers' info intervals
+INFO_MAX_AGE = 150
+
+# seconds gather waits for replies, the reply tube's reserve timeout and
+# the wait after a reply channel error
+GATHER_TIMEOUT = 5
+REPLY_RESERVE_TIMEOUT = 10
+REPLY_RETRY_DELAY = 1
 
 
 class WorkerManager(object):
-    def __init__(self, queueHost, queuePort, **kwargs):
+    def __init__(self, queueHost, queuePort, datastore=None, **kwargs):
+        """
+        Args:
+            queueHost, queuePort: beanstalkd server of the workers
+
+            datastore: datastore of the workers' jobs. Only needed to
+                       manage dead letters
+
+            heartbeatMisses: number of heartbeats a worker can miss before
+                             it's dropped from the worker table
+
+            infoMaxAge: seconds after which a worker's info is stale, and
+                        request_updates asks the worker for it
+
+            telemetryCapacity: number of job run samples kept per job type
+                               & host
+
+            telemetryWindow: seconds of job runs that job_stats covers
+
+            compactMessages: send control messages in the compact encoding
+                             (see messages.py). Only for workers that can
+                             read it
+
+            infoRequestTtl: seconds after which an info request that
+                            hasn't been read is dropped. Defaults to
+                            infoMaxAge
+        """
         self.queueHost = queueHost
         self.queuePort = queuePort
+        self.datastore = datastore
 
         self.queue = self.get_queue(
             zerog.UPDATES_CHANNEL_NAME + kwargs.get("updatesPostfix", "")
         )
         self.updatesChannel = MgmtChannel(self.queue)
+        self.compactMessages = kwargs.get("compactMessages", False)
+
+        self.telemetry = JobTelemetry(
+            kwargs.get("telemetryCapacity", DEFAULT_CAPACITY),
+            kwargs.get("telemetryWindow", DEFAULT_WINDOW)
+        )
+        self.workerTable = WorkerTable(
+            kwargs.get("heartbeatMisses", HEARTBEAT_MISSES)
+        )
+        self.workers = self.workerTable.workers
+        self.infoMaxAge = kwargs.get("infoMaxAge", INFO_MAX_AGE)
+        self.infoRequestTtl = kwargs.get("infoRequestTtl", self.infoMaxAge)
 
-        self.jobRuns = {}
-        self.workers = {}
+        # replies to this manager's requests, gathered by correlationId
+        self.managerId = uuid.uuid4().hex
+        self.replyTube = make_reply_tube(self.managerId)
+        self.asyncReplyQueue = None
+        self.replyReader = None
+        self.pendingRequests = {}   # correlationId -> PendingRequest
 
     def get_queue(self, queueName):
         queue = zerog.BeanstalkdQueue(
@@ -23,43 +94,95 @@ class WorkerManager(object):
         )
         return queue
 
+    def dead_letters(self, name):
+        """
+        Returns the DeadLetters of a service's job queue
+
+        Args:
+            name: service name, as passed to the service's Server
+        """
+        if self.datastore is None:
+            raise ValueError("WorkerManager needs a datastore for dead letters")
+
+        return DeadLetters(self.datastore, self.get_queue(f"{name}_jobs"))
+
+    def list_dead_letters(self, name):
+        """
+        Lists the poison entries buried in a service's job queue, with the
+        reason each was buried
+        """
+        return self.dead_letters(name).list()
+
+    def kick_dead_letters(self, name, jids=None):
+        """
+        Kicks buried entries back into a service's job queue. Kicks all of
+        them if jids is None.
+
+        Returns:
+            ids of the entries that were kicked
+        """
+        return self.dead_letters(name).kick(jids)
+
     def workers_by_host(self):
         workersByHost = {}
-        for workerId, workerData in self.workers.items():
-            parsed = parse_worker_id(workerId)
-
-            host = parsed['host']
-            if host not in workersByHost:
-                workersByHost[host] = []
-
-            workersByHost[host].append(
-                dict(
-                    workerId=workerId,
-                    state=workerData['state'],
-                    retiring=workerData['retiring'],
-                    runningJobUuid=workerData['runningJobUuid'],
-                    mem=workerData['mem']
-                )
-            )
+        for host in self.workerTable.hosts():
+            workersByHost[host] = [
+                self.worker_summary(workerId)
+                for workerId in self.workerTable.on_host(host)
+            ]
 
         return workersByHost
 
+    def worker_summary(self, workerId):
+        workerData = self.workers[workerId]
+        return dict(
+            workerId=workerId,
+            state=workerData['state'],
+            retiring=workerData['retiring'],
+            runningJobUuid=workerData['runningJobUuid'],
+            mem=workerData['mem']
+        )
+
+    def broadcast(self, msg, host=None, serviceName=None):
+        """
+        Sends a control message to every worker on a host, or of a
+        service, with one beanstalkd message. Workers that start later
+        don't get it.
+
+        Returns:
+            the message's sequence number
+        """
+        if host is not None:
+            tube = make_broadcast_tube("host", host)
+        elif serviceName is not None:
+            tube = make_broadcast_tube("service", serviceName)
+        else:
+            raise ValueError("broadcast needs a host or a serviceName")
+
+        return send_broadcast(
+            msg, self.queue, tube, compact=self.compactMessages
+        )
+
     def drain_host(self, host, retire=False):
-        workerIds = [
-            w['workerId']
-            for w in self.workers_by_host().get(host, [])
-        ]
-        self.drain_workers(workerIds, retire)
+        self.broadcast(make_msg("retire" if retire else "drain"), host=host)
 
     def un_drain_host(self, host):
-        workerIds = [
-            w['workerId']
-            for w in self.workers_by_host().get(host, [])
-        ]
-        self.un_drain_workers(workerIds)
+        self.broadcast(make_msg("undrain"), host=host)
+
+    def drain_service(self, serviceName, retire=False):
+        self.broadcast(
+            make_msg("retire" if retire else "drain"),
+            serviceName=serviceName
+        )
+
+    def un_drain_service(self, serviceName):
+        self.broadcast(make_msg("undrain"), serviceName=serviceName)
 
     def host_is_drained(self, host):
-        workers = self.workers_by_host().get(host, [])
+        workers = [
+            self.worker_summary(workerId)
+            for workerId in self.workerTable.on_host(host)
+        ]
         if len(workers) == 0:
             return False
 
@@ -85,44 +208,18 @@ class WorkerManager(object):
 
     def known_workers(self):
         """
-        returns a dictionary of {workerId: workerData}, for all workers
-        that are listening on a control channel queue.
-        """
-        # note that queueName == workerId
-        channelNames = self.updatesChannel.list_all_queues()
-        workerData = {}
-        for wid in channelNames:
-            parsed = parse_worker_id(wid)
-            if parsed:
-                if self.updatesChannel.get_named_queue_watchers(wid) == 0:
-                    # the queue exists but has no watchers, which means the
-                    # associated worker is terminated but there are messages
-                    # in the queue which are keeping it alive.
-                    #
-                    # so the solution is to empty out the queue and then
-                    # delete its associated ctrlChannel.
-                    #
-                    # this is a mess and really just points out that zerog
-                    # management channels and probably the zerog Queue classes
-                    # need to be rethought.
-                    #
-                    # le sigh
-                    while get_msg(self.queue, wid):
-                        pass
-
-                else:
-                    workerData[wid] = parsed
-
-        # workerData = {
-        #     wid: parsed for wid, parsed in
-        #     {wid: parse_worker_id(wid) for wid in channelNames}.items()
-        #     if parsed
-        # }
-        return workerData
+        returns a dictionary of {workerId: parsedWorkerId}, for all workers
+        that have sent a heartbeat recently enough.
+        """
+        self.expire_workers()
+        return {
+            workerId: parse_worker_id(workerId)
+            for workerId in self.workers
+        }
 
     def send_ctrl_msg(self, workerId, msg):
         # workers listen to a control channel where tube == workerId
-        send_msg(msg, self.queue, workerId)
+        send_msg(msg, self.queue, workerId, compact=self.compactMessages)
 
     def drain_workers(self, workerIds, retire=False):
         if retire:
@@ -138,30 +235,58 @@ class WorkerManager(object):
         for workerId in workerIds:
             self.send_ctrl_msg(workerId, msg)
 
+    def expire_workers(self):
+        """
+        Drops the workers that have stopped sending heartbeats from the
+        worker table, and empties their control channels so messages
+        don't pile up there
+        """
+        for workerId in self.workerTable.expire():
+            self.purge_ctrl_channel(workerId)
+
+    def purge_ctrl_channel(self, workerId):
+        while True:
+            queueJob = self.queue.reserve_from(workerId, timeout=0)
+            if not queueJob:
+                break
+            queueJob.delete()
+
     def request_worker_statuses(self, workerIds):
-        # if there is an outstanding worker status request sitting in
-        # this queue, that could be a sign that the worker is dead, and
-        # just piling up worker status requests is only going to keep
-        # the channel open
-        #
-        # can we count listeners to figure it out?
-        msg = make_msg("requestInfo")
+        msg = make_msg(
+            "requestInfo", expiresAt=time.time() + self.infoRequestTtl
+        )
         for workerId in workerIds:
             self.send_ctrl_msg(workerId, msg)
 
     def update_workers(self):
         return self.request_updates()   # temp for backward-compatibility
 
-    def request_updates(self):
-        workerIds = self.known_workers()
+    def request_updates(self, maxAge=None):
+        """
+        Requests info messages from the workers whose info is older than
+        maxAge seconds (infoMaxAge by default), or who haven't sent any.
 
-        # clear out workers that are no longer listening on a control
-        # channel
-        missing = set(self.workers.keys()) - set(workerIds.keys())
-        for workerId in missing:
-            del(self.workers[workerId])
+        Workers send info messages when their state changes and every
+        minute or so, so this is only a fallback for lost messages.
+        """
+        maxAge = self.infoMaxAge if maxAge is None else maxAge
+
+        # workers that have stopped sending heartbeats are expired first,
+        # so requests don't pile up in the control channels of dead workers
+        self.expire_workers()
+        cutoff = time.time() - maxAge
+        stale = {
+            parse_worker_id(workerId)['host']
+            for workerId, workerData in self.workers.items()
+            if (workerData.get('infoAt') or 0) < cutoff
+        }
 
-        self.request_worker_statuses(workerIds)
+        # one broadcast per host with stale workers
+        msg = make_msg(
+            "requestInfo", expiresAt=time.time() + self.infoRequestTtl
+        )
+        for host in sorted(stale):
+            self.broadcast(msg, host=host)
 
     def poll_updates_channel(self):
         while True:
@@ -175,23 +300,191 @@ class WorkerManager(object):
             elif msg.msgtype == "info":
                 self.handle_info_msg(msg)
 
+            elif msg.msgtype == "heartbeat":
+                self.handle_heartbeat_msg(msg)
+
+        self.expire_workers()
+
+    async def gather(
+        self,
+        msgtype,
+        workerIds=None,
+        host=None,
+        serviceName=None,
+        timeout=GATHER_TIMEOUT,
+        **kwargs
+    ):
+        """
+        Sends a control message as a request and gathers the workers'
+        replies: info messages sent after the request is handled. Returns
+        when every expected worker has replied or after timeout seconds,
+        whichever is first, so a query of the whole cluster takes about
+        one round trip. Workers that haven't read the request by then
+        drop it.
+
+        The message goes to the control channels of workerIds, or is
+        broadcast to a host or a service, or to every known host if no
+        target is given. Replies are expected from the targeted workers
+        that are in the worker table. When there are none (e.g. a new
+        manager), the replies that arrive before the timeout are returned.
+
+        Replies also update the worker table, like info messages on the
+        updates channel.
+
+        Args:
+            msgtype: type of the control message, e.g. "requestInfo"
+
+            kwargs: fields of the message
+
+        Returns:
+            {workerId: reply info message} of the workers that replied
+        """
+        correlationId = uuid.uuid4().hex
+        msg = make_msg(
+            msgtype,
+            correlationId=correlationId,
+            replyTo=self.replyTube,
+            expiresAt=time.time() + timeout,
+            **kwargs
+        )
+
+        self.expire_workers()
+        if workerIds is not None:
+            expected = set(workerIds)
+        else:
+            expected = {
+                workerId for workerId in self.workers
+                if host in (None, parse_worker_id(workerId)['host']) and
+                serviceName in (
+                    None, parse_worker_id(workerId)['serviceName']
+                )
+            }
+
+        pending = PendingRequest(expected)
+        self.pendingRequests[correlationId] = pending
+        try:
+            if self.replyReader is None:
+                self.replyReader = asyncio.ensure_future(self.read_replies())
+
+            if workerIds is not None:
+                for workerId in workerIds:
+                    self.send_ctrl_msg(workerId, msg)
+            elif host is not None or serviceName is not None:
+                self.broadcast(msg, host=host, serviceName=serviceName)
+            else:
+                for knownHost in self.workerTable.hosts():
+                    self.broadcast(msg, host=knownHost)
+
+            try:
+                await pending.done.wait(datetime.timedelta(seconds=timeout))
+            except tornado.util.TimeoutError:
+                pass
+        finally:
+            del self.pendingRequests[correlationId]
+            if not self.pendingRequests:
+                self.stop_reading_replies()
+
+        return pending.replies
+
+    async def read_replies(self):
+        # reads the reply tube until there are no requests waiting for
+        # replies
+        if self.asyncReplyQueue is None:
+            self.asyncReplyQueue = AsyncBeanstalkdQueue(
+                self.queueHost, self.queuePort, self.replyTube
+            )
+
+        while True:
+            try:
+                queueJob = await self.asyncReplyQueue.reserve(
+                    timeout=REPLY_RESERVE_TIMEOUT
+                )
+                if queueJob is None:
+                    continue
+
+                await queueJob.delete()
+            except BeanstalkError as e:
+                log.error(f"reply channel error: {e}")
+                await tornado.gen.sleep(REPLY_RETRY_DELAY)
+                continue
+
+            try:
+                msg = make_msg_from_json(queueJob.body)
+            except (TypeError, ValueError, KeyError, IndexError):
+                log.warning(f"bad reply: {queueJob.body}")
+                continue
+
+            self.handle_reply(msg)
+
+    def stop_reading_replies(self):
+        # the reader is usually waiting in a reserve, which can't be
+        # interrupted, so its connection is closed. The next gather
+        # reconnects
+        if self.replyReader is not None:
+            self.replyReader.cancel()
+            self.replyReader = None
+            self.asyncReplyQueue.close()
+
+    def handle_reply(self, msg):
+        if msg.msgtype != "info":
+            return
+
+        self.handle_info_msg(msg)
+
+        # replies to requests that have timed out are dropped
+        pending = self.pendingRequests.get(msg.correlationId)
+        if pending:
+            pending.add(msg)
+
+    def job_stats(self):
+        """
+        Returns throughput, run duration histograms and queue wait
+        percentiles of recent job runs, by job type and by host (see
+        JobTelemetry.snapshot)
+        """
+        return self.telemetry.snapshot()
+
     def handle_job_msg(self, msg):
-        timestamp = msg.timestamp
-        uuid = msg.uuid
-        action = msg.action
-        workerId = msg.workerId
+        parsed = parse_worker_id(msg.workerId)
+        host = parsed['host'] if parsed else ""
 
-        jobRun = self.jobRuns.get(uuid, {})
-        jobRun[timestamp] = dict(workerId=workerId, action=action)
-        self.jobRuns[uuid] = jobRun
+        if msg.action == "start" and msg.queueWait is not None:
+            self.telemetry.record_wait(msg.jobType, host, msg.queueWait)
+
+        elif msg.action == "end" and msg.duration is not None:
+            self.telemetry.record_run(msg.jobType, host, msg.duration)
 
     def handle_info_msg(self, msg):
-        workerId = msg.workerId
-        workerData = dict(
-            alive=True,
+        self.workerTable.update(
+            msg.workerId,
             state=msg.state,
             retiring=msg.retiring,
             runningJobUuid=msg.uuid,
-            mem=msg.mem
+            mem=msg.mem,
+            infoAt=time.time()
+        )
+
+    def handle_heartbeat_msg(self, msg):
+        self.workerTable.update(
+            msg.workerId,
+            msg.interval,
+            state=msg.state,
+            retiring=msg.retiring,
+            runningJobUuid=msg.uuid
         )
-        self.workers[workerId] = workerData
+
+
+class PendingRequest(object):
+    """
+    Replies gathered for a request, and an event that's set once every
+    expected worker has replied
+    """
+    def __init__(self, expected):
+        self.expected = expected
+        self.replies = {}
+        self.done = tornado.locks.Event()
+
+    def add(self, msg):
+        self.replies[msg.workerId] = msg
+        if self.expected and self.expected.issubset(self.replies):
+            self.done.set()
@@ -3,12 +3,55 @@
 """
 Copyright (c) 2021 MotiveMetrics. All rights reserved.
 
+Messages are sent as JSON, in one of two encodings:
+
+- a JSON object of the message's schema dump. Every version of zerog
+  reads these
+
+- the compact encoding, a JSON array of
+  ``[1, msgtype, epoch timestamp, *fields]``, with the
+  fields in the order of the message class's FIELDS. It skips the
+  marshmallow schemas entirely, so it's much cheaper to encode & decode.
+  Fields are only ever appended to FIELDS, so readers ignore trailing
+  fields they don't know and default missing ones. Messages with an
+  envelope (below) are version 2, ``[2, msgtype, timestamp, envelope,
+  *fields]``
+
+Readers accept both encodings. Writers send JSON objects unless asked for
+the compact encoding, so readers can be upgraded before writers.
+
+Any message can carry an envelope of ENVELOPE fields, used for requests
+that expect a reply:
+
+- correlationId: id of the request, copied into its replies
+- replyTo: tube the replies are sent to
+- expiresAt: epoch seconds after which the message is dropped unread
+
+Envelope fields are left out of a message's encoding when they aren't
+set, so messages without them can still be read by older versions.
 """
 import datetime
 import json
+import time
 from marshmallow import Schema, fields
 from marshmallow.validate import OneOf
 
+from zerog.queues.beanstalk_client import CommandFailed
+
+import logging
+log = logging.getLogger(__name__)
+
+COMPACT_VERSION = 2
+ENVELOPE = ("correlationId", "replyTo", "expiresAt")
+EPOCH = datetime.datetime(1970, 1, 1)
+BROADCAST_HISTORY = 16
+# seconds a sender can hold a broadcast log before it's released to the
+# next one, e.g. if the sender dies
+BROADCAST_TTR = 5
+# seconds a sender waits for a broadcast log held by another sender
+BROADCAST_WAIT = 2 * BROADCAST_TTR
+BROADCAST_RETRY = 0.01
+
 
 ##################################################################
 # base class for messages. shouldn't ever be sent as-is
@@ -16,18 +59,74 @@ from marshmallow.validate import OneOf
 class BaseSchema(Schema):
     msgtype = fields.String()
     timestamp = fields.DateTime(format="iso")
+    correlationId = fields.String()
+    replyTo = fields.String()
+    expiresAt = fields.Float()
 
 
 class BaseMsg(object):
     SCHEMA = BaseSchema
     MSG_TYPE = "base"
+    FIELDS = ()     # order of the fields in the compact encoding
 
     def __init__(self, **kwargs):
         self.msgtype = kwargs.get('msgtype', self.MSG_TYPE)
         self.timestamp = kwargs.get('timestamp', datetime.datetime.utcnow())
+        self.correlationId = kwargs.get('correlationId')
+        self.replyTo = kwargs.get('replyTo')
+        self.expiresAt = kwargs.get('expiresAt')
+
+    def envelope(self):
+        # the envelope fields that are set
+        return {
+            field: getattr(self, field)
+            for field in ENVELOPE
+            if getattr(self, field) is not None
+        }
+
+    def expired(self, now=None):
+        if self.expiresAt is None:
+            return False
+
+        return (time.time() if now is None else now) >= self.expiresAt
 
     def dump(self):
-        return self.SCHEMA().dump(self)
+        data = self.SCHEMA().dump(self)
+        for field in ENVELOPE:
+            if data.get(field) is None:
+                data.pop(field, None)
+
+        return data
+
+    def dump_compact(self):
+        """
+        returns the message in the compact encoding
+        """
+        timestamp = (self.timestamp - EPOCH).total_seconds()
+        envelope = self.envelope()
+        if envelope:
+            header = [2, self.msgtype, timestamp, envelope]
+        else:
+            header = [1, self.msgtype, timestamp]
+
+        return header + [getattr(self, field) for field in self.FIELDS]
+
+    @classmethod
+    def load_compact(cls, values):
+        """
+        recreates a message from its compact encoding
+        """
+        if values[0] >= 2:
+            kwargs = dict(zip(cls.FIELDS, values[4:]))
+            kwargs.update(
+                (field, values[3].get(field)) for field in ENVELOPE
+            )
+        else:
+            kwargs = dict(zip(cls.FIELDS, values[3:]))
+
+        kwargs['msgtype'] = values[1]
+        kwargs['timestamp'] = EPOCH + datetime.timedelta(seconds=values[2])
+        return cls(**kwargs)
 
     def dumps(self, **kwargs):
         return self.SCHEMA().dumps(self, **kwargs)
@@ -47,17 +146,29 @@ class JobMsgSchema(BaseSchema):
         validate=OneOf(["start", "end"]),
         required=True
     )
+    jobType = fields.String()
+    queueWait = fields.Float(allow_none=True)
+    duration = fields.Float(allow_none=True)
 
 
 class JobMsg(BaseMsg):
+    """
+    sent when a worker starts or ends a job run. Start messages carry the
+    seconds the job waited in the queue, end messages the run's duration,
+    when they're known
+    """
     SCHEMA = JobMsgSchema
     MSG_TYPE = "job"
+    FIELDS = ("workerId", "uuid", "action", "jobType", "queueWait", "duration")
 
     def __init__(self, **kwargs):
         super(JobMsg, self).__init__(**kwargs)
         self.workerId = kwargs['workerId']
         self.uuid = kwargs['uuid']
         self.action = kwargs['action']
+        self.jobType = kwargs.get('jobType', "")
+        self.queueWait = kwargs.get('queueWait')
+        self.duration = kwargs.get('duration')
 
 
 class InfoMsgSchema(BaseSchema):
@@ -71,6 +182,7 @@ class InfoMsgSchema(BaseSchema):
 class InfoMsg(BaseMsg):
     SCHEMA = InfoMsgSchema
     MSG_TYPE = "info"
+    FIELDS = ("workerId", "state", "uuid", "mem", "retiring")
 
     def __init__(self, **kwargs):
         super(InfoMsg, self).__init__(**kwargs)
@@ -81,6 +193,33 @@ class InfoMsg(BaseMsg):
         self.retiring = kwargs.get('retiring', False)
 
 
+class HeartbeatMsgSchema(BaseSchema):
+    workerId = fields.String(required=True)
+    state = fields.String(required=True)
+    uuid = fields.String()
+    retiring = fields.Boolean()
+    interval = fields.Integer(required=True)
+
+
+class HeartbeatMsg(BaseMsg):
+    """
+    sent by a worker every ``interval`` seconds so managers know it's
+    alive. Lighter than an info message -- no memory stats. An interval
+    of 0 means the worker is going away
+    """
+    SCHEMA = HeartbeatMsgSchema
+    MSG_TYPE = "heartbeat"
+    FIELDS = ("workerId", "state", "uuid", "retiring", "interval")
+
+    def __init__(self, **kwargs):
+        super(HeartbeatMsg, self).__init__(**kwargs)
+        self.workerId = kwargs['workerId']
+        self.state = kwargs['state']
+        self.uuid = kwargs.get('uuid', "")
+        self.retiring = kwargs.get('retiring', False)
+        self.interval = kwargs['interval']
+
+
 ##################################################################
 # control messages are used by the manager to tell a worker to take
 # some action
@@ -107,6 +246,7 @@ class KillJobMsg(BaseMsg):
     """
     SCHEMA = KillJobMsgSchema
     MSG_TYPE = "killJob"
+    FIELDS = ("uuid",)
 
     def __init__(self, **kwargs):
         super(KillJobMsg, self).__init__(**kwargs)
@@ -154,6 +294,20 @@ class RetireMsg(BaseMsg):
     MSG_TYPE = "retire"
 
 
+class PreemptMsgSchema(BaseSchema):
+    pass
+
+
+class PreemptMsg(BaseMsg):
+    """
+    tells a draining worker to stop its running job and return it to the
+    queue, if the job checkpoints its progress (see BaseJob.CHECKPOINTS).
+    Other jobs are left to finish
+    """
+    SCHEMA = PreemptMsgSchema
+    MSG_TYPE = "preempt"
+
+
 ##################################################################
 # functions to create a message using keyword arguments or
 # to recreate a message from its serialized self
@@ -172,23 +326,61 @@ def make_msg(msgtype, **kwargs):
     return msg
 
 
+def fast_msg(msgtype, **kwargs):
+    """
+    creates a message from keyword arguments without loading them with
+    the message's schema. For senders whose arguments are known to be
+    valid
+    """
+    return MSG_TYPE_TO_CLASS_MAP[msgtype](msgtype=msgtype, **kwargs)
+
+
+def encode_msg(msg, compact=False):
+    """
+    returns the JSON-serializable form of a message to put on a queue
+
+    Args:
+        msg: a zerog management message - subclass of messages.BaseMsg
+
+        compact: use the compact encoding, which only newer readers can
+                 decode
+    """
+    if compact:
+        return msg.dump_compact()
+
+    return msg.dump()
+
+
+def decode_msg(data):
+    """
+    reconstitutes a message from either of its encodings
+    """
+    if isinstance(data, list):
+        if data[0] > COMPACT_VERSION:
+            raise ValueError(f"unknown compact message version {data[0]}")
+
+        return MSG_TYPE_TO_CLASS_MAP[data[1]].load_compact(data)
+
+    return make_msg(**data)
+
+
 def make_msg_from_json(jsonStr):
     """
     reconstitutes a message from its JSON serialized self
     """
-    kwargs = json.loads(jsonStr)
-    msg = make_msg(**kwargs)
-    return msg
+    return decode_msg(json.loads(jsonStr))
 
 
 MSG_CLASSES = [
     JobMsg,
     InfoMsg,
+    HeartbeatMsg,
     RequestInfoMsg,
     KillJobMsg,
     DrainMsg,
     UnDrainMsg,
-    RetireMsg
+    RetireMsg,
+    PreemptMsg
 ]
 
 MSG_TYPE_TO_CLASS_MAP = {
@@ -201,14 +393,11 @@ MSG_TYPE_TO_CLASS_MAP = {
 # functions to send or retrieve messages on a specified queue
 # connection/tube combination
 
-def send_msg(msg, queue, tube, **kwargs):
+def send_msg(msg, queue, tube, compact=False, **kwargs):
     """
     send a message on a queue connection / tube by temporarily using
     the named tube.
 
-    currently makes assumptions about the 'queue' object's internal
-    workings (not good)
-
     Args:
         msg: a zerog management message - subclass of messages.BaseMsg
 
@@ -216,20 +405,17 @@ def send_msg(msg, queue, tube, **kwargs):
 
         tube: the name of a Beanstalkd tube (aka "queueName" elsewhere)
 
-        kwargs: keyword arguments passed through to queue's "put" method
+        compact: send the message in the compact encoding
+
+        kwargs: keyword arguments passed through to queue's "put_to" method
     """
-    queue.do_bean("use", tube)
-    queue.put(msg.dump(), **kwargs)
-    queue.do_bean("use", "default")
+    queue.put_to(tube, encode_msg(msg, compact), **kwargs)
 
 
 def get_msg(queue, tube, **kwargs):
     """
     get a message if one is available from a queue connection / tube
-    by temporarily watching the named tube.
-
-    currently makes assumptions about the 'queue' object's internal
-    workings (not good)
+    by temporarily watching only the named tube.
 
     Args:
         queue: a zerog.BeanstalkdQueue object.
@@ -237,7 +423,7 @@ def get_msg(queue, tube, **kwargs):
         tube: the name of a Beanstalkd tube (aka "queueName" elsewhere)
 
         kwargs: keyword arguments passed through to the queue's
-                "reserve" method
+                "reserve_from" method
 
     Returns:
         next available message from the queue, or None if there are no
@@ -245,13 +431,11 @@ def get_msg(queue, tube, **kwargs):
 
         Returned message will be a subclass of messages.BaseMsg
     """
-    queue.do_bean("watch", tube)
-
     if 'timeout' not in kwargs:
         kwargs['timeout'] = 0
 
     msg = None
-    queueJob = queue.reserve(**kwargs)
+    queueJob = queue.reserve_from(tube, **kwargs)
     if queueJob:
         # could wrap this in a try:except to catch malformed messages
         # but they really shouldn't be happening so I think it's better
@@ -259,5 +443,132 @@ def get_msg(queue, tube, **kwargs):
         msg = make_msg_from_json(queueJob.body)
         queueJob.delete()
 
-    queue.do_bean("ignore", tube)
     return msg
+
+
+##################################################################
+# functions to broadcast control messages to every server on a host
+# or of a service. A broadcast tube holds a single ready entry: a log of
+# the last BROADCAST_HISTORY messages, each with a sequence number.
+# Servers peek at the log and act on the messages newer than the last one
+# they saw, so one message reaches all of them and seeing it twice does
+# nothing. Senders reserve the log while they replace it, so concurrent
+# senders take turns instead of dropping each other's messages
+
+def broadcast_counts(queue, tube):
+    # (ready, reserved) versions of a broadcast tube's log
+    try:
+        stats = queue.do_bean("stats_tube", tube)
+    except CommandFailed:
+        return 0, 0
+
+    return stats['current-jobs-ready'], stats['current-jobs-reserved']
+
+
+def peek_broadcasts(queue, tube, wait=0):
+    """
+    returns the [seq, encoded message] entries of a broadcast tube's log,
+    oldest first
+
+    Args:
+        wait: seconds to wait for the log while a sender holds it. The
+              log is empty to readers that don't wait
+    """
+    deadline = time.time() + wait
+    while True:
+        job = queue.peek_from(tube)
+        if job is not None:
+            return json.loads(job.body)['entries']
+
+        if time.time() >= deadline or broadcast_counts(queue, tube)[1] == 0:
+            return []
+
+        time.sleep(BROADCAST_RETRY)
+
+
+def reserve_broadcasts(queue, tube, wait=BROADCAST_WAIT):
+    # reserves a broadcast tube's log, so other senders wait until it's
+    # replaced. Returns None if the tube has no log yet, or another sender
+    # still holds it after wait seconds
+    deadline = time.time() + wait
+    while True:
+        job = queue.reserve_from(tube, timeout=0)
+        if job is not None:
+            return job
+
+        ready, reserved = broadcast_counts(queue, tube)
+        if ready + reserved == 0:
+            return None
+
+        if time.time() >= deadline:
+            log.warning(f"broadcast log of {tube} is held - sending anyway")
+            return None
+
+        if not ready:
+            time.sleep(BROADCAST_RETRY)
+
+
+def send_broadcast(msg, queue, tube, compact=False):
+    """
+    appends a message to a broadcast tube's log
+
+    Args:
+        msg: a zerog management message - subclass of messages.BaseMsg
+
+        queue: a zerog.BeanstalkdQueue object.
+
+        tube: name of the broadcast tube (see utils.make_broadcast_tube)
+
+        compact: send the message in the compact encoding
+
+    Returns:
+        the message's sequence number
+    """
+    held = reserve_broadcasts(queue, tube)
+    entries = dict(json.loads(held.body)['entries']) if held else {}
+
+    # merge any other versions of the log, left by a sender that gave up
+    # waiting or by senders that created the log at the same time
+    while True:
+        job = queue.peek_from(tube)
+        if job is None:
+            break
+
+        entries.update(json.loads(job.body)['entries'])
+        try:
+            queue.delete(job.jid)
+        except CommandFailed:
+            pass
+
+    # time-based, so sequence numbers keep increasing if the log is lost
+    lastSeq = max(entries) if entries else 0
+    seq = max(int(time.time() * 1000000), lastSeq + 1)
+    entries[seq] = encode_msg(msg, compact)
+    queue.put_to(
+        tube,
+        dict(entries=[
+            [s, entries[s]] for s in sorted(entries)[-BROADCAST_HISTORY:]
+        ]),
+        ttr=BROADCAST_TTR
+    )
+
+    if held:
+        try:
+            held.delete()
+        except CommandFailed:
+            # held past BROADCAST_TTR, and merged by the next sender
+            pass
+
+    return seq
+
+
+def get_broadcasts(queue, tube, lastSeq):
+    """
+    returns the (seq, message) pairs of a broadcast tube's log that are
+    newer than lastSeq, oldest first
+    """
+    return [
+        (seq, decode_msg(data))
+        for seq, data in peek_broadcasts(queue, tube)
+        if seq > lastSeq
+    ]
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+"""
+import time
+
+from .messages import make_msg
+from .utils import parse_worker_id
+
+import logging
+log = logging.getLogger(__name__)
+
+POLL_INTERVAL = 5
+RETURN_TIMEOUT = 600
+
+# phases of a host in a rolling drain
+PENDING = "pending"
+DRAINING = "draining"
+RETURNING = "returning"
+DONE = "done"
+FAILED = "failed"
+PHASES = (PENDING, DRAINING, RETURNING, DONE, FAILED)
+
+
+class RollingDrain(object):
+    """
+    Drains a list of hosts, runs an action on each once it's drained (e.g.
+    deploying & restarting its servers) and waits for its workers to come
+    back, keeping as many hosts in flight at once as a capacity budget
+    allows.
+
+    The budget is a number of active workers: a host is only drained if
+    the workers that stay active -- on hosts that aren't in flight, plus
+    those that have come back -- are at least the active workers at the
+    start less maxUnavailable. Workers that are already drained or have
+    died count against the budget too, so the drain slows down rather
+    than dropping below capacity, and while fewer workers than that are
+    active, e.g. because a host hasn't come back, no host is drained. A
+    host with more workers than the budget is only drained when no other
+    host is being drained.
+
+    Pending hosts are taken first-fit, in order of their running jobs,
+    so hosts that drain at once go first and small hosts fill the budget
+    left over by large ones. With preempt, drained servers stop running
+    jobs that checkpoint their progress (see BaseJob.CHECKPOINTS) rather
+    than waiting for them to finish, and the jobs are rerun elsewhere.
+
+    A host has come back when it has at least as many active workers as
+    it had when it was drained. Hosts that don't come back within
+    returnTimeout seconds, or whose action raises, fail. Their workers
+    still count against the budget. With retire, hosts are retired
+    instead of drained and are done once they're drained, without waiting
+    for them to come back.
+
+    The manager's worker table should be up to date when the drain
+    starts, e.g. it has polled the updates channel for a heartbeat
+    interval. Hosts without live workers are drained at once.
+
+    Args:
+        manager: WorkerManager of the hosts' workers
+
+        hosts: hosts to drain, in order of preference
+
+        action: function of a host, called once it's drained. Optional
+                with retire
+
+        maxUnavailable: active workers that may be out of service at
+                        once. Less than 1 is a fraction of the active
+                        workers at the start
+
+        serviceName: only count the workers of this service in the budget
+
+        preempt: preempt running jobs that checkpoint
+
+        retire: retire the hosts rather than bringing them back
+
+        returnTimeout: seconds a host has to come back after its action
+
+        onProgress: function of the progress dict (see progress), called
+                    when a host changes phase
+    """
+    def __init__(
+        self,
+        manager,
+        hosts,
+        action=None,
+        maxUnavailable=1,
+        serviceName=None,
+        preempt=True,
+        retire=False,
+        returnTimeout=RETURN_TIMEOUT,
+        onProgress=None
+    ):
+        if action is None and not retire:
+            raise ValueError("RollingDrain needs an action unless it retires")
+
+        self.manager = manager
+        self.hosts = list(hosts)
+        self.action = action
+        self.maxUnavailable = maxUnavailable
+        self.serviceName = serviceName
+        self.preempt = preempt
+        self.retire = retire
+        self.returnTimeout = returnTimeout
+        self.onProgress = onProgress
+
+        self.phases = {host: PENDING for host in self.hosts}
+        self.since = {}             # host -> time it entered its phase
+        self.expected = {}          # host -> active workers when drained
+        self.minActive = None
+        self.startedAt = None
+        self.finishedAt = None
+
+    def workers(self):
+        # {workerId: workerData} of the workers counted in the budget
+        return {
+            workerId: workerData
+            for workerId, workerData in self.manager.workers.items()
+            if self.serviceName in (
+                None, parse_worker_id(workerId)['serviceName']
+            )
+        }
+
+    def by_host(self, workers):
+        # {host: {'active': n, 'running': n}} of the workers
+        counts = {}
+        for workerId, workerData in workers.items():
+            host = parse_worker_id(workerId)['host']
+            count = counts.setdefault(host, dict(active=0, running=0))
+            if workerData['state'].startswith("active"):
+                count['active'] += 1
+            if workerData['runningJobUuid']:
+                count['running'] += 1
+
+        return counts
+
+    def available(self, counts):
+        # active workers on the hosts that aren't being drained
+        return sum(
+            count['active'] for host, count in counts.items()
+            if self.phases.get(host) != DRAINING
+        )
+
+    def finished(self):
+        return all(
+            phase in (DONE, FAILED) for phase in self.phases.values()
+        )
+
+    def set_phase(self, host, phase, now):
+        log.info(f"rolling drain | {host} {self.phases[host]} -> {phase}")
+        self.phases[host] = phase
+        self.since[host] = now
+
+    def step(self, now=None):
+        """
+        Runs one iteration: refreshes the manager's view of the workers,
+        moves hosts through their phases and drains the pending hosts
+        the budget allows.
+
+        Returns:
+            True when every host is done or has failed
+        """
+        now = time.time() if now is None else now
+        self.manager.poll_updates_channel()
+        counts = self.by_host(self.workers())
+
+        if self.minActive is None:
+            active = sum(count['active'] for count in counts.values())
+            budget = self.maxUnavailable
+            if budget < 1:
+                budget = int(active * budget)
+            self.minActive = active - budget
+            self.startedAt = now
+
+        before = dict(self.phases)
+        for host in self.in_phase(DRAINING):
+            if self.is_drained(host):
+                self.drained(host, now)
+
+        for host in self.in_phase(RETURNING):
+            active = counts.get(host, {}).get('active', 0)
+            if active >= self.expected[host]:
+                self.set_phase(host, DONE, now)
+            elif now - self.since[host] >= self.returnTimeout:
+                log.error(f"rolling drain | {host} didn't come back")
+                self.set_phase(host, FAILED, now)
+
+        self.start_hosts(counts, now)
+
+        if self.finished() and self.finishedAt is None:
+            self.finishedAt = now
+
+        if self.phases != before:
+            progress = self.progress(now)
+            log.info(f"rolling drain | {progress['counts']}")
+            if self.onProgress:
+                self.onProgress(progress)
+
+        return self.finished()
+
+    def in_phase(self, phase):
+        return [host for host in self.hosts if self.phases[host] == phase]
+
+    def is_drained(self, host):
+        # a host without live workers has nothing to drain
+        if not self.manager.workerTable.on_host(host):
+            return True
+
+        return self.manager.host_is_drained(host)
+
+    def start_hosts(self, counts, now):
+        # drains pending hosts, first-fit within the budget
+        available = self.available(counts)
+        pending = sorted(
+            self.in_phase(PENDING),
+            key=lambda h: counts.get(h, {}).get('running', 0)
+        )
+        for host in pending:
+            active = counts.get(host, {}).get('active', 0)
+            fits = available - active >= self.minActive
+
+            # a host larger than the budget goes alone
+            alone = not self.in_phase(DRAINING) and (
+                available >= self.minActive
+            )
+            if not fits and not alone:
+                continue
+
+            self.drain(host, active, now)
+            available -= active
+
+    def drain(self, host, active, now):
+        self.expected[host] = active
+        self.manager.drain_host(host, retire=self.retire)
+        if self.preempt:
+            self.manager.broadcast(make_msg("preempt"), host=host)
+
+        self.set_phase(host, DRAINING, now)
+
+    def drained(self, host, now):
+        # runs the action on a drained host
+        if self.action:
+            try:
+                self.action(host)
+            except Exception:
+                log.exception(f"rolling drain | {host} action failed")
+                self.set_phase(host, FAILED, now)
+                return
+
+        if self.retire:
+            self.set_phase(host, DONE, now)
+        else:
+            self.set_phase(host, RETURNING, now)
+
+    def progress(self, now=None):
+        """
+        Returns:
+            {
+                "counts": {phase: number of hosts},
+                "phases": {host: phase},
+                "elapsed": seconds since the drain started,
+                "eta": estimated seconds until it's finished, from the
+                       rate at which hosts have finished so far. None
+                       until a host has finished
+            }
+        """
+        now = time.time() if now is None else now
+        elapsed = 0 if self.startedAt is None else (
+            (self.finishedAt or now) - self.startedAt
+        )
+        finished = len(self.in_phase(DONE)) + len(self.in_phase(FAILED))
+        eta = None
+        if finished:
+            eta = elapsed / finished * (len(self.hosts) - finished)
+
+        return dict(
+            counts={
+                phase: len(self.in_phase(phase)) for phase in PHASES
+            },
+            phases=dict(self.phases),
+            elapsed=elapsed,
+            eta=eta
+        )
+
+    def run(self, interval=POLL_INTERVAL):
+        """
+        Steps every interval seconds until every host is done or has
+        failed
+
+        Returns:
+            the final progress
+        """
+        while not self.step():
+            time.sleep(interval)
+
+        return self.progress()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+"""
+import array
+import bisect
+import math
+import time
+
+DEFAULT_CAPACITY = 1000
+DEFAULT_WINDOW = 300
+SNAPSHOT_MAX_AGE = 1
+
+# upper bounds, in seconds, of the run duration histogram buckets. The
+# last bucket holds longer runs
+DURATION_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+WAIT_PERCENTILES = (50, 90, 99)
+
+
+class RingBuffer(object):
+    """
+    Fixed-capacity buffer of (time, value) samples, which overwrites the
+    oldest sample when it's full. Samples are kept in two arrays of
+    doubles, so a buffer's size doesn't grow with the number of samples.
+
+    Args:
+        capacity: maximum number of samples
+    """
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.times = array.array('d', bytes(8 * capacity))
+        self.values = array.array('d', bytes(8 * capacity))
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, t, value):
+        if self.size < self.capacity:
+            i = self.start + self.size
+            self.size += 1
+        else:
+            i = self.start
+            self.start = (self.start + 1) % self.capacity
+
+        i %= self.capacity
+        self.times[i] = t
+        self.values[i] = value
+
+    def latest(self):
+        # time of the newest sample, or None if there are none
+        if not self.size:
+            return None
+
+        return self.times[(self.start + self.size - 1) % self.capacity]
+
+    def since(self, t):
+        """
+        Returns the values of the samples taken at or after time t, oldest
+        first. Samples are assumed to be appended in time order
+        """
+        end = self.start + self.size
+        if end <= self.capacity:
+            times = self.times[self.start:end]
+            values = self.values[self.start:end]
+        else:
+            end %= self.capacity
+            times = self.times[self.start:] + self.times[:end]
+            values = self.values[self.start:] + self.values[:end]
+
+        return values[bisect.bisect_left(times, t):]
+
+
+class BucketCounter(object):
+    """
+    Number of events, and sum of their values, in each second of the last
+    ``window`` seconds. Unlike a RingBuffer it counts every event, so
+    totals don't saturate at a buffer's capacity, while its size only
+    depends on the window.
+
+    Args:
+        window: seconds of events counted
+    """
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.size = max(1, int(math.ceil(window)) + 1)
+        self.seconds = array.array('q', [-1] * self.size)
+        self.counts = array.array('q', bytes(8 * self.size))
+        self.sums = array.array('d', bytes(8 * self.size))
+        self.last = None
+
+    def add(self, t, value):
+        second = int(math.floor(t))
+        i = second % self.size
+        if self.seconds[i] != second:
+            if self.seconds[i] > second:
+                # older than the window the bucket already covers
+                return
+
+            self.seconds[i] = second
+            self.counts[i] = 0
+            self.sums[i] = 0
+
+        self.counts[i] += 1
+        self.sums[i] += value
+        if self.last is None or t > self.last:
+            self.last = t
+
+    def latest(self):
+        # time of the newest event, or None if there are none
+        return self.last
+
+    def since(self, t):
+        """
+        Returns (count, sum) of the events in the seconds from time t on
+        """
+        first = int(math.floor(t))
+        count = 0
+        total = 0
+        for i in range(self.size):
+            if self.seconds[i] >= first:
+                count += self.counts[i]
+                total += self.sums[i]
+
+        return count, total
+
+
+def histogram(ordered, bounds=DURATION_BUCKETS):
+    # counts of the sorted values in each bucket
+    counts = []
+    lower = 0
+    for bound in bounds:
+        upper = bisect.bisect_right(ordered, bound, lower)
+        counts.append(upper - lower)
+        lower = upper
+
+    counts.append(len(ordered) - lower)
+    return counts
+
+
+def percentiles(ordered, points=WAIT_PERCENTILES):
+    # nearest-rank percentiles of the sorted values
+    if not ordered:
+        return {f"p{point}": None for point in points}
+
+    n = len(ordered)
+    return {
+        f"p{point}": ordered[max(0, min(n - 1, -(-point * n // 100) - 1))]
+        for point in points
+    }
+
+
+class JobTelemetry(object):
+    """
+    Bounded record of the job runs reported on the updates channel, with
+    rolling aggregates per job type and per host.
+
+    Each job type and host has per-second counts of its runs, plus ring
+    buffers of sampled run durations and queue waits, so memory use is
+    bounded no matter how many jobs run. Aggregates are computed over the
+    last ``window`` seconds when a snapshot is taken: the runs, throughput
+    and mean duration count every run, while the histogram of run
+    durations and the percentiles of queue waits are over the samples.
+
+    Args:
+        capacity: number of samples kept per job type & host
+
+        window: seconds of samples the aggregates cover
+    """
+    def __init__(self, capacity=DEFAULT_CAPACITY, window=DEFAULT_WINDOW):
+        self.capacity = capacity
+        self.window = window
+        self.runs = {}          # (dimension, name) -> BucketCounter
+        self.durations = {}     # (dimension, name) -> RingBuffer
+        self.waits = {}         # (dimension, name) -> RingBuffer
+
+        self.snapshotAt = None
+        self.cached = None
+
+    def add(self, buffers, jobType, host, value, now):
+        for key in [("jobTypes", jobType), ("hosts", host)]:
+            if key not in buffers:
+                buffers[key] = RingBuffer(self.capacity)
+            buffers[key].append(now, value)
+
+        self.cached = None
+
+    def record_run(self, jobType, host, duration, now=None):
+        """
+        Records the duration, in seconds, of a job run
+        """
+        now = time.time() if now is None else now
+        for key in [("jobTypes", jobType), ("hosts", host)]:
+            if key not in self.runs:
+                self.runs[key] = BucketCounter(self.window)
+            self.runs[key].add(now, duration)
+
+        self.add(self.durations, jobType, host, duration, now)
+
+    def record_wait(self, jobType, host, wait, now=None):
+        """
+        Records the seconds a job waited in the queue before a run
+        """
+        now = time.time() if now is None else now
+        self.add(self.waits, jobType, host, wait, now)
+
+    def prune(self, cutoff):
+        # drops the buffers of job types & hosts with no recent samples,
+        # e.g. of hosts that have been retired
+        for buffers in [self.runs, self.durations, self.waits]:
+            for key in [k for k, b in buffers.items() if b.latest() < cutoff]:
+                del buffers[key]
+
+    def snapshot(self, now=None):
+        """
+        Returns the aggregates over the last ``window`` seconds. Snapshots
+        are cached for up to a second, or until a sample is recorded
+
+        Returns:
+            {
+                "window": seconds,
+                "durationBuckets": upper bounds of the histogram buckets,
+                "jobTypes": {jobType: aggregates},
+                "hosts": {host: aggregates}
+            }
+
+            where aggregates is a dict of runs, throughput (runs per
+            second), meanDuration, durationHistogram (counts of sampled
+            runs per bucket, plus one for longer runs) and waits (p50, p90,
+            p99 seconds of the sampled waits)
+        """
+        now = time.time() if now is None else now
+        if (
+            self.cached is not None and
+            0 <= now - self.snapshotAt < SNAPSHOT_MAX_AGE
+        ):
+            return self.cached
+
+        cutoff = now - self.window
+        self.prune(cutoff)
+
+        snapshot = dict(
+            window=self.window,
+            durationBuckets=list(DURATION_BUCKETS),
+            jobTypes={},
+            hosts={}
+        )
+        for key in set(self.runs) | set(self.waits):
+            dimension, name = key
+            runs, total = (
+                self.runs[key].since(cutoff) if key in self.runs else (0, 0)
+            )
+            durations = sorted(self.since(self.durations, key, cutoff))
+            waits = sorted(self.since(self.waits, key, cutoff))
+            snapshot[dimension][name] = dict(
+                runs=runs,
+                throughput=runs / self.window,
+                meanDuration=total / runs if runs else None,
+                durationHistogram=histogram(durations),
+                waits=percentiles(waits)
+            )
+
+        self.snapshotAt = now
+        self.cached = snapshot
+        return snapshot
+
+    def since(self, buffers, key, cutoff):
+        buffer = buffers.get(key)
+        return buffer.since(cutoff) if buffer else []
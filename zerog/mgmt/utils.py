@@ -22,3 +22,18 @@ def parse_worker_id(workerId):
         )
     else:
         return None
+
+
+def make_broadcast_tube(scope, name):
+    """
+    name of the broadcast tube of a host (scope "host") or of a service
+    (scope "service")
+    """
+    return f"zerog_broadcast{DELIM}{scope}{DELIM}{name}"
+
+
+def make_reply_tube(managerId):
+    """
+    name of the tube a WorkerManager receives replies to its requests on
+    """
+    return f"zerog_replies{DELIM}{managerId}"
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+"""
+import heapq
+import time
+
+from .utils import parse_worker_id
+
+HEARTBEAT_INTERVAL = 10
+HEARTBEAT_MISSES = 3
+
+
+class WorkerTable(object):
+    """
+    Expiring table of live workers, built from the heartbeat and info
+    messages they send on the updates channel.
+
+    A worker is expired when it misses ``misses`` heartbeats in a row, or
+    right away when it sends a heartbeat with an interval of 0. Workers
+    are indexed by host as they come and go, and expiry times are kept in
+    a heap, so keeping the table current costs O(changes) rather than
+    O(workers).
+
+    Args:
+        misses: number of heartbeat intervals a worker can miss before
+                it's expired
+    """
+    def __init__(self, misses=HEARTBEAT_MISSES):
+        self.misses = misses
+        self.workers = {}       # workerId -> workerData
+        self.byHost = {}        # host -> set of workerIds
+        self.intervals = {}     # workerId -> heartbeat interval
+        self.expiresAt = {}     # workerId -> time the worker expires
+
+        # heap of (time, workerId). A worker's live entry is the one in
+        # scheduled, and can be earlier than its expiry time, in which case
+        # it's rescheduled when it comes up. Other entries are superseded
+        self.expiries = []
+        self.scheduled = {}     # workerId -> time of its heap entry
+
+    def update(self, workerId, interval=None, now=None, **data):
+        """
+        Records that a worker is alive, updating its workerData with data.
+        Unknown workers are added.
+
+        Args:
+            workerId: id of the worker
+
+            interval: seconds until the worker's next heartbeat. 0 removes
+                      the worker. If None, the worker's last heartbeat
+                      interval is used
+
+            now: current time, for testing
+        """
+        if interval is None:
+            interval = self.intervals.get(workerId, HEARTBEAT_INTERVAL)
+
+        if interval <= 0:
+            self.remove(workerId)
+            return
+
+        now = time.time() if now is None else now
+        if workerId not in self.workers:
+            parsed = parse_worker_id(workerId)
+            if not parsed:
+                return
+
+            self.workers[workerId] = dict(
+                alive=True,
+                state="",
+                retiring=False,
+                runningJobUuid="",
+                mem={}
+            )
+            self.byHost.setdefault(parsed['host'], set()).add(workerId)
+
+        self.workers[workerId].update(data)
+        self.intervals[workerId] = interval
+
+        expiresAt = now + interval * self.misses
+        self.expiresAt[workerId] = expiresAt
+        if expiresAt < self.scheduled.get(workerId, float("inf")):
+            self.schedule(workerId, expiresAt)
+
+    def schedule(self, workerId, expiresAt):
+        heapq.heappush(self.expiries, (expiresAt, workerId))
+        self.scheduled[workerId] = expiresAt
+
+    def remove(self, workerId):
+        # forgets a worker. Its heap entry is dropped when it comes up
+        if self.workers.pop(workerId, None) is None:
+            return
+
+        del self.intervals[workerId]
+        del self.expiresAt[workerId]
+        host = parse_worker_id(workerId)['host']
+        self.byHost[host].discard(workerId)
+        if not self.byHost[host]:
+            del self.byHost[host]
+
+    def expire(self, now=None):
+        """
+        Removes the workers that have missed too many heartbeats
+
+        Returns:
+            ids of the expired workers
+        """
+        now = time.time() if now is None else now
+        expired = []
+        while self.expiries and self.expiries[0][0] <= now:
+            at, workerId = heapq.heappop(self.expiries)
+            if self.scheduled.get(workerId) != at:
+                # superseded
+                continue
+
+            del self.scheduled[workerId]
+
+            expiresAt = self.expiresAt.get(workerId)
+            if expiresAt is None:
+                # already removed
+                continue
+
+            if expiresAt > now:
+                # heard from since the entry was scheduled
+                self.schedule(workerId, expiresAt)
+            else:
+                self.remove(workerId)
+                expired.append(workerId)
+
+        return expired
+
+    def hosts(self):
+        return sorted(self.byHost)
+
+    def on_host(self, host):
+        """
+        Returns the ids of the workers on a host
+        """
+        return sorted(self.byHost.get(host, ()))
@@ -1 +1,4 @@
+from .async_beanstalk_queue import AsyncBeanstalkdQueue
 from .beanstalk_queue import BeanstalkdQueue
+from .shared_beanstalk_queue import SharedBeanstalkdQueue
+from .sqlite_queue import SqliteQueue
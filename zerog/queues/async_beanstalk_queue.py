@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+Non-blocking beanstalkd client for the tornado IOLoop
+"""
+import json
+
+import tornado.gen
+import tornado.locks
+from tornado.iostream import StreamClosedError
+from tornado.tcpclient import TCPClient
+
+from .beanstalk_client import (
+    DEFAULT_PRIORITY, DEFAULT_TTR, DEFAULT_TUBE, BeanstalkError,
+    CommandFailed, DeadlineSoon, SocketError, UnexpectedResponse,
+    parse_yaml_dict
+)
+
+import logging
+log = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = 10
+RECONNECT_TRIES = 2
+RECONNECT_DELAY = 1
+CRLF = b"\r\n"
+
+
+class AsyncQueueJob(object):
+    """
+    A job reserved from an AsyncBeanstalkdQueue
+    """
+    def __init__(self, queue, jid, body):
+        self.queue = queue
+        self.jid = jid
+        self.body = body
+
+    async def delete(self):
+        await self.queue.delete(self.jid)
+
+    async def release(self, priority=DEFAULT_PRIORITY, delay=0):
+        await self.queue.release(self.jid, priority, delay)
+
+    async def bury(self, priority=DEFAULT_PRIORITY):
+        await self.queue.bury(self.jid, priority)
+
+    async def touch(self):
+        await self.queue.touch(self.jid)
+
+    async def stats(self):
+        return await self.queue.stats_job(self.jid)
+
+
+class AsyncBeanstalkdQueue(object):
+    """
+    Coroutine version of BeanstalkdQueue, on a tornado IOStream, so queue
+    operations never block the IOLoop. Reconnects like
+    BeanstalkdQueue.do_bean, but waits between attempts without blocking.
+
+    Commands on a queue are serialized, and a ``reserve`` holds the
+    connection until a job arrives or the reserve times out, so a
+    consumer waiting in ``reserve`` should have its own queue object.
+
+    Args:
+        host, port: beanstalkd address
+
+        queueName: tube that is used for puts & watched for reserves
+    """
+    def __init__(self, host, port, queueName):
+        self.host = host
+        self.port = port
+        self.queueName = queueName
+        self.stream = None
+        self.lock = tornado.locks.Lock()
+
+    async def connect(self):
+        """
+        Connects (if not already connected) and attaches to the queue's
+        tube
+        """
+        async with self.lock:
+            await self._ensure_connected()
+
+    async def _ensure_connected(self):
+        if self.stream and not self.stream.closed():
+            return
+
+        self.stream = None
+        try:
+            stream = await TCPClient().connect(
+                self.host, self.port, timeout=CONNECT_TIMEOUT
+            )
+        except (OSError, StreamClosedError, tornado.gen.TimeoutError) as e:
+            raise SocketError(e)
+
+        stream.set_nodelay(True)
+        self.stream = stream
+
+        # attach. Watch the queue's tube before ignoring "default", since
+        # beanstalkd won't ignore the last watched tube
+        await self._send([
+            self._simple("use %s" % self.queueName, ["USING"]),
+            self._simple("watch %s" % self.queueName, ["WATCHING"]),
+            self._simple(
+                "ignore %s" % DEFAULT_TUBE, ["WATCHING"], ["NOT_IGNORED"]
+            ),
+        ], returnExceptions=True)
+
+    def close(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+    # -- protocol --
+
+    async def _read_response(self, name, ok, err=()):
+        line = await self.stream.read_until(CRLF)
+        parts = line.decode("ascii").split()
+        status, results = parts[0], parts[1:]
+        if status in ok:
+            return status, results
+        if status in err:
+            raise CommandFailed(name, status, results)
+
+        raise UnexpectedResponse(name, status, results)
+
+    async def _read_body(self, size):
+        data = await self.stream.read_bytes(size + 2)
+        return data[:-2].decode("utf-8")
+
+    def _simple(self, command, ok, err=(), value=None):
+        name = command.split()[0]
+
+        async def reader():
+            _, results = await self._read_response(name, ok, err)
+            return value(results) if value else None
+
+        return command.encode("utf-8") + CRLF, reader
+
+    def _put(self, body, priority=DEFAULT_PRIORITY, delay=0,
+             ttr=DEFAULT_TTR):
+        body = body.encode("utf-8")
+        command = b"put %d %d %d %d\r\n" % (priority, delay, ttr, len(body))
+
+        async def reader():
+            _, results = await self._read_response(
+                "put", ["INSERTED"], ["JOB_TOO_BIG", "BURIED", "DRAINING"]
+            )
+            return int(results[0])
+
+        return command + body + CRLF, reader
+
+    async def _send(self, requests, returnExceptions=False):
+        # writes the requests' commands in one write, then reads every
+        # response so the connection stays in sync
+        await self.stream.write(b"".join(data for data, _ in requests))
+
+        results = []
+        failure = None
+        for _, reader in requests:
+            try:
+                results.append(await reader())
+            except BeanstalkError as e:
+                results.append(e)
+                failure = failure or e
+
+        if failure and not returnExceptions:
+            raise failure
+
+        return results
+
+    async def _execute(self, requests, returnExceptions=False):
+        # runs the requests, reconnecting if the connection is lost.
+        # Like do_bean, a request that was sent before the connection
+        # dropped may be repeated
+        async with self.lock:
+            for attempt in range(RECONNECT_TRIES + 1):
+                if attempt:
+                    log.info("attempting to connect to beanstalkd queue")
+                    await tornado.gen.sleep(RECONNECT_DELAY)
+
+                try:
+                    await self._ensure_connected()
+                    return await self._send(requests, returnExceptions)
+
+                except (StreamClosedError, SocketError, OSError):
+                    self.close()
+
+            log.info("failed to connect to beanstalkd queue")
+            raise SocketError
+
+    # -- queue interface --
+
+    async def put(self, data, **kwargs):
+        results = await self._execute([self._put(json.dumps(data), **kwargs)])
+        return results[0]
+
+    async def put_many(self, datas, **kwargs):
+        """
+        Puts several jobs in the queue with one pipelined write.
+
+        Returns:
+            list of job ids, with None for jobs that weren't inserted
+        """
+        results = await self._execute(
+            [self._put(json.dumps(data), **kwargs) for data in datas],
+            returnExceptions=True
+        )
+        return [
+            None if isinstance(result, Exception) else result
+            for result in results
+        ]
+
+    async def put_to(self, tube, data, **kwargs):
+        """
+        Puts data in another tube, pipelining the tube switches
+        """
+        results = await self._execute([
+            self._simple("use %s" % tube, ["USING"]),
+            self._put(json.dumps(data), **kwargs),
+            self._simple("use %s" % self.queueName, ["USING"]),
+        ])
+        return results[1]
+
+    async def reserve(self, timeout=None):
+        """
+        Reserves a job from the queue's tube.
+
+        Returns:
+            AsyncQueueJob, or None if the reserve timed out
+        """
+        if timeout is None:
+            command = b"reserve\r\n"
+        else:
+            command = b"reserve-with-timeout %d\r\n" % timeout
+
+        async def reader():
+            try:
+                _, results = await self._read_response(
+                    "reserve", ["RESERVED"], ["TIMED_OUT", "DEADLINE_SOON"]
+                )
+            except CommandFailed as e:
+                if e.args[1] == "TIMED_OUT":
+                    return None
+                raise DeadlineSoon(e.args[2])
+
+            jid, size = results
+            body = await self._read_body(int(size))
+            return AsyncQueueJob(self, int(jid), body)
+
+        results = await self._execute([(command, reader)])
+        return results[0]
+
+    async def delete(self, jid):
+        await self._execute(
+            [self._simple("delete %d" % jid, ["DELETED"], ["NOT_FOUND"])]
+        )
+
+    async def release(self, jid, priority=DEFAULT_PRIORITY, delay=0):
+        await self._execute([self._simple(
+            "release %d %d %d" % (jid, priority, delay),
+            ["RELEASED", "BURIED"], ["NOT_FOUND"]
+        )])
+
+    async def bury(self, jid, priority=DEFAULT_PRIORITY):
+        await self._execute([self._simple(
+            "bury %d %d" % (jid, priority), ["BURIED"], ["NOT_FOUND"]
+        )])
+
+    async def touch(self, jid):
+        await self._execute(
+            [self._simple("touch %d" % jid, ["TOUCHED"], ["NOT_FOUND"])]
+        )
+
+    async def _stats(self, command):
+        name = command.split()[0]
+
+        async def reader():
+            _, results = await self._read_response(
+                name, ["OK"], ["NOT_FOUND"]
+            )
+            return parse_yaml_dict(await self._read_body(int(results[0])))
+
+        results = await self._execute([(command.encode() + CRLF, reader)])
+        return results[0]
+
+    async def stats_job(self, jid):
+        return await self._stats("stats-job %d" % jid)
+
+    async def stats_tube(self, name):
+        return await self._stats("stats-tube %s" % name)
@@ -0,0 +1,616 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+beanstalkd protocol client
+
+A small client for the beanstalkd protocol
+(https://github.com/beanstalkd/beanstalkd/blob/master/doc/protocol.txt),
+with the same interface as beanstalkc's Connection and Job, plus:
+
+    - buffered socket reads
+    - command pipelining: several commands are sent in one write and
+      their responses are read back in order
+    - a fast parser for the YAML dictionaries & lists returned by the
+      stats, stats-tube, stats-job, list-tubes & list-tubes-watched
+      commands (no YAML library needed)
+    - client-side tracking of the used & watched tubes, so redundant
+      use/watch/ignore commands don't make a round trip
+"""
+import socket
+
+import logging
+log = logging.getLogger(__name__)
+
+DEFAULT_HOST = "localhost"
+DEFAULT_PORT = 11300
+DEFAULT_PRIORITY = 2 ** 31
+DEFAULT_TTR = 120
+DEFAULT_TUBE = "default"
+RECV_SIZE = 65536
+CRLF = b"\r\n"
+
+
+class BeanstalkError(Exception):
+    pass
+
+
+class SocketError(BeanstalkError):
+    @staticmethod
+    def wrap(func, *args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except socket.error as e:
+            raise SocketError(e)
+
+
+class UnexpectedResponse(BeanstalkError):
+    pass
+
+
+class CommandFailed(BeanstalkError):
+    pass
+
+
+class DeadlineSoon(BeanstalkError):
+    pass
+
+
+def parse_scalar(value):
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+        return value[1:-1]
+
+    try:
+        return int(value)
+    except ValueError:
+        pass
+
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def parse_yaml_dict(body):
+    """
+    Parses the flat ``key: value`` YAML dictionaries returned by the
+    stats commands
+    """
+    result = dict()
+    for line in body.splitlines():
+        key, sep, value = line.partition(":")
+        if sep and key != "---":
+            result[key.strip()] = parse_scalar(value.strip())
+
+    return result
+
+
+def parse_yaml_list(body):
+    """
+    Parses the ``- item`` YAML lists returned by the list-tubes commands
+    """
+    return [
+        line[2:].strip() for line in body.splitlines() if line.startswith("- ")
+    ]
+
+
+class Job(object):
+    """
+    A job reserved (or peeked) from beanstalkd
+    """
+    def __init__(self, conn, jid, body, reserved=True):
+        self.conn = conn
+        self.jid = jid
+        self.body = body
+        self.reserved = reserved
+
+    def _priority(self):
+        stats = self.stats()
+        if isinstance(stats, dict):
+            return stats['pri']
+
+        return DEFAULT_PRIORITY
+
+    def delete(self):
+        self.conn.delete(self.jid)
+        self.reserved = False
+
+    def release(self, priority=None, delay=0):
+        if self.reserved:
+            self.conn.release(self.jid, priority or self._priority(), delay)
+            self.reserved = False
+
+    def bury(self, priority=None):
+        if self.reserved:
+            self.conn.bury(self.jid, priority or self._priority())
+            self.reserved = False
+
+    def kick(self):
+        self.conn.kick_job(self.jid)
+
+    def touch(self):
+        if self.reserved:
+            self.conn.touch(self.jid)
+
+    def stats(self):
+        return self.conn.stats_job(self.jid)
+
+
+class Pipeline(object):
+    """
+    Batches commands on a connection. The commands are sent in one write
+    by ``execute``, which returns their results in order.
+
+    Any command of the connection that doesn't return a reply body
+    directly to the caller can be pipelined, including ``put``,
+    ``reserve``, ``use``, ``watch``, ``ignore`` & ``delete``::
+
+        results = conn.pipeline().use("tube").put("a").put("b").execute()
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        self.requests = []
+
+    def __getattr__(self, name):
+        makeRequest = getattr(self.conn, "_req_" + name)
+
+        def add(*args, **kwargs):
+            self.requests.append(makeRequest(*args, **kwargs))
+            return self
+
+        return add
+
+    def __len__(self):
+        return len(self.requests)
+
+    def execute(self, returnExceptions=False):
+        """
+        Sends the batched commands and reads their responses.
+
+        Args:
+            returnExceptions: if True, commands that fail return their
+                              exception in the results instead of raising
+
+        Returns:
+            list of the commands' results
+        """
+        requests, self.requests = self.requests, []
+        return self.conn._execute(requests, returnExceptions)
+
+
+class Connection(object):
+    """
+    beanstalkd connection
+
+    Args:
+        host, port: beanstalkd address
+
+        connectTimeout: socket timeout, in seconds, for connecting
+
+        encoding: encoding of job bodies. Job bodies are returned as
+                  bytes if None
+    """
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                 connectTimeout=None, encoding="utf-8"):
+        self.host = host
+        self.port = port
+        self.connectTimeout = connectTimeout
+        self.encoding = encoding
+        self.connect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def connect(self):
+        """Connect to beanstalkd server."""
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.settimeout(self.connectTimeout)
+        SocketError.wrap(self._socket.connect, (self.host, self.port))
+        self._socket.settimeout(None)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._buffer = bytearray()
+
+        # a new connection uses & watches the default tube
+        self.currentTube = DEFAULT_TUBE
+        self.watchedTubes = {DEFAULT_TUBE}
+
+    def close(self):
+        """Close connection to server."""
+        try:
+            self._socket.sendall(b"quit\r\n")
+        except socket.error:
+            pass
+        try:
+            self._socket.close()
+        except socket.error:
+            pass
+
+    def reconnect(self):
+        """Re-connect to server."""
+        self.close()
+        self.connect()
+
+    def pipeline(self):
+        return Pipeline(self)
+
+    # -- socket I/O --
+
+    def _recv(self):
+        data = SocketError.wrap(self._socket.recv, RECV_SIZE)
+        if not data:
+            raise SocketError("connection closed by beanstalkd")
+
+        self._buffer += data
+
+    def _read_line(self):
+        while True:
+            end = self._buffer.find(CRLF)
+            if end >= 0:
+                line = bytes(self._buffer[:end])
+                del self._buffer[:end + 2]
+                return line
+
+            self._recv()
+
+    def _read_body(self, size):
+        while len(self._buffer) < size + 2:
+            self._recv()
+
+        body = bytes(self._buffer[:size])
+        del self._buffer[:size + 2]
+        if self.encoding:
+            return body.decode(self.encoding)
+
+        return body
+
+    def _read_response(self, name, ok, err=()):
+        parts = self._read_line().decode("ascii").split()
+        status, results = parts[0], parts[1:]
+        if status in ok:
+            return status, results
+        if status in err:
+            raise CommandFailed(name, status, results)
+
+        raise UnexpectedResponse(name, status, results)
+
+    def _execute(self, requests, returnExceptions=False):
+        # sends every request's command in one write, then runs each
+        # request's reader. All the responses are read even if one fails,
+        # so the connection stays in sync
+        SocketError.wrap(
+            self._socket.sendall, b"".join(data for data, _ in requests)
+        )
+
+        results = []
+        failure = None
+        for _, reader in requests:
+            try:
+                results.append(reader())
+            except SocketError:
+                raise
+            except BeanstalkError as e:
+                results.append(e)
+                failure = failure or e
+
+        if failure and not returnExceptions:
+            raise failure
+
+        return results
+
+    def _run(self, request):
+        return self._execute([request])[0]
+
+    # -- requests: (command bytes, response reader) --
+
+    def _simple(self, name, command, ok, err=(), value=None):
+        def reader():
+            _, results = self._read_response(name, ok, err)
+            return value(results) if value else None
+
+        return command.encode("utf-8") + CRLF, reader
+
+    def _job_reader(self, name, ok, err, reserved):
+        def reader():
+            try:
+                _, results = self._read_response(name, ok, err)
+            except CommandFailed as e:
+                status = e.args[1]
+                if status in ["TIMED_OUT", "NOT_FOUND"]:
+                    return None
+                if status == "DEADLINE_SOON":
+                    raise DeadlineSoon(e.args[2])
+                raise
+
+            jid, size = results
+            body = self._read_body(int(size))
+            return Job(self, int(jid), body, reserved)
+
+        return reader
+
+    def _yaml_reader(self, name, parse, err=()):
+        def reader():
+            _, results = self._read_response(name, ["OK"], err)
+            body = self._read_body(int(results[0]))
+            if isinstance(body, bytes):
+                body = body.decode("utf-8")
+            return parse(body)
+
+        return reader
+
+    def _req_put(self, body, priority=DEFAULT_PRIORITY, delay=0,
+                 ttr=DEFAULT_TTR):
+        if isinstance(body, str):
+            if not self.encoding:
+                raise ValueError(
+                    "Job body must be bytes when no encoding is specified"
+                )
+            body = body.encode(self.encoding)
+        elif not isinstance(body, bytes):
+            raise ValueError("Job body must be a str or bytes instance")
+
+        command = b"put %d %d %d %d\r\n" % (priority, delay, ttr, len(body))
+        return command + body + CRLF, self._put_reader()
+
+    def _put_reader(self):
+        def reader():
+            _, results = self._read_response(
+                "put", ["INSERTED"], ["JOB_TOO_BIG", "BURIED", "DRAINING"]
+            )
+            return int(results[0])
+
+        return reader
+
+    def _req_reserve(self, timeout=None):
+        if timeout is None:
+            command = b"reserve\r\n"
+        else:
+            command = b"reserve-with-timeout %d\r\n" % timeout
+
+        return command, self._job_reader(
+            "reserve", ["RESERVED"], ["DEADLINE_SOON", "TIMED_OUT"], True
+        )
+
+    def _req_use(self, name):
+        def using(results):
+            self.currentTube = results[0]
+            return results[0]
+
+        return self._simple("use", "use %s" % name, ["USING"], value=using)
+
+    def _req_watch(self, name):
+        def watching(results):
+            self.watchedTubes.add(name)
+            return int(results[0])
+
+        return self._simple(
+            "watch", "watch %s" % name, ["WATCHING"], value=watching
+        )
+
+    def _req_ignore(self, name):
+        def watching(results):
+            self.watchedTubes.discard(name)
+            return int(results[0])
+
+        return self._simple(
+            "ignore", "ignore %s" % name, ["WATCHING"], ["NOT_IGNORED"],
+            value=watching
+        )
+
+    def _req_delete(self, jid):
+        return self._simple(
+            "delete", "delete %d" % jid, ["DELETED"], ["NOT_FOUND"]
+        )
+
+    def _req_release(self, jid, priority=DEFAULT_PRIORITY, delay=0):
+        return self._simple(
+            "release", "release %d %d %d" % (jid, priority, delay),
+            ["RELEASED", "BURIED"], ["NOT_FOUND"]
+        )
+
+    def _req_bury(self, jid, priority=DEFAULT_PRIORITY):
+        return self._simple(
+            "bury", "bury %d %d" % (jid, priority), ["BURIED"], ["NOT_FOUND"]
+        )
+
+    def _req_touch(self, jid):
+        return self._simple(
+            "touch", "touch %d" % jid, ["TOUCHED"], ["NOT_FOUND"]
+        )
+
+    def _req_kick(self, bound=1):
+        return self._simple(
+            "kick", "kick %d" % bound, ["KICKED"],
+            value=lambda results: int(results[0])
+        )
+
+    def _req_kick_job(self, jid):
+        return self._simple(
+            "kick-job", "kick-job %d" % jid, ["KICKED"], ["NOT_FOUND"]
+        )
+
+    def _req_peek(self, jid):
+        return b"peek %d\r\n" % jid, self._job_reader(
+            "peek", ["FOUND"], ["NOT_FOUND"], False
+        )
+
+    def _req_peek_ready(self):
+        return b"peek-ready\r\n", self._job_reader(
+            "peek-ready", ["FOUND"], ["NOT_FOUND"], False
+        )
+
+    def _req_peek_delayed(self):
+        return b"peek-delayed\r\n", self._job_reader(
+            "peek-delayed", ["FOUND"], ["NOT_FOUND"], False
+        )
+
+    def _req_peek_buried(self):
+        return b"peek-buried\r\n", self._job_reader(
+            "peek-buried", ["FOUND"], ["NOT_FOUND"], False
+        )
+
+    def _req_tubes(self):
+        return b"list-tubes\r\n", self._yaml_reader(
+            "list-tubes", parse_yaml_list
+        )
+
+    def _req_using(self):
+        return self._simple(
+            "list-tube-used", "list-tube-used", ["USING"],
+            value=lambda results: results[0]
+        )
+
+    def _req_watching(self):
+        return b"list-tubes-watched\r\n", self._yaml_reader(
+            "list-tubes-watched", parse_yaml_list
+        )
+
+    def _req_stats(self):
+        return b"stats\r\n", self._yaml_reader("stats", parse_yaml_dict)
+
+    def _req_stats_tube(self, name):
+        return b"stats-tube %s\r\n" % name.encode("utf-8"), self._yaml_reader(
+            "stats-tube", parse_yaml_dict, ["NOT_FOUND"]
+        )
+
+    def _req_stats_job(self, jid):
+        return b"stats-job %d\r\n" % jid, self._yaml_reader(
+            "stats-job", parse_yaml_dict, ["NOT_FOUND"]
+        )
+
+    def _req_pause_tube(self, name, delay):
+        return self._simple(
+            "pause-tube", "pause-tube %s %d" % (name, delay), ["PAUSED"],
+            ["NOT_FOUND"]
+        )
+
+    # -- public interface --
+
+    def put(self, body, priority=DEFAULT_PRIORITY, delay=0, ttr=DEFAULT_TTR):
+        """Put a job into the current tube. Returns job id."""
+        return self._run(self._req_put(body, priority, delay, ttr))
+
+    def put_many(self, bodies, priority=DEFAULT_PRIORITY, delay=0,
+                 ttr=DEFAULT_TTR):
+        """
+        Put several jobs into the current tube with one pipelined write.
+        Returns their job ids, with None for jobs that weren't inserted.
+        """
+        pipeline = self.pipeline()
+        for body in bodies:
+            pipeline.put(body, priority, delay, ttr)
+
+        jids = []
+        for result in pipeline.execute(returnExceptions=True):
+            if isinstance(result, CommandFailed) and result.args[1] == "BURIED":
+                jids.append(int(result.args[2][0]))
+            elif isinstance(result, BeanstalkError):
+                log.warning(f"beanstalkd rejected put: {result}")
+                jids.append(None)
+            else:
+                jids.append(result)
+
+        return jids
+
+    def reserve(self, timeout=None):
+        """
+        Reserve a job from one of the watched tubes, with optional timeout
+        in seconds. Returns a Job object, or None if the request times out.
+        """
+        return self._run(self._req_reserve(timeout))
+
+    def use(self, name):
+        """Use a given tube."""
+        if name == self.currentTube:
+            return name
+
+        return self._run(self._req_use(name))
+
+    def watch(self, name):
+        """Watch a given tube."""
+        if name in self.watchedTubes:
+            return len(self.watchedTubes)
+
+        return self._run(self._req_watch(name))
+
+    def ignore(self, name):
+        """Stop watching a given tube."""
+        if name not in self.watchedTubes:
+            return len(self.watchedTubes)
+
+        try:
+            return self._run(self._req_ignore(name))
+        except CommandFailed:
+            # can't ignore the last watched tube
+            return 1
+
+    def delete(self, jid):
+        """Delete a job, by job id."""
+        self._run(self._req_delete(jid))
+
+    def release(self, jid, priority=DEFAULT_PRIORITY, delay=0):
+        """Release a reserved job back into the ready queue."""
+        self._run(self._req_release(jid, priority, delay))
+
+    def bury(self, jid, priority=DEFAULT_PRIORITY):
+        """Bury a job, by job id."""
+        self._run(self._req_bury(jid, priority))
+
+    def touch(self, jid):
+        """Touch a job, by job id, requesting more time to work on it."""
+        self._run(self._req_touch(jid))
+
+    def kick(self, bound=1):
+        """Kick at most bound jobs into the ready queue."""
+        return self._run(self._req_kick(bound))
+
+    def kick_job(self, jid):
+        """Kick a specific job into the ready queue."""
+        self._run(self._req_kick_job(jid))
+
+    def peek(self, jid):
+        """Peek at a job. Returns a Job, or None."""
+        return self._run(self._req_peek(jid))
+
+    def peek_ready(self):
+        """Peek at next ready job. Returns a Job, or None."""
+        return self._run(self._req_peek_ready())
+
+    def peek_delayed(self):
+        """Peek at next delayed job. Returns a Job, or None."""
+        return self._run(self._req_peek_delayed())
+
+    def peek_buried(self):
+        """Peek at next buried job. Returns a Job, or None."""
+        return self._run(self._req_peek_buried())
+
+    def tubes(self):
+        """Return a list of all existing tubes."""
+        return self._run(self._req_tubes())
+
+    def using(self):
+        """Return the tube currently being used."""
+        return self._run(self._req_using())
+
+    def watching(self):
+        """Return a list of all tubes being watched."""
+        return self._run(self._req_watching())
+
+    def stats(self):
+        """Return a dict of beanstalkd statistics."""
+        return self._run(self._req_stats())
+
+    def stats_tube(self, name):
+        """Return a dict of stats about a given tube."""
+        return self._run(self._req_stats_tube(name))
+
+    def stats_job(self, jid):
+        """Return a dict of stats about a job, by job id."""
+        return self._run(self._req_stats_job(jid))
+
+    def pause_tube(self, name, delay):
+        """Pause a tube for a given delay time, in seconds."""
+        self._run(self._req_pause_tube(name, delay))
@@ -5,14 +5,18 @@ Copyright (c) 2020 MotiveMetrics. All rights reserved.
 
 Simple beanstalkd client
 """
-import beanstalkc
 import json
 import time
-import yaml
+
+from .beanstalk_client import (
+    DEFAULT_PRIORITY, Connection, Job, SocketError
+)
 
 import logging
 log = logging.getLogger(__name__)
 
+PIPELINE_CHUNK_SIZE = 500
+
 
 class BeanstalkdQueue(object):
     def __init__(self, host, port, queueName):
@@ -23,19 +27,15 @@ class BeanstalkdQueue(object):
         self.attach()
 
     def make_connection(self):
-        self.bean = beanstalkc.Connection(
-            host=self.host,
-            port=self.port,
-            parse_yaml=yaml.safe_load
-        )
+        self.bean = Connection(host=self.host, port=self.port)
         # while True:
         #     try:
-        #         self.bean = beanstalkc.Connection(
+        #         self.bean = Connection(
         #             host=self.host, port=self.port
         #         )
         #         return
 
-        #     except beanstalkc.SocketError:
+        #     except SocketError:
         #         pass
 
         #     if retries == 0:
@@ -44,26 +44,115 @@ class BeanstalkdQueue(object):
         #     retries -= 1
         #     time.sleep(1)
 
-        # raise beanstalkc.SocketError
+        # raise SocketError
 
     def put(self, data, **kwargs):
         return self.do_bean("put", json.dumps(data), **kwargs)
 
+    def put_many(self, datas, **kwargs):
+        """
+        Puts several jobs in the queue, pipelining the put commands so
+        there's one round trip per batch instead of one per job.
+
+        Returns:
+            list of job ids, with None for jobs that weren't inserted
+        """
+        bodies = [json.dumps(data) for data in datas]
+        jids = []
+        for i in range(0, len(bodies), PIPELINE_CHUNK_SIZE):
+            chunk = bodies[i:i + PIPELINE_CHUNK_SIZE]
+            jids += self.do_bean("put_many", chunk, **kwargs)
+
+        return jids
+
+    def put_to(self, tube, data, **kwargs):
+        """
+        Puts data in another tube, in one round trip: the use, put and
+        use commands that switch to the tube and back are pipelined.
+
+        Returns:
+            job id
+        """
+        def pipelined():
+            current = self.bean.currentTube
+            results = self.bean.pipeline().use(tube).put(
+                json.dumps(data), **kwargs
+            ).use(current).execute()
+            return results[1]
+
+        return self.do_bean(pipelined)
+
+    def peek_from(self, tube):
+        """
+        Peeks at the next ready job of another tube, in one round trip.
+        The job stays in the tube
+
+        Returns:
+            job, or None if the tube has no ready jobs
+        """
+        def pipelined():
+            current = self.bean.currentTube
+            results = self.bean.pipeline().use(tube).peek_ready().use(
+                current
+            ).execute()
+            return results[1]
+
+        return self.do_bean(pipelined)
+
+    def reserve_from(self, tube, **kwargs):
+        """
+        Reserves a job from another tube only, in one round trip: the
+        watch and ignore commands that switch to the tube and back are
+        pipelined with the reserve.
+
+        Returns:
+            reserved job, or None if the reserve timed out
+        """
+        def pipelined():
+            wasWatched = tube in self.bean.watchedTubes
+            watched = sorted(self.bean.watchedTubes - {tube})
+            pipeline = self.bean.pipeline().watch(tube)
+            for name in watched:
+                pipeline.ignore(name)
+            pipeline.reserve(**kwargs)
+            for name in watched:
+                pipeline.watch(name)
+            if not wasWatched:
+                pipeline.ignore(tube)
+
+            results = pipeline.execute(returnExceptions=True)
+            job = results[1 + len(watched)]
+            if isinstance(job, Exception):
+                raise job
+
+            return job
+
+        return self.do_bean(pipelined)
+
     def reserve(self, **kwargs):
         return self.do_bean("reserve", **kwargs)
 
     def attach(self):
-        self.do_bean("ignore", "default")
+        # beanstalkd won't ignore the last watched tube, so watch the
+        # queue's tube before ignoring "default"
         self.do_bean("use", self.queueName)
         self.do_bean("watch", self.queueName)
+        self.do_bean("ignore", "default")
 
     def detach(self):
         self.do_bean("use", "default")
+        self.do_bean("watch", "default")
         self.do_bean("ignore", self.queueName)
 
     def delete(self, jid):
         self.do_bean("delete", jid)
 
+    def release(self, jid, priority=DEFAULT_PRIORITY, delay=0):
+        self.do_bean("release", jid, priority, delay)
+
+    def kick_job(self, jid):
+        self.do_bean("kick_job", jid)
+
     def list_all_queues(self):
         return self.do_bean("tubes")
 
@@ -72,10 +161,19 @@ class BeanstalkdQueue(object):
         #   - if it succeeds, return the result
         #   - if there's a socket error, fall through to the retry logic
         #   - any other exception is not caught
-        try:
+        #
+        # method may be a callable that uses self.bean, for operations that
+        # are more than one Connection method call
+        def call():
+            if callable(method):
+                return method(*args, **kwargs)
+
             return getattr(self.bean, method)(*args, **kwargs)
 
-        except beanstalkc.SocketError:
+        try:
+            return call()
+
+        except SocketError:
             pass
 
         # initial attempt to execute the method failed, but we may be
@@ -86,20 +184,20 @@ class BeanstalkdQueue(object):
             try:
                 self.make_connection()
                 self.attach()
-                result = getattr(self.bean, method)(*args, **kwargs)
+                result = call()
                 log.info("successfully reconnected")
                 return result
 
-            except beanstalkc.SocketError:
+            except SocketError:
                 pass
 
             time.sleep(1)
 
         log.info("failed to connect to beanstalkd queue")
-        raise beanstalkc.SocketError
+        raise SocketError
 
 
-class QueueJob(beanstalkc.Job):
+class QueueJob(Job):
     """
     this is just for testing
     """
@@ -0,0 +1,876 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+In-process beanstalkd emulator
+
+BeanstalkEmulator keeps beanstalkd's job semantics in memory: tubes,
+priorities, delays, time-to-run expiry, DEADLINE_SOON, bury & kick,
+paused tubes and beanstalkd's stats. MockQueue uses it directly, and
+EmulatorServer serves it over the beanstalkd protocol on a local socket,
+so BeanstalkdQueue & AsyncBeanstalkdQueue in any number of processes can
+share it:
+
+    python -m zerog.queues.emulator --port 11300
+"""
+import argparse
+import heapq
+import os
+import select
+import socket
+import socketserver
+import threading
+import time
+
+from .beanstalk_client import (
+    DEFAULT_PRIORITY, DEFAULT_TTR, DEFAULT_TUBE, CommandFailed, DeadlineSoon
+)
+
+import logging
+log = logging.getLogger(__name__)
+
+MAX_JOB_SIZE = 65535
+SAFETY_MARGIN = 1
+URGENT_PRIORITY = 1024
+ALIVE_CHECK_INTERVAL = 0.25
+
+READY = "ready"
+RESERVED = "reserved"
+DELAYED = "delayed"
+BURIED = "buried"
+
+
+class EmulatedJob(object):
+    def __init__(self, jid, tube, priority, delay, ttr, body, now):
+        self.jid = jid
+        self.tube = tube
+        self.priority = priority
+        self.delay = delay
+        self.ttr = max(ttr, 1)      # as in beanstalkd
+        self.body = body
+        self.createdAt = now
+        self.readyAt = now + delay
+        self.deadline = None
+        self.client = None
+        self.state = DELAYED if delay > 0 else READY
+        self.seq = 0                # invalidates stale heap entries
+        self.reserves = 0
+        self.timeouts = 0
+        self.releases = 0
+        self.buries = 0
+        self.kicks = 0
+
+
+class Tube(object):
+    def __init__(self, name):
+        self.name = name
+        self.ready = []             # heap of (priority, jid, seq)
+        self.using = 0
+        self.watching = 0
+        self.waiting = 0
+        self.totalJobs = 0
+        self.pausedUntil = 0
+        self.pauseDelay = 0
+        self.cmdDelete = 0
+        self.cmdPauseTube = 0
+
+
+class BeanstalkEmulator(object):
+    """
+    In-memory beanstalkd. Thread-safe: every client operation holds the
+    emulator's lock, and blocking reserves wait on its condition.
+
+    Args:
+        maxJobSize: maximum job body size, in bytes (beanstalkd's -z)
+    """
+    def __init__(self, maxJobSize=MAX_JOB_SIZE):
+        self.maxJobSize = maxJobSize
+        self.cond = threading.Condition()
+        self.jobs = dict()
+        self.tubes = dict()
+        self.delayed = []           # heap of (readyAt, jid, seq)
+        self.deadlines = []         # heap of (deadline, jid, seq)
+        self.nextJid = 1
+        self.connections = 0
+        self.totalConnections = 0
+        self.jobTimeouts = 0
+        self.cmdCounts = dict()
+        self.startedAt = time.time()
+
+    def client(self):
+        """Returns a new client (the equivalent of a connection)."""
+        return EmulatorClient(self)
+
+    # -- internals; called with the lock held --
+
+    def count(self, cmd):
+        self.cmdCounts[cmd] = self.cmdCounts.get(cmd, 0) + 1
+
+    def tube(self, name):
+        tube = self.tubes.get(name)
+        if tube is None:
+            tube = self.tubes[name] = Tube(name)
+
+        return tube
+
+    def tube_exists(self, name):
+        tube = self.tubes.get(name)
+        if tube is None:
+            return False
+
+        return bool(
+            tube.using or tube.watching or
+            any(job.tube == name for job in self.jobs.values())
+        )
+
+    def make_ready(self, job):
+        job.state = READY
+        job.deadline = None
+        job.client = None
+        job.seq += 1
+        heapq.heappush(
+            self.tube(job.tube).ready, (job.priority, job.jid, job.seq)
+        )
+        self.cond.notify_all()
+
+    def make_delayed(self, job, now):
+        job.state = DELAYED
+        job.readyAt = now + job.delay
+        job.client = None
+        job.seq += 1
+        heapq.heappush(self.delayed, (job.readyAt, job.jid, job.seq))
+
+    def make_reserved(self, job, client, now):
+        job.state = RESERVED
+        job.deadline = now + job.ttr
+        job.client = client
+        job.reserves += 1
+        job.seq += 1
+        heapq.heappush(self.deadlines, (job.deadline, job.jid, job.seq))
+        client.reserved.add(job.jid)
+
+    def valid(self, entry, state):
+        job = self.jobs.get(entry[1])
+        if job and job.seq == entry[2] and job.state == state:
+            return job
+
+        return None
+
+    def tick(self, now):
+        # makes delayed jobs that are due ready, and expires reserved jobs
+        # whose ttr has run out
+        while self.delayed and self.delayed[0][0] <= now:
+            job = self.valid(heapq.heappop(self.delayed), DELAYED)
+            if job:
+                self.make_ready(job)
+
+        while self.deadlines and self.deadlines[0][0] <= now:
+            job = self.valid(heapq.heappop(self.deadlines), RESERVED)
+            if job:
+                job.client.reserved.discard(job.jid)
+                job.timeouts += 1
+                self.jobTimeouts += 1
+                self.make_ready(job)
+
+    def next_event(self, now):
+        # time of the next delay or ttr expiry or tube unpause
+        times = [
+            heap[0][0] for heap in [self.delayed, self.deadlines] if heap
+        ]
+        times += [
+            tube.pausedUntil for tube in self.tubes.values()
+            if tube.pausedUntil > now
+        ]
+        return min(times) if times else None
+
+    def top_ready(self, tube):
+        while tube.ready:
+            job = self.valid(tube.ready[0], READY)
+            if job:
+                return job
+
+            heapq.heappop(tube.ready)
+
+        return None
+
+    def find(self, jid, cmd):
+        job = self.jobs.get(jid)
+        if job is None:
+            raise CommandFailed(cmd, "NOT_FOUND", [])
+
+        return job
+
+    def remove(self, job):
+        del self.jobs[job.jid]
+        if job.client:
+            job.client.reserved.discard(job.jid)
+        job.seq += 1
+
+    def job_counts(self, jobs):
+        counts = {
+            READY: 0, RESERVED: 0, DELAYED: 0, BURIED: 0, 'urgent': 0
+        }
+        for job in jobs:
+            counts[job.state] += 1
+            if job.state == READY and job.priority < URGENT_PRIORITY:
+                counts['urgent'] += 1
+
+        return counts
+
+
+class EmulatorClient(object):
+    """
+    A client of a BeanstalkEmulator, with the interface of
+    beanstalk_client.Connection. Jobs are returned as (jid, body) tuples.
+    """
+    def __init__(self, emulator):
+        self.emulator = emulator
+        self.reserved = set()
+        self.closed = False
+        with emulator.cond:
+            emulator.connections += 1
+            emulator.totalConnections += 1
+            self.currentTube = DEFAULT_TUBE
+            self.watchedTubes = {DEFAULT_TUBE}
+            emulator.tube(DEFAULT_TUBE).using += 1
+            emulator.tube(DEFAULT_TUBE).watching += 1
+
+    def close(self):
+        """Releases the client's reserved jobs & tubes."""
+        em = self.emulator
+        with em.cond:
+            if self.closed:
+                return
+
+            self.closed = True
+            em.connections -= 1
+            for jid in list(self.reserved):
+                job = em.jobs.get(jid)
+                if job and job.state == RESERVED:
+                    em.make_ready(job)
+            self.reserved.clear()
+
+            em.tube(self.currentTube).using -= 1
+            for name in self.watchedTubes:
+                em.tube(name).watching -= 1
+
+    def put(self, body, priority=DEFAULT_PRIORITY, delay=0, ttr=DEFAULT_TTR):
+        em = self.emulator
+        with em.cond:
+            em.count("put")
+            if len(body) > em.maxJobSize:
+                raise CommandFailed("put", "JOB_TOO_BIG", [])
+
+            now = time.time()
+            job = EmulatedJob(
+                em.nextJid, self.currentTube, priority, delay, ttr, body, now
+            )
+            em.nextJid += 1
+            em.jobs[job.jid] = job
+            em.tube(job.tube).totalJobs += 1
+            if job.state == DELAYED:
+                heapq.heappush(em.delayed, (job.readyAt, job.jid, job.seq))
+                em.cond.notify_all()
+            else:
+                em.make_ready(job)
+
+            return job.jid
+
+    def reserve(self, timeout=None, alive=None):
+        """
+        Reserves a job from the watched tubes, waiting up to timeout
+        seconds (forever if None).
+
+        Args:
+            alive: optional function polled while waiting; the reserve is
+                   abandoned (returns None) when it returns False
+
+        Returns:
+            (jid, body), or None if the reserve timed out
+        """
+        em = self.emulator
+        with em.cond:
+            em.count("reserve-with-timeout" if timeout is not None
+                     else "reserve")
+            end = None if timeout is None else time.time() + timeout
+            for name in self.watchedTubes:
+                em.tube(name).waiting += 1
+
+            try:
+                while True:
+                    now = time.time()
+                    em.tick(now)
+
+                    job = self.next_ready(now)
+                    if job:
+                        em.make_reserved(job, self, now)
+                        return job.jid, job.body
+
+                    if any(
+                        em.jobs[jid].deadline - now <= SAFETY_MARGIN
+                        for jid in self.reserved
+                    ):
+                        raise DeadlineSoon([])
+
+                    if end is not None and now >= end:
+                        return None
+
+                    if alive and not alive():
+                        return None
+
+                    wakeAt = [
+                        t for t in [end, em.next_event(now)] if t is not None
+                    ]
+                    wait = min(wakeAt) - now if wakeAt else None
+                    if alive:
+                        wait = min(
+                            wait if wait is not None else ALIVE_CHECK_INTERVAL,
+                            ALIVE_CHECK_INTERVAL
+                        )
+                    em.cond.wait(wait)
+
+            finally:
+                for name in self.watchedTubes:
+                    em.tube(name).waiting -= 1
+
+    def next_ready(self, now):
+        # the most urgent ready job in the watched, unpaused tubes
+        em = self.emulator
+        best = None
+        for name in self.watchedTubes:
+            tube = em.tube(name)
+            if tube.pausedUntil > now:
+                continue
+
+            job = em.top_ready(tube)
+            if job and (
+                best is None or
+                (job.priority, job.jid) < (best.priority, best.jid)
+            ):
+                best = job
+
+        return best
+
+    def use(self, name):
+        em = self.emulator
+        with em.cond:
+            em.count("use")
+            em.tube(self.currentTube).using -= 1
+            em.tube(name).using += 1
+            self.currentTube = name
+            return name
+
+    def watch(self, name):
+        em = self.emulator
+        with em.cond:
+            em.count("watch")
+            if name not in self.watchedTubes:
+                self.watchedTubes.add(name)
+                em.tube(name).watching += 1
+
+            return len(self.watchedTubes)
+
+    def ignore(self, name):
+        em = self.emulator
+        with em.cond:
+            em.count("ignore")
+            if name in self.watchedTubes:
+                if len(self.watchedTubes) == 1:
+                    raise CommandFailed("ignore", "NOT_IGNORED", [])
+
+                self.watchedTubes.discard(name)
+                em.tube(name).watching -= 1
+
+            return len(self.watchedTubes)
+
+    def delete(self, jid):
+        em = self.emulator
+        with em.cond:
+            em.count("delete")
+            job = em.find(jid, "delete")
+            if job.state == RESERVED and job.client is not self:
+                raise CommandFailed("delete", "NOT_FOUND", [])
+
+            em.tube(job.tube).cmdDelete += 1
+            em.remove(job)
+
+    def reserved_job(self, jid, cmd):
+        job = self.emulator.find(jid, cmd)
+        if job.state != RESERVED or job.client is not self:
+            raise CommandFailed(cmd, "NOT_FOUND", [])
+
+        return job
+
+    def release(self, jid, priority=DEFAULT_PRIORITY, delay=0):
+        em = self.emulator
+        with em.cond:
+            em.count("release")
+            job = self.reserved_job(jid, "release")
+            self.reserved.discard(jid)
+            job.priority = priority
+            job.delay = delay
+            job.releases += 1
+            if delay > 0:
+                em.make_delayed(job, time.time())
+                em.cond.notify_all()
+            else:
+                em.make_ready(job)
+
+    def bury(self, jid, priority=DEFAULT_PRIORITY):
+        em = self.emulator
+        with em.cond:
+            em.count("bury")
+            job = self.reserved_job(jid, "bury")
+            self.reserved.discard(jid)
+            job.priority = priority
+            job.state = BURIED
+            job.client = None
+            job.deadline = None
+            job.buries += 1
+            job.seq += 1
+
+    def touch(self, jid):
+        em = self.emulator
+        with em.cond:
+            em.count("touch")
+            job = self.reserved_job(jid, "touch")
+            job.deadline = time.time() + job.ttr
+            job.seq += 1
+            heapq.heappush(em.deadlines, (job.deadline, job.jid, job.seq))
+
+    def kick(self, bound=1):
+        """
+        Kicks up to bound buried jobs in the used tube or, if there are
+        none, up to bound delayed jobs
+        """
+        em = self.emulator
+        with em.cond:
+            em.count("kick")
+            inTube = sorted(
+                (job for job in em.jobs.values()
+                 if job.tube == self.currentTube),
+                key=lambda job: job.jid
+            )
+            kicked = [job for job in inTube if job.state == BURIED][:bound]
+            if not kicked:
+                kicked = [
+                    job for job in inTube if job.state == DELAYED
+                ][:bound]
+
+            for job in kicked:
+                job.kicks += 1
+                em.make_ready(job)
+
+            return len(kicked)
+
+    def kick_job(self, jid):
+        em = self.emulator
+        with em.cond:
+            em.count("kick-job")
+            job = em.find(jid, "kick-job")
+            if job.state not in [BURIED, DELAYED]:
+                raise CommandFailed("kick-job", "NOT_FOUND", [])
+
+            job.kicks += 1
+            em.make_ready(job)
+
+    def peek(self, jid):
+        em = self.emulator
+        with em.cond:
+            em.count("peek")
+            job = em.jobs.get(jid)
+            return (job.jid, job.body) if job else None
+
+    def _peek_state(self, state, cmd, key):
+        em = self.emulator
+        with em.cond:
+            em.count(cmd)
+            em.tick(time.time())
+            jobs = [
+                job for job in em.jobs.values()
+                if job.tube == self.currentTube and job.state == state
+            ]
+            if not jobs:
+                return None
+
+            job = min(jobs, key=key)
+            return job.jid, job.body
+
+    def peek_ready(self):
+        return self._peek_state(
+            READY, "peek-ready", lambda job: (job.priority, job.jid)
+        )
+
+    def peek_delayed(self):
+        return self._peek_state(
+            DELAYED, "peek-delayed", lambda job: (job.readyAt, job.jid)
+        )
+
+    def peek_buried(self):
+        return self._peek_state(BURIED, "peek-buried", lambda job: job.jid)
+
+    def tubes(self):
+        em = self.emulator
+        with em.cond:
+            em.count("list-tubes")
+            return sorted(
+                name for name in em.tubes if em.tube_exists(name)
+            )
+
+    def using(self):
+        return self.currentTube
+
+    def watching(self):
+        return sorted(self.watchedTubes)
+
+    def pause_tube(self, name, delay):
+        em = self.emulator
+        with em.cond:
+            em.count("pause-tube")
+            if not em.tube_exists(name):
+                raise CommandFailed("pause-tube", "NOT_FOUND", [])
+
+            tube = em.tube(name)
+            tube.pausedUntil = time.time() + delay
+            tube.pauseDelay = delay
+            tube.cmdPauseTube += 1
+            em.cond.notify_all()
+
+    def stats_job(self, jid):
+        em = self.emulator
+        with em.cond:
+            em.count("stats-job")
+            now = time.time()
+            em.tick(now)
+            job = em.find(jid, "stats-job")
+            if job.state == RESERVED:
+                timeLeft = job.deadline - now
+            elif job.state == DELAYED:
+                timeLeft = job.readyAt - now
+            else:
+                timeLeft = 0
+
+            return {
+                'id': job.jid,
+                'tube': job.tube,
+                'state': job.state,
+                'pri': job.priority,
+                'age': int(now - job.createdAt),
+                'delay': int(job.delay),
+                'ttr': int(job.ttr),
+                'time-left': max(int(timeLeft), 0),
+                'file': 0,
+                'reserves': job.reserves,
+                'timeouts': job.timeouts,
+                'releases': job.releases,
+                'buries': job.buries,
+                'kicks': job.kicks,
+            }
+
+    def stats_tube(self, name):
+        em = self.emulator
+        with em.cond:
+            em.count("stats-tube")
+            now = time.time()
+            em.tick(now)
+            if not em.tube_exists(name):
+                raise CommandFailed("stats-tube", "NOT_FOUND", [])
+
+            tube = em.tube(name)
+            counts = em.job_counts(
+                job for job in em.jobs.values() if job.tube == name
+            )
+            return {
+                'name': name,
+                'current-jobs-urgent': counts['urgent'],
+                'current-jobs-ready': counts[READY],
+                'current-jobs-reserved': counts[RESERVED],
+                'current-jobs-delayed': counts[DELAYED],
+                'current-jobs-buried': counts[BURIED],
+                'total-jobs': tube.totalJobs,
+                'current-using': tube.using,
+                'current-watching': tube.watching,
+                'current-waiting': tube.waiting,
+                'cmd-delete': tube.cmdDelete,
+                'cmd-pause-tube': tube.cmdPauseTube,
+                'pause': int(tube.pauseDelay),
+                'pause-time-left': max(int(tube.pausedUntil - now), 0),
+            }
+
+    def stats(self):
+        em = self.emulator
+        with em.cond:
+            em.count("stats")
+            em.tick(time.time())
+            counts = em.job_counts(em.jobs.values())
+            stats = {
+                'current-jobs-urgent': counts['urgent'],
+                'current-jobs-ready': counts[READY],
+                'current-jobs-reserved': counts[RESERVED],
+                'current-jobs-delayed': counts[DELAYED],
+                'current-jobs-buried': counts[BURIED],
+            }
+            for cmd in [
+                "put", "peek", "peek-ready", "peek-delayed", "peek-buried",
+                "reserve", "reserve-with-timeout", "delete", "release",
+                "use", "watch", "ignore", "bury", "kick", "kick-job",
+                "touch", "stats", "stats-job", "stats-tube", "list-tubes",
+                "pause-tube"
+            ]:
+                stats['cmd-' + cmd] = em.cmdCounts.get(cmd, 0)
+
+            stats.update({
+                'job-timeouts': em.jobTimeouts,
+                'total-jobs': em.nextJid - 1,
+                'max-job-size': em.maxJobSize,
+                'current-tubes': len([
+                    name for name in em.tubes if em.tube_exists(name)
+                ]),
+                'current-connections': em.connections,
+                'total-connections': em.totalConnections,
+                'pid': os.getpid(),
+                'version': "emulator",
+                'uptime': int(time.time() - em.startedAt),
+            })
+            return stats
+
+
+##################################################################
+# beanstalkd protocol server
+
+def format_yaml(value):
+    if isinstance(value, dict):
+        lines = ["{0}: {1}".format(k, v) for k, v in value.items()]
+    else:
+        lines = ["- {0}".format(v) for v in value]
+
+    return ("---\n" + "".join(line + "\n" for line in lines)).encode()
+
+
+class EmulatorHandler(socketserver.StreamRequestHandler):
+    """
+    Serves one connection. Each command maps to an EmulatorClient method
+    """
+    emulatorServer = None
+
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.emulatorServer.handlers.add(self)
+        self.client = self.emulatorServer.emulator.client()
+
+    def finish(self):
+        self.emulatorServer.handlers.discard(self)
+        self.client.close()
+        try:
+            super().finish()
+        except OSError:
+            pass
+
+    def drop(self):
+        try:
+            self.request.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def peer_alive(self):
+        # a closed peer makes the socket readable with no data
+        try:
+            readable, _, _ = select.select([self.request], [], [], 0)
+            if readable:
+                return self.request.recv(1, socket.MSG_PEEK) != b""
+        except OSError:
+            return False
+
+        return True
+
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.wfile.write(data + b"\r\n")
+
+    def send_job(self, status, job):
+        if job is None:
+            return self.send("NOT_FOUND")
+
+        jid, body = job
+        self.send(b"%s %d %d\r\n%s" % (status.encode(), jid, len(body), body))
+
+    def send_yaml(self, value):
+        body = format_yaml(value)
+        self.send(b"OK %d\r\n%s" % (len(body), body))
+
+    def handle(self):
+        while True:
+            try:
+                line = self.rfile.readline()
+            except OSError:
+                return
+
+            if not line:
+                return
+
+            parts = line.decode("utf-8", "replace").split()
+            if not parts:
+                self.send("BAD_FORMAT")
+                continue
+
+            if parts[0] == "quit":
+                return
+
+            try:
+                self.dispatch(parts[0], parts[1:])
+            except CommandFailed as e:
+                self.send(" ".join([e.args[1]] + list(e.args[2])))
+            except DeadlineSoon:
+                self.send("DEADLINE_SOON")
+            except (IndexError, TypeError, ValueError):
+                self.send("BAD_FORMAT")
+            except OSError:
+                return
+
+    def dispatch(self, cmd, args):
+        client = self.client
+        ints = [int(arg) for arg in args if arg.isdigit()]
+
+        if cmd == "put":
+            pri, delay, ttr, size = ints
+            body = self.rfile.read(size + 2)[:-2]
+            jid = client.put(body, pri, delay, ttr)
+            self.send("INSERTED %d" % jid)
+
+        elif cmd in ["reserve", "reserve-with-timeout"]:
+            timeout = ints[0] if cmd == "reserve-with-timeout" else None
+            job = client.reserve(timeout, alive=self.peer_alive)
+            if job is None:
+                self.send("TIMED_OUT")
+            else:
+                self.send_job("RESERVED", job)
+
+        elif cmd == "use":
+            self.send("USING %s" % client.use(args[0]))
+
+        elif cmd == "watch":
+            self.send("WATCHING %d" % client.watch(args[0]))
+
+        elif cmd == "ignore":
+            self.send("WATCHING %d" % client.ignore(args[0]))
+
+        elif cmd == "delete":
+            client.delete(ints[0])
+            self.send("DELETED")
+
+        elif cmd == "release":
+            client.release(*ints)
+            self.send("RELEASED")
+
+        elif cmd == "bury":
+            client.bury(*ints)
+            self.send("BURIED")
+
+        elif cmd == "touch":
+            client.touch(ints[0])
+            self.send("TOUCHED")
+
+        elif cmd == "kick":
+            self.send("KICKED %d" % client.kick(ints[0]))
+
+        elif cmd == "kick-job":
+            client.kick_job(ints[0])
+            self.send("KICKED")
+
+        elif cmd == "peek":
+            self.send_job("FOUND", client.peek(ints[0]))
+
+        elif cmd in ["peek-ready", "peek-delayed", "peek-buried"]:
+            method = getattr(client, cmd.replace("-", "_"))
+            self.send_job("FOUND", method())
+
+        elif cmd == "list-tubes":
+            self.send_yaml(client.tubes())
+
+        elif cmd == "list-tube-used":
+            self.send("USING %s" % client.using())
+
+        elif cmd == "list-tubes-watched":
+            self.send_yaml(client.watching())
+
+        elif cmd == "stats":
+            self.send_yaml(client.stats())
+
+        elif cmd == "stats-tube":
+            self.send_yaml(client.stats_tube(args[0]))
+
+        elif cmd == "stats-job":
+            self.send_yaml(client.stats_job(ints[0]))
+
+        elif cmd == "pause-tube":
+            client.pause_tube(args[0], ints[0])
+            self.send("PAUSED")
+
+        else:
+            self.send("UNKNOWN_COMMAND")
+
+
+class ThreadingServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class EmulatorServer(object):
+    """
+    Serves a BeanstalkEmulator over the beanstalkd protocol, in a
+    background thread
+
+    Args:
+        emulator: emulator to serve. A new one is created if None
+
+        host, port: address to listen on. Port 0 picks a free port
+    """
+    def __init__(self, emulator=None, host="127.0.0.1", port=0):
+        self.emulator = emulator or BeanstalkEmulator()
+        self.handlers = set()
+
+        handler = type(
+            "Handler", (EmulatorHandler,), dict(emulatorServer=self)
+        )
+        self.server = ThreadingServer((host, port), handler)
+        self.host, self.port = self.server.server_address[:2]
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        )
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.drop_connections()
+
+    def drop_connections(self):
+        """Closes every client connection, as if beanstalkd restarted."""
+        for handler in list(self.handlers):
+            handler.drop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="beanstalkd emulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11300)
+    parser.add_argument("--max-job-size", type=int, default=MAX_JOB_SIZE)
+    args = parser.parse_args()
+
+    server = EmulatorServer(
+        BeanstalkEmulator(args.max_job_size), args.host, args.port
+    )
+    log.info(f"beanstalkd emulator listening on {server.host}:{server.port}")
+    server.server.serve_forever()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -1,49 +1,138 @@
 import json
-import queue
+
+from .beanstalk_client import DEFAULT_PRIORITY, DEFAULT_TUBE
+from .emulator import BeanstalkEmulator
 
 
 class MockQueueJob(object):
-    def __init__(self, queue, jid, body):
-        self.queue = queue    # this is a queue.Queue object
+    def __init__(self, client, jid, body):
+        self.client = client    # this is an emulator.EmulatorClient
         self.jid = jid
-        self.body = json.dumps(body)
-        self.reserves = 0
-        self.timeouts = 0
+        self.body = body
 
     def delete(self):
-        # assume job is reserved, so job has already been removed
-        # from the queue
-        return
+        self.client.delete(self.jid)
+
+    def release(self, priority=None, delay=0):
+        self.client.release(self.jid, self._priority(priority), delay)
+
+    def bury(self, priority=None):
+        self.client.bury(self.jid, self._priority(priority))
 
-    def release(self, **kwargs):
-        # assume job is reserved, so releasing it back to the queue
-        # means it needs to be re-enqueued
-        self.queue.put(json.loads(self.body))
+    def _priority(self, priority):
+        # the job's current priority if none is given. 0 is the most
+        # urgent priority, not a missing one
+        return self.stats()['pri'] if priority is None else priority
+
+    def kick(self):
+        self.client.kick_job(self.jid)
+
+    def touch(self):
+        self.client.touch(self.jid)
 
     def stats(self):
-        return dict(reserves=self.reserves, timeouts=self.timeouts)
+        return self.client.stats_job(self.jid)
 
 
 class MockQueue(object):
-    def __init__(self):
-        self.queue = queue.Queue()
-        self.currentjid = 0
+    """
+    Queue backed by an in-process beanstalkd emulator, with beanstalkd's
+    priorities, delays, ttr, timeouts, bury & kick.
+
+    Args:
+        emulator: emulator.BeanstalkEmulator to share with other
+                  MockQueues. Each MockQueue gets its own if None
+
+        queueName: tube to use & watch. Uses the "default" tube if None
+    """
+    def __init__(self, emulator=None, queueName=None):
+        self.emulator = emulator or BeanstalkEmulator()
+        self.queueName = queueName or DEFAULT_TUBE
+        self.bean = self.emulator.client()
+        self.attach()
 
     def put(self, data, **kwargs):
-        self.currentjid += 1
-        job = MockQueueJob(self.queue, self.currentjid, data)
-        self.queue.put(job)
-        return True
+        return self.bean.put(json.dumps(data), **kwargs)
+
+    def put_many(self, datas, **kwargs):
+        return [self.put(data, **kwargs) for data in datas]
+
+    def put_to(self, tube, data, **kwargs):
+        current = self.bean.currentTube
+        self.bean.use(tube)
+        try:
+            return self.put(data, **kwargs)
+        finally:
+            self.bean.use(current)
+
+    def peek_from(self, tube):
+        current = self.bean.currentTube
+        self.bean.use(tube)
+        try:
+            return self.job(self.bean.peek_ready())
+        finally:
+            self.bean.use(current)
+
+    def job(self, found):
+        return MockQueueJob(self.bean, *found) if found else None
 
-    def reserve(self, **kwargs):
+    def reserve(self, timeout=0):
         """
-        blocking not supported for mock queue
+        Unlike BeanstalkdQueue, doesn't block by default: returns None if
+        no job is ready. Pass a timeout in seconds to wait for one, or
+        None to wait forever.
         """
+        return self.job(self.bean.reserve(timeout))
+
+    def reserve_from(self, tube, timeout=0):
+        watched = set(self.bean.watchedTubes)
+        self.bean.watch(tube)
+        for name in watched - {tube}:
+            self.bean.ignore(name)
         try:
-            job = self.queue.get(False)
-            job.reserves += 1
+            return self.reserve(timeout)
+        finally:
+            for name in watched:
+                self.bean.watch(name)
+            if tube not in watched:
+                self.bean.ignore(tube)
+
+    def attach(self):
+        self.bean.use(self.queueName)
+        self.bean.watch(self.queueName)
+        if self.queueName != DEFAULT_TUBE:
+            self.bean.ignore(DEFAULT_TUBE)
+
+    def detach(self):
+        self.bean.use(DEFAULT_TUBE)
+        self.bean.watch(DEFAULT_TUBE)
+        if self.queueName != DEFAULT_TUBE:
+            self.bean.ignore(self.queueName)
+
+    def delete(self, jid):
+        self.bean.delete(jid)
+
+    def release(self, jid, priority=DEFAULT_PRIORITY, delay=0):
+        self.bean.release(jid, priority, delay)
+
+    def kick_job(self, jid):
+        self.bean.kick_job(jid)
+
+    def list_all_queues(self):
+        return self.bean.tubes()
+
+    def close(self):
+        self.bean.close()
+
+    def do_bean(self, method, *args, **kwargs):
+        # BeanstalkdQueue compatibility: calls an emulator client method.
+        # Jobs are returned as MockQueueJobs
+        if callable(method):
+            return method(*args, **kwargs)
 
-        except queue.Empty:
-            job = None
+        result = getattr(self.bean, method)(*args, **kwargs)
+        if method in ["reserve", "peek", "peek_ready", "peek_delayed",
+                      "peek_buried"]:
+            return self.job(result)
 
-        return job
+        return result
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+beanstalkd queues that share one connection per process
+"""
+import collections
+import json
+import os
+import threading
+
+from .beanstalk_client import DEFAULT_TUBE, Connection
+from .beanstalk_queue import PIPELINE_CHUNK_SIZE, BeanstalkdQueue
+
+import logging
+log = logging.getLogger(__name__)
+
+# (pid, host, port) -> SharedConnection. Keyed by pid so a forked worker
+# process doesn't use its parent's socket
+_CONNECTIONS = {}
+_CONNECTIONS_LOCK = threading.Lock()
+
+
+def get_shared_connection(host, port):
+    """
+    Returns this process's shared connection to a beanstalkd server,
+    connecting if there isn't one yet
+    """
+    key = (os.getpid(), host, port)
+    with _CONNECTIONS_LOCK:
+        if key not in _CONNECTIONS:
+            _CONNECTIONS[key] = SharedConnection(host, port)
+
+        return _CONNECTIONS[key]
+
+
+class SharedConnection(object):
+    """
+    One beanstalkd connection multiplexing the tubes of several
+    SharedBeanstalkdQueues.
+
+    The connection keeps watching every attached tube, so the tubes'
+    watcher counts (which the WorkerManager uses to find live workers) are
+    the same as with a connection per queue. The used tube is switched
+    only when a queue puts to a different tube than the last put.
+
+    Args:
+        host, port: beanstalkd address
+    """
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.lock = threading.RLock()
+        self.tubes = collections.Counter()     # tube -> attached queues
+        self.connect()
+
+    def connect(self):
+        # (re)connects and watches the attached tubes
+        self.bean = Connection(host=self.host, port=self.port)
+        if self.tubes:
+            pipeline = self.bean.pipeline()
+            for tube in sorted(self.tubes):
+                pipeline.watch(tube)
+            if DEFAULT_TUBE not in self.tubes:
+                pipeline.ignore(DEFAULT_TUBE)
+            pipeline.execute()
+
+    def attach(self, tube):
+        self.tubes[tube] += 1
+        self.bean.watch(tube)
+        if DEFAULT_TUBE not in self.tubes:
+            self.bean.ignore(DEFAULT_TUBE)
+
+    def detach(self, tube):
+        self.tubes[tube] -= 1
+        if self.tubes[tube] > 0:
+            return
+
+        del self.tubes[tube]
+        # beanstalkd won't ignore the last watched tube
+        if not self.tubes:
+            self.bean.watch(DEFAULT_TUBE)
+        self.bean.ignore(tube)
+
+
+class SharedBeanstalkdQueue(BeanstalkdQueue):
+    """
+    BeanstalkdQueue on its process's shared connection to beanstalkd (see
+    SharedConnection), so a Server's job queue and management channels
+    take one connection instead of three.
+
+    Each queue puts to and reserves from its own tube, as a BeanstalkdQueue
+    does. Queue operations are serialized on the connection, so a blocking
+    reserve holds it until it returns.
+
+    Example::
+
+        def make_queue(queueName):
+            return SharedBeanstalkdQueue("beanstalkd", 11300, queueName)
+    """
+    def __init__(self, host, port, queueName):
+        self.attached = False
+        super().__init__(host, port, queueName)
+
+    @property
+    def bean(self):
+        return self.shared.bean
+
+    def make_connection(self):
+        # the first call gets the process's connection, later calls (after
+        # a socket error) reconnect it
+        shared = getattr(self, "shared", None)
+        if shared is None:
+            self.shared = get_shared_connection(self.host, self.port)
+        else:
+            shared.connect()
+
+    def put(self, data, **kwargs):
+        body = json.dumps(data)
+
+        def put_in_tube():
+            # switches tubes in the same round trip as the put
+            if self.bean.currentTube == self.queueName:
+                return self.bean.put(body, **kwargs)
+
+            results = self.bean.pipeline().use(self.queueName).put(
+                body, **kwargs
+            ).execute()
+            return results[1]
+
+        return self.do_bean(put_in_tube)
+
+    def put_many(self, datas, **kwargs):
+        bodies = [json.dumps(data) for data in datas]
+
+        def put_chunk(chunk):
+            self.bean.use(self.queueName)
+            return self.bean.put_many(chunk, **kwargs)
+
+        jids = []
+        for i in range(0, len(bodies), PIPELINE_CHUNK_SIZE):
+            chunk = bodies[i:i + PIPELINE_CHUNK_SIZE]
+            jids += self.do_bean(put_chunk, chunk)
+
+        return jids
+
+    def reserve(self, **kwargs):
+        # the connection watches the tubes of all its queues, so reserve
+        # from this queue's tube only
+        with self.shared.lock:
+            if self.bean.watchedTubes == {self.queueName}:
+                return self.do_bean("reserve", **kwargs)
+
+            return self.reserve_from(self.queueName, **kwargs)
+
+    def attach(self):
+        if not self.attached:
+            self.do_bean(self.shared.attach, self.queueName)
+            self.attached = True
+
+    def detach(self):
+        if self.attached:
+            self.do_bean(self.shared.detach, self.queueName)
+            self.attached = False
+
+    def do_bean(self, method, *args, **kwargs):
+        with self.shared.lock:
+            return super().do_bean(method, *args, **kwargs)
@@ -0,0 +1,544 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Copyright (c) 2021 MotiveMetrics. All rights reserved.
+
+Durable queue in a local SQLite database, for single-host deployments
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from .beanstalk_client import (
+    DEFAULT_PRIORITY, DEFAULT_TTR, DEFAULT_TUBE, CommandFailed
+)
+
+import logging
+log = logging.getLogger(__name__)
+
+SQLITE_TIMEOUT = 30
+MIN_POLL_INTERVAL = 0.005
+MAX_POLL_INTERVAL = 0.1
+
+READY = "ready"
+RESERVED = "reserved"
+BURIED = "buried"
+DELAYED = "delayed"
+
+JOB_COLUMNS = (
+    "id, tube, priority, state, readyAt, ttr, deadline, body, createdAt, "
+    "reserves, timeouts, releases, buries, kicks"
+)
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except PermissionError:
+        # a process of another user
+        return True
+    except OSError:
+        return False
+
+    return True
+
+
+class SqliteQueueJob(object):
+    """
+    A job reserved (or peeked) from a SqliteQueue, with the same interface
+    as a beanstalkd job
+    """
+    def __init__(self, queue, jid, body, priority=DEFAULT_PRIORITY):
+        self.queue = queue
+        self.jid = jid
+        self.body = body
+        self.priority = priority
+
+    def delete(self):
+        self.queue.delete(self.jid)
+
+    def release(self, priority=None, delay=0):
+        self.queue.release(
+            self.jid, self.priority if priority is None else priority, delay
+        )
+
+    def bury(self, priority=None):
+        self.queue.bury(
+            self.jid, self.priority if priority is None else priority
+        )
+
+    def kick(self):
+        self.queue.kick_job(self.jid)
+
+    def touch(self):
+        self.queue.touch(self.jid)
+
+    def stats(self):
+        return self.queue.stats_job(self.jid)
+
+
+class SqliteQueue(object):
+    """
+    Durable queue in a local SQLite database, with the interface and job
+    semantics of BeanstalkdQueue: tubes, priorities, delays, time-to-run,
+    bury & kick.
+
+    Jobs survive restarts, and any number of processes can share the
+    database file: each reserve claims its job in an immediate
+    transaction. A reserved job that isn't deleted, released, buried or
+    touched within its ttr is made ready again, as in beanstalkd. Each
+    reserved job records the process that reserved it, and the jobs of
+    processes that have exited are made ready again without waiting for
+    their ttr, as beanstalkd does when a connection closes. Reserving
+    processes are identified by pid, so the database must not be shared
+    across hosts.
+
+    Blocking reserves poll the database, backing off from
+    MIN_POLL_INTERVAL to MAX_POLL_INTERVAL seconds while the tubes are
+    empty.
+
+    Args:
+        path: database file path
+
+        queueName: tube that is used for puts & watched for reserves
+    """
+    def __init__(self, path, queueName):
+        self.path = path
+        self.queueName = queueName
+        self.clientId = uuid.uuid4().hex
+        self.local = threading.local()
+
+        dirname = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dirname, exist_ok=True)
+
+        conn = self.connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, tube TEXT NOT NULL, "
+            "priority INTEGER NOT NULL, state TEXT NOT NULL, "
+            "readyAt REAL NOT NULL, ttr INTEGER NOT NULL, deadline REAL, "
+            "body TEXT NOT NULL, createdAt REAL NOT NULL, "
+            "reserves INTEGER DEFAULT 0, timeouts INTEGER DEFAULT 0, "
+            "releases INTEGER DEFAULT 0, buries INTEGER DEFAULT 0, "
+            "kicks INTEGER DEFAULT 0, reserver TEXT, reserverPid INTEGER)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_ready "
+            "ON jobs (tube, state, priority, id)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS watchers ("
+            "tube TEXT NOT NULL, clientId TEXT NOT NULL, pid INTEGER, "
+            "PRIMARY KEY (tube, clientId))"
+        )
+
+        self.currentTube = DEFAULT_TUBE
+        self.watchedTubes = {DEFAULT_TUBE}
+        self.attach()
+
+    def connection(self):
+        # connections can't be shared across processes or threads
+        pid = os.getpid()
+        if getattr(self.local, "pid", None) != pid:
+            conn = sqlite3.connect(
+                self.path, timeout=SQLITE_TIMEOUT, isolation_level=None
+            )
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "PRAGMA busy_timeout={0}".format(SQLITE_TIMEOUT * 1000)
+            )
+            self.local.conn = conn
+            self.local.pid = pid
+
+        return self.local.conn
+
+    def transaction(self, func, *args):
+        # runs func(conn, *args) in an immediate transaction
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(conn, *args)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        conn.execute("COMMIT")
+        return result
+
+    # -- tubes --
+
+    def use(self, name):
+        self.currentTube = name
+        return name
+
+    def watch(self, name):
+        self.watchedTubes.add(name)
+        self.connection().execute(
+            "INSERT OR REPLACE INTO watchers VALUES (?, ?, ?)",
+            (name, self.clientId, os.getpid())
+        )
+        return len(self.watchedTubes)
+
+    def ignore(self, name):
+        # like beanstalkd, the last watched tube can't be ignored
+        if name in self.watchedTubes and len(self.watchedTubes) > 1:
+            self.watchedTubes.discard(name)
+            self.connection().execute(
+                "DELETE FROM watchers WHERE tube = ? AND clientId = ?",
+                (name, self.clientId)
+            )
+
+        return len(self.watchedTubes)
+
+    def attach(self):
+        self.use(self.queueName)
+        self.watch(self.queueName)
+        self.ignore(DEFAULT_TUBE)
+
+    def detach(self):
+        self.use(DEFAULT_TUBE)
+        self.watch(DEFAULT_TUBE)
+        self.ignore(self.queueName)
+
+    def close(self):
+        self.connection().execute(
+            "DELETE FROM watchers WHERE clientId = ?", (self.clientId,)
+        )
+
+    def tubes(self):
+        rows = self.connection().execute(
+            "SELECT DISTINCT tube FROM jobs UNION "
+            "SELECT DISTINCT tube FROM watchers"
+        ).fetchall()
+        return sorted({row[0] for row in rows} | {DEFAULT_TUBE})
+
+    def list_all_queues(self):
+        return self.tubes()
+
+    # -- put --
+
+    def _insert(self, conn, tube, body, priority, delay, ttr):
+        now = time.time()
+        cursor = conn.execute(
+            "INSERT INTO jobs (tube, priority, state, readyAt, ttr, body, "
+            "createdAt) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (tube, priority, READY, now + delay, ttr, body, now)
+        )
+        return cursor.lastrowid
+
+    def put(self, data, priority=DEFAULT_PRIORITY, delay=0, ttr=DEFAULT_TTR):
+        return self.put_to(self.currentTube, data, priority, delay, ttr)
+
+    def put_to(self, tube, data, priority=DEFAULT_PRIORITY, delay=0,
+               ttr=DEFAULT_TTR):
+        """
+        Puts data in another tube
+
+        Returns:
+            job id
+        """
+        return self._insert(
+            self.connection(), tube, json.dumps(data), priority, delay, ttr
+        )
+
+    def put_many(self, datas, priority=DEFAULT_PRIORITY, delay=0,
+                 ttr=DEFAULT_TTR):
+        """
+        Puts several jobs in the queue in one transaction.
+
+        Returns:
+            list of job ids
+        """
+        def insert_all(conn):
+            return [
+                self._insert(
+                    conn, self.currentTube, json.dumps(data), priority,
+                    delay, ttr
+                )
+                for data in datas
+            ]
+
+        return self.transaction(insert_all)
+
+    # -- reserve --
+
+    def _claim(self, conn, tubes):
+        # claims the next ready job in tubes. Reserved jobs whose ttr has
+        # run out, or whose reserver has exited, are made ready first
+        now = time.time()
+        marks = ",".join("?" * len(tubes))
+        conn.execute(
+            "UPDATE jobs SET state = ?, timeouts = timeouts + 1, "
+            "deadline = NULL WHERE state = ? AND deadline <= ? "
+            "AND tube IN ({0})".format(marks),
+            [READY, RESERVED, now] + tubes
+        )
+        self._release_orphans(conn, tubes)
+        row = conn.execute(
+            "SELECT id, body, priority, ttr FROM jobs WHERE state = ? "
+            "AND readyAt <= ? AND tube IN ({0}) "
+            "ORDER BY priority, id LIMIT 1".format(marks),
+            [READY, now] + tubes
+        ).fetchone()
+        if row is None:
+            return None
+
+        jid, body, priority, ttr = row
+        conn.execute(
+            "UPDATE jobs SET state = ?, deadline = ?, "
+            "reserves = reserves + 1, reserver = ?, reserverPid = ? "
+            "WHERE id = ?",
+            (RESERVED, now + ttr, self.clientId, os.getpid(), jid)
+        )
+        return SqliteQueueJob(self, jid, body, priority)
+
+    def _release_orphans(self, conn, tubes):
+        # makes the reserved jobs of processes that have exited ready
+        # again
+        marks = ",".join("?" * len(tubes))
+        pids = [
+            row[0] for row in conn.execute(
+                "SELECT DISTINCT reserverPid FROM jobs WHERE state = ? "
+                "AND tube IN ({0})".format(marks),
+                [RESERVED] + tubes
+            ).fetchall()
+        ]
+        dead = [pid for pid in pids if pid is not None and not pid_alive(pid)]
+        if dead:
+            log.info(f"releasing jobs reserved by exited processes {dead}")
+            conn.execute(
+                "UPDATE jobs SET state = ?, deadline = NULL WHERE state = ? "
+                "AND tube IN ({0}) AND reserverPid IN ({1})".format(
+                    marks, ",".join("?" * len(dead))
+                ),
+                [READY, RESERVED] + tubes + dead
+            )
+
+    def reserve(self, timeout=None):
+        """
+        Reserves the next ready job from the watched tubes, waiting up to
+        timeout seconds (forever if None) for one.
+
+        Returns:
+            SqliteQueueJob, or None if the reserve timed out
+        """
+        return self._reserve(sorted(self.watchedTubes), timeout)
+
+    def reserve_from(self, tube, timeout=None):
+        """
+        Reserves a job from another tube only
+        """
+        return self._reserve([tube], timeout)
+
+    def _reserve(self, tubes, timeout):
+        deadline = None if timeout is None else time.time() + timeout
+        interval = MIN_POLL_INTERVAL
+        while True:
+            job = self.transaction(self._claim, tubes)
+            if job or (deadline is not None and time.time() >= deadline):
+                return job
+
+            wait = interval
+            if deadline is not None:
+                wait = min(wait, max(deadline - time.time(), 0))
+            time.sleep(wait)
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+    # -- job operations --
+
+    def _change(self, jid, sql, params, states, name):
+        # applies an update to a job that's in one of states
+        marks = ",".join("?" * len(states))
+        cursor = self.connection().execute(
+            "UPDATE jobs SET {0} WHERE id = ? AND state IN ({1})".format(
+                sql, marks
+            ),
+            list(params) + [jid] + list(states)
+        )
+        if cursor.rowcount == 0:
+            raise CommandFailed(name, "NOT_FOUND", [])
+
+    def delete(self, jid):
+        cursor = self.connection().execute(
+            "DELETE FROM jobs WHERE id = ?", (jid,)
+        )
+        if cursor.rowcount == 0:
+            raise CommandFailed("delete", "NOT_FOUND", [])
+
+    def release(self, jid, priority=DEFAULT_PRIORITY, delay=0):
+        self._change(
+            jid,
+            "state = ?, priority = ?, readyAt = ?, deadline = NULL, "
+            "releases = releases + 1",
+            [READY, priority, time.time() + delay], [RESERVED], "release"
+        )
+
+    def bury(self, jid, priority=DEFAULT_PRIORITY):
+        self._change(
+            jid,
+            "state = ?, priority = ?, deadline = NULL, buries = buries + 1",
+            [BURIED, priority], [RESERVED], "bury"
+        )
+
+    def touch(self, jid):
+        self._change(
+            jid, "deadline = ? + ttr", [time.time()], [RESERVED], "touch"
+        )
+
+    def kick_job(self, jid):
+        # kicks a buried or delayed job
+        self._change(
+            jid, "state = ?, readyAt = ?, kicks = kicks + 1",
+            [READY, time.time()], [BURIED, READY], "kick-job"
+        )
+
+    def kick(self, bound=1):
+        """
+        Kicks up to bound buried jobs in the used tube
+
+        Returns:
+            number of jobs kicked
+        """
+        def kick_buried(conn):
+            return conn.execute(
+                "UPDATE jobs SET state = ?, readyAt = ?, kicks = kicks + 1 "
+                "WHERE id IN (SELECT id FROM jobs WHERE tube = ? AND "
+                "state = ? ORDER BY id LIMIT ?)",
+                (READY, time.time(), self.currentTube, BURIED, bound)
+            ).rowcount
+
+        return self.transaction(kick_buried)
+
+    # -- peek --
+
+    def _peek(self, where, params):
+        row = self.connection().execute(
+            "SELECT id, body, priority FROM jobs WHERE {0} LIMIT 1".format(
+                where
+            ),
+            params
+        ).fetchone()
+        return SqliteQueueJob(self, *row) if row else None
+
+    def peek(self, jid):
+        return self._peek("id = ?", (jid,))
+
+    def peek_ready(self):
+        return self._peek(
+            "tube = ? AND state = ? AND readyAt <= ? ORDER BY priority, id",
+            (self.currentTube, READY, time.time())
+        )
+
+    def peek_from(self, tube):
+        """
+        Peeks at the next ready job of another tube. The job stays in the
+        tube
+        """
+        return self._peek(
+            "tube = ? AND state = ? AND readyAt <= ? ORDER BY priority, id",
+            (tube, READY, time.time())
+        )
+
+    def peek_delayed(self):
+        return self._peek(
+            "tube = ? AND state = ? AND readyAt > ? ORDER BY readyAt, id",
+            (self.currentTube, READY, time.time())
+        )
+
+    def peek_buried(self):
+        return self._peek(
+            "tube = ? AND state = ? ORDER BY id",
+            (self.currentTube, BURIED)
+        )
+
+    # -- stats --
+
+    def stats_job(self, jid):
+        row = self.connection().execute(
+            "SELECT {0} FROM jobs WHERE id = ?".format(JOB_COLUMNS), (jid,)
+        ).fetchone()
+        if row is None:
+            raise CommandFailed("stats-job", "NOT_FOUND", [])
+
+        (jid, tube, priority, state, readyAt, ttr, deadline, _, createdAt,
+         reserves, timeouts, releases, buries, kicks) = row
+        now = time.time()
+        if state == READY and readyAt > now:
+            state = DELAYED
+
+        if state == RESERVED:
+            timeLeft = max(int(deadline - now), 0)
+        elif state == DELAYED:
+            timeLeft = int(readyAt - now)
+        else:
+            timeLeft = 0
+
+        return {
+            'id': jid,
+            'tube': tube,
+            'state': state,
+            'pri': priority,
+            'age': int(now - createdAt),
+            'ttr': ttr,
+            'time-left': timeLeft,
+            'reserves': reserves,
+            'timeouts': timeouts,
+            'releases': releases,
+            'buries': buries,
+            'kicks': kicks,
+        }
+
+    def _count_jobs(self, tube=None):
+        now = time.time()
+        sql = (
+            "SELECT CASE WHEN state = ? AND readyAt > ? THEN ? "
+            "ELSE state END, count(*) FROM jobs"
+        )
+        params = [READY, now, DELAYED]
+        if tube is not None:
+            sql += " WHERE tube = ?"
+            params.append(tube)
+
+        counts = dict(self.connection().execute(
+            sql + " GROUP BY 1", params
+        ).fetchall())
+        return {
+            'current-jobs-ready': counts.get(READY, 0),
+            'current-jobs-reserved': counts.get(RESERVED, 0),
+            'current-jobs-delayed': counts.get(DELAYED, 0),
+            'current-jobs-buried': counts.get(BURIED, 0),
+        }
+
+    def stats_tube(self, name):
+        """
+        Returns a dict of stats about a tube, with beanstalkd's keys.
+        Watchers in processes that have exited aren't counted
+        """
+        if name not in self.tubes():
+            raise CommandFailed("stats-tube", "NOT_FOUND", [])
+
+        pids = [
+            row[0] for row in self.connection().execute(
+                "SELECT pid FROM watchers WHERE tube = ?", (name,)
+            ).fetchall()
+        ]
+        stats = dict(name=name, **self._count_jobs(name))
+        stats['current-watching'] = len([
+            pid for pid in pids if pid_alive(pid)
+        ])
+        return stats
+
+    def stats(self):
+        return self._count_jobs()
+
+    def do_bean(self, method, *args, **kwargs):
+        # BeanstalkdQueue compatibility, for callers that use its
+        # connection methods (e.g. MgmtChannel.get_named_queue_watchers)
+        if callable(method):
+            return method(*args, **kwargs)
+
+        return getattr(self, method)(*args, **kwargs)
@@ -4,7 +4,9 @@
 Copyright (c) 2020 MotiveMetrics. All rights reserved.
 
 """
-from zerog.jobs import BaseJob, make_key
+from marshmallow import ValidationError
+
+from zerog.jobs import BaseJob, enqueue_jobs, make_key
 
 import logging
 log = logging.getLogger(__name__)
@@ -40,6 +42,16 @@ class JobRegistry(object):
                 added[jobClass.__name__] = dict(
                     success=False, error="NotSubclass"
                 )
+            elif jobClass.EPHEMERAL and jobClass.CHECKPOINTS:
+                # an inline job's checkpoints are never saved, so it can't
+                # be preempted and rerun from one
+                log.error(
+                    f"{jobClass.__name__} can't be both EPHEMERAL and "
+                    f"CHECKPOINTS"
+                )
+                added[jobClass.__name__] = dict(
+                    success=False, error="EphemeralCheckpoints"
+                )
             else:
                 self.registry[jobClass.JOB_TYPE] = jobClass
                 added[jobClass.__name__] = dict(
@@ -74,17 +86,93 @@ class JobRegistry(object):
         Returns:
             job object
         """
-        jobType = jobType or data.get('jobType')
-        jobClass = self.registry.get(jobType)
+        jobClass, loaded = self.load_job_data(data, jobType)
 
         if jobClass:
-            loaded = jobClass.SCHEMA().load(data)
             job = jobClass(datastore, queue, keepalive, **loaded)
             return job
 
         else:
             return None
 
+    def make_jobs(self, dataList, datastore, queue, keepalive=None,
+                  jobType=None):
+        """
+        Creates several job instances. Invalid job data doesn't stop the
+        other jobs from being created.
+
+        Args:
+            dataList: list of data used to initialize the jobs' attributes
+
+            datastore, queue, keepalive: see ``make_job``
+
+            jobType: jobClass.JOB_TYPE of all the jobs, or None if each
+                     job's jobType should be gleaned from its data
+
+        Returns:
+            list of (job, error) tuples in the order of dataList. job is
+            None, and error says why, for data that can't make a job
+        """
+        results = []
+        for data in dataList:
+            try:
+                job = self.make_job(data, datastore, queue, keepalive, jobType)
+            except ValidationError as e:
+                results.append((None, e.messages))
+                continue
+
+            if job:
+                results.append((job, None))
+            else:
+                results.append((None, "unknown jobType: {0}".format(
+                    jobType or data.get('jobType')
+                )))
+
+        return results
+
+    def enqueue_jobs(self, dataList, datastore, queue, jobType=None,
+                     **kwargs):
+        """
+        Creates several jobs and enqueues them with batched datastore
+        writes and a pipelined queue put (see zerog.jobs.enqueue_jobs).
+
+        Args:
+            dataList, datastore, queue, jobType: see ``make_jobs``
+
+            kwargs: keyword arguments passed to the queueing client
+
+        Returns:
+            list of (job, error) tuples -- see ``make_jobs``
+        """
+        results = self.make_jobs(
+            dataList, datastore, queue, jobType=jobType
+        )
+        enqueue_jobs([job for job, _ in results if job], **kwargs)
+        return results
+
+    def load_job_data(self, data, jobType=None):
+        """
+        Validates and deserializes job data with the registered job class's
+        schema, without instantiating the job.
+
+        Args:
+            data: serialized job attributes
+
+            jobType: jobClass.JOB_TYPE, or None if the jobType should be
+                     gleaned from the input data
+
+        Returns:
+            (jobClass, loaded) tuple, or (None, None) if the jobType isn't
+            registered
+        """
+        jobType = jobType or data.get('jobType')
+        jobClass = self.registry.get(jobType)
+
+        if jobClass:
+            return jobClass, jobClass.SCHEMA().load(data)
+
+        return None, None
+
     def get_job(self, uuid, datastore, queue, keepalive=None):
         """
         Creates an instance of a job from a job record saved in the
@@ -104,6 +192,23 @@ class JobRegistry(object):
                        that it's still alive
         """
         data, cas = datastore.read_with_cas(make_key(uuid))
+        return self.job_from_record(data, cas, datastore, queue, keepalive)
+
+    def job_from_record(self, data, cas, datastore, queue, keepalive=None):
+        """
+        Creates an instance of a job from a job record that has already
+        been read from the datastore -- e.g. by an async datastore client.
+
+        Args:
+            data: job record data, or None if the record wasn't found
+
+            cas: the record's cas
+
+            datastore, queue, keepalive: see ``get_job``
+
+        Returns:
+            job object, or None if there's no data
+        """
         if data:
             data['cas'] = cas
             return self.make_job(data, datastore, queue, keepalive)
@@ -5,16 +5,34 @@
 ZeroG Server class definition
 """
 
+import asyncio
 import atexit
+import datetime
 import multiprocessing
 import json
 import psutil
 import time
+import tornado.gen
 import tornado.web
 import tornado.ioloop
 
 import zerog
-from zerog.mgmt import MgmtChannel, make_msg, make_worker_id
+from zerog.archive import archive_jobs
+from zerog.cache import (
+    JobCache, DEFAULT_MAX_BYTES, DEFAULT_TTL, copy_loaded
+)
+from zerog.datastores import ExecutorDatastore
+from zerog.deadletters import DeadLetters
+from zerog.jobs import async_enqueue_jobs, make_key
+from zerog.mgmt import MgmtChannel, make_worker_id
+from zerog.mgmt.messages import (
+    BROADCAST_TTR, encode_msg, fast_msg, get_broadcasts, make_msg_from_json,
+    peek_broadcasts, send_msg
+)
+from zerog.mgmt.utils import make_broadcast_tube
+from zerog.mgmt.workertable import HEARTBEAT_INTERVAL
+from zerog.queues.beanstalk_client import BeanstalkError, CommandFailed
+from zerog.signals import Signals
 
 import logging
 log = logging.getLogger(__name__)
@@ -22,6 +40,14 @@ log = logging.getLogger(__name__)
 HANDLERS = []
 POLL_INTERVAL = 2
 POLL_JITTER = 0.1
+ARCHIVE_DELAY = 3600
+ARCHIVE_BATCH_SIZE = 100
+ARCHIVE_INTERVAL = 60
+CONTROL_RESERVE_TIMEOUT = 10
+KILL_JOIN_TIMEOUT = 5
+KILLED_ENTRY_TRIES = 10
+KILLED_ENTRY_DELAY = 0.05
+INFO_INTERVAL = 60
 
 ACTIVE_IDLE = "activeIdle"
 ACTIVE_RUNNING = "activeRunning"
@@ -42,6 +68,16 @@ class Server(tornado.web.Application):
         jobClasses,
         handlers=[],
         thisHost='localhost',
+        makeAsyncDatastore=None,
+        jobCacheBytes=DEFAULT_MAX_BYTES,
+        jobCacheTtl=DEFAULT_TTL,
+        makeArchiver=None,
+        archiveDelay=ARCHIVE_DELAY,
+        makeAsyncQueue=None,
+        heartbeatInterval=HEARTBEAT_INTERVAL,
+        infoInterval=INFO_INTERVAL,
+        broadcastInterval=POLL_INTERVAL,
+        compactMessages=False,
         **kwargs
     ):
         """
@@ -53,7 +89,8 @@ class Server(tornado.web.Application):
         :type makeDatastore: function
 
         :param makeQueue: function to create Queue objects for posting jobs
-            & for inter-server communications
+            & for inter-server communications. Make SharedBeanstalkdQueues
+            to have the server's queues share one beanstalkd connection
         :type makeQueue: function
 
         :param jobClasses: List of job classes (derived from BaseClass) that
@@ -68,6 +105,62 @@ class Server(tornado.web.Application):
             method
         :type handlers: list of tuples
 
+        :param makeAsyncDatastore: function to create an async Datastore
+            object (e.g. AsyncCouchbaseDatastore) that the server & its
+            handlers use on the IOLoop. If not specified, operations on the
+            Datastore created by makeDatastore are run in a thread pool.
+        :type makeAsyncDatastore: function
+
+        :param jobCacheBytes: approximate size budget, in bytes, of the
+            cache of job records used by ``get_job``. 0 disables the cache
+        :type jobCacheBytes: int
+
+        :param jobCacheTtl: maximum age, in seconds, of a cached record of a
+            job that hasn't completed
+        :type jobCacheTtl: int
+
+        :param makeArchiver: function to create a JobArchiver. If specified,
+            completed jobs are moved from the datastore to the archive
+            ``archiveDelay`` seconds after they finish, and ``get_job``
+            reads jobs missing from the datastore from the archive. The
+            jobs to archive are found with the datastore's ``jobIndex``,
+            which archiving requires
+        :type makeArchiver: function
+
+        :param archiveDelay: seconds to keep a completed job in the
+            datastore before archiving it
+        :type archiveDelay: int
+
+        :param makeAsyncQueue: function to create async Queue objects (e.g.
+            AsyncBeanstalkdQueue) for the management channels. If
+            specified, the server consumes its control channel with an
+            async reserve loop instead of polling it, and sends updates
+            without blocking the IOLoop
+        :type makeAsyncQueue: function
+
+        :param heartbeatInterval: seconds between the heartbeats the server
+            sends on the updates channel, which WorkerManagers use to find
+            live workers. 0 disables heartbeats
+        :type heartbeatInterval: int
+
+        :param infoInterval: seconds between the info messages, with memory
+            stats, that the server sends on the updates channel. Info
+            messages are also sent whenever the server's state changes, so
+            WorkerManagers don't have to request them. 0 disables the
+            periodic messages
+        :type infoInterval: int
+
+        :param broadcastInterval: seconds between polls of the broadcast
+            tubes for control messages sent to every server on this host
+            or of this service, e.g. drain_host. 0 disables them
+        :type broadcastInterval: int
+
+        :param compactMessages: send management messages in the compact
+            encoding, which is much cheaper for WorkerManagers to decode.
+            Only enable it once all the managers reading the updates
+            channel can read it
+        :type compactMessages: bool
+
         :param `**kwargs`: passed to parent ``__init__`` method
         """
         self.pid = psutil.Process().pid
@@ -78,28 +171,94 @@ class Server(tornado.web.Application):
         log.info(f"workerId: {self.workerId} | initializing")
 
         self.datastore = makeDatastore()
+        if makeAsyncDatastore:
+            self.asyncDatastore = makeAsyncDatastore()
+        else:
+            self.asyncDatastore = ExecutorDatastore(self.datastore)
         self.jobQueue = makeQueue("{0}_jobs".format(self.name))
+        self.deadLetters = DeadLetters(self.datastore, self.jobQueue)
+        self.jobCache = JobCache(jobCacheBytes, jobCacheTtl)
+
+        self.archiver = makeArchiver() if makeArchiver else None
+        if self.archiver and getattr(self.datastore, 'jobIndex', None) is None:
+            raise ValueError("archiving requires a datastore with a jobIndex")
+        self.archiveDelay = archiveDelay
+        self.archivedAt = 0
+        self.archiving = None
 
         # ugly hack to add extra zerog management channels on the same
         # queue server
+        self.compactMessages = compactMessages
         self.updatesChannel = MgmtChannel(
             makeQueue(
                 zerog.UPDATES_CHANNEL_NAME + kwargs.get("updatesPostfix", "")
-            )
+            ),
+            compact=compactMessages
         )
         self.ctrlChannel = MgmtChannel(makeQueue(self.workerId))
 
+        # control messages broadcast to the servers on this host & of this
+        # service. Only messages sent after the server starts are acted on
+        self.broadcastSeqs = {}
+        for tube in [
+            make_broadcast_tube("host", thisHost),
+            make_broadcast_tube("service", name)
+        ]:
+            entries = peek_broadcasts(
+                self.ctrlChannel.queue, tube, wait=BROADCAST_TTR
+            )
+            self.broadcastSeqs[tube] = entries[-1][0] if entries else 0
+
+        if makeAsyncQueue:
+            self.asyncUpdatesQueue = makeAsyncQueue(
+                zerog.UPDATES_CHANNEL_NAME + kwargs.get("updatesPostfix", "")
+            )
+            self.asyncCtrlQueue = makeAsyncQueue(self.workerId)
+            tornado.ioloop.IOLoop.current().spawn_callback(self.control_loop)
+        else:
+            self.asyncUpdatesQueue = None
+            self.asyncCtrlQueue = None
+
         self.registry = zerog.JobRegistry()
         self.registry.add_classes(jobClasses)
 
         self.state = ACTIVE_IDLE
         self.retiring = False
+        self.preempting = False
         self.workerStatus = ""
         self.runningJobUuid = ""
+        self.runningJobType = ""
+        self.runningJobStart = None
+        self.runningQueueJobId = None
 
         self.make_worker(makeDatastore, makeQueue)
         atexit.register(self.exit_handler)
 
+        self.mem = {}
+        self.publishedInfo = None
+        self.infoInterval = infoInterval
+        if infoInterval > 0:
+            self.send_info()
+            self.infoCallback = tornado.ioloop.PeriodicCallback(
+                self.send_info, infoInterval * 1000
+            )
+            self.infoCallback.start()
+
+        self.heartbeatInterval = heartbeatInterval
+        if heartbeatInterval > 0:
+            self.send_heartbeat()
+            self.heartbeatCallback = tornado.ioloop.PeriodicCallback(
+                self.send_heartbeat, heartbeatInterval * 1000
+            )
+            self.heartbeatCallback.start()
+
+        self.broadcastInterval = broadcastInterval
+        if broadcastInterval > 0:
+            self.broadcastCallback = tornado.ioloop.PeriodicCallback(
+                self.do_broadcast_poll, broadcastInterval * 1000
+            )
+            self.broadcastCallback.start()
+
         handlers += HANDLERS
         super(Server, self).__init__(handlers, **kwargs)
 
@@ -117,14 +276,186 @@ class Server(tornado.web.Application):
             data, self.datastore, self.jobQueue, None, jobType=jobType
         )
 
+    def make_jobs(self, dataList, jobType=None):
+        """
+        Instantiate several jobs from deserialized job attribute data
+
+        :param list dataList: deserialized job attributes data, one per job
+
+        :param str jobType: ``jobType`` of all the jobs, or ``None`` to use
+            the ``jobType`` in each job's data
+
+        :returns: list of (job, error) tuples -- see
+            ``JobRegistry.make_jobs``
+        """
+        return self.registry.make_jobs(
+            dataList, self.datastore, self.jobQueue, None, jobType=jobType
+        )
+
+    def enqueue_jobs(self, jobs, **kwargs):
+        """
+        Saves & enqueues several new jobs with batched datastore writes
+        and a pipelined queue put
+
+        :param list jobs: new jobs, e.g. from ``make_jobs``
+        :params dict kwargs: keyword arguments passed to the queueing client
+        """
+        enqueue_jobs(jobs, **kwargs)
+
+    async def async_enqueue_jobs(self, jobs, **kwargs):
+        """
+        Coroutine version of ``enqueue_jobs`` that uses the async datastore
+
+        :param list jobs: new jobs, e.g. from ``make_jobs``
+        :params dict kwargs: keyword arguments passed to the queueing client
+        """
+        await async_enqueue_jobs(self.asyncDatastore, jobs, **kwargs)
+
     def get_job(self, uuid):
         """
         Retrieve and instantiate a job that has been persisted in the datastore
 
+        Jobs are served from the job cache when possible. Cached records of
+        running jobs are revalidated with a cas lookup, or with a full read
+        if the datastore has no ``read_cas``.
+
         :param str uuid: UUID of the job to be retrieved and instantiated
         """
-        return self.registry.get_job(
-            uuid, self.datastore, self.jobQueue, None
+        key = make_key(uuid)
+        entry = self.jobCache.lookup(uuid)
+        if entry:
+            if entry.complete:
+                return self.job_from_cache(entry)
+
+            if (
+                hasattr(self.datastore, 'read_cas') and
+                self.datastore.read_cas(key) == entry.cas
+            ):
+                return self.job_from_cache(entry, revalidated=True)
+
+        data, cas = self.datastore.read_with_cas(key)
+        if entry and data is not None and cas == entry.cas:
+            return self.job_from_cache(entry, revalidated=True)
+
+        if data is None and self.archiver:
+            data, cas = self.archiver.read(uuid), 0
+
+        return self.job_from_record(uuid, data, cas, stale=bool(entry))
+
+    async def async_get_job(self, uuid):
+        """
+        Coroutine version of ``get_job``. Reads the job with the async
+        datastore so the IOLoop isn't blocked.
+
+        :param str uuid: UUID of the job to be retrieved and instantiated
+        """
+        key = make_key(uuid)
+        entry = self.jobCache.lookup(uuid)
+        if entry:
+            if entry.complete:
+                return self.job_from_cache(entry)
+
+            if (
+                hasattr(self.asyncDatastore, 'read_cas') and
+                await self.asyncDatastore.read_cas(key) == entry.cas
+            ):
+                return self.job_from_cache(entry, revalidated=True)
+
+        data, cas = await self.asyncDatastore.read_with_cas(key)
+        if entry and data is not None and cas == entry.cas:
+            return self.job_from_cache(entry, revalidated=True)
+
+        if data is None and self.archiver:
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(None, self.archiver.read, uuid)
+            cas = 0
+
+        return self.job_from_record(uuid, data, cas, stale=bool(entry))
+
+    def get_jobs(self, uuids):
+        """
+        Retrieve and instantiate several jobs with one bulk datastore read.
+        Completed jobs in the job cache aren't read at all.
+
+        :param list uuids: UUIDs of the jobs to be retrieved
+
+        :returns: dictionary of {uuid: job}. Jobs that don't exist map to
+            ``None``
+        :rtype: dict
+        """
+        jobs, pending = self.get_cached_jobs(uuids)
+        if pending:
+            records = self.datastore.read_multi(
+                [make_key(uuid) for uuid in pending]
+            )
+            jobs.update(self.jobs_from_records(pending, records))
+
+        return jobs
+
+    async def async_get_jobs(self, uuids):
+        """
+        Coroutine version of ``get_jobs``
+
+        :param list uuids: UUIDs of the jobs to be retrieved
+        """
+        jobs, pending = self.get_cached_jobs(uuids)
+        if pending:
+            records = await self.asyncDatastore.read_multi(
+                [make_key(uuid) for uuid in pending]
+            )
+            jobs.update(self.jobs_from_records(pending, records))
+
+        return jobs
+
+    def get_cached_jobs(self, uuids):
+        # returns ({uuid: job} for completed jobs in the cache,
+        # {uuid: cache entry or None} for the jobs that must be read)
+        jobs = dict()
+        pending = dict()
+        for uuid in uuids:
+            entry = self.jobCache.lookup(uuid)
+            if entry and entry.complete:
+                jobs[uuid] = self.job_from_cache(entry)
+            else:
+                pending[uuid] = entry
+
+        return jobs, pending
+
+    def jobs_from_records(self, pending, records):
+        jobs = dict()
+        for uuid, entry in pending.items():
+            data, cas = records.get(make_key(uuid), (None, None))
+            if data is None and self.archiver:
+                data, cas = self.archiver.read(uuid), 0
+
+            if entry and data and cas == entry.cas:
+                jobs[uuid] = self.job_from_cache(entry, revalidated=True)
+            else:
+                jobs[uuid] = self.job_from_record(
+                    uuid, data, cas, stale=bool(entry)
+                )
+
+        return jobs
+
+    def job_from_cache(self, entry, revalidated=False):
+        self.jobCache.hit(entry, revalidated)
+        return self.jobCache.make_job(entry, self.datastore, self.jobQueue)
+
+    def job_from_record(self, uuid, data, cas, stale=False):
+        # instantiates a job from a datastore record & caches the record
+        self.jobCache.miss(stale)
+        if not data:
+            self.jobCache.invalidate(uuid)
+            return None
+
+        data['cas'] = cas
+        jobClass, loaded = self.registry.load_job_data(data)
+        if not jobClass:
+            return None
+
+        self.jobCache.store(uuid, jobClass, loaded, cas, data)
+        return jobClass(
+            self.datastore, self.jobQueue, None, **copy_loaded(loaded)
         )
 
     def exit_handler(self):
@@ -135,6 +466,14 @@ class Server(tornado.web.Application):
         log.info(f"{self.name}:{self.pid} | exiting")
         self.kill_worker()
 
+        if self.heartbeatInterval > 0:
+            # tells WorkerManagers to forget this worker now instead of
+            # waiting for its heartbeats to stop
+            try:
+                self.send_heartbeat(interval=0)
+            except Exception as e:
+                log.error(f"{self.name}:{self.pid} | can't send update: {e}")
+
     def make_worker(self, makeDatastore, makeQueue):
         log.info(f"{self.name}:{self.pid} | creating worker")
         self.parentConn, self.childConn = multiprocessing.Pipe()
@@ -154,6 +493,26 @@ class Server(tornado.web.Application):
         log.info(f"{self.name}:{self.pid}:{self.proc.pid} | started worker")
 
     def kill_worker(self, killJob=False):
+        uuid, queueJobId = self.stop_worker_proc(killJob)
+        if uuid:
+            job = self.get_job(uuid)
+            if job:
+                self.record_killed_job(job, killJob)
+            elif killJob and queueJobId:
+                self.delete_killed_entry(queueJobId)
+
+    async def async_kill_worker(self, killJob=False):
+        """
+        Coroutine version of ``kill_worker`` that records the killed job
+        with the async datastore
+        """
+        uuid, queueJobId = self.stop_worker_proc(killJob)
+        if uuid:
+            await self.async_record_killed_job(uuid, killJob, queueJobId)
+
+    def stop_worker_proc(self, killJob=False):
+        # kills the worker process. Returns the uuid & queue entry id of
+        # the job it was running, if any
         self.do_poll()
 
         log.info(
@@ -161,18 +520,80 @@ class Server(tornado.web.Application):
             f"killing worker | activeJob: {self.runningJobUuid}"
         )
         self.proc.kill()
+        self.proc.join(KILL_JOIN_TIMEOUT)
 
         # runningJobUuid is still set to the last job because we haven't
         # run do_poll() yet
-        if self.runningJobUuid:
-            job = self.get_job(self.runningJobUuid)
-            if killJob:
-                self.runningJobUuid = ""
-                job.record_error(410, msg="Killed by user")
-                job.record_result(410)  # 'Gone' is best fit error code
-                self.jobQueue.delete(job.queueJobId)
-            else:
-                job.record_event("System restart")
+        uuid = self.runningJobUuid
+        queueJobId = self.runningQueueJobId
+        if uuid and killJob:
+            self.runningJobUuid = ""
+            self.runningQueueJobId = None
+
+        return uuid, queueJobId
+
+    def try_delete_entry(self, queueJobId):
+        # deletes a killed job's queue entry. The entry is only released
+        # once beanstalkd sees the killed worker's connection close, so
+        # this can fail for a moment. Returns True if it's gone
+        try:
+            self.jobQueue.delete(queueJobId)
+        except CommandFailed:
+            return False
+
+        return True
+
+    def delete_killed_entry(self, queueJobId):
+        """
+        Deletes the queue entry of a killed job that isn't in the
+        datastore (an inline, ephemeral job), so it isn't run again
+        """
+        for _ in range(KILLED_ENTRY_TRIES):
+            if self.try_delete_entry(queueJobId):
+                return
+            time.sleep(KILLED_ENTRY_DELAY)
+
+        log.warning(
+            f"{self.name}:{self.pid} | can't delete killed job's queue "
+            f"entry {queueJobId}"
+        )
+
+    def record_killed_job(self, job, killJob):
+        self.record_kill(job, killJob)
+        if killJob:
+            self.jobQueue.delete(job.queueJobId)
+
+    def record_kill(self, job, killJob):
+        # records the kill with the job's own methods, so subclass
+        # overrides & signalling apply
+        if killJob:
+            job.record_error(410, msg="Killed by user")
+            job.record_result(410)  # 'Gone' is best fit error code
+        else:
+            job.record_event("System restart")
+
+    async def async_record_killed_job(self, uuid, killJob, queueJobId=None):
+        job = await self.async_get_job(uuid)
+        if not job:
+            if killJob and queueJobId:
+                for _ in range(KILLED_ENTRY_TRIES):
+                    if self.try_delete_entry(queueJobId):
+                        return
+                    await tornado.gen.sleep(KILLED_ENTRY_DELAY)
+
+                log.warning(
+                    f"{self.name}:{self.pid} | can't delete killed job's "
+                    f"queue entry {queueJobId}"
+                )
+            return
+
+        # the job's record methods are synchronous, so they're run in the
+        # executor
+        await tornado.ioloop.IOLoop.current().run_in_executor(
+            None, self.record_kill, job, killJob
+        )
+        if killJob:
+            self.jobQueue.delete(job.queueJobId)
 
     def drain(self):
         if self.state == ACTIVE_IDLE:
@@ -227,18 +648,86 @@ class Server(tornado.web.Application):
         if msgType == 'runningJobUuid':
             newRunningJobUuid = msg['value']
             if newRunningJobUuid:
-                kwargs = dict(action="start", uuid=newRunningJobUuid)
+                self.runningJobType = msg.get('jobType', "")
+                self.runningJobStart = time.time()
+                self.runningQueueJobId = msg.get('queueJobId')
+                kwargs = dict(
+                    action="start",
+                    uuid=newRunningJobUuid,
+                    jobType=self.runningJobType,
+                    queueWait=msg.get('queueWait')
+                )
                 if self.state in [ACTIVE_IDLE, ACTIVE_RUNNING]:
                     self.state = ACTIVE_RUNNING
                 else:
                     self.state = DRAINING_RUNNING
             else:
-                kwargs = dict(action="end", uuid=self.runningJobUuid)
+                duration = None
+                if self.runningJobStart:
+                    duration = time.time() - self.runningJobStart
+                kwargs = dict(
+                    action="end",
+                    uuid=self.runningJobUuid,
+                    jobType=self.runningJobType,
+                    duration=duration
+                )
+                self.runningJobType = ""
+                self.runningJobStart = None
+                self.runningQueueJobId = None
 
             self.runningJobUuid = newRunningJobUuid
             kwargs['workerId'] = self.workerId
-            msg = make_msg("job", **kwargs)
-            self.updatesChannel.send_msg(msg)
+            msg = fast_msg("job", **kwargs)
+            self.send_update(msg)
+            self.publish_state()
+
+    def send_update(self, msg):
+        """
+        Sends a message on the updates channel. With an async updates
+        queue on a running IOLoop, the message is sent without blocking
+        the loop
+        """
+        if self.asyncUpdatesQueue:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+            else:
+                tornado.ioloop.IOLoop.current().spawn_callback(
+                    self.async_send_update, msg
+                )
+                return
+
+        self.updatesChannel.send_msg(msg)
+
+    def send_heartbeat(self, interval=None):
+        """
+        Sends a heartbeat with the server's state on the updates channel
+
+        :param int interval: seconds until the next heartbeat. Defaults to
+            the server's ``heartbeatInterval``; 0 says the server is going
+            away
+        """
+        if interval is None:
+            interval = self.heartbeatInterval
+
+        msg = fast_msg(
+            "heartbeat",
+            workerId=self.workerId,
+            state=self.state,
+            retiring=self.retiring,
+            uuid=self.runningJobUuid,
+            interval=interval
+        )
+        self.send_update(msg)
+
+    async def async_send_update(self, msg):
+        try:
+            await self.asyncUpdatesQueue.put(
+                encode_msg(msg, self.compactMessages)
+            )
+        except BeanstalkError as e:
+            log.error(f"{self.name}:{self.pid} | can't send update: {e}")
 
     def poll(self):
         self.do_poll()
@@ -248,7 +737,87 @@ class Server(tornado.web.Application):
 
     def do_poll(self):
         self.do_worker_poll()
-        self.do_control_queue_poll()
+        if not self.asyncCtrlQueue:
+            self.do_control_queue_poll()
+        self.do_archive_poll()
+        self.publish_state()
+
+    def do_archive_poll(self, now=None):
+        # archives jobs that finished more than archiveDelay seconds ago,
+        # in a thread so the IOLoop isn't blocked. Polls the job index
+        # every ARCHIVE_INTERVAL seconds, or right away while there are
+        # full batches of due jobs. Only runs on the IOLoop, e.g. not
+        # when do_poll is called on exit
+        now = now or time.time()
+        if (
+            not self.archiver or self.archiving or
+            now < self.archivedAt + ARCHIVE_INTERVAL
+        ):
+            return
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+
+        self.archivedAt = now
+        self.archiving = tornado.ioloop.IOLoop.current().run_in_executor(
+            None, self.archive_due, now
+        )
+        self.archiving.add_done_callback(self.archive_done)
+
+    def archive_done(self, future):
+        self.archiving = None
+        if future.exception():
+            log.error(
+                f"{self.name}:{self.pid} | archiving failed\n"
+                f"{future.exception()}"
+            )
+        elif future.result() >= ARCHIVE_BATCH_SIZE:
+            self.archivedAt = 0
+
+    def due_for_archive(self, now=None):
+        """
+        Returns the UUIDs of up to ARCHIVE_BATCH_SIZE jobs that completed
+        more than ``archiveDelay`` seconds ago, from the job index
+        """
+        now = now or time.time()
+        before = datetime.datetime.utcfromtimestamp(now - self.archiveDelay)
+        return self.datastore.jobIndex.completed(
+            before, limit=ARCHIVE_BATCH_SIZE
+        )
+
+    def archive_due(self, now=None):
+        # archives a batch of due jobs. Returns the size of the batch
+        uuids = self.due_for_archive(now)
+        if uuids:
+            self.archive_jobs(uuids)
+
+        return len(uuids)
+
+    def archive_jobs(self, uuids):
+        """
+        Moves completed jobs from the datastore to the archive
+
+        :param list uuids: UUIDs of the jobs to archive. Jobs that haven't
+            completed are skipped
+
+        :returns: UUIDs of the archived jobs
+        :rtype: list
+        """
+        return archive_jobs(self.datastore, self.archiver, uuids)
+
+    def signal(self, name):
+        """
+        Sends a signal, waking up the jobs that are waiting for it (see
+        ``BaseJob.wait_for_signal``)
+
+        :param str name: name of the signal
+
+        :returns: UUIDs of the jobs that were woken up
+        :rtype: list
+        """
+        return Signals(self.datastore, self.jobQueue).signal(name)
 
     def do_worker_poll(self):
         while self.parentConn.poll() is True:
@@ -278,6 +847,7 @@ class Server(tornado.web.Application):
                         f"killed. exitcode: {exitcode}"
                     )
                 self.runningJobUuid = ""
+                self.runningQueueJobId = None
                 restart = True
 
             elif workerStatus == "NoSuchProcess":
@@ -304,6 +874,10 @@ class Server(tornado.web.Application):
                 else:
                     self.state = DRAINING_DOWN
 
+                # the state may look the same, but managers should know
+                # about the restart
+                self.send_info()
+
             self.workerStatus = workerStatus
 
     def do_control_queue_poll(self):
@@ -312,41 +886,255 @@ class Server(tornado.web.Application):
             if not msg:
                 break
             else:
-                if msg.msgtype == "requestInfo":
-                    try:
-                        p = psutil.Process(self.pid)
-                        used = p.memory_full_info().uss
-                        for kid in p.children(recursive=True):
-                            used += kid.memory_full_info().uss
-                    except psutil.NoSuchProcess:
-                        used = 0
-
-                    mem = dict(
-                        available=psutil.virtual_memory().available,
-                        used=used
-                    )
-                    infomsg = make_msg(
-                        "info",
-                        workerId=self.workerId,
-                        state=self.state,
-                        retiring=self.retiring,
-                        uuid=self.runningJobUuid,
-                        mem=mem,
+                self.process_control_message(msg)
+
+    def do_broadcast_poll(self):
+        # peeks at the broadcast tubes' logs. A log that a sender is
+        # replacing is read on the next poll
+        for tube, lastSeq in self.broadcastSeqs.items():
+            try:
+                broadcasts = get_broadcasts(
+                    self.ctrlChannel.queue, tube, lastSeq
+                )
+            except (TypeError, ValueError, KeyError, IndexError):
+                log.warning(f"{self.name}:{self.pid} | bad broadcast log")
+                continue
+
+            for seq, msg in broadcasts:
+                self.broadcastSeqs[tube] = seq
+                self.process_control_message(msg)
+
+    async def control_loop(self):
+        # consumes the control channel with a long-lived async reserve.
+        # The reserve times out periodically so a half-open connection
+        # is noticed
+        while True:
+            try:
+                queueJob = await self.asyncCtrlQueue.reserve(
+                    timeout=CONTROL_RESERVE_TIMEOUT
+                )
+            except BeanstalkError as e:
+                log.error(
+                    f"{self.name}:{self.pid} | control channel error: {e}"
+                )
+                await tornado.gen.sleep(POLL_INTERVAL)
+                continue
+
+            if queueJob is None:
+                continue
+
+            try:
+                msg = make_msg_from_json(queueJob.body)
+            except Exception:
+                # a malformed message mustn't stop the loop
+                log.warning(
+                    f"{self.name}:{self.pid} | "
+                    f"bad control message: {queueJob.body}"
+                )
+            else:
+                # nor may a message that fails to be processed
+                try:
+                    self.process_control_message(msg)
+                except Exception:
+                    log.exception(
+                        f"{self.name}:{self.pid} | can't process "
+                        f"{msg.msgtype} control message"
                     )
-                    self.updatesChannel.send_msg(infomsg)
 
-                elif msg.msgtype == "drain":
-                    self.drain()
+            try:
+                await queueJob.delete()
+            except BeanstalkError as e:
+                log.error(
+                    f"{self.name}:{self.pid} | can't delete control "
+                    f"message: {e}"
+                )
+
+    def measure_mem(self):
+        try:
+            p = psutil.Process(self.pid)
+            used = p.memory_full_info().uss
+            for kid in p.children(recursive=True):
+                used += kid.memory_full_info().uss
+        except psutil.NoSuchProcess:
+            used = 0
 
-                elif msg.msgtype == "undrain":
-                    self.undrain()
+        return dict(
+            available=psutil.virtual_memory().available,
+            used=used
+        )
 
-                elif msg.msgtype == "retire":
-                    self.retiring = True
-                    self.drain()
+    def send_info(self, measure=True):
+        """
+        Sends an info message with the server's state on the updates
+        channel
+
+        :param bool measure: measure the server's memory use. If False,
+            the last measurement is sent
+        """
+        self.send_update(self.info_msg(measure))
+        self.publishedInfo = (self.state, self.retiring, self.runningJobUuid)
 
-                elif msg.msgtype == "killJob":
-                    uuid = self.runningJobUuid
-                    if uuid and uuid == msg.uuid:
-                        self.kill_worker(killJob=True)
-                        self.start_worker()
+    def info_msg(self, measure=True, **kwargs):
+        # info message with the server's state. kwargs are passed through
+        # to the message, e.g. a reply's envelope
+        if measure or not self.mem:
+            self.mem = self.measure_mem()
+
+        return fast_msg(
+            "info",
+            workerId=self.workerId,
+            state=self.state,
+            retiring=self.retiring,
+            uuid=self.runningJobUuid,
+            mem=self.mem,
+            **kwargs
+        )
+
+    def send_reply(self, request):
+        """
+        Replies to a control message that has a replyTo tube with an info
+        message, which carries the request's correlationId
+        """
+        reply = self.info_msg(
+            measure=request.msgtype == "requestInfo",
+            correlationId=request.correlationId,
+            expiresAt=request.expiresAt
+        )
+        try:
+            send_msg(
+                reply,
+                self.ctrlChannel.queue,
+                request.replyTo,
+                compact=self.compactMessages
+            )
+        except BeanstalkError as e:
+            log.error(f"{self.name}:{self.pid} | can't send reply: {e}")
+
+    def publish_state(self):
+        # pushes an info message if the state, retiring flag or running job
+        # has changed since the last one. Memory isn't re-measured, since
+        # this runs on every job start & end
+        info = (self.state, self.retiring, self.runningJobUuid)
+        if info != self.publishedInfo:
+            self.send_info(measure=False)
+
+    def process_control_message(self, msg):
+        if msg.expired():
+            log.info(
+                f"{self.name}:{self.pid} | dropping expired {msg.msgtype} "
+                f"message"
+            )
+            return
+
+        if msg.msgtype == "requestInfo":
+            # a request with a reply tube gets its info as the reply
+            if not msg.replyTo:
+                self.send_info()
+
+        elif msg.msgtype == "drain":
+            self.drain()
+
+        elif msg.msgtype == "undrain":
+            self.undrain()
+
+        elif msg.msgtype == "retire":
+            self.retiring = True
+            self.drain()
+
+        elif msg.msgtype == "killJob":
+            uuid = self.runningJobUuid
+            if uuid and uuid == msg.uuid:
+                self.kill_job()
+
+        elif msg.msgtype == "preempt":
+            if (
+                self.state == DRAINING_RUNNING and not self.preempting and
+                self.job_checkpoints()
+            ):
+                self.preempt_job()
+
+        self.publish_state()
+        if msg.replyTo:
+            self.send_reply(msg)
+
+    def job_checkpoints(self):
+        # True if the running job's class checkpoints its progress. An
+        # ephemeral job may be running inline, with nothing saved to rerun
+        # it from, so it's never preempted
+        jobClass = self.registry.registry.get(self.runningJobType)
+        return bool(
+            jobClass and jobClass.CHECKPOINTS and not jobClass.EPHEMERAL
+        )
+
+    def preempt_job(self):
+        # stop the worker & its running job without recording an error,
+        # and leave the server drained. The job's queue entry is released
+        # so the job is rerun from its last checkpoint by another worker.
+        #
+        # The job is marked as no longer running before the worker is
+        # stopped, so the worker that reserves it doesn't take it for a
+        # crashed job
+        self.preempting = True
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self.record_preempted_job(self.runningJobUuid)
+            self.stop_preempted_worker()
+        else:
+            tornado.ioloop.IOLoop.current().spawn_callback(
+                self.async_preempt_job
+            )
+
+    async def async_preempt_job(self):
+        # records the preempted job in the executor, as the job's own
+        # update_attrs & record_event are synchronous
+        await tornado.ioloop.IOLoop.current().run_in_executor(
+            None, self.record_preempted_job, self.runningJobUuid
+        )
+        self.stop_preempted_worker()
+
+    def record_preempted_job(self, uuid):
+        job = self.get_job(uuid) if uuid else None
+        if job:
+            job.update_attrs(running=False)
+            job.record_event("Preempted by drain - requeued")
+
+    def stop_preempted_worker(self):
+        _, queueJobId = self.stop_worker_proc()
+        self.runningJobUuid = ""
+        self.runningJobType = ""
+        self.runningJobStart = None
+        self.runningQueueJobId = None
+        self.state = DRAINING_DOWN
+        self.preempting = False
+        if queueJobId:
+            self.release_preempted_entry(queueJobId)
+
+    def release_preempted_entry(self, queueJobId):
+        # beanstalkd releases the entry itself once it sees the worker's
+        # connection close, and won't let another connection release it.
+        # Queues that don't track connections (e.g. SqliteQueue) would
+        # hold it until its time-to-run is up
+        try:
+            self.jobQueue.release(queueJobId)
+        except CommandFailed:
+            pass
+
+    def kill_job(self):
+        # kill the worker & its running job, then start a new worker.
+        #
+        # On the IOLoop the killed job is recorded asynchronously. When
+        # polled directly (e.g. in tests) there's no loop to block, so
+        # it's recorded synchronously
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self.kill_worker(killJob=True)
+            self.start_worker()
+        else:
+            uuid, queueJobId = self.stop_worker_proc(killJob=True)
+            self.start_worker()
+            if uuid:
+                tornado.ioloop.IOLoop.current().spawn_callback(
+                    self.async_record_killed_job, uuid, True, queueJobId
+                )
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2017-2021 MotiveMetrics. All rights reserved.
+"""
+ZeroG Signals class definition
+"""
+from zerog.datastores.documents import update_document
+from zerog.queues.beanstalk_client import CommandFailed
+
+import logging
+log = logging.getLogger(__name__)
+
+SIGNAL_DOCUMENT_TYPE = "zerog_signal"
+DEFAULT_WAIT = 3600
+
+
+class Signals(object):
+    """
+    Named signals that wake up waiting jobs.
+
+    A job that waits on external state can park itself on a signal (see
+    ``BaseJob.wait_for_signal``) instead of being re-run every few seconds
+    to check it. The job is requeued with a long delay and recorded as a
+    waiter of the signal. Sending the signal -- with the SignalHandler
+    endpoint, ``Server.signal``, or the completion of a job that lists it
+    in its ``signalKeys`` -- kicks the waiters out of the delayed (or
+    buried) state, so they run right away.
+
+    Each signal has a datastore document holding the number of times it
+    has been sent and its parked waiters. A job notes the count when it
+    decides to wait, and isn't parked if the signal was sent since then.
+
+    Args:
+        datastore: datastore holding the signal documents. Usually the
+                   datastore that holds the jobs
+
+        queue: job queue holding the parked jobs
+    """
+    def __init__(self, datastore, queue):
+        self.datastore = datastore
+        self.queue = queue
+
+    def key(self, name):
+        return "{0}_{1}".format(SIGNAL_DOCUMENT_TYPE, name)
+
+    def count(self, name):
+        """
+        :returns: number of times the signal has been sent
+        """
+        data, _ = self.datastore.read_with_cas(self.key(name))
+        return (data or {}).get('count', 0)
+
+    def park(self, name, uuid, queueJobId, count):
+        """
+        Records a requeued job as a waiter of a signal. If the signal has
+        been sent since the job read its ``count``, the job is kicked
+        instead.
+
+        :returns: True if the job was parked
+        """
+        def add_waiter(doc):
+            if doc['count'] != count:
+                return False
+
+            doc['waiters'][uuid] = queueJobId
+            return True
+
+        parked = self.update(name, add_waiter)
+        if not parked:
+            self.kick([queueJobId])
+
+        return parked
+
+    def signal(self, name):
+        """
+        Sends a signal, kicking the jobs that are parked on it.
+
+        :returns: uuids of the jobs that were woken up
+        """
+        waiters = dict()
+
+        def take_waiters(doc):
+            waiters.clear()
+            waiters.update(doc['waiters'])
+            doc['count'] += 1
+            doc['waiters'] = {}
+            return True
+
+        if not self.update(name, take_waiters):
+            return []
+
+        self.kick(waiters.values())
+        return sorted(waiters)
+
+    def kick(self, queueJobIds):
+        for queueJobId in queueJobIds:
+            try:
+                self.queue.kick_job(queueJobId)
+            except CommandFailed:
+                # the job's wait timed out, so it's already ready or running
+                pass
+
+    def update(self, name, func):
+        # read-modify-write of a signal document. func modifies the
+        # document and returns False if it shouldn't be written. Returns
+        # True if the document was written
+        def modify(data):
+            doc = data or dict(count=0, waiters={})
+            return doc if func(doc) else None
+
+        return update_document(self.datastore, self.key(name), modify)
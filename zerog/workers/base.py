@@ -6,17 +6,25 @@ Copyright (c) 2020 MotiveMetrics. All rights reserved.
 """
 import psutil
 
+import datetime
 import json
 import os
 import traceback
 
 import zerog.jobs
+from zerog.deadletters import DeadLetters
 
 import logging
 log = logging.getLogger(__name__)
 
 MAX_TIMEOUTS = 2
 MAX_RESERVES = 3
+# a job that isn't found may not be visible yet, e.g. on a datastore
+# replica, so its entry is retried after NOT_FOUND_DELAY seconds before
+# it's buried
+MAX_NOT_FOUND_RESERVES = 2
+NOT_FOUND_DELAY = 5
+LOAD_ERROR_DELAY = 30
 
 POLL_INTERVAL = 2
 
@@ -58,6 +66,41 @@ class BaseWorker(object):
     def get_job(self, uuid):
         return self.registry.get_job(uuid, self.datastore, self.queue, None)
 
+    def queue_wait(self, job):
+        # seconds the job was ready in the queue: since it was last saved,
+        # which is when it was enqueued, less the delay it was enqueued
+        # with. None if it can't be worked out
+        try:
+            wait = datetime.datetime.utcnow() - job.updatedAt
+            delay = float((job.queueKwargs or {}).get('delay') or 0)
+        except (TypeError, ValueError):
+            return None
+
+        return max(wait.total_seconds() - delay, 0)
+
+    def make_inline_job(self, data):
+        # instantiates an ephemeral job from the serialized job in its
+        # queue entry, without reading the datastore
+        job = self.registry.make_job(data, self.datastore, self.queue, None)
+        if job:
+            job.inline = True
+
+        return job
+
+    def recover_inline_job(self, job):
+        # an inline entry is deleted when its run ends, so one that's
+        # reserved again was being run by a worker that crashed or was
+        # killed. Its running flag wasn't saved, so the job is persisted
+        # as running -- or read back, if that was done by an earlier
+        # crash -- and the crash is handled like any other job's
+        stored = self.get_job(job.uuid)
+        if stored:
+            return stored
+
+        job.running = True
+        job.persist()
+        return job
+
     def run(self):
         """
         Process() target function.
@@ -86,6 +129,7 @@ class BaseWorker(object):
         """
         self.datastore = self.makeDatastore()
         self.queue = self.makeQueue("{0}_jobs".format(self.name))
+        self.deadLetters = DeadLetters(self.datastore, self.queue)
         self.pid = psutil.Process().pid
         self.draining = False
 
@@ -120,6 +164,7 @@ class BaseWorker(object):
                 queueJob = self.queue.reserve(timeout=0)
                 if queueJob:
                     self._process_queue_job(queueJob)
+                    self.flush_index()
                     return      # suicide to return memory
 
             # check if parent is still alive. Suicide if not.
@@ -129,6 +174,21 @@ class BaseWorker(object):
                 )
                 return
 
+    def flush_index(self):
+        # writes the job index updates queued by the job, as the worker
+        # exits before the index's background flush would run
+        jobIndex = getattr(self.datastore, 'jobIndex', None)
+        if jobIndex is None:
+            return
+
+        try:
+            jobIndex.flush()
+        except Exception as e:
+            log.error(
+                f"{self.name}:{self.parentPid}:{self.pid} | "
+                f"job index flush failed: {e}"
+            )
+
     def _check_parent(self):
         # Return True if parent is still alive, False if not
 
@@ -149,21 +209,40 @@ class BaseWorker(object):
         # crash the worker
         #
         # Args:
-        #   queueJob: queue job object. Currently it is a beanstalkc.Job
+        #   queueJob: queue job object. Currently it is a
+        #             zerog.queues.beanstalk_client.Job
         #
-        # body of the queue job is just a uuid that we can use to retrieve
-        # the full job
-        uuid = json.loads(queueJob.body)
+        # body of the queue job is usually just a uuid that we can use to
+        # retrieve the full job. An ephemeral job's body is the full job
+        try:
+            body = json.loads(queueJob.body)
+        except ValueError:
+            log.error(
+                f"{self.name}:{self.parentPid}:{self.pid} | "
+                f"bad queue entry {queueJob.jid}, burying"
+            )
+            self.deadLetters.bury(queueJob, "bad queue entry")
+            return
+
+        inline = isinstance(body, dict)
+        uuid = body.get('uuid') if inline else body
         log.info(
             f"{self.name}:{self.parentPid}:{self.pid} | "
             f"reserved {uuid}"
         )
 
         job = None
+        error = ""
         try:
-            job = self.get_job(uuid)
-        except BaseException:
+            if inline:
+                job = self.make_inline_job(body)
+                if job and queueJob.stats()['reserves'] > 1:
+                    job = self.recover_inline_job(job)
+            else:
+                job = self.get_job(uuid)
+        except BaseException as e:
             msg = traceback.format_exc()
+            error = repr(e)
         else:
             msg = ""
 
@@ -174,23 +253,31 @@ class BaseWorker(object):
             msg += "worker {0} failed to load {1}, queue stats: {2}".format(
                 self.pid, uuid, stats
             )
-            delete = False
+            log.error(msg)
 
-            if stats['reserves'] > MAX_RESERVES:
-                delete = True
-                tooMany = "{0} reserves".format(MAX_RESERVES)
+            # bury the poison entry rather than have it cycle through the
+            # workers. A missing job or an exception may be transient, so
+            # those entries are retried a few times first
+            reason = None
+            if not error:
+                if stats['reserves'] > MAX_NOT_FOUND_RESERVES:
+                    reason = "job not found"
+            elif stats['reserves'] > MAX_RESERVES:
+                reason = "more than {0} reserves".format(MAX_RESERVES)
             elif stats['timeouts'] > MAX_TIMEOUTS:
-                delete = True
-                tooMany = "{0} timeouts".format(MAX_TIMEOUTS)
+                reason = "more than {0} timeouts".format(MAX_TIMEOUTS)
 
-            if delete:
-                msg = "more than {0}, deleting from queue".format(tooMany)
-                log.error("worker {0}, job {1}: {2}".format(
-                    self.pid, uuid, msg)
+            if reason:
+                log.error("worker {0}, job {1}: {2}, burying".format(
+                    self.pid, uuid, reason)
                 )
-                queueJob.delete()
+                if error:
+                    reason += ": " + error
+                self.deadLetters.bury(queueJob, reason, uuid=uuid)
             else:
-                queueJob.release(delay=30)
+                queueJob.release(
+                    delay=LOAD_ERROR_DELAY if error else NOT_FOUND_DELAY
+                )
 
             return
 
@@ -228,7 +315,15 @@ class BaseWorker(object):
 
             log.info('start 1')
             self.conn.send(
-                json.dumps(dict(type="runningJobUuid", value=uuid))
+                json.dumps(
+                    dict(
+                        type="runningJobUuid",
+                        value=uuid,
+                        jobType=job.JOB_TYPE,
+                        queueJobId=queueJob.jid,
+                        queueWait=self.queue_wait(job)
+                    )
+                )
             )
             log.info('conn 1')
             job.update_attrs(running=True)
@@ -261,6 +356,8 @@ class BaseWorker(object):
 
         except (zerog.jobs.ErrorFinish, zerog.jobs.WarningFinish):
             # error has already been recorded and job is done
+            if job.inline:
+                job.persist()
             job.record_event("Error - finished")
             queueJob.delete()
             return
@@ -305,8 +402,17 @@ class BaseWorker(object):
             )
             job.update_attrs(running=False)
 
+        if job.inline and (
+            resultCode == zerog.jobs.NO_RESULT or job.errors or
+            job.PERSIST_RESULT
+        ):
+            # an ephemeral job is only written to the datastore if it's
+            # requeued, errored or its result needs to be kept
+            job.persist()
+
         queueJob.delete()
         if resultCode == zerog.jobs.NO_RESULT:
             job.enqueue(delay=delay)
+            job.park()
         else:
             job.record_result(resultCode)